@@ -10,24 +10,56 @@
   - Configurable OLLAMA_HOST via env (passed through Ollama CLI)
   - Keeps normal Unicode; optional ASCII-only scrub
   - Exit codes: 0 ok, 1 env/cli, 2 no drafts, 3 summarizer empty, 4 summarizer error, 5 timeout, 6 pull error
+  - -DeadlineSec bounds the whole run: drafts get -DraftBudgetShare of it, the summarizer the rest;
+    with -MinDrafts k the merge starts once k drafts arrived and slower models are stopped
+  - The summarizer is skipped when drafts overlap at least -SkipMergeSimilarity (word 3-gram Jaccard);
+    a lone draft counts as 1.0, so values above 1 always merge
+  - -FallbackSummarizerModel merges the same drafts again when the summarizer errors or times out (exit 4/5)
+  - Models are listed/pulled once at startup ('ollama list' is cached for -InventoryRefreshSec); -Server
+    also warms each model with a one-token run. -SkipModelCheck skips both when the caller (the bot)
+    already keeps the models pulled and warm. -KeepAlive is passed to every 'ollama run' as --keepalive
+  - -Server keeps the process warm: one JSON request per stdin line, one JSON result per stdout line
+    request:  {"id": "...", "prompt": "...", "models": [...], "summarizer_model": "...", "temperature": 0.2,
+               "max_tokens": 512, "timeout_sec": 120, "retries": 1, "deadline_sec": 216,
+               "draft_budget_share": 0.5, "min_drafts": 0, "fallback_summarizer_model": "...",
+               "drafts": {"<model>": "..."}}   (all but id/prompt optional; models with a draft are not run again)
+    response: {"id": "...", "exit_code": 0, "answer": "...", "message": "...", "drafts": [...],
+               "drafts_by_model": {"<model>": "..."}, "timings": {...}, "merge_skipped": false,
+               "similarity": 0.42}   (lowest pairwise draft overlap, 0-1; null when no drafts were compared)
 #>
 
+[CmdletBinding(DefaultParameterSetName='OneShot')]
 param(
-    [Parameter(Mandatory=$true)]
+    [Parameter(Mandatory=$true, ParameterSetName='OneShot')]
     [string]$Prompt,
 
+    [Parameter(Mandatory=$true, ParameterSetName='Server')]
+    [switch]$Server,
+
     [string[]]$Models = @("llama2-uncensored:7b", "mistral-openorca:7b"),
     [string]$SummarizerModel = "mistral-openorca:7b",
+    [string]$FallbackSummarizerModel = "", # merges again when the summarizer errors or times out
 
     [double]$Temperature = 0.2,
     [int]$MaxTokens = 512,
     [int]$TimeoutSec = 120,
     [int]$Retries = 1,
 
+    [int]$DeadlineSec = 0,            # 0 = no overall deadline, per-stage timeouts only
+    [double]$DraftBudgetShare = 0.5,
+    [int]$MinDrafts = 0,              # 0 = wait for every model
+    [double]$SkipMergeSimilarity = 0.7,
+
     [switch]$AsciiOnly,
-    [switch]$NoAutoPull # if set, do not pull missing models
+    [switch]$NoAutoPull, # if set, do not pull missing models
+    [switch]$SkipModelCheck, # models are already verified and warm: never run 'ollama list' or pull
+    [string]$KeepAlive = "", # e.g. "30m": how long Ollama keeps a model loaded after each run
+    [int]$InventoryRefreshSec = 300
 )
 
+# pwsh -File cannot bind arrays, so the bot passes -Models as one comma-separated string
+$Models = @($Models | ForEach-Object { $_ -split ',' } | ForEach-Object { $_.Trim() } | Where-Object { $_ })
+
 # --------------------------------
 # Resolve Ollama CLI & env
 # --------------------------------
@@ -52,24 +84,27 @@ Only output clear, human-readable answers.
 "@
 $persona = if ($env:NIGHTSHADE_PERSONA) { $env:NIGHTSHADE_PERSONA } else { $defaultPersona }
 
-$finalPrompt = @"
-$persona
-
-User: $Prompt
-NightshadeAI:
-"@.Trim()
-
 # --------------------------------
 # Helpers: model list / pull
 # --------------------------------
+# Cached 'ollama list' names, re-listed at most every -InventoryRefreshSec
+$script:inventory = @()
+$script:inventoryAt = [datetime]::MinValue
 function Get-OllamaModels {
-    try {
-        & $ollamaExe list --format json | ConvertFrom-Json
-    } catch { @() }
+    if (([datetime]::UtcNow - $script:inventoryAt).TotalSeconds -ge $InventoryRefreshSec) {
+        try {
+            $script:inventory = @(& $ollamaExe list --format json | ConvertFrom-Json | ForEach-Object { $_.name })
+        } catch { $script:inventory = @() }
+        $script:inventoryAt = [datetime]::UtcNow
+    }
+    $script:inventory
 }
 function Ensure-Models([string[]]$names) {
-    $available = (Get-OllamaModels) | ForEach-Object { $_.name }
-    $missing = $names | Select-Object -Unique | Where-Object { $_ -notin $available }
+    $wanted = @($names | Select-Object -Unique)
+    # Names already in the cached inventory need no listing at all
+    if (-not ($wanted | Where-Object { $_ -notin $script:inventory })) { return }
+    $available = Get-OllamaModels
+    $missing = @($wanted | Where-Object { $_ -notin $available })
     if ($missing.Count -eq 0) { return }
     if ($NoAutoPull) {
         throw "Missing models: $($missing -join ', '). Run 'ollama pull <model>' or omit -NoAutoPull."
@@ -78,16 +113,19 @@ function Ensure-Models([string[]]$names) {
         try {
             Write-Output "[pull] $m"
             & $ollamaExe pull $m | Out-Null
+            $script:inventory += $m
         } catch {
             throw "Failed to pull model '$m': $($_.Exception.Message)"
         }
     }
 }
-try {
-    Ensure-Models -names ($Models + $SummarizerModel)
-} catch {
-    Write-Error $_
-    exit 6
+if (-not $SkipModelCheck) {
+    try {
+        Ensure-Models -names ($Models + $SummarizerModel)
+    } catch {
+        Write-Error $_
+        exit 6
+    }
 }
 
 # --------------------------------
@@ -118,21 +156,31 @@ function Invoke-OllamaModel {
         [int]$MaxTokens = 512,
         [int]$TimeoutSec = 120,
         [int]$Retries = 0,
-        [bool]$AsciiOnly = $false
+        [bool]$AsciiOnly = $false,
+        [datetime]$Deadline = [datetime]::MaxValue,  # UTC; no attempt outlives it
+        [string]$KeepAlive = ""
     )
 
-    $argsBase = @("run", $Model, "--temp", $Temperature, "--num-predict", $MaxTokens, $Prompt)
+    $argsBase = @("run", $Model, "--temp", $Temperature, "--num-predict", $MaxTokens)
+    if ($KeepAlive) { $argsBase += @("--keepalive", $KeepAlive) }
+    $argsBase += $Prompt
     for ($i = 0; $i -le [Math]::Max(0,$Retries); $i++) {
+        $attemptTimeout = $TimeoutSec
+        if ($Deadline -ne [datetime]::MaxValue) {
+            $left = [int][Math]::Floor(($Deadline - [datetime]::UtcNow).TotalSeconds)
+            if ($left -lt 1) { throw "Timeout (deadline reached) on '$Model'." }
+            $attemptTimeout = [Math]::Min($TimeoutSec, $left)
+        }
         $job = Start-Job -ScriptBlock {
             param($exe, $args)
             & $exe @args 2>&1 | Out-String
         } -ArgumentList $ollamaExe, $argsBase
 
-        if (-not (Wait-Job $job -Timeout $TimeoutSec)) {
+        if (-not (Wait-Job $job -Timeout $attemptTimeout)) {
             Stop-Job $job -Force | Out-Null
             Remove-Job $job -Force | Out-Null
             if ($i -lt $Retries) { Start-Sleep -Seconds 1; continue }
-            throw "Timeout ($TimeoutSec s) on '$Model'."
+            throw "Timeout ($attemptTimeout s) on '$Model'."
         }
 
         $result = Receive-Job $job -Keep
@@ -147,44 +195,175 @@ function Invoke-OllamaModel {
 }
 
 # --------------------------------
-# Run base models in parallel
+# Draft redundancy (mirrors ai/similarity.py)
 # --------------------------------
-$baseJobs = foreach ($m in $Models | Select-Object -Unique) {
-    Start-Job -Name "ollama_$($m -replace '[:/\\ ]','_')" -ScriptBlock {
-        param($Model, $Prompt, $Temp, $MaxTok, $TO, $Retries, $Ascii, $inv)
-        Set-Item -Path function:Invoke-OllamaModel -Value $inv
-        try {
-            Invoke-OllamaModel -Model $Model -Prompt $Prompt -Temperature $Temp -MaxTokens $MaxTok -TimeoutSec $TO -Retries $Retries -AsciiOnly:$Ascii
-        } catch {
-            "[[ERROR:$Model]] $($_.Exception.Message)"
+function Get-Shingles([string]$Text, [int]$Size = 3) {
+    $words = @([regex]::Matches($Text.ToLowerInvariant(), '\w+') | ForEach-Object { $_.Value })
+    $set = [Collections.Generic.HashSet[string]]::new()
+    if ($words.Count -lt $Size) {
+        foreach ($w in $words) { [void]$set.Add($w) }
+    } else {
+        for ($i = 0; $i -le $words.Count - $Size; $i++) { [void]$set.Add(($words[$i..($i + $Size - 1)] -join ' ')) }
+    }
+    return ,$set
+}
+function Get-Jaccard($A, $B) {
+    if ($A.Count -eq 0 -and $B.Count -eq 0) { return 1.0 }
+    $inter = [Collections.Generic.HashSet[string]]::new($A)
+    $inter.IntersectWith($B)
+    $union = [Collections.Generic.HashSet[string]]::new($A)
+    $union.UnionWith($B)
+    return $inter.Count / $union.Count
+}
+function Get-DraftSimilarity([string[]]$Drafts) {
+    # Lowest pairwise overlap: drafts only count as redundant if every pair is
+    if ($Drafts.Count -lt 2) { return 1.0 }
+    $sets = @($Drafts | ForEach-Object { ,(Get-Shingles $_) })
+    $min = 1.0
+    for ($i = 0; $i -lt $sets.Count; $i++) {
+        for ($j = $i + 1; $j -lt $sets.Count; $j++) { $min = [Math]::Min($min, (Get-Jaccard $sets[$i] $sets[$j])) }
+    }
+    return $min
+}
+function Select-BestDraft([string[]]$Drafts) {
+    # The draft closest to all the others; ties go to the longer one
+    if ($Drafts.Count -eq 1) { return $Drafts[0] }
+    $sets = @($Drafts | ForEach-Object { ,(Get-Shingles $_) })
+    $best = 0; $bestScore = -1.0
+    for ($i = 0; $i -lt $sets.Count; $i++) {
+        $score = 0.0
+        for ($j = 0; $j -lt $sets.Count; $j++) { if ($j -ne $i) { $score += Get-Jaccard $sets[$i] $sets[$j] } }
+        if ($score -gt $bestScore -or ($score -eq $bestScore -and $Drafts[$i].Length -gt $Drafts[$best].Length)) {
+            $best = $i; $bestScore = $score
         }
-    } -ArgumentList $m, $finalPrompt, $Temperature, $MaxTokens, $TimeoutSec, $Retries, [bool]$AsciiOnly, ${function:Invoke-OllamaModel}
+    }
+    return $Drafts[$best]
 }
 
-# Wait slightly longer than timeout to drain all jobs
-Wait-Job -Job $baseJobs -Timeout ($TimeoutSec + 10) | Out-Null
-
-$drafts = foreach ($j in $baseJobs) {
-    $o = Receive-Job $j -ErrorAction SilentlyContinue
-    Remove-Job $j -Force | Out-Null
-    ($o -join "")
+# --------------------------------
+# Fan-out -> merge pipeline (shared by one-shot and -Server mode)
+# --------------------------------
+function New-PipelineResult([int]$ExitCode, [string]$Answer, [string]$Message, $DraftsByModel, $Timings, [bool]$MergeSkipped = $false, $Similarity = $null) {
+    [pscustomobject]@{
+        exit_code       = $ExitCode
+        answer          = $Answer
+        message         = $Message
+        drafts          = @($DraftsByModel.Values)
+        drafts_by_model = $DraftsByModel
+        timings         = $Timings
+        merge_skipped   = $MergeSkipped
+        similarity      = $Similarity
+    }
 }
-$drafts = $drafts | Where-Object { $_ -and ($_ -notmatch '^\s*\[\[ERROR:') }
 
-if (-not $drafts -or $drafts.Count -eq 0) {
-    Write-Warning "No valid outputs generated from base models."
-    exit 2
-}
+function Invoke-Pipeline {
+    param(
+        [string]$Prompt,
+        [string[]]$Models,
+        [string]$SummarizerModel,
+        [string]$FallbackSummarizerModel = "",
+        [double]$Temperature,
+        [int]$MaxTokens,
+        [int]$TimeoutSec,
+        [int]$Retries,
+        [bool]$AsciiOnly,
+        [int]$DeadlineSec = 0,
+        [double]$DraftBudgetShare = 0.5,
+        [int]$MinDrafts = 0,
+        [double]$SkipMergeSimilarity = 0.7,
+        [hashtable]$Drafts = @{}          # model -> draft kept from an earlier attempt; those models are not run
+    )
 
-# Hard-delimit drafts and cap insane lengths (defense-in-depth)
-[int]$perDraftCap = [Math]::Max(2000, [int]($MaxTokens * 6))  # rough chars≈tokens*~4, room to merge
-$mergeText = ($drafts | ForEach-Object {
-    $t = $_.Trim()
-    if ($t.Length -gt $perDraftCap) { $t = $t.Substring(0, $perDraftCap) + " …" }
-    "<<<DRAFT>>>`n$t`n<<<END>>>"
-}) -join "`n"
+    $timings = [ordered]@{}
+    $total = [Diagnostics.Stopwatch]::StartNew()
+
+    # Split the budget: drafts may use their share, the summarizer gets whatever is left
+    $deadline = [datetime]::MaxValue
+    $draftBudget = $TimeoutSec + 10
+    if ($DeadlineSec -gt 0) {
+        $deadline = [datetime]::UtcNow.AddSeconds($DeadlineSec)
+        $draftBudget = [Math]::Max(1, $DeadlineSec * $DraftBudgetShare)
+    }
+    $draftDeadline = [datetime]::UtcNow.AddSeconds($draftBudget)
 
-$summarizerPrompt = @"
+    $finalPrompt = @"
+$persona
+
+User: $Prompt
+NightshadeAI:
+"@.Trim()
+
+    # Run base models in parallel, except those whose draft the caller already has
+    $uniqueModels = @($Models | Select-Object -Unique)
+    $baseJobs = foreach ($m in $uniqueModels | Where-Object { -not $Drafts.ContainsKey($_) }) {
+        [pscustomobject]@{
+            Model = $m
+            Job   = Start-Job -Name "ollama_$($m -replace '[:/\\ ]','_')" -ScriptBlock {
+                param($Model, $Prompt, $Temp, $MaxTok, $TO, $Retries, $Ascii, $inv, $clean, $exe, $Budget, $Keep)
+                Set-Item -Path function:Invoke-OllamaModel -Value $inv
+                Set-Item -Path function:Clean-Output -Value $clean
+                $ollamaExe = $exe
+                try {
+                    Invoke-OllamaModel -Model $Model -Prompt $Prompt -Temperature $Temp -MaxTokens $MaxTok -TimeoutSec $TO -Retries $Retries -AsciiOnly:$Ascii -Deadline ([datetime]::UtcNow.AddSeconds($Budget)) -KeepAlive $Keep
+                } catch {
+                    "[[ERROR:$Model]] $($_.Exception.Message)"
+                }
+            } -ArgumentList $m, $finalPrompt, $Temperature, $MaxTokens, $TimeoutSec, $Retries, $AsciiOnly, ${function:Invoke-OllamaModel}, ${function:Clean-Output}, $ollamaExe, $draftBudget, $KeepAlive
+        }
+    }
+
+    # Collect drafts as they finish until k are usable or the draft budget runs out
+    $wanted = if ($MinDrafts -gt 0) { [Math]::Min($MinDrafts, $uniqueModels.Count) } else { $uniqueModels.Count }
+    $draftsByModel = @{}
+    foreach ($m in $uniqueModels | Where-Object { $Drafts.ContainsKey($_) }) { $draftsByModel[$m] = $Drafts[$m] }
+    $pending = [Collections.Generic.List[object]]::new()
+    foreach ($b in $baseJobs) { $pending.Add($b) }
+    while ($pending.Count -gt 0 -and $draftsByModel.Count -lt $wanted) {
+        $left = ($draftDeadline - [datetime]::UtcNow).TotalSeconds
+        if ($left -le 0) { break }
+        if (-not (Wait-Job -Job $pending.Job -Any -Timeout ([Math]::Max(1, [int][Math]::Ceiling($left))))) { break }
+        foreach ($b in @($pending | Where-Object { $_.Job.State -ne 'Running' })) {
+            $o = (Receive-Job $b.Job -ErrorAction SilentlyContinue) -join ""
+            if ($b.Job.PSEndTime) {
+                $timings["draft:$($b.Model)"] = ($b.Job.PSEndTime - $b.Job.PSBeginTime).TotalSeconds
+            }
+            Remove-Job $b.Job -Force | Out-Null
+            [void]$pending.Remove($b)
+            if ($o -and ($o -notmatch '^\s*\[\[ERROR:')) { $draftsByModel[$b.Model] = $o }
+        }
+    }
+    # Stragglers are dropped rather than waited for
+    foreach ($b in $pending) {
+        Stop-Job $b.Job -ErrorAction SilentlyContinue | Out-Null
+        Remove-Job $b.Job -Force | Out-Null
+    }
+    # Model order, so the merge (and the caller's checkpoints) see the same drafts in the same order
+    $byModel = [ordered]@{}
+    foreach ($m in $uniqueModels | Where-Object { $draftsByModel.ContainsKey($_) }) { $byModel[$m] = $draftsByModel[$m] }
+    $drafts = @($byModel.Values)
+    $timings["drafts"] = $total.Elapsed.TotalSeconds
+
+    if ($drafts.Count -eq 0) {
+        $timings["total"] = $total.Elapsed.TotalSeconds
+        return New-PipelineResult 2 "" "No valid outputs generated from base models." $byModel $timings
+    }
+
+    # Merging near-identical drafts (or a single one) would only restate them
+    $similarity = Get-DraftSimilarity $drafts
+    if ($similarity -ge $SkipMergeSimilarity) {
+        $timings["total"] = $total.Elapsed.TotalSeconds
+        return New-PipelineResult 0 (Clean-Output (Select-BestDraft $drafts) $AsciiOnly) "" $byModel $timings $true $similarity
+    }
+
+    # Hard-delimit drafts and cap insane lengths (defense-in-depth)
+    [int]$perDraftCap = [Math]::Max(2000, [int]($MaxTokens * 6))  # rough chars≈tokens*~4, room to merge
+    $mergeText = ($drafts | ForEach-Object {
+        $t = $_.Trim()
+        if ($t.Length -gt $perDraftCap) { $t = $t.Substring(0, $perDraftCap) + " …" }
+        "<<<DRAFT>>>`n$t`n<<<END>>>"
+    }) -join "`n"
+
+    $summarizerPrompt = @"
 $persona
 
 You will be given multiple draft answers, each wrapped in:
@@ -204,32 +383,132 @@ $mergeText
 Final Answer:
 "@.Trim()
 
-$sumTimeout = [Math]::Max($TimeoutSec, [int]([double]$TimeoutSec * 2))
+    $sumTimeout = [Math]::Max($TimeoutSec, [int]([double]$TimeoutSec * 2))  # further capped by $deadline
+    # An error or timeout (exit 4/5) merges the same drafts again with the fallback, if there is time left
+    $summarizers = @($SummarizerModel) + @($FallbackSummarizerModel | Where-Object { $_ -and $_ -ne $SummarizerModel })
 
-try {
-    $final = Invoke-OllamaModel `
-        -Model $SummarizerModel `
-        -Prompt $summarizerPrompt `
-        -Temperature ([Math]::Max(0.1, $Temperature - 0.1)) `
-        -MaxTokens ([Math]::Max(256, $MaxTokens)) `
-        -TimeoutSec $sumTimeout `
-        -Retries $Retries `
-        -AsciiOnly:$AsciiOnly
+    for ($i = 0; $i -lt $summarizers.Count; $i++) {
+        $stage = if ($i -eq 0) { "summarizer" } else { "fallback_summarizer" }
+        $sumWatch = [Diagnostics.Stopwatch]::StartNew()
+        try {
+            $final = Invoke-OllamaModel `
+                -Model $summarizers[$i] `
+                -Prompt $summarizerPrompt `
+                -Temperature ([Math]::Max(0.1, $Temperature - 0.1)) `
+                -MaxTokens ([Math]::Max(256, $MaxTokens)) `
+                -TimeoutSec $sumTimeout `
+                -Retries $Retries `
+                -AsciiOnly:$AsciiOnly `
+                -Deadline $deadline `
+                -KeepAlive $KeepAlive
+            $timings[$stage] = $sumWatch.Elapsed.TotalSeconds
+
+            if (-not $final) {
+                $timings["total"] = $total.Elapsed.TotalSeconds
+                return New-PipelineResult 3 "" "Summarizer produced empty output." $byModel $timings $false $similarity
+            }
 
-    if (-not $final) {
-        Write-Warning "Summarizer produced empty output."
-        exit 3
+            $final = Clean-Output $final $AsciiOnly
+            $timings["total"] = $total.Elapsed.TotalSeconds
+            return New-PipelineResult 0 $final "" $byModel $timings $false $similarity
+        }
+        catch {
+            $timings[$stage] = $sumWatch.Elapsed.TotalSeconds
+            $failure = $_.Exception.Message
+            if ($i -lt $summarizers.Count - 1 -and [datetime]::UtcNow -lt $deadline) { continue }
+            $timings["total"] = $total.Elapsed.TotalSeconds
+            if ($failure -like "Timeout*") {
+                return New-PipelineResult 5 "" "Summarizer timeout: $failure" $byModel $timings $false $similarity
+            }
+            return New-PipelineResult 4 "" "Summarizer error: $failure" $byModel $timings $false $similarity
+        }
     }
+}
 
-    $final = Clean-Output $final $AsciiOnly
-    Write-Output $final
-    exit 0
+# --------------------------------
+# -Server: warm worker speaking newline-delimited JSON on stdin/stdout
+# --------------------------------
+function Write-JsonLine($obj) {
+    [Console]::Out.WriteLine(($obj | ConvertTo-Json -Compress -Depth 5))
+    [Console]::Out.Flush()
 }
-catch {
-    if ($_.Exception.Message -like "Timeout*") {
-        Write-Error "Summarizer timeout: $($_.Exception.Message)"
-        exit 5
+
+if ($Server) {
+    if (-not $SkipModelCheck) {
+        # Load every model once so the first question does not pay for it
+        foreach ($m in ($Models + $SummarizerModel | Select-Object -Unique)) {
+            try {
+                $null = Invoke-OllamaModel -Model $m -Prompt "hi" -MaxTokens 1 -TimeoutSec $TimeoutSec -KeepAlive $KeepAlive
+            } catch {
+                Write-Warning "Warm-up of '$m' failed: $($_.Exception.Message)"
+            }
+        }
+    }
+    Write-JsonLine ([pscustomobject]@{ event = "ready"; pid = $PID })
+    while ($null -ne ($line = [Console]::In.ReadLine())) {
+        if (-not $line.Trim()) { continue }
+        try {
+            $req = $line | ConvertFrom-Json
+        } catch {
+            Write-JsonLine ([pscustomobject]@{ id = $null; exit_code = 1; answer = ""; message = "Malformed request: $($_.Exception.Message)"; drafts = @(); timings = @{} })
+            continue
+        }
+        $reqModels = if ($req.models) { @($req.models) } else { $Models }
+        $reqDrafts = @{}
+        if ($req.drafts) {
+            foreach ($p in $req.drafts.PSObject.Properties) { $reqDrafts[$p.Name] = [string]$p.Value }
+        }
+        if (-not $SkipModelCheck) {
+            # Served from the cached inventory; only unknown models trigger a listing or pull
+            try {
+                $null = Ensure-Models -names ($reqModels + ($req.summarizer_model ?? $SummarizerModel))
+            } catch {
+                Write-JsonLine ([pscustomobject]@{ id = $req.id; exit_code = 6; answer = ""; message = "$($_.Exception.Message)"; drafts = @(); timings = @{} })
+                continue
+            }
+        }
+        $r = Invoke-Pipeline `
+            -Prompt $req.prompt `
+            -Models $reqModels `
+            -SummarizerModel ($req.summarizer_model ?? $SummarizerModel) `
+            -FallbackSummarizerModel ($req.fallback_summarizer_model ?? $FallbackSummarizerModel) `
+            -Temperature ($req.temperature ?? $Temperature) `
+            -MaxTokens ($req.max_tokens ?? $MaxTokens) `
+            -TimeoutSec ($req.timeout_sec ?? $TimeoutSec) `
+            -Retries ($req.retries ?? $Retries) `
+            -AsciiOnly ([bool]$AsciiOnly) `
+            -DeadlineSec ($req.deadline_sec ?? $DeadlineSec) `
+            -DraftBudgetShare ($req.draft_budget_share ?? $DraftBudgetShare) `
+            -MinDrafts ($req.min_drafts ?? $MinDrafts) `
+            -SkipMergeSimilarity ($req.skip_merge_similarity ?? $SkipMergeSimilarity) `
+            -Drafts $reqDrafts
+        $r | Add-Member -NotePropertyName id -NotePropertyValue $req.id
+        Write-JsonLine $r
     }
-    Write-Error "Summarizer error: $($_.Exception.Message)"
-    exit 4
+    exit 0
+}
+
+# --------------------------------
+# One-shot: plain text on stdout, status via exit code
+# --------------------------------
+$result = Invoke-Pipeline `
+    -Prompt $Prompt `
+    -Models $Models `
+    -SummarizerModel $SummarizerModel `
+    -FallbackSummarizerModel $FallbackSummarizerModel `
+    -Temperature $Temperature `
+    -MaxTokens $MaxTokens `
+    -TimeoutSec $TimeoutSec `
+    -Retries $Retries `
+    -AsciiOnly ([bool]$AsciiOnly) `
+    -DeadlineSec $DeadlineSec `
+    -DraftBudgetShare $DraftBudgetShare `
+    -MinDrafts $MinDrafts `
+    -SkipMergeSimilarity $SkipMergeSimilarity
+
+switch ($result.exit_code) {
+    0 { Write-Output $result.answer }
+    { $_ -in 2, 3 } { Write-Warning $result.message }
+    default { Write-Error $result.message }
 }
+exit $result.exit_code
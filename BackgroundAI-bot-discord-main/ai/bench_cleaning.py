@@ -0,0 +1,110 @@
+"""Benchmark for output cleaning and splitting: python -m ai.bench_cleaning [--mb N] [--chunk-kb N]
+
+Compares the buffered path (decode everything, clean_ai_output, then the old slicing splitter)
+with StreamCleaner fed raw byte chunks straight into stream_discord_chunks, on a synthetic
+multi-megabyte model output with spinners, colour codes, persona echoes, blank-line runs and
+multi-byte UTF-8 cut at arbitrary chunk boundaries. Both paths must produce identical chunks.
+"""
+import argparse
+import random
+import time
+from typing import Iterator, List
+
+if __package__ in (None, ""):
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from ai.cleaning import clean_ai_output, clean_stream, stream_discord_chunks
+else:
+    from .cleaning import clean_ai_output, clean_stream, stream_discord_chunks
+
+WORDS = ["the", "model", "answer", "réponse", "naïve", "数据", "ok", "pipeline", "🙂", "summary", "draft"]
+
+
+def synthetic_output(size_bytes: int, seed: int = 1) -> bytes:
+    rng = random.Random(seed)
+    parts: List[str] = []
+    total = 0
+    while total < size_bytes:
+        roll = rng.random()
+        if roll < 0.02:
+            part = "\x1b[2K\x1b[1G" + rng.choice("⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏")  # spinner frame
+        elif roll < 0.03:
+            part = "\nNightshadeAI: "
+        elif roll < 0.05:
+            part = "\n" * rng.randint(1, 5)
+        elif roll < 0.08:
+            part = f"\x1b[{rng.randint(30, 37)}m"
+        else:
+            part = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) + rng.choice(". \n")
+        parts.append(part)
+        total += len(part.encode("utf-8"))
+    return "".join(parts).encode("utf-8")
+
+
+def byte_chunks(data: bytes, size: int) -> Iterator[bytes]:
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def legacy_split(text: str, limit: int = 2000) -> List[str]:
+    # The splitter bot.py used before stream_discord_chunks: re-slices the remainder per chunk
+    chunks = []
+    while len(text) > limit:
+        split_pos = text.rfind('\n', 0, limit)
+        if split_pos == -1:
+            split_pos = text.rfind(' ', 0, limit)
+        if split_pos == -1:
+            split_pos = limit
+        chunks.append(text[:split_pos].strip())
+        text = text[split_pos:].strip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+def run(mb: float, chunk_kb: int, seed: int = 1) -> dict:
+    data = synthetic_output(int(mb * 1024 * 1024), seed)
+    chunk_size = chunk_kb * 1024
+
+    started = time.perf_counter()
+    buffered = legacy_split(clean_ai_output(b"".join(byte_chunks(data, chunk_size)).decode("utf-8", errors="ignore")))
+    buffered_sec = time.perf_counter() - started
+
+    started = time.perf_counter()
+    first_chunk_sec = None
+    streamed = []
+    for chunk in stream_discord_chunks(clean_stream(byte_chunks(data, chunk_size))):
+        if first_chunk_sec is None:
+            first_chunk_sec = time.perf_counter() - started
+        streamed.append(chunk)
+    streamed_sec = time.perf_counter() - started
+
+    if streamed != buffered:
+        raise AssertionError("streaming and buffered cleaning disagree")
+    size_mb = len(data) / (1024 * 1024)
+    return {
+        "input_mb": round(size_mb, 2),
+        "messages": len(streamed),
+        "buffered_sec": round(buffered_sec, 4),
+        "buffered_mb_per_sec": round(size_mb / buffered_sec, 1),
+        "streamed_sec": round(streamed_sec, 4),
+        "streamed_mb_per_sec": round(size_mb / streamed_sec, 1),
+        "streamed_first_message_ms": round((first_chunk_sec or 0.0) * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, nargs="+", default=[1, 4, 8], help="output sizes to test, in MiB")
+    parser.add_argument("--chunk-kb", type=int, default=64, help="size of each byte chunk fed to the cleaner")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    for mb in args.mb:
+        result = run(mb, args.chunk_kb, args.seed)
+        print("  ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""End-to-end load test: python -m ai.bench_e2e [--mode message|ask] [--requests N] [--rate QPS] [--output FILE]
+
+Drives the real bot code against a fake Ollama server and fake Discord traffic and prints one JSON
+document (latency percentiles, throughput, event-loop lag, memory) for regression tracking.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from ai.fake_discord import FakeDiscord, FakeMessage
+    from ai.fake_ollama import FakeOllamaServer, distribution
+else:
+    from .fake_discord import FakeDiscord, FakeMessage
+    from .fake_ollama import FakeOllamaServer, distribution
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+WORDS = ("the", "model", "answer", "shard", "token", "queue", "latency", "draft", "merge", "cache")
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    # Nearest-rank percentile; None for an empty sample
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(values: Sequence[float], scale: float = 1.0) -> Dict[str, Optional[float]]:
+    def scaled(v: Optional[float]) -> Optional[float]:
+        return None if v is None else round(v * scale, 6)
+
+    return {
+        "count": len(values),
+        "mean": scaled(statistics.fmean(values)) if values else None,
+        "p50": scaled(percentile(values, 0.50)),
+        "p95": scaled(percentile(values, 0.95)),
+        "p99": scaled(percentile(values, 0.99)),
+        "max": scaled(max(values)) if values else None,
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KiB on Linux
+
+
+async def monitor_loop_lag(interval: float, samples: List[float], stop: asyncio.Event) -> None:
+    # How late a short sleep wakes up = how long something blocked the event loop
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+def load_bot(ollama_url: str, args: argparse.Namespace):
+    # The bot reads its configuration at import time; defaults here keep limits out of the way
+    os.environ["OLLAMA_HOST"] = ollama_url
+    os.environ["AI_BACKEND"] = "http"
+    os.environ["AI_MODELS"] = ",".join(args.models)
+    os.environ["AI_SUMMARIZER_MODEL"] = args.models[-1]
+    os.environ["AI_STREAMING"] = "true" if args.streaming else "false"
+    os.environ["AI_MAX_CONCURRENCY"] = str(args.concurrency)
+    os.environ["ANSWER_CACHE_SIZE"] = str(args.cache_size)
+    for name, value in (
+        ("DISCORD_TOKEN", "benchmark"),
+        ("QUOTA_DB", ""),
+        ("MAX_QUESTIONS_PER_SERVER", str(10 ** 9)),
+        ("PER_USER_COOLDOWN_SEC", "0.001"),
+        ("RATE_LIMIT_USER_BURST", str(10 ** 6)),
+        ("RATE_LIMIT_GUILD_PER_MIN", "0"),
+        ("RATE_LIMIT_GLOBAL_PER_MIN", "0"),
+        ("AI_MAX_QUEUE", str(10 ** 6)),
+        ("AI_MAX_QUEUE_PER_GUILD", str(10 ** 6)),
+    ):
+        os.environ.setdefault(name, value)
+    return importlib.import_module("ai.bot")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    questions = [" ".join(rng.choice(WORDS) for _ in range(8)) + "?" for _ in range(args.questions)]
+    server = FakeOllamaServer(
+        lambda model, prompt: " ".join(rng.choice(WORDS) for _ in range(args.answer_tokens)),
+        latency=distribution(args.ollama_latency, args.seed),
+        tokens_per_sec=distribution(args.token_rate, args.seed + 1),
+        models=list(args.models),
+    )
+    await server.start()
+    discord = FakeDiscord(args.guilds, args.users, api_latency=distribution(args.discord_latency, args.seed + 2),
+                          seed=args.seed)
+    bot = load_bot(server.url, args)
+    for guild in discord.guilds:
+        bot.ai_channels.index_guild(guild.id, guild.text_channels)
+
+    async def process_commands(_message):
+        return None
+
+    # on_message only needs the bot's user and process_commands; no gateway connection is made
+    bot.bot = type("BenchBot", (), {"user": discord.bot_user, "process_commands": staticmethod(process_commands)})()
+
+    latencies: List[float] = []
+    first_response: List[float] = []
+    outcomes: Counter = Counter()
+
+    async def one(message: FakeMessage, question: str) -> None:
+        started = time.perf_counter()
+        if args.mode == "ask":
+            _answer, exit_code = await bot.ask_ai_async(question, guild_id=message.guild.id)
+            outcomes[f"exit_{exit_code}"] += 1
+            latencies.append(time.perf_counter() - started)
+            return
+        await bot.on_message(message)
+        latencies.append(time.perf_counter() - started)
+        answered = [t for t, _op, content in message.channel.events
+                    if content and content.startswith(bot.MESSAGE_HEADER)]
+        outcomes["answered" if answered else "rejected"] += 1
+        if answered:
+            first_response.append(answered[0] - started)
+
+    lag: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(args.lag_interval, lag, stop))
+    if args.tracemalloc:
+        tracemalloc.start()
+    tasks = []
+    started = time.perf_counter()
+    for message in discord.mention_traffic(args.requests, questions):
+        question = message.content.split(" ", 1)[1]
+        tasks.append(asyncio.create_task(one(message, question)))
+        if args.rate > 0:
+            await asyncio.sleep(rng.expovariate(args.rate))  # Poisson arrivals
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+    stop.set()
+    await monitor
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+    await bot.ollama_client.close()
+    await server.stop()
+
+    return {
+        "benchmark": "e2e",
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "wall_sec": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else None,
+        "outcomes": dict(outcomes),
+        "latency_sec": summarize(latencies),
+        "first_response_sec": summarize(first_response),
+        "loop_lag_ms": summarize(lag, scale=1000.0),
+        "memory": {
+            "peak_rss_mb": peak_rss_mb(),
+            "tracemalloc_peak_mb": round(traced_peak / (1024 * 1024), 2) if traced_peak is not None else None,
+        },
+        "ollama_requests": len(server.requests),
+        "discord_calls": dict(discord.calls),
+        "coalesced": bot.inflight_questions.coalesced,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("message", "ask"), default="message",
+                        help="drive on_message with fake Discord traffic, or call ask_ai_async directly")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20.0, help="mean arrivals per second (0 = all at once)")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=100, help="distinct questions in the traffic mix")
+    parser.add_argument("--models", nargs="+", default=["fake-a", "fake-b", "fake-summarizer"],
+                        help="draft models; the last one also summarizes")
+    parser.add_argument("--ollama-latency", default="lognormal:0.2,0.5",
+                        help="time to first token: N, uniform:a,b, lognormal:median,sigma or exp:mean")
+    parser.add_argument("--token-rate", default="200", help="tokens per second, same syntax")
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--discord-latency", default="lognormal:0.05,0.4", help="seconds per Discord call")
+    parser.add_argument("--concurrency", type=int, default=4, help="AI_MAX_CONCURRENCY")
+    parser.add_argument("--cache-size", type=int, default=0, help="ANSWER_CACHE_SIZE (0 = every question runs)")
+    parser.add_argument("--no-streaming", dest="streaming", action="store_false")
+    parser.add_argument("--lag-interval", type=float, default=0.01)
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+    args.models = tuple(args.models)
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
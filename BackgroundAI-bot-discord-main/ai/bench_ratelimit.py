@@ -0,0 +1,50 @@
+"""Microbenchmark for the rate limiter: python -m ai.bench_ratelimit [--users N] [--checks N]"""
+import argparse
+import random
+import time
+
+if __package__ in (None, ""):
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from ai.ratelimit import Limit, RateLimiter
+else:
+    from .ratelimit import Limit, RateLimiter
+
+
+def run(users: int, checks: int, guilds: int = 500, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    limiter = RateLimiter(user=Limit(1 / 4, 2), guild=Limit.per_minute(30, 10), global_limit=Limit(1000, 1000))
+    traffic = [(rng.randrange(guilds), rng.randrange(users)) for _ in range(checks)]
+    now, step = 0.0, 0.001  # simulated clock: one check per millisecond
+    peak = 0
+    started = time.perf_counter()
+    for i, (guild_id, user_id) in enumerate(traffic):
+        limiter.check(guild_id, user_id, now)
+        now += step
+        if i % 1000 == 0:
+            peak = max(peak, len(limiter))
+    elapsed = time.perf_counter() - started
+    return {
+        "checks": checks,
+        "ns_per_check": elapsed / checks * 1e9,
+        "peak_buckets": peak,
+        "final_buckets": len(limiter),
+        "denied": limiter.denied,
+        "expired": limiter.expired,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--checks", type=int, default=500_000)
+    args = parser.parse_args()
+    result = run(args.users, args.checks)
+    for key, value in result.items():
+        print(f"{key:>14}: {value:,.0f}" if isinstance(value, float) else f"{key:>14}: {value:,}")
+
+
+if __name__ == "__main__":
+    main()
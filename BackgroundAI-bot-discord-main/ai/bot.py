@@ -1,16 +1,51 @@
 import os
-import re
+import io
 import asyncio
 import sys
 import logging
 import shutil
 import contextlib
-from typing import Dict, Tuple, List
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, List, Optional, Sequence
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+if __package__ in (None, ""):
+    # Running as `python bot.py` from inside ai/ (see README): make the package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.cache import AnswerCache, answer_cache_key
+from ai.cancellation import ActiveRequests, RequestCancelled
+from ai.checkpoints import DraftCheckpoints
+from ai.channels import AIChannelRegistry
+from ai.cleaning import StreamCleaner, clean_ai_output, split_discord_message
+from ai.conversation import ConversationStore, History, Turn
+from ai.degradation import DEFAULT_THRESHOLDS, DEFAULT_TIERS, DegradationController, Tier, apply_tier
+from ai.inventory import ModelInventory
+from ai.metrics import MetricsRegistry, MetricsServer
+from ai.hostpool import OllamaHostPool, parse_hosts
+from ai.ollama_client import OllamaClient
+from ai.outbound import OutboundSender
+from ai.profiling import LoopWatchdog, Tracer, add_span, format_trace, span
+from ai.processes import NEW_PROCESS_GROUP, kill_process_tree
+from ai.pipeline import (
+    DEFAULT_MODELS, DEFAULT_PERSONA, DEFAULT_SUMMARIZER_MODEL, MergeStats, Pipeline, PipelineConfig,
+    PipelineResult, ProgressCallback, build_prompt,
+)
+from ai.quota import QuotaStore, SharedQuotaStore
+from ai.router import DEFAULT_COMPLEX_KEYWORDS, FULL_ROUTE, QuestionRouter, Route, apply_route
+from ai.ratelimit import Limit, RateLimiter, SharedWindowLimit
+from ai.scheduler import FairScheduler, QueueFullError, QueuedCallback
+from ai.semantic_cache import SemanticCache, Vector, cache_namespace
+from ai.sharding import ShardSupervisor
+from ai.singleflight import SingleFlight
+from ai.state import StateError, create_state_backend
+from ai.streaming import DEFAULT_EDIT_INTERVAL_SEC, ProgressiveReply
+from ai.workers import OrchestratorPool
+
 # -------------------------
 # Config
 # -------------------------
@@ -29,18 +64,196 @@ def _get_positive_number_env(var_name: str, default, caster):
     return parsed
 
 
+def _get_non_negative_number_env(var_name: str, default, caster):
+    value = os.getenv(var_name)
+    if value is None:
+        return default
+    try:
+        parsed = caster(value)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"{var_name} must be a non-negative {caster.__name__}") from exc
+    if parsed < 0:
+        raise ValueError(f"{var_name} must not be negative")
+    return parsed
+
+
+def _get_bool_env(var_name: str, default: bool) -> bool:
+    value = os.getenv(var_name)
+    if value is None:
+        return default
+    value = value.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"{var_name} must be a boolean (1/0, true/false, yes/no, on/off)")
+
+
+def _get_weights_env(var_name: str) -> Dict[int, float]:
+    # "guild_id:weight,guild_id:weight"
+    weights: Dict[int, float] = {}
+    for item in (os.getenv(var_name) or "").split(","):
+        if not item.strip():
+            continue
+        try:
+            guild, weight = item.split(":", 1)
+            weights[int(guild)] = float(weight)
+        except ValueError as exc:
+            raise ValueError(f"{var_name} entries must look like <guild_id>:<weight>") from exc
+        if weights[int(guild)] <= 0:
+            raise ValueError(f"{var_name} weights must be positive")
+    return weights
+
+
+def _get_list_env(var_name: str, default) -> Tuple[str, ...]:
+    value = os.getenv(var_name)
+    if value is None:
+        return tuple(default)
+    items = tuple(item.strip() for item in value.split(",") if item.strip())
+    if not items:
+        raise ValueError(f"{var_name} must list at least one value")
+    return items
+
+
 AI_NAME = os.getenv("AI_NAME", "NightshadeAI")
 MAX_QUESTIONS_PER_SERVER = _get_positive_number_env("MAX_QUESTIONS_PER_SERVER", 400, int)
 AI_TIMEOUT_SEC = _get_positive_number_env("AI_TIMEOUT_SEC", 240, float)  # overall PS roundtrip timeout
-PER_USER_COOLDOWN_SEC = _get_positive_number_env("PER_USER_COOLDOWN_SEC", 4, float)  # simple flood control
+PER_USER_COOLDOWN_SEC = _get_positive_number_env("PER_USER_COOLDOWN_SEC", 4, float)  # one token per interval
+# Token-bucket flood control: bursts on top of the per-user cooldown, plus per-server and global ceilings
+RATE_LIMIT_USER_BURST = _get_positive_number_env("RATE_LIMIT_USER_BURST", 1, int)
+RATE_LIMIT_GUILD_PER_MIN = _get_non_negative_number_env("RATE_LIMIT_GUILD_PER_MIN", 30, float)  # 0 disables
+RATE_LIMIT_GUILD_BURST = _get_positive_number_env("RATE_LIMIT_GUILD_BURST", 10, int)
+RATE_LIMIT_GLOBAL_PER_MIN = _get_non_negative_number_env("RATE_LIMIT_GLOBAL_PER_MIN", 300, float)  # 0 disables
+RATE_LIMIT_GLOBAL_BURST = _get_positive_number_env("RATE_LIMIT_GLOBAL_BURST", 60, int)
 THINKING_MESSAGE = os.getenv("THINKING_MESSAGE", "⏳ Thinking…")
+
+# Backend: "http" talks to the Ollama API in-process, "pool" sends questions to warm
+# BackgroundAI_Bot.ps1 -Server workers, "powershell" spawns the script per question
+AI_BACKEND = os.getenv("AI_BACKEND", "http").strip().lower()
+if AI_BACKEND not in ("http", "pool", "powershell"):
+    raise ValueError("AI_BACKEND must be 'http', 'pool' or 'powershell'")
+AI_WORKER_POOL_SIZE = _get_positive_number_env("AI_WORKER_POOL_SIZE", 2, int)
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_MAX_CONNECTIONS = _get_positive_number_env("OLLAMA_MAX_CONNECTIONS", 8, int)
+# Several Ollama machines (http backend): JSON list of {"url", "models", "weight"}; replaces OLLAMA_HOST.
+# Each call goes to the least-loaded healthy host; failing hosts are ejected and probed back in
+OLLAMA_HOSTS = parse_hosts(os.environ["OLLAMA_HOSTS"]) if os.getenv("OLLAMA_HOSTS", "").strip() else []
+OLLAMA_HEALTH_CHECK_SEC = _get_non_negative_number_env("OLLAMA_HEALTH_CHECK_SEC", 10, float)  # 0 disables
+OLLAMA_BREAKER_FAILURES = _get_positive_number_env("OLLAMA_BREAKER_FAILURES", 3, int)
+OLLAMA_BREAKER_RESET_SEC = _get_positive_number_env("OLLAMA_BREAKER_RESET_SEC", 30, float)
+AI_MODELS = _get_list_env("AI_MODELS", DEFAULT_MODELS)
+AI_SUMMARIZER_MODEL = os.getenv("AI_SUMMARIZER_MODEL", DEFAULT_SUMMARIZER_MODEL)
+# Merges the same drafts again when the summarizer errors or times out (exit 4/5); empty = no second try
+AI_FALLBACK_SUMMARIZER_MODEL = os.getenv("AI_FALLBACK_SUMMARIZER_MODEL", "").strip() or None
+AI_TEMPERATURE = _get_non_negative_number_env("AI_TEMPERATURE", 0.2, float)
+AI_MAX_TOKENS = _get_positive_number_env("AI_MAX_TOKENS", 512, int)
+AI_MODEL_TIMEOUT_SEC = _get_positive_number_env("AI_MODEL_TIMEOUT_SEC", 120, int)  # per model, like -TimeoutSec
+AI_RETRIES = _get_non_negative_number_env("AI_RETRIES", 1, int)
+# Deadline-aware fan-out: the pipeline plans its stages to finish inside AI_TIMEOUT_SEC
+AI_MIN_DRAFTS = _get_non_negative_number_env("AI_MIN_DRAFTS", 0, int)  # merge after k drafts (0 = all models)
+AI_DRAFT_BUDGET_SHARE = _get_positive_number_env("AI_DRAFT_BUDGET_SHARE", 0.5, float)
+if AI_DRAFT_BUDGET_SHARE >= 1:
+    raise ValueError("AI_DRAFT_BUDGET_SHARE must be below 1 so the summarizer keeps some budget")
+AI_HEDGE_AFTER_SEC = _get_non_negative_number_env("AI_HEDGE_AFTER_SEC", 0, float)  # 0 disables hedging
+# Return the best draft directly when drafts overlap at least this much (above 1 always runs the summarizer)
+AI_SKIP_MERGE_SIMILARITY = _get_non_negative_number_env("AI_SKIP_MERGE_SIMILARITY", 0.7, float)
+# Headroom for process start-up and delivery, so the pipeline ends on its own before the outer timeout fires
+PIPELINE_DEADLINE_SEC = AI_TIMEOUT_SEC * 0.9
+# Startup model phase: check/pull the models once, warm each with a tiny generation, then keep them loaded
+# with keep-alive pings and refresh the cached model list in the background (the request path never lists)
+MODEL_WARMUP = _get_bool_env("MODEL_WARMUP", True)
+AI_AUTO_PULL = _get_bool_env("AI_AUTO_PULL", True)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m").strip() or None
+MODEL_INVENTORY_REFRESH_SEC = _get_positive_number_env("MODEL_INVENTORY_REFRESH_SEC", 300, float)
+MODEL_KEEPALIVE_PING_SEC = _get_non_negative_number_env("MODEL_KEEPALIVE_PING_SEC", 240, float)  # 0 disables
+NIGHTSHADE_PERSONA = os.getenv("NIGHTSHADE_PERSONA") or DEFAULT_PERSONA
+# Stream summarizer tokens into the placeholder message (HTTP backend only)
+AI_STREAMING = _get_bool_env("AI_STREAMING", True)
+STREAM_EDIT_INTERVAL_SEC = _get_positive_number_env("STREAM_EDIT_INTERVAL_SEC", DEFAULT_EDIT_INTERVAL_SEC, float)
+ANSWER_CACHE_SIZE = _get_non_negative_number_env("ANSWER_CACHE_SIZE", 512, int)  # 0 disables the cache
+ANSWER_CACHE_TTL_SEC = _get_positive_number_env("ANSWER_CACHE_TTL_SEC", 3600, float)
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB") or None  # optional SQLite file that survives restarts
+# Semantic answer cache: a question whose SEMANTIC_CACHE_MODEL embedding is at least SEMANTIC_CACHE_THRESHOLD
+# cosine-similar to an answered one ("password reset how?" vs "how do I reset my password") gets its answer
+SEMANTIC_CACHE = _get_bool_env("SEMANTIC_CACHE", False)
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "").strip() or "nomic-embed-text"
+SEMANTIC_CACHE_THRESHOLD = _get_positive_number_env("SEMANTIC_CACHE_THRESHOLD", 0.9, float)
+if SEMANTIC_CACHE_THRESHOLD > 1:
+    raise ValueError("SEMANTIC_CACHE_THRESHOLD is a cosine similarity and must be at most 1")
+SEMANTIC_CACHE_SIZE = _get_positive_number_env("SEMANTIC_CACHE_SIZE", 1024, int)
+# Drafts outlive a failed merge for a while, so retrying the question only re-runs the summarizer
+DRAFT_CHECKPOINT_SIZE = _get_non_negative_number_env("DRAFT_CHECKPOINT_SIZE", 256, int)  # 0 disables
+DRAFT_CHECKPOINT_TTL_SEC = _get_positive_number_env("DRAFT_CHECKPOINT_TTL_SEC", 300, float)
+# Global backend scheduling: concurrency cap sized to Ollama capacity, fair share across guilds
+AI_MAX_CONCURRENCY = _get_positive_number_env("AI_MAX_CONCURRENCY", 4, int)
+AI_MAX_QUEUE = _get_positive_number_env("AI_MAX_QUEUE", 100, int)
+AI_MAX_QUEUE_PER_GUILD = _get_positive_number_env("AI_MAX_QUEUE_PER_GUILD", 10, int)
+AI_GUILD_WEIGHTS = _get_weights_env("AI_GUILD_WEIGHTS")
+# Conversation memory per user and channel (HTTP backend only): a reply to one of the bot's answers is a follow-up
+# and sees the earlier turns; older turns are folded into a summary once the history passes
+# CONVERSATION_TOKEN_BUDGET estimated tokens (0 disables); idle sessions are forgotten
+CONVERSATION_TOKEN_BUDGET = _get_non_negative_number_env("CONVERSATION_TOKEN_BUDGET", 1024, int)
+CONVERSATION_MAX_SESSIONS = _get_positive_number_env("CONVERSATION_MAX_SESSIONS", 256, int)
+CONVERSATION_IDLE_SEC = _get_positive_number_env("CONVERSATION_IDLE_SEC", 1800, float)
+# Load-adaptive degradation: as pressure (queue depth per concurrency slot, or recent backend latency per
+# DEGRADE_LATENCY_TARGET_SEC) passes each threshold, run fewer models, then one model without the summarizer,
+# then shorter answers, then turn new questions away; tiers come back one at a time once pressure clears
+AI_DEGRADATION = _get_bool_env("AI_DEGRADATION", True)
+DEGRADE_THRESHOLDS = tuple(float(t) for t in _get_list_env("DEGRADE_THRESHOLDS", map(str, DEFAULT_THRESHOLDS)))
+DEGRADE_LATENCY_TARGET_SEC = _get_positive_number_env("DEGRADE_LATENCY_TARGET_SEC", AI_TIMEOUT_SEC / 2, float)
+DEGRADE_HOLD_SEC = _get_non_negative_number_env("DEGRADE_HOLD_SEC", 30, float)
+# Question router: short questions without code or "explain/compare/write..." keywords go to one fast model
+# without the merge pass; everything else keeps the full fan-out
+AI_ROUTER = _get_bool_env("AI_ROUTER", False)
+ROUTE_FAST_MODEL = os.getenv("ROUTE_FAST_MODEL", "").strip() or AI_MODELS[0]
+ROUTE_FAST_MAX_TOKENS = _get_positive_number_env("ROUTE_FAST_MAX_TOKENS", AI_MAX_TOKENS, int)
+ROUTE_FAST_MAX_WORDS = _get_positive_number_env("ROUTE_FAST_MAX_WORDS", 12, int)
+ROUTE_FAST_THRESHOLD = _get_positive_number_env("ROUTE_FAST_THRESHOLD", 0.5, float)
+if ROUTE_FAST_THRESHOLD > 1:
+    raise ValueError("ROUTE_FAST_THRESHOLD is a probability and must be at most 1")
+ROUTE_COMPLEX_KEYWORDS = _get_list_env("ROUTE_COMPLEX_KEYWORDS", DEFAULT_COMPLEX_KEYWORDS)
 
 DISCORD_MESSAGE_LIMIT = 2000
 MESSAGE_HEADER = f"🤖 {AI_NAME}:\n"
+# Outbound pacing: Discord allows 5 messages per 5s per channel; answers longer than
+# DISCORD_ATTACH_AFTER_CHUNKS messages are sent as one .md attachment instead (0 disables)
+DISCORD_CHANNEL_SENDS_PER_5S = _get_positive_number_env("DISCORD_CHANNEL_SENDS_PER_5S", 5, int)
+DISCORD_GLOBAL_SENDS_PER_SEC = _get_non_negative_number_env("DISCORD_GLOBAL_SENDS_PER_SEC", 50, float)  # 0 disables
+DISCORD_ATTACH_AFTER_CHUNKS = _get_non_negative_number_env("DISCORD_ATTACH_AFTER_CHUNKS", 4, int)
+OUTPUT_READ_BYTES = 64 * 1024  # PowerShell stdout is cleaned in chunks of this size as it arrives
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 POWERSHELL_SCRIPT = os.path.join(SCRIPT_DIR, "BackgroundAI_Bot.ps1")
 
+# Question quotas survive restarts in SQLite (set QUOTA_DB to an empty string to keep them in memory only)
+QUOTA_DB = os.getenv("QUOTA_DB", os.path.join(SCRIPT_DIR, "nightshade_state.sqlite3")) or None
+QUOTA_WINDOW_SEC = _get_non_negative_number_env("QUOTA_WINDOW_SEC", 0, float)  # e.g. 86400 = daily reset; 0 = never
+QUOTA_FLUSH_INTERVAL_SEC = _get_positive_number_env("QUOTA_FLUSH_INTERVAL_SEC", 2, float)
+
+# Sharded mode: BOT_SHARD_COUNT gateway shards spread over BOT_PROCESSES child processes
+BOT_SHARD_COUNT = _get_non_negative_number_env("BOT_SHARD_COUNT", 0, int)  # 0 = one unsharded connection
+BOT_PROCESSES = _get_positive_number_env("BOT_PROCESSES", 1, int)
+BOT_SHARD_IDS = tuple(int(i) for i in _get_list_env("BOT_SHARD_IDS", ()))  # set by the supervisor per child
+if BOT_SHARD_IDS and (not BOT_SHARD_COUNT or max(BOT_SHARD_IDS) >= BOT_SHARD_COUNT):
+    raise ValueError("BOT_SHARD_IDS must be below BOT_SHARD_COUNT")
+# Quotas, the global rate limit and cached answers shared by every process:
+# memory://, sqlite:///path/to/state.sqlite3 or redis://host:port/db (empty = per-process state)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "").strip()
+
+# Prometheus text endpoint; bound to localhost by default since it is unauthenticated
+METRICS_PORT = _get_non_negative_number_env("METRICS_PORT", 0, int)  # 0 = no endpoint (/aiinfo still summarizes)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Profiling: a watchdog thread logs the loop's stack when a callback blocks it for LOOP_STALL_THRESHOLD_SEC, and a
+# TRACE_SAMPLE_RATE share of questions is traced stage by stage; traces slower than TRACE_SLOW_SEC are kept for
+# /aitraces and appended to TRACE_FILE as JSON lines (rotated at TRACE_FILE_MAX_BYTES, 3 old files kept)
+LOOP_STALL_THRESHOLD_SEC = _get_non_negative_number_env("LOOP_STALL_THRESHOLD_SEC", 0.25, float)  # 0 disables
+TRACE_SAMPLE_RATE = _get_non_negative_number_env("TRACE_SAMPLE_RATE", 0.1, float)  # 0 disables tracing
+TRACE_SLOW_SEC = _get_non_negative_number_env("TRACE_SLOW_SEC", 30, float)
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(SCRIPT_DIR, "nightshade_traces.jsonl")) or None
+TRACE_FILE_MAX_BYTES = _get_positive_number_env("TRACE_FILE_MAX_BYTES", 1_000_000, int)
+TRACES_SHOWN = 5  # newest slow traces listed by /aitraces
+
 TOKEN = os.getenv("DISCORD_TOKEN")
 if not TOKEN:
     print("❌ DISCORD_TOKEN env var not set.", file=sys.stderr)
@@ -63,42 +276,228 @@ intents.messages = True
 intents.message_content = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-server_question_count: Dict[int, int] = {}
-guild_locks: Dict[int, asyncio.Lock] = {}
-last_user_ask_at: Dict[Tuple[int, int], float] = {}  # (guild_id, user_id) -> ts
+if BOT_SHARD_COUNT:
+    # Without BOT_SHARD_IDS a single process runs every shard
+    bot = commands.AutoShardedBot(
+        command_prefix="!", intents=intents, shard_count=BOT_SHARD_COUNT, shard_ids=list(BOT_SHARD_IDS) or None
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents)
+state_backend = create_state_backend(STATE_BACKEND) if STATE_BACKEND else None
+if state_backend is not None:
+    quota_store = SharedQuotaStore(MAX_QUESTIONS_PER_SERVER, state_backend, window_sec=QUOTA_WINDOW_SEC)
+else:
+    quota_store = QuotaStore(
+        MAX_QUESTIONS_PER_SERVER,
+        sqlite_path=QUOTA_DB,
+        window_sec=QUOTA_WINDOW_SEC,
+        flush_interval=QUOTA_FLUSH_INTERVAL_SEC,
+    )
+# Per-user and per-guild buckets stay in-process: a guild's messages always arrive on the same shard.
+# Only the global ceiling spans shards; without a shared backend each process gets its slice of it.
+GLOBAL_LIMIT = Limit.per_minute(RATE_LIMIT_GLOBAL_PER_MIN, RATE_LIMIT_GLOBAL_BURST) if RATE_LIMIT_GLOBAL_PER_MIN else None
+if GLOBAL_LIMIT is not None and BOT_SHARD_IDS and state_backend is None:
+    _shard_share = len(BOT_SHARD_IDS) / BOT_SHARD_COUNT
+    GLOBAL_LIMIT = Limit(GLOBAL_LIMIT.rate_per_sec * _shard_share, max(1, round(GLOBAL_LIMIT.burst * _shard_share)))
+shared_global_limit = (
+    SharedWindowLimit(state_backend, GLOBAL_LIMIT) if GLOBAL_LIMIT is not None and state_backend is not None else None
+)
+rate_limiter = RateLimiter(
+    user=Limit(1 / PER_USER_COOLDOWN_SEC, RATE_LIMIT_USER_BURST),
+    guild=Limit.per_minute(RATE_LIMIT_GUILD_PER_MIN, RATE_LIMIT_GUILD_BURST) if RATE_LIMIT_GUILD_PER_MIN else None,
+    global_limit=GLOBAL_LIMIT if shared_global_limit is None else None,
+)
 
 # -------------------------
-# Utils
+# Metrics
 # -------------------------
-BRAILLE_RE = re.compile(r'[\u2800-\u28FF]')
-ANSI_RE = re.compile(r'\x1B[@-_][0-?]*[ -/]*[@-~]')
-PERSONA_TAG_RE = re.compile(r'(?im)^\s*NightshadeAI:\s*')
-
-def clean_ai_output(text: str, remove_persona_tag: bool = True) -> str:
-    if not text:
-        return ""
-    text = BRAILLE_RE.sub('', text)
-    text = ANSI_RE.sub('', text)
-    if remove_persona_tag:
-        text = PERSONA_TAG_RE.sub('', text)
-    text = re.sub(r'(\r?\n){3,}', '\n\n', text)
-    return text.strip()
-
-def split_discord_message(text: str, limit: int = 2000) -> List[str]:
-    chunks = []
-    while len(text) > limit:
-        split_pos = text.rfind('\n', 0, limit)
-        if split_pos == -1:
-            split_pos = text.rfind(' ', 0, limit)
-        if split_pos == -1:
-            split_pos = limit
-        chunks.append(text[:split_pos].strip())
-        text = text[split_pos:].strip()
-    if text:
-        chunks.append(text)
-    return chunks
+# BackgroundAI_Bot.ps1 exit codes 0-6, plus 124 (timeout) and 127 (PowerShell missing) from the bot itself
+KNOWN_EXIT_CODES = (0, 1, 2, 3, 4, 5, 6, 124, 127)
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    "nightshade_stage_seconds", "Seconds spent in each request stage.", labels=("stage",)
+)
+DRAFT_SECONDS = metrics.histogram("nightshade_draft_seconds", "Seconds per base-model draft.", labels=("model",))
+DISCORD_SECONDS = metrics.histogram(
+    "nightshade_discord_request_seconds", "Seconds per Discord API call.", labels=("operation",)
+)
+REQUESTS_TOTAL = metrics.counter("nightshade_requests_total", "Backend runs by exit code.", labels=("exit_code",))
+ROUTE_SECONDS = metrics.histogram(
+    "nightshade_route_seconds", "Backend seconds per question by router route.", labels=("route",)
+)
+for _code in KNOWN_EXIT_CODES:
+    REQUESTS_TOTAL.inc(0, exit_code=_code)
+metrics.gauge("nightshade_queue_depth", "Questions waiting for a backend slot.", lambda: request_scheduler.queue_depth)
+metrics.gauge("nightshade_in_flight", "Backend runs in progress.", lambda: request_scheduler.in_flight)
+metrics.gauge("nightshade_outbound_queue_depth", "Discord messages waiting to be sent.", lambda: outbound.queue_depth)
+metrics.gauge(
+    "nightshade_degradation_tier", "Service tier in use (0 = full service).",
+    lambda: degradation.level if degradation is not None else 0,
+)
+# Shard processes each listen on their own port: METRICS_PORT + process index (its first shard id)
+metrics_server = MetricsServer(
+    metrics, METRICS_HOST, METRICS_PORT + (BOT_SHARD_IDS[0] if BOT_SHARD_IDS else 0)
+) if METRICS_PORT else None
+loop_watchdog = LoopWatchdog(LOOP_STALL_THRESHOLD_SEC) if LOOP_STALL_THRESHOLD_SEC else None
+metrics.gauge(
+    "nightshade_event_loop_stalls", "Times the event loop was blocked past LOOP_STALL_THRESHOLD_SEC.",
+    lambda: loop_watchdog.stalls if loop_watchdog is not None else 0,
+)
+metrics.gauge(
+    "nightshade_event_loop_max_lag_seconds", "Longest event-loop stall seen.",
+    lambda: loop_watchdog.max_lag_sec if loop_watchdog is not None else 0,
+)
+# Shard processes write their own trace file: nightshade_traces.<first shard id>.jsonl
+tracer = Tracer(
+    TRACE_SAMPLE_RATE,
+    TRACE_SLOW_SEC,
+    path=(f"{os.path.splitext(TRACE_FILE)[0]}.{BOT_SHARD_IDS[0]}{os.path.splitext(TRACE_FILE)[1]}"
+          if TRACE_FILE and BOT_SHARD_IDS else TRACE_FILE),
+    max_bytes=TRACE_FILE_MAX_BYTES,
+)
+
+PIPELINE_CONFIG = PipelineConfig(
+    models=AI_MODELS,
+    summarizer_model=AI_SUMMARIZER_MODEL,
+    fallback_summarizer_model=AI_FALLBACK_SUMMARIZER_MODEL,
+    temperature=AI_TEMPERATURE,
+    max_tokens=AI_MAX_TOKENS,
+    timeout_sec=AI_MODEL_TIMEOUT_SEC,
+    retries=AI_RETRIES,
+    persona=NIGHTSHADE_PERSONA,
+    deadline_sec=PIPELINE_DEADLINE_SEC,
+    draft_budget_share=AI_DRAFT_BUDGET_SHARE,
+    min_drafts=AI_MIN_DRAFTS,
+    hedge_after_sec=AI_HEDGE_AFTER_SEC or None,
+    skip_merge_similarity=AI_SKIP_MERGE_SIMILARITY,
+    keep_alive=OLLAMA_KEEP_ALIVE,
+)
+ollama_hosts = OllamaHostPool(
+    OLLAMA_HOSTS,
+    max_connections=OLLAMA_MAX_CONNECTIONS,
+    health_interval_sec=OLLAMA_HEALTH_CHECK_SEC,
+    breaker_failures=OLLAMA_BREAKER_FAILURES,
+    breaker_reset_sec=OLLAMA_BREAKER_RESET_SEC,
+) if OLLAMA_HOSTS else None
+ollama_client = ollama_hosts or OllamaClient(OLLAMA_HOST, max_connections=OLLAMA_MAX_CONNECTIONS)
+draft_checkpoints = DraftCheckpoints(
+    DRAFT_CHECKPOINT_SIZE, DRAFT_CHECKPOINT_TTL_SEC
+) if DRAFT_CHECKPOINT_SIZE else None
+metrics.gauge(
+    "nightshade_draft_checkpoints", "Drafts kept for resuming a failed merge.",
+    lambda: len(draft_checkpoints) if draft_checkpoints is not None else 0,
+)
+metrics.gauge(
+    "nightshade_drafts_resumed", "Drafts taken from a checkpoint instead of running the model again.",
+    lambda: draft_checkpoints.resumed if draft_checkpoints is not None else 0,
+)
+ai_pipeline = Pipeline(ollama_client, PIPELINE_CONFIG, draft_checkpoints)
+degradation = DegradationController(
+    DEFAULT_TIERS,
+    DEGRADE_THRESHOLDS,
+    latency_target_sec=DEGRADE_LATENCY_TARGET_SEC,
+    hold_sec=DEGRADE_HOLD_SEC,
+) if AI_DEGRADATION else None
+# One pipeline per reduced tier; the full tier keeps ai_pipeline
+tier_pipelines = {
+    tier.name: Pipeline(ollama_client, apply_tier(PIPELINE_CONFIG, tier), draft_checkpoints)
+    for tier in DEFAULT_TIERS[1:]
+} if degradation is not None else {}
+question_router = QuestionRouter(
+    Route("fast", (ROUTE_FAST_MODEL,), summarize=False, max_tokens=ROUTE_FAST_MAX_TOKENS),
+    max_words=ROUTE_FAST_MAX_WORDS,
+    keywords=ROUTE_COMPLEX_KEYWORDS,
+    threshold=ROUTE_FAST_THRESHOLD,
+) if AI_ROUTER else None
+# (route, tier) -> pipeline for the routes other than full; a degraded tier still applies on top of a route
+route_pipelines = {
+    (route.name, tier.name): Pipeline(ollama_client, apply_tier(apply_route(PIPELINE_CONFIG, route), tier),
+                                      draft_checkpoints)
+    for route in question_router.routes if route is not FULL_ROUTE
+    for tier in (DEFAULT_TIERS if degradation is not None else DEFAULT_TIERS[:1])
+} if question_router is not None else {}
+# One inventory per machine, so every host that may serve a model has it pulled and loaded
+_served_models = AI_MODELS + (AI_SUMMARIZER_MODEL,) + (
+    (AI_FALLBACK_SUMMARIZER_MODEL,) if AI_FALLBACK_SUMMARIZER_MODEL else ()
+) + ((ROUTE_FAST_MODEL,) if question_router is not None else ())
+_embedding_models = (SEMANTIC_CACHE_MODEL,) if SEMANTIC_CACHE else ()
+model_inventories = [
+    ModelInventory(
+        client,
+        models,
+        embedding_models=embedding_models,
+        auto_pull=AI_AUTO_PULL,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        refresh_sec=MODEL_INVENTORY_REFRESH_SEC,
+        ping_sec=MODEL_KEEPALIVE_PING_SEC,
+    )
+    for client, models, embedding_models in (
+        [(h.client, [m for m in _served_models if h.serves(m)], [m for m in _embedding_models if h.serves(m)])
+         for h in ollama_hosts.hosts]
+        if ollama_hosts is not None else [(ollama_client, _served_models, _embedding_models)]
+    )
+] if MODEL_WARMUP else []
+orchestrator_pool = OrchestratorPool(
+    lambda: powershell_server_args(),
+    size=AI_WORKER_POOL_SIZE,
+    request_timeout=AI_TIMEOUT_SEC,
+    on_spawn=lambda seconds: STAGE_SECONDS.observe(seconds, stage="spawn"),
+)
+answer_cache = AnswerCache(
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SEC, sqlite_path=ANSWER_CACHE_DB, backend=state_backend
+) if ANSWER_CACHE_SIZE else None
+semantic_cache = SemanticCache(
+    lambda text: ollama_client.embed(SEMANTIC_CACHE_MODEL, text, keep_alive=OLLAMA_KEEP_ALIVE),
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    max_entries=SEMANTIC_CACHE_SIZE,
+    ttl_sec=ANSWER_CACHE_TTL_SEC,
+) if SEMANTIC_CACHE else None
+metrics.gauge(
+    "nightshade_semantic_cache_entries", "Answers kept by the semantic cache.",
+    lambda: len(semantic_cache) if semantic_cache is not None else 0,
+)
+metrics.gauge(
+    "nightshade_semantic_cache_hits", "Questions answered from a paraphrase in the semantic cache.",
+    lambda: semantic_cache.hits if semantic_cache is not None else 0,
+)
+metrics.gauge(
+    "nightshade_semantic_cache_misses", "Semantic cache lookups without a close enough answer.",
+    lambda: semantic_cache.misses if semantic_cache is not None else 0,
+)
+metrics.gauge(
+    "nightshade_semantic_cache_errors", "Questions the embedding model could not embed.",
+    lambda: semantic_cache.errors if semantic_cache is not None else 0,
+)
+inflight_questions = SingleFlight()  # identical concurrent questions share one backend run
+active_requests = ActiveRequests()  # question message id -> its answer, cancelled on delete or a newer question
+ai_channels = AIChannelRegistry()  # guild -> ids of #ai channels; replaces a channel scan per message
+merge_stats = MergeStats()  # summarizer runs vs. skips, for tuning AI_SKIP_MERGE_SIMILARITY
+request_scheduler = FairScheduler(
+    AI_MAX_CONCURRENCY,
+    max_queue=AI_MAX_QUEUE,
+    max_queue_per_guild=AI_MAX_QUEUE_PER_GUILD,
+    weights=AI_GUILD_WEIGHTS,
+)
+# The global send budget belongs to the bot token, so each shard process gets its slice of it
+_sends_per_sec = DISCORD_GLOBAL_SENDS_PER_SEC * (len(BOT_SHARD_IDS) / BOT_SHARD_COUNT if BOT_SHARD_IDS else 1)
+outbound = OutboundSender(
+    channel_limit=Limit(DISCORD_CHANNEL_SENDS_PER_5S / 5, DISCORD_CHANNEL_SENDS_PER_5S),
+    global_limit=Limit(_sends_per_sec, max(1, _sends_per_sec)) if _sends_per_sec else None,
+    attach_after_chunks=DISCORD_ATTACH_AFTER_CHUNKS,
+    make_file=lambda data, filename: discord.File(io.BytesIO(data), filename=filename),
+    on_api_call=lambda operation, seconds: DISCORD_SECONDS.observe(seconds, operation=operation),
+)
+conversations = ConversationStore(
+    CONVERSATION_TOKEN_BUDGET,
+    max_sessions=CONVERSATION_MAX_SESSIONS,
+    idle_sec=CONVERSATION_IDLE_SEC,
+    summarize=lambda summary, turns: compact_conversation(summary, turns),
+) if CONVERSATION_TOKEN_BUDGET and AI_BACKEND == "http" else None
 
+# -------------------------
+# Utils
+# -------------------------
 def powershell_prefix() -> List[str]:
     # Prefer pwsh (Core) if present; fallback to Windows PowerShell
     for exe in ("pwsh", "powershell"):
@@ -109,33 +508,360 @@ def powershell_prefix() -> List[str]:
 def mentions_none() -> discord.AllowedMentions:
     return discord.AllowedMentions.none()
 
-async def ask_ai_async(question: str) -> Tuple[str, int]:
+NO_RESPONSE_MESSAGE = "⚠️ AI returned no response."
+
+def clean_response(raw: str) -> str:
+    with STAGE_SECONDS.time(stage="cleaning"), span("cleaning"):
+        cleaned = clean_ai_output(raw)
+    return cleaned or NO_RESPONSE_MESSAGE
+
+def record_pipeline_result(result: PipelineResult) -> None:
+    merge_stats.record(result)
+    for name, seconds in result.timings.items():
+        if name.startswith("draft:"):
+            DRAFT_SECONDS.observe(seconds, model=name[len("draft:"):])
+            add_span(name, seconds)
+        elif name in ("drafts", "summarizer", "fallback_summarizer", "total"):
+            STAGE_SECONDS.observe(seconds, stage=name)
+            if name != "total":
+                add_span(name, seconds)
+
+def record_exit_code(exit_code: int) -> None:
+    REQUESTS_TOTAL.inc(exit_code=exit_code if exit_code in KNOWN_EXIT_CODES else "other")
+
+def observe_discord_call(operation: str, seconds: float) -> None:
+    DISCORD_SECONDS.observe(seconds, operation=operation)
+
+async def discord_call(operation: str, call):
+    started = time.perf_counter()
+    try:
+        with span(f"discord:{operation}"):
+            return await call
+    finally:
+        observe_discord_call(operation, time.perf_counter() - started)
+
+def latency_summary() -> str:
+    # p50/p95 per stage, estimated from histogram buckets like PromQL's histogram_quantile()
+    parts = []
+    for label, histogram, labels in (
+        ("queue", STAGE_SECONDS, {"stage": "queue_wait"}),
+        ("drafts", STAGE_SECONDS, {"stage": "drafts"}),
+        ("summarizer", STAGE_SECONDS, {"stage": "summarizer"}),
+        ("cleaning", STAGE_SECONDS, {"stage": "cleaning"}),
+        ("Discord send", DISCORD_SECONDS, {"operation": "send"}),
+    ):
+        if histogram.count(**labels):
+            p50, p95 = histogram.quantile(0.5, **labels), histogram.quantile(0.95, **labels)
+            parts.append(f"{label} {p50:.2f}/{p95:.2f}s")
+    return " · ".join(parts)
+
+def exit_code_summary() -> str:
+    counts = sorted(
+        ((labels[0], int(count)) for labels, count in REQUESTS_TOTAL.values().items() if count),
+        key=lambda item: (not item[0].isdigit(), int(item[0]) if item[0].isdigit() else 0),
+    )
+    return ", ".join(f"{code}×{count}" for code, count in counts)
+
+def model_status(inventory: ModelInventory) -> str:
+    if not inventory.ready:
+        return "loading…"
+    parts = []
+    for model in inventory.models:
+        if model in inventory.warmup_sec:
+            parts.append(f"{model} ✅ (warm-up {inventory.warmup_sec[model]:.1f}s)")
+        else:
+            parts.append(f"{model} ⚠️ ({inventory.errors.get(model, 'not available')})")
+    return ", ".join(parts)
+
+def host_status() -> str:
+    parts = []
+    for host in ollama_hosts.hosts:
+        latency = f", {host.latency_sec:.1f}s avg" if host.latency_sec is not None else ""
+        if host.breaker.state == "closed":
+            parts.append(f"{host.url} ✅ ({host.outstanding} in flight{latency})")
+        else:
+            parts.append(f"{host.url} ⛔ ({host.breaker.state}, retry in {host.breaker.retry_in():.0f}s)")
+    return ", ".join(parts)
+
+def current_tier() -> Tier:
+    # Re-evaluated when a question arrives and when its backend run starts, so no timer is needed
+    if degradation is None:
+        return DEFAULT_TIERS[0]
+    return degradation.update(request_scheduler.queue_depth, request_scheduler.max_concurrency)
+
+def route_for(question: str) -> Route:
+    return question_router.route(question) if question_router is not None else FULL_ROUTE
+
+def pipeline_for(tier: Tier, route: Route = FULL_ROUTE) -> Pipeline:
+    return route_pipelines.get((route.name, tier.name)) or tier_pipelines.get(tier.name, ai_pipeline)
+
+def route_summary() -> str:
+    # Volume and p50 per route, and the backend time the fast route saved against the full route's mean
+    parts = []
+    for route in question_router.routes:
+        count = ROUTE_SECONDS.count(route=route.name)
+        p50 = ROUTE_SECONDS.quantile(0.5, route=route.name) if count else None
+        parts.append(f"{route.name} **{count}**" + (f" (p50 {p50:.1f}s)" if p50 is not None else ""))
+    fast, full = question_router.fast.name, question_router.full.name
+    if ROUTE_SECONDS.count(route=fast) and ROUTE_SECONDS.count(route=full):
+        fast_mean = ROUTE_SECONDS.sum(route=fast) / ROUTE_SECONDS.count(route=fast)
+        full_mean = ROUTE_SECONDS.sum(route=full) / ROUTE_SECONDS.count(route=full)
+        parts.append(f"≈{max(0.0, full_mean - fast_mean) * ROUTE_SECONDS.count(route=fast):.0f}s saved")
+    return ", ".join(parts)
+
+def pool_overrides(config: PipelineConfig) -> Dict[str, Any]:
+    # Per-request settings for the -Server loop; the full tier sends none
+    if config is PIPELINE_CONFIG:
+        return {}
+    return {
+        "models": list(config.models),
+        "max_tokens": config.max_tokens,
+        "retries": config.retries,
+        "skip_merge_similarity": config.skip_merge_similarity,
+    }
+
+def _powershell_settings_args(config: PipelineConfig = PIPELINE_CONFIG) -> List[str]:
+    return [
+        "-Models", ",".join(config.models),
+        "-SummarizerModel", AI_SUMMARIZER_MODEL,
+        "-Temperature", str(AI_TEMPERATURE),
+        "-MaxTokens", str(config.max_tokens),
+        "-TimeoutSec", str(AI_MODEL_TIMEOUT_SEC),
+        "-Retries", str(config.retries),
+        "-DeadlineSec", str(max(1, int(PIPELINE_DEADLINE_SEC))),
+        "-DraftBudgetShare", str(AI_DRAFT_BUDGET_SHARE),
+        "-MinDrafts", str(AI_MIN_DRAFTS),
+        "-SkipMergeSimilarity", str(config.skip_merge_similarity),
+    ] + (["-FallbackSummarizerModel", AI_FALLBACK_SUMMARIZER_MODEL] if AI_FALLBACK_SUMMARIZER_MODEL else []) + (
+        ["-KeepAlive", OLLAMA_KEEP_ALIVE] if OLLAMA_KEEP_ALIVE else []
+    ) + (
+        # The bot already keeps the models pulled and warm, so the script must not list them per question
+        ["-SkipModelCheck"] if model_inventories else []
+    ) + ([] if AI_AUTO_PULL else ["-NoAutoPull"])
+
+def powershell_args(question: str, config: PipelineConfig = PIPELINE_CONFIG) -> List[str]:
+    return powershell_prefix() + ["-File", POWERSHELL_SCRIPT, "-Prompt", question] + _powershell_settings_args(config)
+
+def powershell_server_args() -> List[str]:
+    return powershell_prefix() + ["-File", POWERSHELL_SCRIPT, "-Server"] + _powershell_settings_args()
+
+def streaming_enabled() -> bool:
+    return AI_STREAMING and AI_BACKEND == "http"
+
+def question_cache_key(question: str) -> str:
+    return answer_cache_key(
+        question,
+        persona=NIGHTSHADE_PERSONA,
+        models=AI_MODELS,
+        summarizer_model=AI_SUMMARIZER_MODEL,
+        temperature=AI_TEMPERATURE,
+        max_tokens=AI_MAX_TOKENS,
+        route=route_for(question).name,
+    )
+
+def semantic_cache_namespace(route: Route = FULL_ROUTE) -> str:
+    return cache_namespace(
+        persona=NIGHTSHADE_PERSONA,
+        models=AI_MODELS,
+        summarizer_model=AI_SUMMARIZER_MODEL,
+        temperature=AI_TEMPERATURE,
+        max_tokens=AI_MAX_TOKENS,
+        embedding_model=SEMANTIC_CACHE_MODEL,
+        route=route.name,
+    )
+
+async def ask_ai_async(question: str, on_progress: Optional[ProgressCallback] = None, *, guild_id: int = 0,
+                       on_queued: Optional[QueuedCallback] = None,
+                       conversation_id: Optional[Hashable] = None, follow_up: bool = False) -> Tuple[str, int]:
+    # Raises QueueFullError when the scheduler cannot take more work
+    history = None
+    if conversations is not None and conversation_id is not None:
+        history = conversations.history(conversation_id)
+    if history and follow_up:
+        # A follow-up depends on the earlier turns, so it is neither cached nor coalesced
+        response, exit_code, _ = await _run_in_slot(
+            guild_id, on_queued, lambda: ask_ai_http(question, on_progress, history), route_for(question)
+        )
+        return (response, exit_code)
+    key = question_cache_key(question)
+    response = None
+    embedding = None
+    if answer_cache is not None:
+        with span("cache_lookup"):
+            response = await answer_cache.get(key)
+    if response is None and semantic_cache is not None:
+        # Only exact misses pay for an embedding
+        with span("semantic_lookup"):
+            embedding = await semantic_cache.embed(question)
+            hit = await semantic_cache.get(semantic_cache_namespace(route_for(question)), embedding)
+        if hit is not None:
+            log.info("Semantic cache hit (%.2f similar to a cached question)", hit.similarity)
+            response = hit.answer
+    if response is not None:
+        exit_code = 0
+    else:
+        response, exit_code = await inflight_questions.do(
+            key, lambda progress: _ask_and_cache(key, question, progress, guild_id, on_queued, embedding),
+            on_progress,
+        )
+    if history is not None and exit_code == 0:
+        conversations.record(history, question, response)
+    return (response, exit_code)
+
+async def _run_in_slot(guild_id: int, on_queued: Optional[QueuedCallback],
+                       run: Callable[[], Awaitable[Tuple[str, int]]],
+                       route: Route = FULL_ROUTE) -> Tuple[str, int, Tier]:
+    # Also returns the tier the backend ran at
+    tier = current_tier()
+    if tier.reject:
+        # Shed load before queueing; cache hits and coalesced waiters are still answered
+        raise QueueFullError(f"Service tier '{tier.name}' turns new questions away")
+    queued_at = time.perf_counter()
+    async with request_scheduler.slot(guild_id, on_queued):
+        STAGE_SECONDS.observe(time.perf_counter() - queued_at, stage="queue_wait")
+        add_span("queue_wait", time.perf_counter() - queued_at)
+        started = time.perf_counter()
+        # Read again after the wait: the backends pick their pipeline from this same tier before their first await
+        tier = current_tier()
+        with span("backend", backend=AI_BACKEND, tier=tier.name, route=route.name):
+            response, exit_code = await run()
+        ROUTE_SECONDS.observe(time.perf_counter() - started, route=route.name)
+        if degradation is not None:
+            degradation.observe_latency(time.perf_counter() - started)
+    record_exit_code(exit_code)
+    return (response, exit_code, tier)
+
+async def _ask_and_cache(key: str, question: str, on_progress: Optional[ProgressCallback], guild_id: int,
+                         on_queued: Optional[QueuedCallback], embedding: Optional[Vector] = None) -> Tuple[str, int]:
+    # Only the single-flight leader takes a backend slot; cache hits and coalesced waiters never queue
+    response, exit_code, tier = await _run_in_slot(
+        guild_id, on_queued, lambda: ask_backend(question, on_progress), route_for(question)
+    )
+    # Failures (timeouts, missing drafts, ...) are worth retrying, so only clean answers are kept; answers from a
+    # reduced tier would outlive the load that caused them, so only full-service answers are cached
+    cacheable = exit_code == 0 and tier is DEFAULT_TIERS[0]
+    if cacheable and answer_cache is not None:
+        await answer_cache.put(key, response)
+    if cacheable and semantic_cache is not None:
+        await semantic_cache.put(semantic_cache_namespace(route_for(question)), question, embedding, response)
+    return (response, exit_code)
+
+async def ask_backend(question: str, on_progress: Optional[ProgressCallback] = None) -> Tuple[str, int]:
+    if AI_BACKEND == "powershell":
+        return await ask_ai_powershell(question)
+    if AI_BACKEND == "pool":
+        return await ask_ai_pool(question)
+    return await ask_ai_http(question, on_progress)
+
+def pool_checkpoint_keys(question: str, pipe: Pipeline) -> Dict[str, str]:
+    # The script builds the same persona prompt, so its drafts share the HTTP pipeline's checkpoint keys
+    prompt = build_prompt(pipe.config.persona, question)
+    return pipe.checkpoint_keys({model: (prompt, None) for model in dict.fromkeys(pipe.config.models)})
+
+async def ask_ai_pool(question: str) -> Tuple[str, int]:
     if not os.path.isfile(POWERSHELL_SCRIPT):
         return ("⚠️ AI backend script is missing.", 1)
+    pipe = pipeline_for(current_tier(), route_for(question))
+    overrides = pool_overrides(pipe.config)
+    keys = pool_checkpoint_keys(question, pipe) if draft_checkpoints is not None else {}
+    saved = draft_checkpoints.restore(keys) if keys else {}
+    if saved:
+        # The worker only runs the models without a draft, then merges
+        log.info("Resuming from %d checkpointed draft(s): %s", len(saved), ", ".join(saved))
+        overrides["drafts"] = {model: checkpoint.draft for model, checkpoint in saved.items()}
+    try:
+        result = await orchestrator_pool.run(question, **overrides)
+    except asyncio.TimeoutError:
+        log.warning("AI timed out after %ss; orchestrator worker will be restarted.", AI_TIMEOUT_SEC)
+        return (f"⚠️ AI timed out after {AI_TIMEOUT_SEC}s. Try again with a shorter question.", 124)
+    except FileNotFoundError:
+        return ("❌ PowerShell (pwsh/powershell) not found. Install PowerShell 7 or fix PATH.", 127)
+    except Exception:
+        log.exception("Error calling AI")
+        return ("⚠️ Error calling AI. Please try again later.", 1)
 
-    args = powershell_prefix() + ["-File", POWERSHELL_SCRIPT, "-Prompt", question]
+    if keys:
+        if result.exit_code == 0:
+            draft_checkpoints.forget(keys)
+        else:
+            for model, draft in result.drafts_by_model.items():
+                if model in keys:
+                    draft_checkpoints.put(keys[model], draft)
+    record_pipeline_result(result)
+    return (clean_response(result.answer), result.exit_code)
 
+async def ask_ai_http(question: str, on_progress: Optional[ProgressCallback] = None,
+                      history: Optional[History] = None) -> Tuple[str, int]:
     try:
-        proc = await asyncio.create_subprocess_exec(
-            *args,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT,
+        result = await asyncio.wait_for(
+            pipeline_for(current_tier(), route_for(question)).run(question, on_progress, history=history),
+            timeout=AI_TIMEOUT_SEC,
         )
+    except asyncio.TimeoutError:
+        log.warning("AI timed out after %ss; abandoning Ollama requests.", AI_TIMEOUT_SEC)
+        return (f"⚠️ AI timed out after {AI_TIMEOUT_SEC}s. Try again with a shorter question.", 124)
+    except Exception:
+        log.exception("Error calling AI")
+        return ("⚠️ Error calling AI. Please try again later.", 1)
+
+    record_pipeline_result(result)
+    response = clean_response(result.answer)
+    if history is not None and result.exit_code == 0:
+        conversations.record(history, question, response, result.contexts)
+    return (response, result.exit_code)
+
+async def compact_conversation(summary: str, turns: Sequence[Turn]) -> str:
+    # Runs in the background but still competes for Ollama, so it waits for a slot like a question
+    async with request_scheduler.slot(0):
+        return await ai_pipeline.compact_history(summary, turns, max(64, CONVERSATION_TOKEN_BUDGET // 4))
+
+async def ask_ai_powershell(question: str) -> Tuple[str, int]:
+    if not os.path.isfile(POWERSHELL_SCRIPT):
+        return ("⚠️ AI backend script is missing.", 1)
+
+    args = powershell_args(question, pipeline_for(current_tier(), route_for(question)).config)
+
+    try:
+        with STAGE_SECONDS.time(stage="spawn"), span("spawn"):
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                **NEW_PROCESS_GROUP,
+            )
+        # Clean stdout as it arrives instead of buffering the whole run and cleaning it afterwards
+        cleaner = StreamCleaner()
+        cleaned: List[str] = []
+        cleaning_sec = 0.0
+
+        async def read_output() -> int:
+            nonlocal cleaning_sec
+            while True:
+                data = await proc.stdout.read(OUTPUT_READ_BYTES)
+                if not data:
+                    break
+                started = time.perf_counter()
+                cleaned.append(cleaner.feed(data))
+                cleaning_sec += time.perf_counter() - started
+            return await proc.wait()
+
         try:
-            stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=AI_TIMEOUT_SEC)
+            exit_code = await asyncio.wait_for(read_output(), timeout=AI_TIMEOUT_SEC)
         except asyncio.TimeoutError:
-            log.warning("AI timed out after %ss; terminating child process.", AI_TIMEOUT_SEC)
-            proc.kill()
-            with contextlib.suppress(ProcessLookupError):
-                await proc.wait()
+            log.warning("AI timed out after %ss; terminating the orchestrator and its children.", AI_TIMEOUT_SEC)
+            await kill_process_tree(proc)
             return (f"⚠️ AI timed out after {AI_TIMEOUT_SEC}s. Try again with a shorter question.", 124)
+        except asyncio.CancelledError:
+            # Abandoned question: the draft jobs and `ollama run` children go down with the script
+            await kill_process_tree(proc)
+            raise
 
-        exit_code = await proc.wait()
-        raw = (stdout or b"").decode("utf-8", errors="ignore")
-        cleaned = clean_ai_output(raw)
-        if not cleaned:
-            cleaned = "⚠️ AI returned no response."
-        return (cleaned, exit_code)
+        started = time.perf_counter()
+        cleaned.append(cleaner.finish())
+        cleaning_sec += time.perf_counter() - started
+        STAGE_SECONDS.observe(cleaning_sec, stage="cleaning")
+        add_span("cleaning", cleaning_sec)
+        return ("".join(cleaned) or NO_RESPONSE_MESSAGE, exit_code)
 
     except FileNotFoundError:
         return ("❌ PowerShell (pwsh/powershell) not found. Install PowerShell 7 or fix PATH.", 127)
@@ -143,13 +869,11 @@ async def ask_ai_async(question: str) -> Tuple[str, int]:
         log.exception("Error calling AI")
         return ("⚠️ Error calling AI. Please try again later.", 1)
 
-def is_cooldown_ok(guild_id: int, user_id: int, now: float) -> bool:
-    key = (guild_id, user_id)
-    last = last_user_ask_at.get(key, 0.0)
-    if now - last >= PER_USER_COOLDOWN_SEC:
-        last_user_ask_at[key] = now
-        return True
-    return False
+RATE_LIMIT_MESSAGES = {
+    "user": "⚠️ Slow down a bit—try again in ~{wait}s.",
+    "guild": "⚠️ This server is asking a lot right now—try again in ~{wait}s.",
+    "global": "⚠️ {name} is very busy right now—try again in ~{wait}s.",
+}
 
 # -------------------------
 # Slash commands
@@ -157,6 +881,21 @@ def is_cooldown_ok(guild_id: int, user_id: int, now: float) -> bool:
 @bot.event
 async def on_ready():
     log.info("%s is online!", AI_NAME)
+    for guild in bot.guilds:
+        ai_channels.index_guild(guild.id, guild.text_channels)
+    log.info("Indexed %d AI channel(s) across %d server(s).", len(ai_channels), len(bot.guilds))
+    if loop_watchdog is not None:
+        loop_watchdog.start()
+    if ollama_hosts is not None:
+        ollama_hosts.start()
+    for inventory in model_inventories:
+        inventory.start()  # runs in the background; questions are accepted while models load
+    if metrics_server is not None and not metrics_server.running:
+        try:
+            await metrics_server.start()
+            log.info("Metrics endpoint listening on %s", metrics_server.url)
+        except OSError as e:
+            log.error("Could not start the metrics endpoint: %s", e)
     try:
         await bot.tree.sync()
         log.info("Application commands synced.")
@@ -171,19 +910,18 @@ async def start(interaction: discord.Interaction):
         await interaction.response.send_message("❌ This command only works in a server.", ephemeral=True)
         return
 
-    existing = discord.utils.get(guild.text_channels, name="ai")
-    if existing:
+    ai_channels.index_guild(guild.id, guild.text_channels)
+    if ai_channels.channels(guild.id):
         await interaction.response.send_message("⚠️ #ai channel already exists.", ephemeral=True)
         return
 
     try:
-        channel = await guild.create_text_channel("ai")
+        channel = await guild.create_text_channel(ai_channels.name)
     except discord.Forbidden:
         await interaction.response.send_message("❌ I don’t have permission to create channels.", ephemeral=True)
         return
 
-    server_question_count[guild.id] = 0
-    guild_locks[guild.id] = asyncio.Lock()
+    ai_channels.add(channel)
     await interaction.response.send_message(f"✅ AI channel created: {channel.mention}", ephemeral=True)
 
 
@@ -197,17 +935,72 @@ async def start_error(interaction: discord.Interaction, error: app_commands.AppC
 @bot.tree.command(name="aiinfo", description="Show NightshadeAI status for this server")
 async def aiinfo(interaction: discord.Interaction):
     gid = interaction.guild_id
-    cnt = server_question_count.get(gid, 0)
-    await interaction.response.send_message(
-        f"**{AI_NAME} server status**\nQuestions used: **{cnt} / {MAX_QUESTIONS_PER_SERVER}**\nTimeout: **{AI_TIMEOUT_SEC}s**\nPer-user cooldown: **{PER_USER_COOLDOWN_SEC}s**",
-        ephemeral=True
+    cnt = await quota_store.used(gid)
+    window = f" (resets every {QUOTA_WINDOW_SEC / 3600:g}h)" if QUOTA_WINDOW_SEC else ""
+    lines = [
+        f"**{AI_NAME} server status**",
+        f"Questions used: **{cnt} / {MAX_QUESTIONS_PER_SERVER}**{window}",
+        f"Timeout: **{AI_TIMEOUT_SEC}s**",
+        f"Per-user cooldown: **{PER_USER_COOLDOWN_SEC}s**",
+    ]
+    if answer_cache is not None:
+        lines.append(
+            f"Answer cache: **{answer_cache.hits}** hits / **{answer_cache.misses}** misses "
+            f"({answer_cache.hit_rate:.0%}), {len(answer_cache)} entries"
+            + (f", {answer_cache.shared_hits} from other shards" if state_backend is not None else "")
+        )
+    if semantic_cache is not None:
+        lines.append(
+            f"Semantic cache: **{semantic_cache.hits}** hits / **{semantic_cache.misses}** misses "
+            f"({semantic_cache.hit_rate:.0%}), {len(semantic_cache)} entries"
+            + (f", {semantic_cache.errors} embedding errors" if semantic_cache.errors else "")
+        )
+    lines.append(f"Coalesced duplicate questions: **{inflight_questions.coalesced}**")
+    if draft_checkpoints is not None:
+        lines.append(
+            f"Draft checkpoints: **{draft_checkpoints.resumed}** drafts resumed, {len(draft_checkpoints)} kept"
+        )
+    if conversations is not None:
+        lines.append(
+            f"Conversations: **{len(conversations)}** active, {conversations.compactions} compacted, "
+            f"{conversations.evictions} expired (budget {conversations.token_budget} tokens)"
+        )
+    if ollama_hosts is not None:
+        lines.append(f"Ollama hosts: {host_status()}")
+    for inventory, host in zip(model_inventories, ollama_hosts.hosts if ollama_hosts is not None else [None]):
+        lines.append(f"Models{f' on {host.url}' if host is not None else ''}: {model_status(inventory)}")
+    if merge_stats.merged or merge_stats.skipped:
+        lines.append(
+            f"Summarizer skipped: **{merge_stats.skipped}** / {merge_stats.merged + merge_stats.skipped} "
+            f"(≈{merge_stats.seconds_saved:.0f}s saved)"
+        )
+    lines.append(
+        f"Backend load: **{request_scheduler.in_flight} / {request_scheduler.max_concurrency}** running, "
+        f"**{request_scheduler.queue_depth}** queued"
     )
+    if question_router is not None:
+        lines.append(f"Routes: {route_summary()}")
+    if degradation is not None:
+        tier = current_tier()
+        lines.append(
+            f"Service tier: **{tier.name}** (pressure {degradation.pressure:.2f}, "
+            f"{degradation.recent_latency:.1f}s recent latency, {degradation.transitions} changes)"
+        )
+    latency = latency_summary()
+    if latency:
+        lines.append(f"Latency p50/p95: {latency}")
+    exit_codes = exit_code_summary()
+    if exit_codes:
+        lines.append(f"Exit codes: {exit_codes}")
+    if BOT_SHARD_COUNT:
+        lines.append(f"Shard: **{getattr(interaction.guild, 'shard_id', 0)}** of {BOT_SHARD_COUNT}")
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
 
 @bot.tree.command(name="resetcounter", description="(Admin) Reset the NightshadeAI question counter for this server")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def resetcounter(interaction: discord.Interaction):
     gid = interaction.guild_id
-    server_question_count[gid] = 0
+    await quota_store.reset(gid)
     await interaction.response.send_message("✅ Counter reset.", ephemeral=True)
 
 @resetcounter.error
@@ -217,6 +1010,80 @@ async def resetcounter_error(interaction: discord.Interaction, error: app_comman
     else:
         await interaction.response.send_message("⚠️ Error processing command.", ephemeral=True)
 
+@bot.tree.command(name="aitraces", description="(Admin) Show slow NightshadeAI requests and event-loop stalls")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def aitraces(interaction: discord.Interaction):
+    # Only this server's traces; the full JSON (every server) is in TRACE_FILE
+    traces = tracer.find(guild=interaction.guild_id)[:TRACES_SHOWN]
+    lines = [
+        f"**Slow requests** (over {tracer.slow_sec:g}s; {tracer.traced} traced, {tracer.sample_rate:.0%} sampled)",
+        *(format_trace(t) for t in traces),
+    ]
+    if not traces:
+        lines.append("None recorded.")
+    if loop_watchdog is not None:
+        lines.append(
+            f"**Event-loop stalls** over {LOOP_STALL_THRESHOLD_SEC:g}s: **{loop_watchdog.stalls}**, "
+            f"longest {loop_watchdog.max_lag_sec:.2f}s"
+        )
+        if loop_watchdog.recent:
+            stall = loop_watchdog.recent[-1]
+            lines.append(f"Last: {stall.seconds:.2f}s in `{stall.location}`")
+    content = "\n".join(lines)
+    if len(content) > DISCORD_MESSAGE_LIMIT:
+        content = content[:DISCORD_MESSAGE_LIMIT - 1] + "…"
+    await interaction.response.send_message(content, ephemeral=True)
+
+@aitraces.error
+async def aitraces_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.MissingPermissions):
+        await interaction.response.send_message("❌ You need **Manage Server** to use this.", ephemeral=True)
+    else:
+        await interaction.response.send_message("⚠️ Error processing command.", ephemeral=True)
+
+# -------------------------
+# AI channel registry upkeep
+# -------------------------
+@bot.event
+async def on_guild_available(guild: discord.Guild):
+    ai_channels.index_guild(guild.id, guild.text_channels)
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    ai_channels.index_guild(guild.id, guild.text_channels)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    ai_channels.forget_guild(guild.id)
+
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+    if isinstance(channel, discord.TextChannel):
+        ai_channels.add(channel)
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    ai_channels.remove(channel)
+    active_requests.cancel_channel(channel.id)
+
+@bot.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+    if isinstance(after, discord.TextChannel):
+        ai_channels.update(before, after)
+
+# -------------------------
+# Cancellation: a deleted question stops its answer
+# -------------------------
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    # Raw event: the question may no longer be in the message cache
+    active_requests.cancel(payload.message_id, "question deleted")
+
+@bot.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    for message_id in payload.message_ids:
+        active_requests.cancel(message_id, "question deleted")
+
 # -------------------------
 # Respond in #ai channel on mention
 # -------------------------
@@ -227,29 +1094,65 @@ async def on_message(message: discord.Message):
 
     await bot.process_commands(message)
 
-    ai_channel = discord.utils.get(message.guild.text_channels, name="ai")
-    if ai_channel is None or message.channel.id != ai_channel.id:
+    # Cheap checks first: most messages neither mention the bot nor sit in an #ai channel
+    if not bot.user or not bot.user.mentioned_in(message):
         return
 
-    if not bot.user or not bot.user.mentioned_in(message):
+    if not ai_channels.is_ai_channel(message.guild.id, message.channel.id):
         return
 
+    with tracer.trace("message", guild=message.guild.id, channel=message.channel.id, message=message.id):
+        await answer_message(message)
+
+def replies_to_bot(message: discord.Message) -> bool:
+    # Only a reply to one of the bot's answers continues a conversation; other questions stay cacheable
+    reference = getattr(message, "reference", None)
+    author = getattr(getattr(reference, "resolved", None), "author", None)  # None if deleted or not fetched
+    return author is not None and bot.user is not None and author.id == bot.user.id
+
+async def quota_unavailable(channel) -> None:
+    # The shared state backend is down: answering anyway would let a server past its question limit
+    log.warning("Could not reach the question quota store.", exc_info=True)
+    await outbound.send(
+        channel,
+        f"⚠️ {AI_NAME} can't check this server's question limit right now—please try again in a minute.",
+        allowed_mentions=mentions_none()
+    )
+
+async def refund_question(guild_id: int) -> None:
+    try:
+        await quota_store.refund(guild_id)
+    except (StateError, OSError):
+        log.warning("Could not give a question back to guild %s's quota.", guild_id, exc_info=True)
+
+async def answer_message(message: discord.Message):
     guild_id = message.guild.id
     user_id = message.author.id
-    server_question_count.setdefault(guild_id, 0)
-    guild_locks.setdefault(guild_id, asyncio.Lock())
 
-    if server_question_count[guild_id] >= MAX_QUESTIONS_PER_SERVER:
-        await message.channel.send(
+    try:
+        used = await quota_store.used(guild_id)
+    except (StateError, OSError):
+        await quota_unavailable(message.channel)
+        return
+    if used >= MAX_QUESTIONS_PER_SERVER:
+        await outbound.send(
+            message.channel,
             f"❌ {AI_NAME} has reached the question limit for this server.",
             allowed_mentions=mentions_none()
         )
         return
 
-    now = asyncio.get_event_loop().time()
-    if not is_cooldown_ok(guild_id, user_id, now):
-        await message.channel.send(
-            f"⚠️ Slow down a bit—try again in ~{PER_USER_COOLDOWN_SEC}s.",
+    verdict = rate_limiter.check(guild_id, user_id, asyncio.get_event_loop().time())
+    if verdict.allowed and shared_global_limit is not None:
+        try:
+            verdict = await shared_global_limit.check()
+        except (StateError, OSError):
+            # Fail open: the per-user and per-guild buckets above still apply
+            log.warning("Shared global rate limit unavailable; skipping it.", exc_info=True)
+    if not verdict.allowed:
+        await outbound.send(
+            message.channel,
+            RATE_LIMIT_MESSAGES[verdict.scope].format(wait=math.ceil(verdict.retry_after), name=AI_NAME),
             allowed_mentions=mentions_none()
         )
         return
@@ -260,34 +1163,141 @@ async def on_message(message: discord.Message):
         user_question = user_question.replace(f"<@{mention.id}>", "").replace(f"<@!{mention.id}>", "")
     user_question = user_question.strip()
     if not user_question:
-        await message.channel.send(
+        await outbound.send(
+            message.channel,
             "⚠️ Please ask a question after mentioning me.",
             allowed_mentions=mentions_none()
         )
         return
 
-    server_question_count[guild_id] += 1
+    try:
+        consumed = await quota_store.try_consume(guild_id)
+    except (StateError, OSError):
+        await quota_unavailable(message.channel)
+        return
+    if not consumed:
+        # Another question took the last slot while this one was being validated
+        await outbound.send(
+            message.channel,
+            f"❌ {AI_NAME} has reached the question limit for this server.",
+            allowed_mentions=mentions_none()
+        )
+        return
+
+    with span("thinking_message"):
+        thinking_msg = await outbound.send(message.channel, THINKING_MESSAGE, allowed_mentions=mentions_none())
+
+    async def show_queue_position(position: int):
+        try:
+            await discord_call("edit", thinking_msg.edit(content=f"{THINKING_MESSAGE} (queue position {position})"))
+        except discord.HTTPException:
+            pass
+
+    reply = None
+    on_progress = None
+    if streaming_enabled():
+        # The placeholder becomes the first answer message and is edited as tokens arrive
+        reply = ProgressiveReply(
+            message.channel,
+            thinking_msg,
+            header=MESSAGE_HEADER,
+            limit=DISCORD_MESSAGE_LIMIT,
+            render=clean_ai_output,
+            split=split_discord_message,
+            edit_interval=STREAM_EDIT_INTERVAL_SEC,
+            allowed_mentions=mentions_none(),
+            on_api_call=observe_discord_call,
+            send=lambda content: outbound.send(message.channel, content, allowed_mentions=mentions_none()),
+        )
+        on_progress = reply.update
 
-    async with guild_locks[guild_id]:
-        thinking_msg = await message.channel.send(THINKING_MESSAGE, allowed_mentions=mentions_none())
-        response, exit_code = await ask_ai_async(user_question)
+    try:
+        with span("ask_ai_async"):
+            response, exit_code = await active_requests.run(
+                message.id, message.channel.id, (guild_id, user_id),
+                ask_ai_async(
+                    user_question, on_progress, guild_id=guild_id, on_queued=show_queue_position,
+                    conversation_id=(message.channel.id, user_id), follow_up=replies_to_bot(message),
+                ),
+            )
+    except RequestCancelled:
+        # The question was deleted or replaced: nothing is posted and the quota is given back
+        await refund_question(guild_id)
+        if reply is not None:
+            await reply.abort()
+        else:
+            try:
+                await discord_call("delete", thinking_msg.delete())
+            except discord.HTTPException:
+                pass
+        return
+    except QueueFullError:
+        # Rejected before any backend work: give the question back to the server's quota
+        await refund_question(guild_id)
         try:
-            await thinking_msg.delete()
+            await discord_call("delete", thinking_msg.delete())
         except discord.HTTPException:
             pass
+        await outbound.send(
+            message.channel,
+            f"⚠️ {AI_NAME} is at capacity right now—please try again in a minute.",
+            allowed_mentions=mentions_none()
+        )
+        return
+
+    # Tag nonzero exit with a subtle prefix to aid debugging
+    prefix = "" if exit_code == 0 else f"[exit {exit_code}] "
+    if reply is not None:
+        with span("deliver"):
+            await reply.finish(prefix + response)
+        return
+
+    try:
+        await discord_call("delete", thinking_msg.delete())
+    except discord.HTTPException:
+        pass
 
-        # Tag nonzero exit with a subtle prefix to aid debugging
-        prefix = "" if exit_code == 0 else f"[exit {exit_code}] "
-        header = MESSAGE_HEADER
-        chunk_limit = max(1, DISCORD_MESSAGE_LIMIT - len(header))
-        text_to_split = prefix + response
-        for chunk in split_discord_message(text_to_split, limit=chunk_limit):
-            await message.channel.send(
-                f"{header}{chunk}",
-                allowed_mentions=mentions_none()
-            )
+    # The backend slot is already free: chunks (or the .md attachment) go through the channel's paced queue
+    with span("deliver"):
+        await outbound.deliver(
+            message.channel,
+            prefix + response,
+            header=MESSAGE_HEADER,
+            limit=DISCORD_MESSAGE_LIMIT,
+            allowed_mentions=mentions_none()
+        )
 
 # -------------------------
 # Run bot
 # -------------------------
-bot.run(TOKEN)
+def run_shard_supervisor() -> None:
+    if state_backend is None:
+        log.warning("BOT_PROCESSES > 1 without STATE_BACKEND: quotas and cached answers stay per process.")
+    supervisor = ShardSupervisor([sys.executable, os.path.abspath(__file__)], BOT_SHARD_COUNT, BOT_PROCESSES)
+    log.info("Running %d shard(s) in %d process(es).", BOT_SHARD_COUNT, len(supervisor.children))
+
+    async def supervise():
+        try:
+            await supervisor.run()
+        finally:
+            await supervisor.stop()
+
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(supervise())
+
+
+def main() -> None:
+    if BOT_SHARD_COUNT and BOT_PROCESSES > 1 and not BOT_SHARD_IDS:
+        run_shard_supervisor()
+        return
+    bot.run(TOKEN)
+    quota_store.close()  # flush counters still waiting for the write-behind batch
+    if answer_cache is not None:
+        answer_cache.close()
+    tracer.close()
+    if state_backend is not None:
+        state_backend.close()
+
+
+if __name__ == "__main__":
+    main()
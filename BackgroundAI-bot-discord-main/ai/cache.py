@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence, Tuple
+
+from .state import StateBackend, StateError
+
+log = logging.getLogger("nightshade-bot")
+
+_WS_RE = re.compile(r"\s+")
+_EDGE_PUNCT = " \t\r\n?!.,;:"
+
+
+def normalize_question(question: str) -> str:
+    # "What can you do?" / "what can you do" / "  What  can you do ?? " share one entry
+    return _WS_RE.sub(" ", question.casefold()).strip(_EDGE_PUNCT)
+
+
+def answer_cache_key(question: str, *, persona: str, models: Sequence[str], summarizer_model: str,
+                     temperature: float, max_tokens: int, route: str = "full") -> str:
+    # `route` names the question router's path; a fast-route answer must not stand in for a full one
+    material = json.dumps(
+        [normalize_question(question), persona, list(models), summarizer_model, temperature, max_tokens, route],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+# -------------------------
+# LRU + TTL answer cache with an optional SQLite tier and an optional shared tier
+# -------------------------
+class AnswerCache:
+    def __init__(self, max_entries: int = 512, ttl_sec: float = 3600.0, *, sqlite_path: Optional[str] = None,
+                 disk_max_entries: Optional[int] = None, backend: Optional[StateBackend] = None,
+                 clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.sqlite_path = sqlite_path
+        self.disk_max_entries = disk_max_entries or max_entries * 10
+        self.backend = backend  # shared by every shard process
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # key -> (expires_at, answer)
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get(self, key: str) -> Optional[str]:
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+        if self.sqlite_path:
+            row = await self._disk_call(self._disk_get, key, now)
+            if row is not None:
+                self._remember(key, row[0], row[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return row[1]
+        if self.backend is not None:
+            row = await self._shared_get(key, now)
+            if row is not None:
+                self._remember(key, row[0], row[1])
+                self.hits += 1
+                self.shared_hits += 1
+                return row[1]
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, answer: str) -> None:
+        expires_at = self._clock() + self.ttl_sec
+        self._remember(key, expires_at, answer)
+        if self.sqlite_path:
+            await self._disk_call(self._disk_put, key, expires_at, answer)
+        if self.backend is not None:
+            try:
+                await self.backend.set(f"answer:{key}", json.dumps([expires_at, answer]), ttl=self.ttl_sec)
+            except (StateError, OSError):
+                log.warning("Could not store the answer in the shared cache", exc_info=True)
+
+    def _remember(self, key: str, expires_at: float, answer: str) -> None:
+        self._entries[key] = (expires_at, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # --- shared tier: best effort, a backend outage only costs cache hits ---
+    async def _shared_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        try:
+            raw = await self.backend.get(f"answer:{key}")
+        except (StateError, OSError):
+            log.warning("Shared answer cache unavailable", exc_info=True)
+            return None
+        if raw is None:
+            return None
+        expires_at, answer = json.loads(raw)
+        return (expires_at, answer) if expires_at > now else None
+
+    # --- SQLite tier (runs in a worker thread); a locked or corrupt file only costs cache hits ---
+    async def _disk_call(self, fn, *args):
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except sqlite3.Error:
+            log.warning("SQLite answer cache %s unavailable", self.sqlite_path, exc_info=True)
+            return None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, answer TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS answers_expires_at ON answers (expires_at)")
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT expires_at, answer FROM answers WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _disk_put(self, key: str, expires_at: float, answer: str) -> None:
+        with self._db_lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO answers (key, answer, expires_at) VALUES (?, ?, ?)",
+                       (key, answer, expires_at))
+            db.execute("DELETE FROM answers WHERE expires_at <= ?", (self._clock(),))
+            # Keep the newest rows only; expiry order approximates insertion order for a fixed TTL
+            db.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,),
+            )
+            db.commit()
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
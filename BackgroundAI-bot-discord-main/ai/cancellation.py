@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+log = logging.getLogger("nightshade-bot")
+
+
+class RequestCancelled(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Request:
+    __slots__ = ("task", "channel_id", "user_key", "reason")
+
+    def __init__(self, task: asyncio.Task, channel_id: int, user_key: Hashable):
+        self.task = task
+        self.channel_id = channel_id
+        self.user_key = user_key
+        self.reason: Optional[str] = None  # set when cancelled on purpose
+
+
+# -------------------------
+# Active requests: lets Discord events cancel the answer a question is still waiting for
+# -------------------------
+class ActiveRequests:
+    # Keyed by the question's message id; a user's newer question supersedes their older one
+    def __init__(self) -> None:
+        self._requests: Dict[int, _Request] = {}
+        self._latest: Dict[Hashable, int] = {}  # user key -> message id of their newest question
+        self.cancelled = 0
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    async def run(self, message_id: int, channel_id: int, user_key: Hashable, work: Awaitable[Any]) -> Any:
+        # Raises RequestCancelled when cancel() stopped the work; the caller cleans up its placeholder
+        previous = self._latest.get(user_key)
+        if previous is not None:
+            self.cancel(previous, "superseded by a newer question")
+        request = _Request(asyncio.ensure_future(work), channel_id, user_key)
+        self._requests[message_id] = request
+        self._latest[user_key] = message_id
+        try:
+            return await request.task
+        except asyncio.CancelledError:
+            if request.reason is None:
+                raise  # the caller itself was cancelled
+            raise RequestCancelled(request.reason) from None
+        finally:
+            if self._requests.get(message_id) is request:
+                del self._requests[message_id]
+            if self._latest.get(user_key) == message_id:
+                del self._latest[user_key]
+
+    def cancel(self, message_id: int, reason: str) -> bool:
+        request = self._requests.get(message_id)
+        if request is None or request.task.done() or request.reason is not None:
+            return False
+        request.reason = reason
+        request.task.cancel()
+        self.cancelled += 1
+        log.info("Cancelling the answer to message %s: %s", message_id, reason)
+        return True
+
+    def cancel_channel(self, channel_id: int, reason: str = "channel deleted") -> int:
+        matching = [mid for mid, request in self._requests.items() if request.channel_id == channel_id]
+        return sum(self.cancel(mid, reason) for mid in matching)
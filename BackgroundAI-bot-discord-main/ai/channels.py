@@ -0,0 +1,50 @@
+from typing import Any, Dict, FrozenSet, Iterable, Set
+
+DEFAULT_AI_CHANNEL_NAME = "ai"
+
+
+# -------------------------
+# Per-guild index of AI channel IDs, kept current from gateway events
+# -------------------------
+class AIChannelRegistry:
+    def __init__(self, name: str = DEFAULT_AI_CHANNEL_NAME):
+        self.name = name
+        self._by_guild: Dict[int, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._by_guild.values())
+
+    def is_ai_channel(self, guild_id: int, channel_id: int) -> bool:
+        ids = self._by_guild.get(guild_id)
+        return ids is not None and channel_id in ids
+
+    def channels(self, guild_id: int) -> FrozenSet[int]:
+        return frozenset(self._by_guild.get(guild_id, ()))
+
+    def index_guild(self, guild_id: int, text_channels: Iterable[Any]) -> None:
+        # Full rebuild for one guild (startup, reconnect, guild join)
+        ids = {c.id for c in text_channels if c.name == self.name}
+        if ids:
+            self._by_guild[guild_id] = ids
+        else:
+            self._by_guild.pop(guild_id, None)
+
+    def forget_guild(self, guild_id: int) -> None:
+        self._by_guild.pop(guild_id, None)
+
+    def add(self, channel: Any) -> None:
+        if channel.name == self.name:
+            self._by_guild.setdefault(channel.guild.id, set()).add(channel.id)
+
+    def remove(self, channel: Any) -> None:
+        ids = self._by_guild.get(channel.guild.id)
+        if ids is None:
+            return
+        ids.discard(channel.id)
+        if not ids:
+            del self._by_guild[channel.guild.id]
+
+    def update(self, before: Any, after: Any) -> None:
+        # Renames move a channel in or out of the index
+        self.remove(before)
+        self.add(after)
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+def draft_key(model: str, prompt: str, *, temperature: float, max_tokens: int, ascii_only: bool = False,
+              context: Optional[List[int]] = None) -> str:
+    # A draft is only reusable for the exact same generation: model, prompt, sampling and prior context
+    material = json.dumps([model, prompt, temperature, max_tokens, ascii_only, context], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class Checkpoint(NamedTuple):
+    draft: str
+    context: Optional[List[int]]  # Ollama context returned with the draft (HTTP backend only)
+
+
+# -------------------------
+# Draft checkpoints: finished drafts outlive a failed merge, so a retry resumes at the summarizer
+# -------------------------
+class DraftCheckpoints:
+    # Short-lived by design: a checkpoint only has to bridge a failure and its retry
+    def __init__(self, max_entries: int = 256, ttl_sec: float = 300.0, *,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Checkpoint]]" = OrderedDict()  # key -> (expires_at, ...)
+        self.saved = 0
+        self.resumed = 0  # drafts served from a checkpoint instead of a model run
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Checkpoint]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self._clock():
+            del self._entries[key]
+            return None
+        return entry[1]
+
+    def put(self, key: str, draft: str, context: Optional[List[int]] = None) -> None:
+        self._entries[key] = (self._clock() + self.ttl_sec, Checkpoint(draft, context))
+        self._entries.move_to_end(key)
+        self.saved += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def restore(self, keys: Dict[str, str]) -> Dict[str, Checkpoint]:
+        # model -> checkpoint, for the models in `keys` (model -> key) that have one
+        found = {model: checkpoint for model, checkpoint in ((m, self.get(k)) for m, k in keys.items())
+                 if checkpoint is not None}
+        self.resumed += len(found)
+        return found
+
+    def forget(self, keys: Dict[str, str]) -> None:
+        # Once the answer exists its drafts are no longer needed
+        for key in keys.values():
+            self._entries.pop(key, None)
@@ -0,0 +1,226 @@
+import codecs
+import re
+from typing import Iterable, Iterator, List, Union
+
+BRAILLE_RE = re.compile(r'[\u2800-\u28FF]')
+ANSI_RE = re.compile(r'\x1B[@-_][0-?]*[ -/]*[@-~]')
+PERSONA_TAG_RE = re.compile(r'(?im)^\s*NightshadeAI:\s*')
+# Three or more line breaks; the same matches as (\r?\n){3,}, but leading with a character class
+# lets the regex engine skip straight to the next line break instead of trying every position
+BLANK_LINES_RE = re.compile(r'[\r\n](?:(?<=\r)\n)?(?<=\n)(?:\r?\n){2,}')
+
+PERSONA_TAG = "NightshadeAI:"
+
+
+def clean_ai_output(text: str, remove_persona_tag: bool = True) -> str:
+    if not text:
+        return ""
+    text = BRAILLE_RE.sub('', text)
+    text = ANSI_RE.sub('', text)
+    if remove_persona_tag:
+        text = PERSONA_TAG_RE.sub('', text)
+    text = BLANK_LINES_RE.sub('\n\n', text)
+    return text.strip()
+
+
+# -------------------------
+# Incremental cleaner: same output as clean_ai_output, fed chunk by chunk
+# -------------------------
+# Each stage rewrites what it can already decide and holds back the shortest tail whose fate
+# depends on text that has not arrived yet, so the work per chunk stays proportional to the chunk.
+
+# An escape sequence that could still complete once more text arrives
+_ANSI_TAIL_RE = re.compile(r'\x1B(?:[@-_][0-?]*[ -/]*)?\Z')
+
+
+def _tag_prefix_pattern(tag: str) -> str:
+    # "N(?:i(?:g(?:...(?::\s*)?...)?)?)?": any prefix of the tag, plus the whitespace after a full tag
+    pattern = r'\s*'
+    for ch in reversed(tag):
+        pattern = re.escape(ch) + f'(?:{pattern})?'
+    return pattern
+
+
+_TAG_AT_RE = re.compile(r'\s*' + re.escape(PERSONA_TAG) + r'\s*', re.I)
+_TAG_PREFIX_AT_RE = re.compile(r'\s*(?:' + _tag_prefix_pattern(PERSONA_TAG) + r')?\Z', re.I)
+# The earliest line start whose text could begin a tag (or runs out before telling)
+_TAG_CANDIDATE_RE = re.compile(r'\n(?=\s*(?:' + re.escape(PERSONA_TAG[0]) + r'|\Z))', re.I)
+_WS_RUN_RE = re.compile(r'\s*')
+_NEWLINE_RUN_RE = re.compile(r'(?:\r?\n)*\r?')
+_NON_SPACE_RE = re.compile(r'\S')
+
+
+class _AnsiStage:
+    def __init__(self) -> None:
+        self._pending = ""
+
+    def feed(self, text: str, final: bool = False) -> str:
+        text = self._pending + text
+        cut = len(text)
+        if not final:
+            tail = _ANSI_TAIL_RE.search(text)
+            if tail is not None:
+                cut = tail.start()
+        self._pending = text[cut:]
+        return ANSI_RE.sub('', text[:cut])
+
+
+class _PersonaTagStage:
+    def __init__(self) -> None:
+        self._pending = ""
+        self._line_start = True  # is the first pending character at the start of a line?
+
+    def feed(self, text: str, final: bool = False) -> str:
+        text = self._pending + text
+        out: List[str] = []
+        n = len(text)
+        pos = emit = 0
+        line_start = self._line_start
+        while pos < n:
+            if line_start:
+                tag = _TAG_AT_RE.match(text, pos)
+                if tag is not None and (tag.end() < n or final):
+                    out.append(text[emit:pos])
+                    pos = emit = tag.end()
+                    line_start = text[pos - 1] == '\n'
+                    continue
+                if not final and _TAG_PREFIX_AT_RE.match(text, pos):
+                    break  # hold: the tag (or its trailing whitespace) may continue in the next chunk
+                # Every line start inside this whitespace run fails the same way
+                pos = _WS_RUN_RE.match(text, pos).end()
+                line_start = False
+                continue
+            candidate = _TAG_CANDIDATE_RE.search(text, pos)
+            if candidate is None:
+                pos = n
+                break
+            pos = candidate.end()
+            line_start = True
+        out.append(text[emit:pos])
+        self._pending = text[pos:]
+        self._line_start = line_start
+        return "".join(out)
+
+
+class _BlankLinesStage:
+    def __init__(self) -> None:
+        self._pending = ""
+
+    def feed(self, text: str, final: bool = False) -> str:
+        text = self._pending + text
+        cut = len(text)
+        if not final:
+            # Hold the trailing newline run: a third newline may still arrive
+            cut = len(text.rstrip('\r\n'))
+            while not _NEWLINE_RUN_RE.fullmatch(text, cut):
+                cut += 1
+        self._pending = text[cut:]
+        return BLANK_LINES_RE.sub('\n\n', text[:cut])
+
+
+class _StripStage:
+    def __init__(self) -> None:
+        self._pending = ""
+        self._started = False
+
+    def feed(self, text: str, final: bool = False) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        text = self._pending + text
+        body = text.rstrip()
+        self._pending = "" if final else text[len(body):]
+        return body
+
+
+class StreamCleaner:
+    """Incremental clean_ai_output over bytes or str chunks.
+
+    Concatenating every feed() result and finish() gives exactly clean_ai_output() of the whole
+    decoded text, however the input was chunked: UTF-8 sequences and escape codes split across
+    chunk boundaries are held back until they complete.
+    """
+
+    def __init__(self, remove_persona_tag: bool = True, *, encoding: str = "utf-8", errors: str = "ignore"):
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+        self._stages = [_AnsiStage()]
+        if remove_persona_tag:
+            self._stages.append(_PersonaTagStage())
+        self._stages += [_BlankLinesStage(), _StripStage()]
+        self.finished = False
+
+    def feed(self, data: Union[bytes, str]) -> str:
+        if self.finished:
+            raise ValueError("StreamCleaner already finished")
+        text = data if isinstance(data, str) else self._decoder.decode(data)
+        return self._run(text, final=False)
+
+    def finish(self) -> str:
+        if self.finished:
+            return ""
+        self.finished = True
+        return self._run(self._decoder.decode(b"", final=True), final=True)
+
+    def _run(self, text: str, final: bool) -> str:
+        text = BRAILLE_RE.sub('', text)
+        for stage in self._stages:
+            text = stage.feed(text, final)
+        return text
+
+
+def clean_stream(chunks: Iterable[Union[bytes, str]], remove_persona_tag: bool = True) -> Iterator[str]:
+    cleaner = StreamCleaner(remove_persona_tag)
+    for chunk in chunks:
+        text = cleaner.feed(chunk)
+        if text:
+            yield text
+    text = cleaner.finish()
+    if text:
+        yield text
+
+
+# -------------------------
+# Discord-sized chunks
+# -------------------------
+def stream_discord_chunks(pieces: Iterable[str], limit: int = 2000) -> Iterator[str]:
+    """Split streamed text into messages of at most `limit` characters.
+
+    Yields the same chunks as split_discord_message() on the concatenated text, each one as soon
+    as the text that decides it has arrived. Works on offsets into a small buffer, so a long
+    output is never re-sliced per chunk.
+    """
+    buf, pos = "", 0
+    first = True  # the first chunk is judged on the raw text, later ones on the stripped remainder
+    for piece in pieces:
+        buf = buf[pos:] + piece if pos else buf + piece
+        pos = 0
+        while True:
+            if not first:
+                non_space = _NON_SPACE_RE.search(buf, pos)
+                pos = non_space.start() if non_space is not None else len(buf)
+                if _NON_SPACE_RE.search(buf, pos + limit) is None:
+                    break
+            elif len(buf) - pos <= limit:
+                break
+            window_end = pos + limit
+            split_pos = buf.rfind('\n', pos, window_end)
+            if split_pos == -1:
+                split_pos = buf.rfind(' ', pos, window_end)
+            if split_pos == -1:
+                split_pos = window_end
+            yield buf[pos:split_pos].strip()
+            pos = split_pos
+            first = False
+    rest = buf[pos:] if first else buf[pos:].strip()
+    if rest:
+        yield rest
+
+
+def iter_discord_chunks(text: str, limit: int = 2000) -> Iterator[str]:
+    return stream_discord_chunks((text,), limit)
+
+
+def split_discord_message(text: str, limit: int = 2000) -> List[str]:
+    return list(iter_discord_chunks(text, limit))
@@ -0,0 +1,170 @@
+import array
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+log = logging.getLogger("nightshade-bot")
+
+
+def estimate_tokens(text: str) -> int:
+    # rough chars≈tokens*~4, the same rule of thumb the summarizer prompt uses
+    return (len(text) + 3) // 4
+
+
+class Turn(NamedTuple):
+    question: str
+    answer: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.question) + estimate_tokens(self.answer) + 8  # "User:" / persona labels
+
+
+class History(NamedTuple):
+    # Snapshot of one session, handed to the pipeline and back to record()
+    key: Hashable
+    version: int  # 0 when the session did not exist
+    summary: str
+    turns: Tuple[Turn, ...]
+    contexts: Dict[str, List[int]]  # model -> Ollama context that ends exactly after the last turn
+
+    def __bool__(self) -> bool:
+        return bool(self.summary or self.turns)
+
+
+# (previous summary, turns to fold in) -> new summary
+Summarizer = Callable[[str, Sequence[Turn]], Awaitable[str]]
+
+
+class _Session:
+    __slots__ = ("summary", "turns", "tokens", "contexts", "version", "last_used", "compacting")
+
+    def __init__(self, version: int, now: float):
+        self.summary = ""
+        self.turns: Deque[Turn] = deque()
+        self.tokens = 0  # summary + turns
+        self.contexts: Dict[str, array.array] = {}
+        self.version = version
+        self.last_used = now
+        self.compacting = False
+
+
+# -------------------------
+# Conversation memory (one session per user and channel): token-budgeted history, compaction, LRU of idle sessions
+# -------------------------
+class ConversationStore:
+    def __init__(self, token_budget: int = 1024, *, max_sessions: int = 256, idle_sec: float = 1800.0,
+                 summarize: Optional[Summarizer] = None, clock: Callable[[], float] = time.monotonic):
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.idle_sec = idle_sec
+        self.summarize = summarize
+        self._clock = clock
+        self._sessions: "OrderedDict[Hashable, _Session]" = OrderedDict()  # least recently used first
+        self._versions = itertools.count(1)
+        self._tasks: Set[asyncio.Task] = set()
+        self.compactions = 0
+        self.compaction_failures = 0
+        self.evictions = 0
+        self.stale_contexts = 0  # contexts dropped because the session moved on during the request
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def history(self, key: Hashable) -> History:
+        now = self._clock()
+        self._expire(now)
+        session = self._sessions.get(key)
+        if session is None:
+            return History(key, 0, "", (), {})
+        session.last_used = now
+        self._sessions.move_to_end(key)
+        contexts = {model: ctx.tolist() for model, ctx in session.contexts.items()}
+        return History(key, session.version, session.summary, tuple(session.turns), contexts)
+
+    def record(self, history: History, question: str, answer: str,
+               contexts: Optional[Dict[str, List[int]]] = None) -> None:
+        now = self._clock()
+        self._expire(now)
+        session = self._sessions.get(history.key)
+        if session is None:
+            session = self._sessions[history.key] = _Session(0, now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        # A context only continues this session if nothing else changed it while the request ran
+        current = session.version == history.version
+        if contexts and not current:
+            self.stale_contexts += 1
+        turn = Turn(question, answer)
+        session.turns.append(turn)
+        session.tokens += turn.tokens
+        session.contexts = {m: array.array("l", ctx) for m, ctx in (contexts or {}).items()} if current else {}
+        session.version = next(self._versions)
+        session.last_used = now
+        self._sessions.move_to_end(history.key)
+        if session.tokens > self.token_budget and not session.compacting:
+            self._compact_soon(history.key, session)
+
+    async def aclose(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _compact_soon(self, key: Hashable, session: _Session) -> None:
+        # Fold the oldest turns into the summary until the rest fits in half the budget, so compaction
+        # (which changes the prompt prefix) happens every few turns rather than on every turn
+        keep = self.token_budget // 2
+        remaining = session.tokens - estimate_tokens(session.summary)
+        fold: List[Turn] = []
+        for turn in session.turns:
+            if remaining <= keep or len(fold) == len(session.turns) - 1:
+                break
+            fold.append(turn)
+            remaining -= turn.tokens
+        if not fold:
+            return
+        if self.summarize is None:
+            self._apply(key, session, fold, session.summary)
+            return
+        session.compacting = True
+        task = asyncio.create_task(self._compact(key, session, fold))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _compact(self, key: Hashable, session: _Session, fold: List[Turn]) -> None:
+        try:
+            summary = (await self.summarize(session.summary, fold)).strip()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # The turns are dropped anyway: an unbounded history is worse than a forgotten detail
+            log.warning("Conversation compaction failed: %s", exc)
+            self.compaction_failures += 1
+            summary = session.summary
+        finally:
+            session.compacting = False
+        self._apply(key, session, fold, summary)
+
+    def _apply(self, key: Hashable, session: _Session, fold: List[Turn], summary: str) -> None:
+        if self._sessions.get(key) is not session:
+            return  # evicted or reset meanwhile
+        # Turns are only ever appended, so the folded ones are still at the front
+        for _ in fold:
+            session.turns.popleft()
+        session.summary = summary[:self.token_budget]  # ~4 chars per token: at most a quarter of the budget
+        session.tokens = estimate_tokens(session.summary) + sum(t.tokens for t in session.turns)
+        session.contexts = {}  # they encode the old prefix
+        session.version = next(self._versions)
+        self.compactions += 1
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session.last_used + self.idle_sec > now:
+                break
+            del self._sessions[key]
+            self.evictions += 1
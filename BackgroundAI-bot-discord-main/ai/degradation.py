@@ -0,0 +1,115 @@
+import collections
+import dataclasses
+import logging
+import math
+import time
+from typing import Callable, Deque, NamedTuple, Optional, Sequence, Tuple
+
+from .pipeline import PipelineConfig
+
+log = logging.getLogger("nightshade-bot")
+
+
+class Tier(NamedTuple):
+    name: str
+    model_share: float = 1.0  # share of the configured base models to run (at least one)
+    summarize: bool = True  # False returns the best draft without a merge pass
+    token_share: float = 1.0  # share of the configured max_tokens
+    retries: Optional[int] = None  # None keeps the configured retries
+    reject: bool = False  # turn new questions away politely
+
+
+DEFAULT_TIERS: Tuple[Tier, ...] = (
+    Tier("full"),
+    Tier("fewer-models", model_share=0.5, retries=0),
+    Tier("single-model", model_share=0.0, summarize=False, retries=0),
+    Tier("short-answers", model_share=0.0, summarize=False, token_share=0.5, retries=0),
+    Tier("rejecting", model_share=0.0, summarize=False, token_share=0.5, retries=0, reject=True),
+)
+# Pressure at which each tier after "full" is entered
+DEFAULT_THRESHOLDS: Tuple[float, ...] = (1.0, 2.0, 3.0, 4.0)
+MIN_TOKENS = 64
+
+
+def apply_tier(config: PipelineConfig, tier: Tier) -> PipelineConfig:
+    if tier.model_share >= 1.0 and tier.summarize and tier.token_share >= 1.0 and tier.retries is None:
+        return config
+    count = max(1, math.ceil(len(config.models) * tier.model_share))
+    return dataclasses.replace(
+        config,
+        models=tuple(config.models[:count]),
+        max_tokens=max(MIN_TOKENS, int(config.max_tokens * tier.token_share)),
+        retries=config.retries if tier.retries is None else tier.retries,
+        skip_merge_similarity=config.skip_merge_similarity if tier.summarize else 0.0,
+        hedge_after_sec=None,  # duplicate requests are extra load
+    )
+
+
+# -------------------------
+# Degradation controller: steps through service tiers as queue depth and latency build up
+# -------------------------
+class DegradationController:
+    # Pressure is the larger of queue depth per concurrency slot and recent latency per latency target.
+    # Escalation is immediate; recovery goes one tier at a time, only once pressure fell below
+    # recover_ratio × the current tier's threshold and the tier has been held for hold_sec (hysteresis).
+    def __init__(self, tiers: Sequence[Tier] = DEFAULT_TIERS, thresholds: Sequence[float] = DEFAULT_THRESHOLDS, *,
+                 latency_target_sec: float = 60.0, latency_window_sec: float = 60.0, recover_ratio: float = 0.6,
+                 hold_sec: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        if len(thresholds) != len(tiers) - 1:
+            raise ValueError("Need one threshold per tier after the first")
+        if any(b <= a for a, b in zip(thresholds, thresholds[1:])):
+            raise ValueError("Degradation thresholds must increase")
+        self.tiers = tuple(tiers)
+        self.thresholds = tuple(thresholds)
+        self.latency_target_sec = latency_target_sec
+        self.latency_window_sec = latency_window_sec
+        self.recover_ratio = recover_ratio
+        self.hold_sec = hold_sec
+        self._clock = clock
+        self._latencies: Deque[Tuple[float, float]] = collections.deque()
+        self._latency_sum = 0.0
+        self.level = 0
+        self.pressure = 0.0
+        self.changed_at = clock()
+        self.transitions = 0
+
+    @property
+    def tier(self) -> Tier:
+        return self.tiers[self.level]
+
+    @property
+    def recent_latency(self) -> float:
+        self._prune(self._clock())
+        return self._latency_sum / len(self._latencies) if self._latencies else 0.0
+
+    def observe_latency(self, seconds: float) -> None:
+        now = self._clock()
+        self._latencies.append((now, seconds))
+        self._latency_sum += seconds
+        self._prune(now)
+
+    def update(self, queue_depth: int, capacity: int) -> Tier:
+        now = self._clock()
+        self.pressure = max(queue_depth / max(1, capacity), self.recent_latency / self.latency_target_sec)
+        target = sum(1 for threshold in self.thresholds if self.pressure >= threshold)
+        if target > self.level:
+            self._move(target, now, "Degrading")
+        elif (target < self.level and self.pressure < self.thresholds[self.level - 1] * self.recover_ratio
+              and now - self.changed_at >= self.hold_sec):
+            self._move(self.level - 1, now, "Recovering")
+        return self.tier
+
+    def _move(self, level: int, now: float, verb: str) -> None:
+        log_level = logging.WARNING if level > self.level else logging.INFO
+        log.log(log_level, "%s to service tier '%s' (pressure %.2f, was '%s')",
+                verb, self.tiers[level].name, self.pressure, self.tier.name)
+        self.level = level
+        self.changed_at = now
+        self.transitions += 1
+
+    def _prune(self, now: float) -> None:
+        while self._latencies and self._latencies[0][0] <= now - self.latency_window_sec:
+            _, seconds = self._latencies.popleft()
+            self._latency_sum -= seconds
+        if not self._latencies:
+            self._latency_sum = 0.0  # drop accumulated float error
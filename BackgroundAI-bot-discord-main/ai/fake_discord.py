@@ -0,0 +1,109 @@
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+# -------------------------
+# Local stand-in for Discord objects (benchmarks): guilds, #ai channels, users, mention traffic
+# -------------------------
+_ids = itertools.count(1)
+
+
+def _snowflake() -> int:
+    # Real-looking ids: the high bits drive shard routing ((id >> 22) % shard_count)
+    return next(_ids) << 22
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str, *, bot: bool = False):
+        self.id = user_id
+        self.name = name
+        self.bot = bot
+        self.mention = f"<@{user_id}>"
+
+    def mentioned_in(self, message: "FakeMessage") -> bool:
+        return any(user.id == self.id for user in message.mentions)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, channel_name: str):
+        self.id = guild_id
+        self.shard_id = 0
+        self.ai_channel = FakeChannelInfo(_snowflake(), channel_name, self)
+        self.text_channels = [self.ai_channel]
+
+
+class FakeChannelInfo:
+    def __init__(self, channel_id: int, name: str, guild: FakeGuild):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+
+
+class FakeSentMessage:
+    def __init__(self, channel: "FakeChannel", content: str):
+        self.id = _snowflake()
+        self.channel = channel
+        self.content = content
+        self.deleted = False
+
+    async def edit(self, content: str) -> "FakeSentMessage":
+        await self.channel.api_call("edit", content)
+        self.content = content
+        return self
+
+    async def delete(self) -> None:
+        await self.channel.api_call("delete", None)
+        self.deleted = True
+
+
+class FakeChannel:
+    # One view of a guild's #ai channel per incoming message, so every reply can be traced to its question
+    def __init__(self, info: FakeChannelInfo, discord: "FakeDiscord"):
+        self.id = info.id
+        self.name = info.name
+        self.guild = info.guild
+        self.mention = f"<#{info.id}>"
+        self._discord = discord
+        self.events: List[Tuple[float, str, Optional[str]]] = []  # (perf_counter, operation, content)
+
+    async def send(self, content: str, allowed_mentions: Any = None) -> FakeSentMessage:
+        await self.api_call("send", content)
+        return FakeSentMessage(self, content)
+
+    async def api_call(self, operation: str, content: Optional[str]) -> None:
+        self._discord.calls[operation] += 1
+        await asyncio.sleep(self._discord.api_latency(operation))
+        self.events.append((time.perf_counter(), operation, content))
+
+
+class FakeMessage:
+    def __init__(self, author: FakeUser, channel: FakeChannel, content: str, mentions: Sequence[FakeUser]):
+        self.id = _snowflake()
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.mentions = list(mentions)
+
+
+class FakeDiscord:
+    def __init__(self, guilds: int, users: int, *, channel_name: str = "ai",
+                 api_latency: Callable[[str], float] = lambda _operation: 0.0, seed: int = 0):
+        self.bot_user = FakeUser(_snowflake(), "NightshadeAI", bot=True)
+        self.guilds = [FakeGuild(_snowflake(), channel_name) for _ in range(guilds)]
+        self.users = [FakeUser(_snowflake(), f"user{i}") for i in range(users)]
+        self.api_latency = api_latency  # seconds per Discord call, sampled per operation
+        self.calls: Counter = Counter()
+        self._rng = random.Random(seed)
+
+    def mention_traffic(self, count: int, questions: Sequence[str]) -> Iterator[FakeMessage]:
+        # Uniform over guilds and users; each message gets its own channel view
+        for _ in range(count):
+            guild = self._rng.choice(self.guilds)
+            author = self._rng.choice(self.users)
+            question = self._rng.choice(questions)
+            channel = FakeChannel(guild.ai_channel, self)
+            yield FakeMessage(author, channel, f"{self.bot_user.mention} {question}", [self.bot_user])
@@ -0,0 +1,210 @@
+import asyncio
+import contextlib
+import json
+import math
+import random
+import re
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Set, Union
+
+# -------------------------
+# Local stand-in for the Ollama HTTP API (tests & benchmarks)
+# -------------------------
+Latency = Union[float, Callable[[str], float]]  # seconds, fixed or sampled per model
+TokenRate = Union[float, Callable[[str], float]]  # tokens per second, fixed or sampled per model
+
+
+def distribution(spec: str, seed: Optional[int] = None) -> Callable[[str], float]:
+    # "0.5" | "uniform:LOW,HIGH" | "lognormal:MEDIAN,SIGMA" | "exp:MEAN"; the model name is ignored
+    rng = random.Random(seed)
+    kind, _, params = spec.partition(":")
+    if not params:
+        value = float(kind)
+        return lambda _model: value
+    args = [float(p) for p in params.split(",")]
+    if kind == "uniform":
+        return lambda _model: rng.uniform(args[0], args[1])
+    if kind == "lognormal":
+        # Median-parameterised: exp(mu) is the median, sigma controls the tail
+        mu = math.log(args[0])
+        return lambda _model: rng.lognormvariate(mu, args[1])
+    if kind == "exp":
+        return lambda _model: rng.expovariate(1.0 / args[0])
+    raise ValueError(f"Unknown distribution {spec!r} (use N, uniform:a,b, lognormal:median,sigma or exp:mean)")
+
+
+def _default_responder(model: str, prompt: str) -> str:
+    return f"Answer from {model}."
+
+
+def bag_of_words_embedding(text: str, dim: int = 64) -> List[float]:
+    # Stand-in for an embedding model: hashed word counts, so texts sharing words point the same way
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.casefold()):
+        vector[zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+    return vector
+
+
+class FakeOllamaServer:
+    def __init__(self, responder: Optional[Callable[[str, str], str]] = None, *, latency: Latency = 0.0,
+                 tokens_per_sec: TokenRate = 0.0, models: Optional[List[str]] = None,
+                 failing_models: Optional[Set[str]] = None,
+                 embedder: Optional[Callable[[str], List[float]]] = None):
+        self.responder = responder or _default_responder
+        self.embedder = embedder or bag_of_words_embedding
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.models = list(models or [])
+        self.failing_models = set(failing_models or ())
+        self.requests: List[Dict[str, Any]] = []
+        self.connections = 0
+        self.generating = 0  # /api/generate requests being answered right now
+        self.aborted = 0  # generations stopped because the client hung up
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set[asyncio.Task] = set()
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self) -> "FakeOllamaServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._handlers):
+                task.cancel()
+            with contextlib.suppress(Exception):
+                await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "FakeOllamaServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    def _latency_for(self, model: str) -> float:
+        return self.latency(model) if callable(self.latency) else self.latency
+
+    def _rate_for(self, model: str) -> float:
+        return self.tokens_per_sec(model) if callable(self.tokens_per_sec) else self.tokens_per_sec
+
+    # --- HTTP plumbing ---
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                self.requests.append({"method": method, "path": path, "body": body})
+                if path == "/api/generate":
+                    await self._generate_until_hangup(reader, writer, body)
+                else:
+                    await self._dispatch(writer, method, path, body)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def _dispatch(self, writer, method: str, path: str, body: Dict[str, Any]) -> None:
+        if path == "/api/tags":
+            await _send_json(writer, 200, {"models": [{"name": m} for m in self.models]})
+        elif path == "/api/pull":
+            if body.get("model") not in self.models:
+                self.models.append(body.get("model"))
+            await _send_json(writer, 200, {"status": "success"})
+        elif path == "/api/generate":
+            await self._generate(writer, body)
+        elif path == "/api/embed":
+            model = body.get("model", "")
+            await asyncio.sleep(self._latency_for(model))
+            if model in self.failing_models:
+                await _send_json(writer, 500, {"error": f"model '{model}' failed"})
+                return
+            texts = body.get("input", "")
+            texts = [texts] if isinstance(texts, str) else texts
+            await _send_json(writer, 200, {"model": model, "embeddings": [self.embedder(t) for t in texts]})
+        else:
+            await _send_json(writer, 404, {"error": f"unknown endpoint {path}"})
+
+    async def _generate_until_hangup(self, reader, writer, body: Dict[str, Any]) -> None:
+        # Like Ollama, stop generating as soon as the client closes the connection
+        self.generating += 1
+        generation = asyncio.ensure_future(self._generate(writer, body))
+        hangup = asyncio.ensure_future(_wait_for_eof(reader))
+        try:
+            await asyncio.wait({generation, hangup}, return_when=asyncio.FIRST_COMPLETED)
+            if not generation.done():
+                self.aborted += 1
+                raise ConnectionResetError("client went away")
+            generation.result()
+        finally:
+            self.generating -= 1
+            hangup.cancel()
+            generation.cancel()  # no-op once it finished
+
+    async def _generate(self, writer, body: Dict[str, Any]) -> None:
+        model = body.get("model", "")
+        await asyncio.sleep(self._latency_for(model))
+        if model in self.failing_models:
+            await _send_json(writer, 500, {"error": f"model '{model}' failed"})
+            return
+        text = self.responder(model, body.get("prompt", ""))
+        tokens = text.split(" ")
+        rate = self._rate_for(model)
+        delay = 1.0 / rate if rate > 0 else 0.0
+        context = [len(self.requests)]
+        if not body.get("stream", True):
+            await asyncio.sleep(delay * len(tokens))
+            await _send_json(writer, 200, {"model": model, "response": text, "done": True, "context": context})
+            return
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for i, token in enumerate(tokens):
+            if delay:
+                await asyncio.sleep(delay)
+            piece = token if i == 0 else " " + token
+            _write_chunk(writer, {"model": model, "response": piece, "done": False})
+            await writer.drain()
+        _write_chunk(writer, {"model": model, "response": "", "done": True, "context": context})
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def _wait_for_eof(reader: asyncio.StreamReader) -> None:
+    # at_eof() turns true once the peer closed and nothing is left unread, so no request bytes are consumed
+    while not reader.at_eof():
+        await asyncio.sleep(0.01)
+
+
+async def _send_json(writer, status: int, payload: Dict[str, Any]) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body
+    )
+    await writer.drain()
+
+
+def _write_chunk(writer, payload: Dict[str, Any]) -> None:
+    data = json.dumps(payload).encode("utf-8") + b"\n"
+    writer.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+# Stands in for BackgroundAI_Bot.ps1 and its draft jobs: starts `children` sleeping processes (the
+# Start-Job runspaces / `ollama run` calls), writes their pids to a file, then hangs like a slow model
+TREE_SCRIPT = r'''
+import os, subprocess, sys, time
+pid_file, count = sys.argv[1], int(sys.argv[2])
+children = [subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"]) for _ in range(count)]
+with open(pid_file + ".tmp", "w") as f:
+    f.write(" ".join(str(c.pid) for c in children))
+os.replace(pid_file + ".tmp", pid_file)  # readers never see a partial list
+print("NightshadeAI: thinking", flush=True)
+time.sleep(60)
+'''
+
+
+def tree_command(pid_file: str, children: int = 2) -> List[str]:
+    return [sys.executable, "-c", TREE_SCRIPT, pid_file, str(children)]
+
+
+async def read_pids(pid_file: str, timeout: float = 10.0) -> List[int]:
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(pid_file):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{pid_file} was not written")
+        await asyncio.sleep(0.02)
+    with open(pid_file) as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def alive(pid: int) -> bool:
+    if os.path.isdir("/proc"):
+        # A zombie has exited; it only waits for its (new) parent to reap it
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+        except FileNotFoundError:
+            return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+async def survivors(pids: List[int], timeout: float = 5.0) -> List[int]:
+    # Processes from `pids` still running after up to `timeout` seconds
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = [pid for pid in pids if alive(pid)]
+        if not remaining or time.monotonic() > deadline:
+            return remaining
+        await asyncio.sleep(0.02)
@@ -0,0 +1,137 @@
+import asyncio
+import contextlib
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from .state import RedisStateBackend
+
+
+# -------------------------
+# Local stand-in for a Redis server (tests & single-host deployments)
+# -------------------------
+class FakeRedisServer:
+    # Speaks enough RESP2 for RedisStateBackend: PING, SELECT, GET, SET [EX|PX], INCRBY, PEXPIRE, PTTL, DEL,
+    # and EVAL of RedisStateBackend.INCR_SCRIPT only
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.commands: List[List[str]] = []
+        self.connections = 0
+        self.reply_delay = 0.0  # seconds before each reply: a slow or hung server
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}  # key -> (value, expires_at); shared by all dbs
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set[asyncio.Task] = set()
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def start(self) -> "FakeRedisServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._handlers):
+                task.cancel()
+            with contextlib.suppress(Exception):
+                await self._server.wait_closed()
+            self._server = None
+
+    def drop_connections(self) -> None:
+        for task in list(self._handlers):
+            task.cancel()
+
+    async def __aenter__(self) -> "FakeRedisServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    # --- RESP plumbing ---
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        self.connections += 1
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n")
+                if header[:1] != b"*":
+                    writer.write(b"-ERR inline commands are not supported\r\n")
+                    break
+                args = []
+                for _ in range(int(header[1:-2])):
+                    size = int((await reader.readuntil(b"\r\n"))[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2].decode("utf-8"))
+                self.commands.append(args)
+                if self.reply_delay:
+                    await asyncio.sleep(self.reply_delay)
+                writer.write(self._execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    def _live(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def _execute(self, args: List[str]) -> bytes:
+        name = args[0].upper()
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name == "SELECT":
+            return b"+OK\r\n"
+        if name == "GET":
+            entry = self._live(args[1])
+            return _bulk(None if entry is None else entry[0])
+        if name == "SET":
+            expires_at = None
+            if len(args) == 5:
+                unit = 1000.0 if args[3].upper() == "PX" else 1.0
+                expires_at = time.monotonic() + int(args[4]) / unit
+            self._data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if name == "INCRBY":
+            entry = self._live(args[1])
+            try:
+                value = (0 if entry is None else int(entry[0])) + int(args[2])
+            except ValueError:
+                return b"-ERR value is not an integer or out of range\r\n"
+            self._data[args[1]] = (str(value), None if entry is None else entry[1])
+            return b":%d\r\n" % value
+        if name == "EVAL" and args[1] == RedisStateBackend.INCR_SCRIPT:
+            key, amount, ttl_ms = args[3], args[4], args[5]
+            reply = self._execute(["INCRBY", key, amount])
+            if reply.startswith(b":") and self._data[key][1] is None:
+                self._execute(["PEXPIRE", key, ttl_ms])
+            return reply
+        if name == "PEXPIRE":
+            entry = self._live(args[1])
+            if entry is None:
+                return b":0\r\n"
+            self._data[args[1]] = (entry[0], time.monotonic() + int(args[2]) / 1000.0)
+            return b":1\r\n"
+        if name == "PTTL":
+            entry = self._live(args[1])
+            if entry is None:
+                return b":-2\r\n"
+            return b":%d\r\n" % (-1 if entry[1] is None else int((entry[1] - time.monotonic()) * 1000))
+        if name == "DEL":
+            removed = sum(1 for key in args[1:] if self._live(key) is not None and self._data.pop(key, None))
+            return b":%d\r\n" % removed
+        return f"-ERR unknown command '{args[0]}'\r\n".encode("utf-8")
+
+
+def _bulk(value: Optional[str]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    data = value.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
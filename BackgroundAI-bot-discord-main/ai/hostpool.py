@@ -0,0 +1,339 @@
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Set
+
+from .inventory import model_key
+from .ollama_client import OllamaClient, OllamaError, normalize_host
+
+log = logging.getLogger("nightshade-bot")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class NoHealthyHost(OllamaError):
+    pass
+
+
+class HostConfig(NamedTuple):
+    url: str
+    models: FrozenSet[str] = frozenset()  # model keys this host serves; empty serves every model
+    weight: float = 1.0
+
+
+def parse_hosts(value: str) -> List[HostConfig]:
+    # OLLAMA_HOSTS: [{"url": "http://gpu1:11434", "models": ["llama2-uncensored:7b"], "weight": 2}, ...]
+    # (a bare URL string is accepted in place of an object)
+    try:
+        entries = json.loads(value)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"OLLAMA_HOSTS must be a JSON list: {exc}") from None
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("OLLAMA_HOSTS must be a non-empty JSON list of hosts")
+    hosts = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        if not isinstance(entry, dict) or not entry.get("url"):
+            raise ValueError(f"OLLAMA_HOSTS entries need a url: {entry!r}")
+        weight = float(entry.get("weight", 1.0))
+        if weight <= 0:
+            raise ValueError(f"OLLAMA_HOSTS weight must be positive: {entry!r}")
+        models = frozenset(model_key(m) for m in entry.get("models") or ())
+        hosts.append(HostConfig(normalize_host(entry["url"]), models, weight))
+    return hosts
+
+
+def _is_host_failure(exc: BaseException) -> bool:
+    # Connection trouble and 5xx mean the host is sick; a 4xx (unknown model, bad request) does not
+    if isinstance(exc, OllamaError):
+        return exc.status is None or exc.status >= 500
+    return isinstance(exc, OSError)
+
+
+class CircuitBreaker:
+    # closed -> open after `failures` consecutive errors; after reset_sec one probe is let through
+    # (half-open), which closes it again or re-opens it with a doubled wait (capped at max_reset_sec)
+    def __init__(self, failures: int = 3, reset_sec: float = 30.0, max_reset_sec: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.threshold = failures
+        self.reset_sec = reset_sec
+        self.max_reset_sec = max_reset_sec
+        self._clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_until = 0.0
+        self.trips = 0
+        self._wait = reset_sec
+        self._probing = False
+
+    def allows(self) -> bool:
+        if self.state == OPEN and self._clock() >= self.opened_until:
+            self.state = HALF_OPEN
+        return self.state == CLOSED or (self.state == HALF_OPEN and not self._probing)
+
+    def begin(self) -> None:
+        if self.state == HALF_OPEN:
+            self._probing = True
+
+    def success(self) -> None:
+        self.consecutive_failures = 0
+        self._probing = False
+        if self.state != CLOSED:
+            self.state = CLOSED
+            self._wait = self.reset_sec
+
+    def failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN:
+            self._wait = min(self.max_reset_sec, self._wait * 2)
+            self._trip()
+        elif self.state == CLOSED and self.consecutive_failures >= self.threshold:
+            self._trip()
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_until - self._clock()) if self.state == OPEN else 0.0
+
+    def release(self) -> None:
+        # The probe was abandoned (e.g. cancelled by a deadline) without telling us anything
+        self._probing = False
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self.opened_until = self._clock() + self._wait
+        self.trips += 1
+
+
+class Host:
+    def __init__(self, config: HostConfig, client, breaker: CircuitBreaker, smoothing: float):
+        self.config = config
+        self.client = client
+        self.breaker = breaker
+        self.smoothing = smoothing
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency_sec: Optional[float] = None  # moving average per request
+        self.models: FrozenSet[str] = frozenset()  # from the last successful health check
+
+    @property
+    def url(self) -> str:
+        return self.config.url
+
+    def serves(self, model: str) -> bool:
+        return not self.config.models or model_key(model) in self.config.models
+
+    def score(self, default_latency: float) -> float:
+        # Expected wait if one more request lands here, scaled down by the host's weight
+        latency = self.latency_sec if self.latency_sec is not None else default_latency
+        return (self.outstanding + 1) * latency / self.config.weight
+
+    def observe(self, seconds: float) -> None:
+        if self.latency_sec is None:
+            self.latency_sec = seconds
+        else:
+            self.latency_sec += self.smoothing * (seconds - self.latency_sec)
+
+
+# -------------------------
+# Ollama host pool: least-loaded routing over several hosts, health checks, circuit breakers
+# -------------------------
+class OllamaHostPool:
+    # Speaks the OllamaClient API, so the pipeline and model inventory can use it unchanged
+    def __init__(self, hosts: Sequence[HostConfig], *, max_connections: int = 8, health_interval_sec: float = 10.0,
+                 health_timeout_sec: float = 5.0, breaker_failures: int = 3, breaker_reset_sec: float = 30.0,
+                 smoothing: float = 0.2, client_factory: Optional[Callable[[str], Any]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if not hosts:
+            raise ValueError("OllamaHostPool needs at least one host")
+        make_client = client_factory or (lambda url: OllamaClient(url, max_connections=max_connections))
+        self.hosts = [
+            Host(config, make_client(config.url), CircuitBreaker(breaker_failures, breaker_reset_sec, clock=clock),
+                 smoothing)
+            for config in hosts
+        ]
+        self.health_interval_sec = health_interval_sec
+        self.health_timeout_sec = health_timeout_sec
+        self.failovers = 0
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._health_task is not None and not self._health_task.done()
+
+    def start(self) -> None:
+        if not self.running and self.health_interval_sec > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._health_task
+        for host in self.hosts:
+            await host.client.close()
+
+    def pick(self, model: str, exclude: Set[Host] = frozenset()) -> Host:
+        candidates = [h for h in self.hosts if h not in exclude and h.serves(model) and h.breaker.allows()]
+        if not candidates:
+            raise NoHealthyHost(f"No healthy Ollama host serves '{model}'.")
+        # Hosts nobody has measured yet are assumed as fast as the average measured one
+        measured = [h.latency_sec for h in self.hosts if h.latency_sec is not None]
+        default = sum(measured) / len(measured) if measured else 1.0
+        return min(candidates, key=lambda h: (h.score(default), h.requests))
+
+    # --- OllamaClient API ---
+    async def generate(self, model: str, prompt: str, **kwargs) -> Dict[str, Any]:
+        tried: Set[Host] = set()
+        while True:
+            host = self._pick_for_retry(model, tried)
+            try:
+                return await self._call(host, host.client.generate(model, prompt, **kwargs))
+            except (OllamaError, OSError) as exc:
+                if not _is_host_failure(exc) or not self._has_fallback(model, tried | {host}):
+                    raise
+                tried.add(host)
+
+    async def stream_generate(self, model: str, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        tried: Set[Host] = set()
+        while True:
+            host = self._pick_for_retry(model, tried)
+            yielded = False
+            self._begin(host)
+            started = time.monotonic()
+            try:
+                async with contextlib.aclosing(host.client.stream_generate(model, prompt, **kwargs)) as stream:
+                    async for item in stream:
+                        yielded = True
+                        yield item
+            except (OllamaError, OSError) as exc:
+                self._end(host, started, exc)
+                # Once tokens reached the caller another host cannot take over seamlessly
+                if yielded or not _is_host_failure(exc) or not self._has_fallback(model, tried | {host}):
+                    raise
+                tried.add(host)
+                continue
+            except BaseException:
+                self._end(host, started, None, abandoned=True)
+                raise
+            self._end(host, started, None)
+            return
+
+    async def embed(self, model: str, text: str, **kwargs) -> List[float]:
+        tried: Set[Host] = set()
+        while True:
+            host = self._pick_for_retry(model, tried)
+            try:
+                return await self._call(host, host.client.embed(model, text, **kwargs), timed=False)
+            except (OllamaError, OSError) as exc:
+                if not _is_host_failure(exc) or not self._has_fallback(model, tried | {host}):
+                    raise
+                tried.add(host)
+
+    async def list_models(self) -> List[str]:
+        # Models available on at least one healthy host
+        names: Set[str] = set()
+        errors = []
+        for host in self.hosts:
+            if not host.breaker.allows():
+                continue
+            try:
+                listed = await self._call(host, host.client.list_models(), timed=False)
+            except (OllamaError, OSError) as exc:
+                errors.append(exc)
+                continue
+            host.models = frozenset(model_key(n) for n in listed)
+            names.update(n for n in listed if host.serves(n))
+        if not names and errors:
+            raise errors[0]
+        return sorted(names)
+
+    async def pull(self, model: str) -> Dict[str, Any]:
+        # Every healthy host meant to serve the model gets it, so routing can use all of them
+        result: Dict[str, Any] = {}
+        hosts = [h for h in self.hosts if h.serves(model) and h.breaker.allows()]
+        if not hosts:
+            raise NoHealthyHost(f"No healthy Ollama host serves '{model}'.")
+        for host in hosts:
+            if model_key(model) not in host.models:
+                result = await self._call(host, host.client.pull(model), timed=False)
+        return result
+
+    # --- internals ---
+    def _has_fallback(self, model: str, tried: Set[Host]) -> bool:
+        return any(h not in tried and h.serves(model) and h.breaker.allows() for h in self.hosts)
+
+    def _pick_for_retry(self, model: str, tried: Set[Host]) -> Host:
+        host = self.pick(model, exclude=tried)
+        if tried:
+            self.failovers += 1
+            log.info("Failing over '%s' to %s", model, host.url)
+        return host
+
+    async def _call(self, host: Host, call, timed: bool = True):
+        # Listing and pulling take part in health accounting but not in the latency used for routing
+        self._begin(host)
+        started = time.monotonic() if timed else None
+        try:
+            result = await call
+        except (OllamaError, OSError) as exc:
+            self._end(host, started, exc)
+            raise
+        except BaseException:
+            self._end(host, started, None, abandoned=True)
+            raise
+        self._end(host, started, None)
+        return result
+
+    def _begin(self, host: Host) -> None:
+        host.breaker.begin()
+        host.outstanding += 1
+        host.requests += 1
+
+    def _end(self, host: Host, started: Optional[float], error: Optional[BaseException],
+             abandoned: bool = False) -> None:
+        host.outstanding -= 1
+        if error is not None and _is_host_failure(error):
+            host.failures += 1
+            self._record_failure(host, error)
+            return
+        if started is not None:
+            host.observe(time.monotonic() - started)
+        if abandoned:
+            # Cancelled by a deadline: the time spent still says the host is slow, but not that it is down
+            host.breaker.release()
+        else:
+            host.breaker.success()
+
+    def _record_failure(self, host: Host, error: BaseException) -> None:
+        was_open = host.breaker.state == OPEN
+        host.breaker.failure()
+        if host.breaker.state == OPEN and not was_open:
+            log.warning("Ejecting Ollama host %s for %.0fs: %s", host.url, host.breaker.retry_in(), error)
+
+    async def check(self, host: Host) -> bool:
+        # Active health check; for an ejected host whose wait is over it is the probe that lets it back in
+        if not host.breaker.allows():
+            return False
+        host.breaker.begin()
+        try:
+            listed = await asyncio.wait_for(host.client.list_models(), timeout=self.health_timeout_sec)
+        except (OllamaError, OSError, asyncio.TimeoutError) as exc:
+            self._record_failure(host, exc if not isinstance(exc, asyncio.TimeoutError) else OSError("timeout"))
+            return False
+        except BaseException:
+            host.breaker.release()
+            raise
+        if host.breaker.state != CLOSED:
+            log.info("Ollama host %s is back", host.url)
+        host.models = frozenset(model_key(n) for n in listed)
+        host.breaker.success()
+        return True
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self.check(h) for h in self.hosts))
+            await asyncio.sleep(self.health_interval_sec)
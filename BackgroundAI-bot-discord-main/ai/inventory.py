@@ -0,0 +1,160 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
+
+from .ollama_client import OllamaError
+
+log = logging.getLogger("nightshade-bot")
+
+WARMUP_PROMPT = "hi"
+
+
+def model_key(name: str) -> str:
+    # Ollama lists "llama2" as "llama2:latest"
+    return name if ":" in name else f"{name}:latest"
+
+
+# -------------------------
+# Model inventory: pull + warm up once, keep resident, refresh the listing in the background
+# -------------------------
+class ModelInventory:
+    def __init__(self, client, models: Sequence[str], *, embedding_models: Sequence[str] = (), auto_pull: bool = True,
+                 keep_alive: Optional[str] = "30m", refresh_sec: float = 300.0, ping_sec: float = 240.0,
+                 warmup_timeout_sec: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.client = client
+        self.models = tuple(dict.fromkeys(tuple(models) + tuple(embedding_models)))
+        self.embedding_models = frozenset(embedding_models)  # cannot generate, so they are warmed with an embedding
+        self.auto_pull = auto_pull
+        self.keep_alive = keep_alive  # passed to Ollama with every warm-up and ping
+        self.refresh_sec = refresh_sec
+        self.ping_sec = ping_sec  # 0 disables keep-alive pings
+        self.warmup_timeout_sec = warmup_timeout_sec
+        self._clock = clock
+        self.available: FrozenSet[str] = frozenset()
+        self.refreshed_at: Optional[float] = None
+        self.warmup_sec: Dict[str, float] = {}  # model -> seconds its warm-up generation took
+        self.errors: Dict[str, str] = {}  # model -> why it could not be pulled or warmed
+        self.pulled: List[str] = []
+        self.refreshes = 0
+        self.pings = 0
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def ready(self) -> bool:
+        # The startup phase finished (whether or not every model made it)
+        return self._ready.is_set()
+
+    @property
+    def missing(self) -> List[str]:
+        return [m for m in self.models if model_key(m) not in self.available]
+
+    def has(self, model: str) -> bool:
+        return model_key(model) in self.available
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def wait_ready(self) -> None:
+        await self._ready.wait()
+
+    async def refresh(self) -> List[str]:
+        names = await self.client.list_models()
+        self.available = frozenset(model_key(n) for n in names)
+        self.refreshed_at = self._clock()
+        self.refreshes += 1
+        return self.missing
+
+    async def ensure(self) -> None:
+        missing = await self.refresh()
+        if not missing:
+            return
+        if not self.auto_pull:
+            for model in missing:
+                self.errors[model] = "not pulled (auto-pull disabled)"
+            log.error("Missing models: %s. Run 'ollama pull <model>' or enable AI_AUTO_PULL.", ", ".join(missing))
+            return
+        for model in missing:
+            log.info("Pulling model %s", model)
+            try:
+                await self.client.pull(model)
+            except (OllamaError, OSError) as exc:
+                self.errors[model] = f"pull failed: {exc}"
+                log.error("Failed to pull model '%s': %s", model, exc)
+            else:
+                self.pulled.append(model)
+                self.errors.pop(model, None)
+        await self.refresh()
+
+    async def warm_up(self) -> None:
+        # One model at a time: loading several into RAM at once only makes each slower
+        for model in self.models:
+            if not self.has(model):
+                continue
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._load(model, WARMUP_PROMPT), timeout=self.warmup_timeout_sec)
+            except (OllamaError, OSError, asyncio.TimeoutError) as exc:
+                self.errors[model] = f"warm-up failed: {exc or 'timeout'}"
+                log.warning("Warm-up of '%s' failed: %s", model, exc or "timeout")
+                continue
+            self.warmup_sec[model] = time.perf_counter() - started
+            self.errors.pop(model, None)
+            log.info("Warmed up %s in %.1fs", model, self.warmup_sec[model])
+
+    async def ping(self) -> None:
+        # An empty prompt only loads the model and restarts its keep-alive timer; nothing is generated
+        for model in self.models:
+            if self.has(model):
+                try:
+                    await self._load(model, "")
+                    self.pings += 1
+                except (OllamaError, OSError) as exc:
+                    log.warning("Keep-alive ping to '%s' failed: %s", model, exc)
+
+    async def _load(self, model: str, prompt: str) -> None:
+        if model in self.embedding_models:
+            await self.client.embed(model, prompt or WARMUP_PROMPT, keep_alive=self.keep_alive)
+        elif prompt:
+            await self.client.generate(model, prompt, options={"num_predict": 1}, keep_alive=self.keep_alive)
+        else:
+            await self.client.generate(model, prompt, keep_alive=self.keep_alive)
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _run(self) -> None:
+        try:
+            await self.ensure()
+            await self.warm_up()
+        except (OllamaError, OSError) as exc:
+            log.warning("Model check at startup failed: %s", exc)
+        finally:
+            self._ready.set()
+        next_refresh = self._clock() + self.refresh_sec
+        next_ping = self._clock() + self.ping_sec if self.ping_sec else float("inf")
+        while True:
+            await asyncio.sleep(max(0.0, min(next_refresh, next_ping) - self._clock()))
+            now = self._clock()
+            try:
+                if now >= next_refresh:
+                    next_refresh = now + self.refresh_sec
+                    if await self.refresh() and self.auto_pull:
+                        # A model was removed (or Ollama restarted empty): pull and load it again
+                        await self.ensure()
+                        await self.warm_up()
+                if now >= next_ping:
+                    next_ping = now + self.ping_sec
+                    await self.ping()
+            except (OllamaError, OSError) as exc:
+                log.warning("Model inventory refresh failed: %s", exc)
@@ -0,0 +1,249 @@
+import asyncio
+import contextlib
+import json
+import ssl
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+
+
+class OllamaError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status  # HTTP status when the server answered with an error
+
+
+def normalize_host(host: Optional[str]) -> str:
+    # OLLAMA_HOST is often set without a scheme (e.g. "0.0.0.0:11434")
+    host = (host or DEFAULT_OLLAMA_HOST).strip().rstrip("/")
+    if "://" not in host:
+        host = "http://" + host
+    return host
+
+
+# -------------------------
+# Connection pool
+# -------------------------
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self) -> None:
+        with contextlib.suppress(Exception):
+            self.writer.close()
+
+
+class OllamaClient:
+    # Minimal HTTP/1.1 client for the Ollama API with pooled keep-alive connections
+    def __init__(self, host: Optional[str] = None, *, max_connections: int = 8, connect_timeout: float = 10.0):
+        self.base_url = normalize_host(host)
+        parts = urlsplit(self.base_url)
+        self._host = parts.hostname or "localhost"
+        self._ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        self._port = parts.port or (443 if self._ssl else 80)
+        self._prefix = parts.path.rstrip("/")
+        self._connect_timeout = connect_timeout
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle: List[_Connection] = []
+        self.connections_opened = 0
+
+    async def close(self) -> None:
+        while self._idle:
+            self._idle.pop().close()
+
+    # --- public API ---
+    async def generate(self, model: str, prompt: str, *, options: Optional[Dict[str, Any]] = None,
+                       context: Optional[List[int]] = None, keep_alive: Optional[str] = None) -> Dict[str, Any]:
+        payload = _generate_payload(model, prompt, options, context, keep_alive, stream=False)
+        return await self.request_json("POST", "/api/generate", payload)
+
+    async def stream_generate(self, model: str, prompt: str, *, options: Optional[Dict[str, Any]] = None,
+                              context: Optional[List[int]] = None,
+                              keep_alive: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        payload = _generate_payload(model, prompt, options, context, keep_alive, stream=True)
+        async for item in self.request_lines("POST", "/api/generate", payload):
+            yield item
+
+    async def embed(self, model: str, text: str, *, keep_alive: Optional[str] = None) -> List[float]:
+        payload: Dict[str, Any] = {"model": model, "input": text}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        data = await self.request_json("POST", "/api/embed", payload)
+        embeddings = data.get("embeddings") or []
+        if not embeddings or not embeddings[0]:
+            raise OllamaError(f"No embedding returned by '{model}'")
+        return [float(x) for x in embeddings[0]]
+
+    async def list_models(self) -> List[str]:
+        data = await self.request_json("GET", "/api/tags")
+        return [m.get("name", "") for m in data.get("models", [])]
+
+    async def pull(self, model: str) -> Dict[str, Any]:
+        return await self.request_json("POST", "/api/pull", {"model": model, "stream": False})
+
+    # --- transport ---
+    async def request_json(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        async with self._slots:
+            conn, status, headers = await self._send(method, path, payload)
+            reusable = False
+            try:
+                body = b"".join([part async for part in _iter_body(conn.reader, headers)])
+                reusable = headers.get("connection", "").lower() != "close"
+            finally:
+                self._release(conn, reusable)
+        data = _decode_json(body)
+        if status >= 400:
+            raise OllamaError(f"{method} {path} failed with HTTP {status}: {data.get('error', body[:200])}", status)
+        return data
+
+    async def request_lines(self, method: str, path: str,
+                            payload: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        async with self._slots:
+            conn, status, headers = await self._send(method, path, payload)
+            reusable = False
+            try:
+                if status >= 400:
+                    body = b"".join([part async for part in _iter_body(conn.reader, headers)])
+                    raise OllamaError(
+                        f"{method} {path} failed with HTTP {status}: {_decode_json(body).get('error', body[:200])}",
+                        status,
+                    )
+                pending = b""
+                async for part in _iter_body(conn.reader, headers):
+                    pending += part
+                    *lines, pending = pending.split(b"\n")
+                    for line in lines:
+                        if line.strip():
+                            item = _decode_json(line)
+                            if "error" in item:
+                                raise OllamaError(str(item["error"]))
+                            yield item
+                if pending.strip():
+                    yield _decode_json(pending)
+                reusable = headers.get("connection", "").lower() != "close"
+            finally:
+                # An abandoned stream leaves unread bytes on the socket, so it is closed, not pooled
+                self._release(conn, reusable)
+
+    async def _send(self, method: str, path: str,
+                    payload: Optional[Dict[str, Any]]) -> Tuple[_Connection, int, Dict[str, str]]:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        head = (
+            f"{method} {self._prefix}{path} HTTP/1.1\r\n"
+            f"Host: {self._host}:{self._port}\r\n"
+            "Connection: keep-alive\r\n"
+            "Accept: application/json\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode("ascii")
+        while True:
+            conn, reused = await self._acquire()
+            try:
+                conn.writer.write(head + body)
+                await conn.writer.drain()
+                status, headers = await _read_head(conn.reader)
+                return conn, status, headers
+            except (ConnectionError, asyncio.IncompleteReadError, OllamaError):
+                conn.close()
+                # The server may have dropped an idle keep-alive socket; retry once on a fresh one
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+    async def _acquire(self) -> Tuple[_Connection, bool]:
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn.reader.at_eof() and not conn.writer.is_closing():
+                return conn, True
+            conn.close()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self._host, self._port, ssl=self._ssl),
+                timeout=self._connect_timeout,
+            )
+        except asyncio.TimeoutError as exc:
+            raise ConnectionError(f"Timed out connecting to {self.base_url}") from exc
+        self.connections_opened += 1
+        return _Connection(reader, writer), False
+
+    def _release(self, conn: _Connection, reusable: bool) -> None:
+        if reusable and not conn.reader.at_eof():
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+
+# -------------------------
+# HTTP helpers
+# -------------------------
+def _generate_payload(model, prompt, options, context, keep_alive, stream: bool) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {"model": model, "prompt": prompt, "stream": stream}
+    if options:
+        payload["options"] = options
+    if context:
+        payload["context"] = context
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    return payload
+
+
+def _decode_json(raw: bytes) -> Dict[str, Any]:
+    if not raw.strip():
+        return {}
+    try:
+        data = json.loads(raw)
+    except ValueError as exc:
+        raise OllamaError(f"Invalid JSON from Ollama: {raw[:200]!r}") from exc
+    return data if isinstance(data, dict) else {"value": data}
+
+
+async def _read_head(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed before response")
+    try:
+        status = int(status_line.split(b" ", 2)[1])
+    except (IndexError, ValueError) as exc:
+        raise OllamaError(f"Malformed status line: {status_line[:100]!r}") from exc
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+async def _iter_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> AsyncIterator[bytes]:
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # Drain optional trailers up to the terminating blank line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            chunk = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield chunk
+    elif "content-length" in headers:
+        remaining = int(headers["content-length"])
+        while remaining > 0:
+            chunk = await reader.read(min(remaining, 65536))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return
+            yield chunk
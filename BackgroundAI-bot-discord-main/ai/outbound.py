@@ -0,0 +1,177 @@
+import asyncio
+import collections
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional
+
+from .cleaning import iter_discord_chunks
+from .ratelimit import Limit
+
+# Discord allows 5 messages per 5s in a channel and about 50 requests per second per bot
+DEFAULT_CHANNEL_LIMIT = Limit(1.0, 5)
+DEFAULT_GLOBAL_LIMIT = Limit(50.0, 50)
+ATTACHMENT_NOTE = "\n\n📄 The full answer is long, so it is attached as `{name}`."
+
+FileFactory = Callable[[bytes, str], Any]  # (data, filename) -> discord.File
+
+
+class OutboundMessage(NamedTuple):
+    content: str
+    attachment: Optional[bytes] = None  # sent as a file named OutboundSender.attachment_name
+
+
+class _Pacer:
+    # Token bucket that hands out future send times instead of refusing, so callers just sleep
+    __slots__ = ("limit", "tokens", "updated")
+
+    def __init__(self, limit: Limit, now: float):
+        self.limit = limit
+        self.tokens = float(limit.burst)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        self.tokens = min(self.limit.burst, self.tokens + (now - self.updated) * self.limit.rate_per_sec)
+        self.updated = now
+        self.tokens -= 1.0
+        return max(0.0, -self.tokens / self.limit.rate_per_sec)
+
+    def full_at(self) -> float:
+        return self.updated + (self.limit.burst - self.tokens) / self.limit.rate_per_sec
+
+
+class _Delivery:
+    __slots__ = ("channel", "messages", "allowed_mentions", "future")
+
+    def __init__(self, channel, messages: List[OutboundMessage], allowed_mentions: Any):
+        self.channel = channel
+        self.messages = messages
+        self.allowed_mentions = allowed_mentions
+        self.future: "asyncio.Future[List[Any]]" = asyncio.get_running_loop().create_future()
+
+
+# -------------------------
+# Outbound sender: per-channel FIFO queues paced to Discord's rate-limit buckets
+# -------------------------
+class OutboundSender:
+    def __init__(self, *, channel_limit: Limit = DEFAULT_CHANNEL_LIMIT,
+                 global_limit: Optional[Limit] = DEFAULT_GLOBAL_LIMIT, attach_after_chunks: int = 0,
+                 attachment_name: str = "answer.md", make_file: Optional[FileFactory] = None,
+                 on_api_call: Optional[Callable[[str, float], None]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.channel_limit = channel_limit
+        self.attach_after_chunks = attach_after_chunks  # 0 never attaches
+        self.attachment_name = attachment_name
+        self.make_file = make_file
+        self.on_api_call = on_api_call  # (operation, seconds) for every Discord call
+        self._clock = clock
+        self._global = _Pacer(global_limit, clock()) if global_limit is not None else None
+        self._queues: Dict[int, Deque[_Delivery]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._pacers: Dict[int, _Pacer] = {}
+        self.sent = 0
+        self.attachments = 0
+        self.failed = 0
+        self.waited_sec = 0.0  # time spent holding messages back for rate limits
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(d.messages) for queue in self._queues.values() for d in queue)
+
+    def plan(self, text: str, *, header: str = "", limit: int = 2000) -> List[OutboundMessage]:
+        chunk_limit = max(1, limit - len(header))
+        chunks = list(iter_discord_chunks(text, chunk_limit))
+        if self.attach_after_chunks and self.make_file is not None and len(chunks) > self.attach_after_chunks:
+            # One message with a preview plus the whole answer as a file instead of a wall of messages
+            note = ATTACHMENT_NOTE.format(name=self.attachment_name)
+            preview = next(iter_discord_chunks(text, max(1, chunk_limit - len(note))), "")
+            return [OutboundMessage(f"{header}{preview}{note}", text.encode("utf-8"))]
+        return [OutboundMessage(f"{header}{chunk}") for chunk in chunks]
+
+    async def deliver(self, channel, text: str, *, header: str = "", limit: int = 2000,
+                      allowed_mentions: Any = None) -> List[Any]:
+        # Every message of one answer goes out back to back, in order, before the next queued answer
+        return await self.submit(channel, self.plan(text, header=header, limit=limit), allowed_mentions)
+
+    async def send(self, channel, content: str, *, allowed_mentions: Any = None) -> Any:
+        sent = await self.submit(channel, [OutboundMessage(content)], allowed_mentions)
+        return sent[0]
+
+    def submit(self, channel, messages: List[OutboundMessage],
+               allowed_mentions: Any = None) -> "asyncio.Future[List[Any]]":
+        delivery = _Delivery(channel, messages, allowed_mentions)
+        queue = self._queues.setdefault(channel.id, collections.deque())
+        queue.append(delivery)
+        if channel.id not in self._workers:
+            self._workers[channel.id] = asyncio.create_task(self._drain(channel.id))
+        return delivery.future
+
+    async def aclose(self) -> None:
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _drain(self, channel_id: int) -> None:
+        queue = self._queues[channel_id]
+        try:
+            while queue:
+                delivery = queue[0]
+                if not delivery.future.done():  # skip answers whose requester already gave up
+                    try:
+                        sent = await self._send_all(channel_id, delivery)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as exc:
+                        # The rest of this answer is dropped; later answers in the channel still go out
+                        self.failed += 1
+                        if not delivery.future.done():
+                            delivery.future.set_exception(exc)
+                    else:
+                        if not delivery.future.done():
+                            delivery.future.set_result(sent)
+                queue.popleft()
+        finally:
+            for delivery in queue:
+                if not delivery.future.done():
+                    delivery.future.cancel()
+            del self._queues[channel_id]
+            del self._workers[channel_id]
+            self._forget_idle_channels()
+
+    async def _send_all(self, channel_id: int, delivery: _Delivery) -> List[Any]:
+        sent = []
+        for message in delivery.messages:
+            await self._wait_for_slot(channel_id)
+            kwargs: Dict[str, Any] = {"allowed_mentions": delivery.allowed_mentions}
+            if message.attachment is not None:
+                kwargs["file"] = self.make_file(message.attachment, self.attachment_name)
+                self.attachments += 1
+            sent.append(await self._timed("send", delivery.channel.send(message.content, **kwargs)))
+            self.sent += 1
+        return sent
+
+    async def _wait_for_slot(self, channel_id: int) -> None:
+        now = self._clock()
+        pacer = self._pacers.get(channel_id)
+        if pacer is None:
+            pacer = self._pacers[channel_id] = _Pacer(self.channel_limit, now)
+        delay = pacer.reserve(now)
+        if self._global is not None:
+            delay = max(delay, self._global.reserve(now))
+        if delay > 0:
+            self.waited_sec += delay
+            await asyncio.sleep(delay)
+
+    def _forget_idle_channels(self) -> None:
+        # A bucket that has refilled is the same as a fresh one; drop them to keep memory bounded
+        if len(self._pacers) > 2 * len(self._workers) + 64:
+            now = self._clock()
+            for channel_id in [c for c, p in self._pacers.items() if p.full_at() <= now and c not in self._workers]:
+                del self._pacers[channel_id]
+
+    async def _timed(self, operation: str, call: Awaitable[Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return await call
+        finally:
+            if self.on_api_call is not None:
+                self.on_api_call(operation, time.perf_counter() - started)
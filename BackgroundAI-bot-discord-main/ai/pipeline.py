@@ -0,0 +1,469 @@
+import asyncio
+import contextlib
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .checkpoints import Checkpoint, DraftCheckpoints, draft_key
+from .conversation import History, Turn
+from .ollama_client import OllamaError
+from .similarity import best_draft, draft_similarity
+
+log = logging.getLogger("nightshade-bot")
+
+# -------------------------
+# Exit codes (kept in sync with BackgroundAI_Bot.ps1)
+# -------------------------
+EXIT_OK = 0
+EXIT_ENV = 1
+EXIT_NO_DRAFTS = 2
+EXIT_SUMMARIZER_EMPTY = 3
+EXIT_SUMMARIZER_ERROR = 4
+EXIT_TIMEOUT = 5
+EXIT_PULL_ERROR = 6
+# Merge failures worth a second try with the fallback summarizer
+FALLBACK_EXIT_CODES = (EXIT_SUMMARIZER_ERROR, EXIT_TIMEOUT)
+
+DEFAULT_MODELS: Tuple[str, ...] = ("llama2-uncensored:7b", "mistral-openorca:7b")
+DEFAULT_SUMMARIZER_MODEL = "mistral-openorca:7b"
+DEFAULT_PERSONA = (
+    "You are NightshadeAI, an advanced AI with human-like understanding.\n"
+    "Always respond thoughtfully and concisely.\n"
+    "Do not include loading animations, spinners, extra persona tags, or repeated headers.\n"
+    "Only output clear, human-readable answers."
+)
+
+
+@dataclass
+class PipelineConfig:
+    models: Tuple[str, ...] = DEFAULT_MODELS
+    summarizer_model: str = DEFAULT_SUMMARIZER_MODEL
+    temperature: float = 0.2
+    max_tokens: int = 512
+    timeout_sec: float = 120.0
+    retries: int = 1
+    retry_delay_sec: float = 1.0
+    ascii_only: bool = False
+    persona: str = DEFAULT_PERSONA
+    # Deadline propagation: the whole run must finish within deadline_sec (None = per-stage timeouts only)
+    deadline_sec: Optional[float] = None
+    draft_budget_share: float = 0.5  # share of the remaining budget the draft stage may use
+    min_drafts: int = 0  # merge as soon as this many drafts arrived (0 = wait for every model)
+    hedge_after_sec: Optional[float] = None  # duplicate a draft request still running after this long
+    # Skip the summarizer when every pair of drafts overlaps at least this much (a lone draft counts as 1.0);
+    # above 1 always merges
+    skip_merge_similarity: float = 0.7
+    keep_alive: Optional[str] = None  # how long Ollama keeps each model loaded after a request (e.g. "30m")
+    # Merge again with this model when the summarizer errors or times out (exit 4/5); the drafts are reused
+    fallback_summarizer_model: Optional[str] = None
+
+
+@dataclass
+class PipelineResult:
+    answer: str
+    exit_code: int
+    drafts: List[str] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+    merge_skipped: bool = False
+    drafts_by_model: Dict[str, str] = field(default_factory=dict)  # the drafts above, keyed by their model
+    # model -> Ollama context ending right after this answer; only set for models whose draft became the answer
+    contexts: Dict[str, List[int]] = field(default_factory=dict)
+    similarity: Optional[float] = None  # lowest pairwise draft overlap (0-1); None when no drafts were compared
+
+
+class MergeStats:
+    # How often the summarizer was skipped and roughly how much time that saved, for tuning the threshold
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self.merged = 0
+        self.skipped = 0
+        self.seconds_saved = 0.0
+        self.summarizer_avg_sec: Optional[float] = None
+        self._similarity_sums = {True: 0.0, False: 0.0}
+
+    def record(self, result: PipelineResult) -> None:
+        if result.similarity is not None:
+            self._similarity_sums[result.merge_skipped] += result.similarity
+        if result.merge_skipped:
+            self.skipped += 1
+            # Estimated from recent summarizer runs; nothing is claimed before one has been seen
+            self.seconds_saved += self.summarizer_avg_sec or 0.0
+        elif "summarizer" in result.timings:
+            self.merged += 1
+            took = result.timings["summarizer"]
+            if self.summarizer_avg_sec is None:
+                self.summarizer_avg_sec = took
+            else:
+                self.summarizer_avg_sec += self.smoothing * (took - self.summarizer_avg_sec)
+
+    def mean_similarity(self, skipped: bool) -> float:
+        count = self.skipped if skipped else self.merged
+        return self._similarity_sums[skipped] / count if count else 0.0
+
+
+# Receives the accumulated (uncleaned) summarizer text each time a token arrives
+ProgressCallback = Callable[[str], None]
+# Receives the Ollama context returned with a finished generation
+ContextCallback = Callable[[List[int]], None]
+
+
+class ModelTimeout(Exception):
+    pass
+
+
+class EmptyModelOutput(Exception):
+    pass
+
+
+def _remaining(deadline: Optional[float]) -> float:
+    return float("inf") if deadline is None else deadline - time.monotonic()
+
+
+# -------------------------
+# Prompts & cleaning (mirrors Clean-Output / $finalPrompt / $summarizerPrompt)
+# -------------------------
+BRAILLE_RE = re.compile(r'[\u2800-\u28FF]')
+PERSONA_TAG_RE = re.compile(r'(?im)^\s*NightshadeAI:\s*')
+BLANK_LINES_RE = re.compile(r'(\r?\n){3,}')
+
+
+def clean_draft(text: str, ascii_only: bool = False) -> str:
+    if not text:
+        return ""
+    text = BRAILLE_RE.sub('', text)
+    text = PERSONA_TAG_RE.sub('', text)
+    text = BLANK_LINES_RE.sub('\n\n', text)
+    if ascii_only:
+        text = "".join(ch for ch in text if 9 <= ord(ch) <= 126 or ch in "\r\n\t")
+    return text.strip()
+
+
+def build_prompt(persona: str, question: str, history: Optional[History] = None) -> str:
+    if not history:
+        return f"{persona}\n\nUser: {question}\nNightshadeAI:".strip()
+    # Earlier turns only ever get appended, so Ollama's prompt cache keeps the persona + history prefix warm
+    blocks = [persona]
+    if history.summary:
+        blocks.append(f"Summary of the earlier conversation:\n{history.summary}")
+    blocks.extend(f"User: {turn.question}\nNightshadeAI: {turn.answer}" for turn in history.turns)
+    blocks.append(f"User: {question}\nNightshadeAI:")
+    return "\n\n".join(blocks).strip()
+
+
+def build_followup_prompt(question: str) -> str:
+    # Continues an Ollama context that already holds the persona and every earlier turn
+    return f"\n\nUser: {question}\nNightshadeAI:"
+
+
+def build_compaction_prompt(summary: str, turns: Sequence[Turn], max_tokens: int) -> str:
+    lines = [f"User: {turn.question}\nNightshadeAI: {turn.answer}" for turn in turns]
+    previous = f"Summary so far:\n{summary}\n\n" if summary else ""
+    return (
+        "Summarize the conversation below so it can replace the original turns.\n"
+        "Keep names, facts, decisions and open questions; drop greetings and filler.\n"
+        f"Write plain prose, at most {max(1, max_tokens * 3 // 4)} words, with no headers or persona tags.\n\n"
+        f"{previous}"
+        "Conversation:\n" + "\n\n".join(lines) + "\n\n"
+        "Summary:"
+    ).strip()
+
+
+def build_summarizer_prompt(persona: str, drafts: Sequence[str], max_tokens: int) -> str:
+    # rough chars≈tokens*~4, room to merge
+    per_draft_cap = max(2000, int(max_tokens * 6))
+    blocks = []
+    for draft in drafts:
+        draft = draft.strip()
+        if len(draft) > per_draft_cap:
+            draft = draft[:per_draft_cap] + " …"
+        blocks.append(f"<<<DRAFT>>>\n{draft}\n<<<END>>>")
+    merge_text = "\n".join(blocks)
+    return (
+        f"{persona}\n\n"
+        "You will be given multiple draft answers, each wrapped in:\n"
+        "<<<DRAFT>>>\n...content...\n<<<END>>>\n\n"
+        "Task:\n"
+        "1) Synthesize a single, clear NightshadeAI response.\n"
+        "2) Eliminate duplicates and contradictions.\n"
+        "3) Keep the voice concise, human, and helpful.\n"
+        "4) Do not include any headers or persona tags in the output.\n\n"
+        f"Drafts:\n{merge_text}\n\n"
+        "Final Answer:"
+    ).strip()
+
+
+# -------------------------
+# Fan-out -> merge pipeline over the Ollama HTTP API
+# -------------------------
+class Pipeline:
+    def __init__(self, client, config: Optional[PipelineConfig] = None,
+                 checkpoints: Optional[DraftCheckpoints] = None):
+        self.client = client
+        self.config = config or PipelineConfig()
+        self.checkpoints = checkpoints  # shared by every pipeline of the bot; keys include the settings
+        self.hedges = 0
+        self.stragglers_dropped = 0
+        self.fallbacks = 0
+
+    async def run(self, question: str, on_progress: Optional[ProgressCallback] = None,
+                  history: Optional[History] = None) -> PipelineResult:
+        cfg = self.config
+        started = time.monotonic()
+        deadline = None if cfg.deadline_sec is None else started + cfg.deadline_sec
+        timings: Dict[str, float] = {}
+        prompts = {}
+        for model in dict.fromkeys(cfg.models):
+            # A model whose context already ends after the last turn only needs the new question prefilled
+            if history and model in history.contexts:
+                prompts[model] = (build_followup_prompt(question), history.contexts[model])
+            else:
+                prompts[model] = (build_prompt(cfg.persona, question, history), None)
+        contexts: Dict[str, List[int]] = {}
+        keys = self.checkpoint_keys(prompts) if self.checkpoints is not None else {}
+        saved = self.checkpoints.restore(keys) if keys else {}
+        if saved:
+            log.info("Resuming from %d checkpointed draft(s): %s", len(saved), ", ".join(saved))
+            contexts.update({m: c.context for m, c in saved.items() if c.context})
+
+        by_model = await self._collect_drafts(prompts, timings, deadline, contexts, saved, keys)
+        drafts = list(by_model.values())
+        timings["drafts"] = time.monotonic() - started
+
+        if not drafts:
+            log.warning("No valid outputs generated from base models.")
+            timings["total"] = time.monotonic() - started
+            return PipelineResult("⚠️ No valid outputs generated from base models.", EXIT_NO_DRAFTS, [], timings)
+
+        similarity = draft_similarity(drafts)
+        if similarity >= cfg.skip_merge_similarity:
+            # Merging near-identical drafts (or a single one) would only restate them
+            log.info("Skipping summarizer: %d draft(s), similarity %.2f", len(drafts), similarity)
+            timings["total"] = time.monotonic() - started
+            answer = best_draft(drafts)
+            # Only the models that produced this exact answer hold a context matching the recorded turn
+            kept = {m: contexts[m] for m, draft in by_model.items() if draft == answer and m in contexts}
+            self._forget(keys)
+            return PipelineResult(answer, EXIT_OK, drafts, timings, merge_skipped=True, drafts_by_model=by_model,
+                                  contexts=kept, similarity=similarity)
+
+        exit_code, answer = await self._summarize(drafts, timings, on_progress, deadline)
+        fallback = cfg.fallback_summarizer_model
+        if (exit_code in FALLBACK_EXIT_CODES and fallback and fallback != cfg.summarizer_model
+                and _remaining(deadline) > 0):
+            # Only the merge failed: the drafts are already here, so just the failed stage runs again
+            self.fallbacks += 1
+            log.warning("Merging again with the fallback summarizer %s", fallback)
+            exit_code, answer = await self._summarize(drafts, timings, on_progress, deadline, model=fallback,
+                                                      stage="fallback_summarizer")
+        if exit_code == EXIT_OK:
+            self._forget(keys)
+        timings["total"] = time.monotonic() - started
+        return PipelineResult(answer, exit_code, drafts, timings, drafts_by_model=by_model, similarity=similarity)
+
+    def checkpoint_keys(self, prompts: Dict[str, Tuple[str, Optional[List[int]]]]) -> Dict[str, str]:
+        cfg = self.config
+        return {
+            m: draft_key(m, prompt, temperature=cfg.temperature, max_tokens=cfg.max_tokens,
+                         ascii_only=cfg.ascii_only, context=context)
+            for m, (prompt, context) in prompts.items()
+        }
+
+    def _forget(self, keys: Dict[str, str]) -> None:
+        if self.checkpoints is not None:
+            self.checkpoints.forget(keys)
+
+    async def _collect_drafts(self, prompts: Dict[str, Tuple[str, Optional[List[int]]]], timings: Dict[str, float],
+                              deadline: Optional[float], contexts: Dict[str, List[int]],
+                              saved: Optional[Dict[str, Checkpoint]] = None,
+                              keys: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        # Wait for k of N drafts within the draft stage's share of the budget; stragglers are cancelled.
+        # Checkpointed drafts count as arrived; fresh ones are checkpointed as they come in
+        cfg = self.config
+        saved = saved or {}
+        stage_deadline = None
+        if deadline is not None:
+            stage_deadline = time.monotonic() + max(0.0, _remaining(deadline)) * cfg.draft_budget_share
+        models = list(prompts)
+        wanted = min(cfg.min_drafts, len(models)) if cfg.min_drafts > 0 else len(models)
+        tasks = {
+            asyncio.create_task(self._draft(
+                m, prompt, timings, stage_deadline, context, lambda ctx, m=m: contexts.__setitem__(m, ctx)
+            )): m
+            for m, (prompt, context) in prompts.items() if m not in saved
+        }
+        results: Dict[str, str] = {m: checkpoint.draft for m, checkpoint in saved.items()}
+        pending = set(tasks)
+        try:
+            while pending and len(results) < wanted:
+                timeout = None if stage_deadline is None else max(0.0, _remaining(stage_deadline))
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.result():
+                        model = tasks[task]
+                        results[model] = task.result()
+                        if keys and self.checkpoints is not None:
+                            self.checkpoints.put(keys[model], results[model], contexts.get(model))
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        if pending and results:
+            self.stragglers_dropped += len(pending)
+            log.info("Merging %d draft(s); dropped stragglers: %s", len(results),
+                     ", ".join(sorted(tasks[t] for t in pending)))
+        return {m: results[m] for m in models if m in results}
+
+    async def _draft(self, model: str, prompt: str, timings: Dict[str, float],
+                     deadline: Optional[float] = None, context: Optional[List[int]] = None,
+                     on_context: Optional[ContextCallback] = None) -> str:
+        started = time.monotonic()
+        try:
+            return await self._hedged(model, prompt, deadline, context, on_context)
+        except Exception as exc:
+            # Same as the "[[ERROR:model]]" drafts the .ps1 filters out
+            log.warning("Draft from %s failed: %s", model, exc)
+            return ""
+        finally:
+            timings[f"draft:{model}"] = time.monotonic() - started
+
+    async def _hedged(self, model: str, prompt: str, deadline: Optional[float],
+                      context: Optional[List[int]] = None, on_context: Optional[ContextCallback] = None) -> str:
+        # A second identical request races the first once it is slower than hedge_after_sec
+        cfg = self.config
+        returned: Dict["asyncio.Task[str]", List[int]] = {}
+
+        def attempt() -> "asyncio.Task[str]":
+            task = asyncio.create_task(self.invoke_model(
+                model, prompt, cfg.temperature, cfg.max_tokens, cfg.timeout_sec, deadline=deadline,
+                context=context, on_context=lambda ctx: returned.__setitem__(task, ctx),
+            ))
+            return task
+
+        racers = {attempt()}
+        try:
+            if cfg.hedge_after_sec is not None:
+                done, _ = await asyncio.wait(racers, timeout=cfg.hedge_after_sec)
+                if not done and _remaining(deadline) > 0:
+                    self.hedges += 1
+                    log.info("Hedging slow draft from %s after %ss", model, cfg.hedge_after_sec)
+                    racers.add(attempt())
+            failure: Optional[BaseException] = None
+            while racers:
+                done, racers = await asyncio.wait(racers, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        # The context must be the winner's: it encodes that racer's own response tokens
+                        if on_context is not None and task in returned:
+                            on_context(returned[task])
+                        return task.result()
+                    failure = task.exception()
+            raise failure
+        finally:
+            for task in racers:
+                task.cancel()
+            if racers:
+                await asyncio.gather(*racers, return_exceptions=True)
+
+    async def _summarize(self, drafts: List[str], timings: Dict[str, float],
+                         on_progress: Optional[ProgressCallback] = None,
+                         deadline: Optional[float] = None, *, model: Optional[str] = None,
+                         stage: str = "summarizer") -> Tuple[int, str]:
+        cfg = self.config
+        started = time.monotonic()
+        try:
+            final = await self.invoke_model(
+                model or cfg.summarizer_model,
+                build_summarizer_prompt(cfg.persona, drafts, cfg.max_tokens),
+                max(0.1, cfg.temperature - 0.1),
+                max(256, cfg.max_tokens),
+                max(cfg.timeout_sec, cfg.timeout_sec * 2),
+                on_progress=on_progress,
+                deadline=deadline,
+            )
+        except ModelTimeout as exc:
+            log.warning("Summarizer timeout: %s", exc)
+            return EXIT_TIMEOUT, "⚠️ Summarizer timed out while merging drafts."
+        except EmptyModelOutput as exc:
+            log.warning("Summarizer produced empty output: %s", exc)
+            return EXIT_SUMMARIZER_EMPTY, "⚠️ Summarizer produced empty output."
+        except Exception as exc:
+            log.warning("Summarizer error: %s", exc)
+            return EXIT_SUMMARIZER_ERROR, "⚠️ Summarizer failed to merge drafts."
+        finally:
+            timings[stage] = time.monotonic() - started
+        return EXIT_OK, final
+
+    async def invoke_model(self, model: str, prompt: str, temperature: float, max_tokens: int,
+                           timeout_sec: float, on_progress: Optional[ProgressCallback] = None,
+                           deadline: Optional[float] = None, context: Optional[List[int]] = None,
+                           on_context: Optional[ContextCallback] = None) -> str:
+        # One-shot model invocation with retry + timeout (Invoke-OllamaModel); no attempt outlives the deadline
+        cfg = self.config
+        options = {"temperature": temperature, "num_predict": max_tokens}
+        attempts = max(0, cfg.retries) + 1
+        for attempt in range(attempts):
+            budget = min(timeout_sec, _remaining(deadline))
+            if budget <= 0:
+                raise ModelTimeout(f"Deadline reached before '{model}' could run.")
+            last = attempt == attempts - 1
+            try:
+                raw = await asyncio.wait_for(
+                    self._generate(model, prompt, options, on_progress, context, on_context), timeout=budget
+                )
+            except asyncio.TimeoutError:
+                if last:
+                    raise ModelTimeout(f"Timeout ({budget:g} s) on '{model}'.")
+                await asyncio.sleep(cfg.retry_delay_sec)
+                continue
+            except (OllamaError, OSError):
+                if last:
+                    raise
+                await asyncio.sleep(cfg.retry_delay_sec)
+                continue
+            text = clean_draft(raw, cfg.ascii_only)
+            if text:
+                return text
+            if not last:
+                await asyncio.sleep(cfg.retry_delay_sec)
+        raise EmptyModelOutput(f"Empty output from '{model}' after {attempts} attempt(s).")
+
+    async def _generate(self, model: str, prompt: str, options: Dict[str, float],
+                        on_progress: Optional[ProgressCallback], context: Optional[List[int]] = None,
+                        on_context: Optional[ContextCallback] = None) -> str:
+        if on_progress is None:
+            data = await self.client.generate(
+                model, prompt, options=options, context=context, keep_alive=self.config.keep_alive
+            )
+            if on_context is not None and data.get("context"):
+                on_context(data["context"])
+            return data.get("response", "")
+        # Each attempt restarts the accumulated text, so a retry replaces what was shown
+        text = ""
+        stream = self.client.stream_generate(
+            model, prompt, options=options, context=context, keep_alive=self.config.keep_alive
+        )
+        async with contextlib.aclosing(stream) as stream:
+            async for item in stream:
+                fragment = item.get("response", "")
+                if fragment:
+                    text += fragment
+                    on_progress(text)
+                if item.get("done") and item.get("context") and on_context is not None:
+                    on_context(item["context"])
+        return text
+
+    async def compact_history(self, summary: str, turns: Sequence[Turn], max_tokens: int) -> str:
+        # Folds old conversation turns into a running summary with the summarizer model
+        cfg = self.config
+        return await self.invoke_model(
+            cfg.summarizer_model,
+            build_compaction_prompt(summary, turns, max_tokens),
+            max(0.1, cfg.temperature - 0.1),
+            max(64, max_tokens),
+            cfg.timeout_sec,
+        )
@@ -0,0 +1,36 @@
+import asyncio
+import contextlib
+import os
+import signal
+import subprocess
+import sys
+from typing import Any, Dict
+
+# Spawn the orchestrator as the leader of its own process group, so the Start-Job runspaces and
+# `ollama run` children it starts can be reclaimed together with it
+if sys.platform == "win32":
+    NEW_PROCESS_GROUP: Dict[str, Any] = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    NEW_PROCESS_GROUP = {"start_new_session": True}
+
+
+async def kill_process_tree(proc: asyncio.subprocess.Process) -> None:
+    # proc.kill() alone only reaches the top-level pwsh and orphans everything below it
+    if sys.platform == "win32":
+        if proc.returncode is None:
+            # Windows has no group signal; taskkill /T walks the child tree instead
+            with contextlib.suppress(OSError):
+                killer = await asyncio.create_subprocess_exec(
+                    "taskkill", "/F", "/T", "/PID", str(proc.pid),
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+                )
+                await killer.wait()
+    else:
+        # Signal the group even if its leader already exited: the children may not have
+        with contextlib.suppress(ProcessLookupError, PermissionError):
+            os.killpg(proc.pid, signal.SIGKILL)
+    if proc.returncode is None:
+        with contextlib.suppress(ProcessLookupError):
+            proc.kill()
+    with contextlib.suppress(ProcessLookupError):
+        await proc.wait()
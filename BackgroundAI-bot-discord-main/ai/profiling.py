@@ -0,0 +1,238 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import itertools
+import json
+import logging
+import logging.handlers
+import random
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional
+
+log = logging.getLogger("nightshade-bot")
+
+STACK_LIMIT = 20  # innermost frames kept per stack sample
+
+
+# -------------------------
+# Event-loop watchdog: a thread that notices when the loop stops ticking and samples what it is running
+# -------------------------
+class Stall(NamedTuple):
+    at: float  # wall-clock time the stall was detected
+    seconds: float  # how long the loop was blocked (so far, while it still is)
+    stack: str  # the loop thread's stack when the stall was detected
+
+    @property
+    def location(self) -> str:
+        # Innermost frame, e.g. 'File "cleaning.py", line 40, in clean_ai_output'
+        frames = [line.strip() for line in self.stack.splitlines() if line.strip().startswith("File ")]
+        return frames[-1] if frames else self.stack
+
+
+class LoopWatchdog:
+    # A heartbeat task stamps the time every interval_sec; if the stamp gets older than interval_sec +
+    # threshold_sec, some callback has held the loop that long, and its stack is taken from the loop thread
+    def __init__(self, threshold_sec: float = 0.25, *, interval_sec: Optional[float] = None, keep: int = 20):
+        self.threshold_sec = threshold_sec
+        self.interval_sec = interval_sec or threshold_sec / 4
+        self.stalls = 0
+        self.max_lag_sec = 0.0
+        self.recent: Deque[Stall] = collections.deque(maxlen=keep)
+        self._beat = 0.0
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        # Must be called from the event loop it should watch
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def aclose(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval_sec)
+
+    def _watch(self) -> None:
+        stalled_since = None  # heartbeat stamp of the stall being tracked
+        while not self._stop.wait(self.interval_sec):
+            beat = self._beat
+            lag = time.monotonic() - beat - self.interval_sec
+            if stalled_since is not None and beat != stalled_since:
+                # The loop ticked again; the last measured lag is close to the whole stall
+                log.info("Event loop resumed after %.2fs", self.recent[-1].seconds)
+                stalled_since = None
+            if lag < self.threshold_sec:
+                continue
+            if stalled_since is None:
+                stalled_since = beat
+                self.stalls += 1
+                stack = self._sample()
+                self.recent.append(Stall(time.time(), lag, stack))
+                log.warning("Event loop blocked for %.2fs so far, in:\n%s", lag, stack)
+            else:
+                self.recent[-1] = self.recent[-1]._replace(seconds=lag)
+            self.max_lag_sec = max(self.max_lag_sec, lag)
+
+    def _sample(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return "(loop thread not found)"
+        return "".join(traceback.format_stack(frame, limit=STACK_LIMIT)).rstrip()
+
+
+# -------------------------
+# Request traces: spans of one Discord message through the bot, kept when the request was slow
+# -------------------------
+class Span(NamedTuple):
+    name: str
+    start_sec: float  # offset from the start of the trace
+    seconds: float
+    attrs: Dict[str, Any]
+
+
+class Trace:
+    __slots__ = ("trace_id", "name", "attrs", "started_at", "spans", "seconds", "_t0")
+
+    def __init__(self, trace_id: str, name: str, attrs: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        self.seconds: Optional[float] = None
+        self._t0 = time.perf_counter()
+
+    def add(self, name: str, seconds: float, **attrs) -> None:
+        # For stages measured elsewhere (pipeline timings): assumed to have just ended
+        self.spans.append(Span(name, max(0.0, time.perf_counter() - self._t0 - seconds), seconds, attrs))
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            self.spans.append(Span(name, started - self._t0, ended - started, attrs))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.trace_id,
+            "name": self.name,
+            "started_at": round(self.started_at, 3),
+            "seconds": None if self.seconds is None else round(self.seconds, 4),
+            "attrs": self.attrs,
+            "spans": [
+                {"name": s.name, "start": round(s.start_sec, 4), "seconds": round(s.seconds, 4), **s.attrs}
+                for s in sorted(self.spans, key=lambda s: s.start_sec)
+            ],
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("nightshade_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs) -> Iterator[None]:
+    # No-op unless the running task belongs to a sampled request
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name, **attrs):
+        yield
+
+
+def add_span(name: str, seconds: float, **attrs) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds, **attrs)
+
+
+def format_trace(trace: Trace, top: int = 6) -> str:
+    # One line: total time, then the slowest spans
+    spans = sorted(trace.spans, key=lambda s: s.seconds, reverse=True)[:top]
+    parts = [f"{s.name} {s.seconds:.2f}s" for s in spans]
+    when = time.strftime("%H:%M:%S", time.localtime(trace.started_at))
+    return f"`{trace.trace_id}` {when} **{trace.seconds or 0:.1f}s** — " + (", ".join(parts) or "no spans")
+
+
+class Tracer:
+    # A sample_rate share of requests is traced; those that take at least slow_sec are kept in memory
+    # and appended as JSON lines to a size-rotated file
+    def __init__(self, sample_rate: float = 0.1, slow_sec: float = 30.0, *, path: Optional[str] = None,
+                 max_bytes: int = 1_000_000, backups: int = 3, keep: int = 50,
+                 rng: Callable[[], float] = random.random):
+        self.sample_rate = sample_rate
+        self.slow_sec = slow_sec
+        self.path = path
+        self.recent: Deque[Trace] = collections.deque(maxlen=keep)
+        self.traced = 0
+        self.slow = 0
+        self._rng = rng
+        self._ids = itertools.count(1)
+        self._prefix = f"{int(time.time()) % 100000:05d}"
+        self._handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True
+        ) if path else None
+
+    @contextlib.contextmanager
+    def trace(self, name: str, **attrs) -> Iterator[Optional[Trace]]:
+        if self.sample_rate <= 0 or self._rng() >= self.sample_rate:
+            yield None
+            return
+        trace = Trace(f"{self._prefix}-{next(self._ids)}", name, attrs)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            self.finish(trace)
+
+    def finish(self, trace: Trace) -> None:
+        trace.seconds = time.perf_counter() - trace._t0
+        self.traced += 1
+        if trace.seconds < self.slow_sec:
+            return
+        self.slow += 1
+        self.recent.append(trace)
+        if self._handler is not None:
+            # The handler rotates the file and reports its own write errors on stderr
+            self._handler.handle(logging.makeLogRecord({"msg": json.dumps(trace.to_dict(), default=str)}))
+
+    def find(self, **attrs) -> List[Trace]:
+        # Newest first, optionally only those whose attributes match
+        return [t for t in reversed(self.recent) if all(t.attrs.get(k) == v for k, v in attrs.items())]
+
+    def close(self) -> None:
+        if self._handler is not None:
+            self._handler.close()
@@ -0,0 +1,216 @@
+import asyncio
+import contextlib
+import logging
+import math
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .state import StateBackend
+
+log = logging.getLogger("nightshade-bot")
+
+
+class _GuildQuota:
+    __slots__ = ("used", "window_start")
+
+    def __init__(self, used: int, window_start: float):
+        self.used = used
+        self.window_start = window_start
+
+
+# -------------------------
+# Per-guild question quota: memory first, SQLite (WAL) behind it
+# -------------------------
+class QuotaStore:
+    def __init__(self, limit: int, *, sqlite_path: Optional[str] = None, window_sec: float = 0.0,
+                 flush_interval: float = 2.0, clock: Callable[[], float] = time.time):
+        self.limit = limit
+        self.sqlite_path = sqlite_path
+        self.window_sec = window_sec  # 0 = the quota never resets on its own
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._quotas: Dict[int, _GuildQuota] = {}
+        self._dirty: Set[int] = set()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0
+
+    async def used(self, guild_id: int) -> int:
+        return (await self._load(guild_id)).used
+
+    async def try_consume(self, guild_id: int) -> bool:
+        quota = await self._load(guild_id)
+        if quota.used >= self.limit:
+            return False
+        quota.used += 1
+        self._mark_dirty(guild_id)
+        return True
+
+    async def refund(self, guild_id: int) -> None:
+        quota = self._quotas.get(guild_id)
+        if quota is not None and quota.used > 0:
+            quota.used -= 1
+            self._mark_dirty(guild_id)
+
+    async def reset(self, guild_id: int) -> None:
+        # No load needed: the row is overwritten on the next flush
+        self._quotas[guild_id] = _GuildQuota(0, self._window_start(self._clock()))
+        self._mark_dirty(guild_id)
+
+    def _window_start(self, now: float) -> float:
+        # Windows are aligned to the epoch, so a daily window rolls over at 00:00 UTC
+        return math.floor(now / self.window_sec) * self.window_sec if self.window_sec else 0.0
+
+    async def _load(self, guild_id: int) -> _GuildQuota:
+        quota = self._quotas.get(guild_id)
+        if quota is None:
+            row = await asyncio.to_thread(self._disk_get, guild_id) if self.sqlite_path else None
+            # Another message for this guild may have loaded it while we were reading
+            quota = self._quotas.get(guild_id)
+            if quota is None:
+                quota = self._quotas[guild_id] = _GuildQuota(*row) if row else _GuildQuota(0, 0.0)
+        if self.window_sec:
+            # Expired windows reset lazily, one guild at a time, instead of rewriting the table
+            current = self._window_start(self._clock())
+            if quota.window_start < current:
+                quota.used, quota.window_start = 0, current
+                self._mark_dirty(guild_id)
+        return quota
+
+    def _mark_dirty(self, guild_id: int) -> None:
+        if not self.sqlite_path:
+            return
+        self._dirty.add(guild_id)
+        if self._flusher is None or self._flusher.done():
+            with contextlib.suppress(RuntimeError):  # no running loop: close() flushes synchronously
+                self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    # --- write-behind ---
+    def _take_dirty(self) -> List[Tuple[int, int, float]]:
+        rows = [(gid, self._quotas[gid].used, self._quotas[gid].window_start) for gid in self._dirty]
+        self._dirty.clear()
+        return rows
+
+    async def flush(self) -> None:
+        rows = self._take_dirty()
+        if not rows:
+            return
+        try:
+            await asyncio.to_thread(self._disk_put, rows)
+        except BaseException:
+            self._dirty.update(row[0] for row in rows)
+            raise
+
+    async def _flush_loop(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except sqlite3.Error:
+                log.exception("Could not persist question quotas; will retry")
+
+    async def aclose(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flusher
+        await self.flush()
+        self.close()
+
+    def close(self) -> None:
+        # Final synchronous flush for shutdown paths without an event loop
+        if self._flusher is not None:
+            with contextlib.suppress(RuntimeError):  # its loop may already be closed
+                self._flusher.cancel()
+        rows = self._take_dirty()
+        if rows:
+            self._disk_put(rows)
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # --- SQLite (runs in a worker thread) ---
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS guild_quota ("
+                "guild_id INTEGER PRIMARY KEY, used INTEGER NOT NULL, window_start REAL NOT NULL)"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _disk_get(self, guild_id: int) -> Optional[Tuple[int, float]]:
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT used, window_start FROM guild_quota WHERE guild_id = ?", (guild_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _disk_put(self, rows: List[Tuple[int, int, float]]) -> None:
+        with self._db_lock:
+            db = self._connect()
+            db.executemany(
+                "INSERT INTO guild_quota (guild_id, used, window_start) VALUES (?, ?, ?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET used = excluded.used, window_start = excluded.window_start",
+                rows,
+            )
+            db.commit()
+            self.flushes += 1
+
+
+# -------------------------
+# Per-guild question quota in a shared state backend (sharded deployments)
+# -------------------------
+class SharedQuotaStore:
+    # Same interface as QuotaStore; every call is one atomic backend operation, nothing is cached locally
+    def __init__(self, limit: int, backend: StateBackend, *, window_sec: float = 0.0,
+                 clock: Callable[[], float] = time.time):
+        self.limit = limit
+        self.backend = backend
+        self.window_sec = window_sec
+        self._clock = clock
+
+    def _key(self, guild_id: int) -> str:
+        # One key per window: rolling over needs no write, and old windows expire on their own
+        window = math.floor(self._clock() / self.window_sec) if self.window_sec else 0
+        return f"quota:{guild_id}:{window}"
+
+    @property
+    def _ttl(self) -> Optional[float]:
+        return 2 * self.window_sec if self.window_sec else None
+
+    async def used(self, guild_id: int) -> int:
+        return int(await self.backend.get(self._key(guild_id)) or 0)
+
+    async def try_consume(self, guild_id: int) -> bool:
+        key = self._key(guild_id)
+        if await self.backend.incr(key, 1, self._ttl) <= self.limit:
+            return True
+        # Over the limit: undo our increment so the stored count stays at the limit
+        await self.backend.incr(key, -1)
+        return False
+
+    async def refund(self, guild_id: int) -> None:
+        key = self._key(guild_id)
+        if await self.backend.incr(key, -1, self._ttl) < 0:
+            await self.backend.incr(key, 1)
+
+    async def reset(self, guild_id: int) -> None:
+        await self.backend.delete(self._key(guild_id))
+
+    async def flush(self) -> None:
+        pass  # writes go straight to the backend
+
+    async def aclose(self) -> None:
+        pass  # the backend is shared with other components and closed by its owner
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,152 @@
+import math
+import time
+from typing import Callable, Dict, Hashable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .state import StateBackend
+
+
+class Limit(NamedTuple):
+    rate_per_sec: float
+    burst: float
+
+    @classmethod
+    def per_minute(cls, count: float, burst: float) -> "Limit":
+        return cls(count / 60.0, burst)
+
+
+class Verdict(NamedTuple):
+    retry_after: float  # 0 when allowed
+    scope: Optional[str]  # "user", "guild" or "global" when denied
+
+    @property
+    def allowed(self) -> bool:
+        return self.scope is None
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "full_at", "scheduled")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.full_at = now
+        self.scheduled = False
+
+
+# -------------------------
+# Hashed timing wheel: coarse expiry in O(1) per operation
+# -------------------------
+class TimingWheel:
+    def __init__(self, slot_sec: float = 1.0, slots: int = 64):
+        self.slot_sec = slot_sec
+        self._slots: List[List[Hashable]] = [[] for _ in range(slots)]
+        self._tick: Optional[int] = None
+
+    def schedule(self, key: Hashable, at: float) -> None:
+        tick = math.ceil(at / self.slot_sec)
+        if self._tick is None:
+            self._tick = tick
+        # Past-due keys go in the next slot; far-future keys wait in the last one and get rescheduled
+        tick = min(max(tick, self._tick), self._tick + len(self._slots) - 1)
+        self._slots[tick % len(self._slots)].append(key)
+
+    def advance(self, now: float) -> Iterator[Hashable]:
+        # Yields keys whose slot has passed; callers re-check and reschedule if still live
+        if self._tick is None:
+            return
+        target = math.floor(now / self.slot_sec)
+        steps = min(target - self._tick + 1, len(self._slots))
+        for _ in range(max(0, steps)):
+            slot = self._slots[self._tick % len(self._slots)]
+            self._slots[self._tick % len(self._slots)] = []
+            self._tick += 1
+            yield from slot
+        if self._tick <= target:
+            self._tick = target + 1
+
+
+# -------------------------
+# Token buckets per user, per guild and globally
+# -------------------------
+class RateLimiter:
+    def __init__(self, *, user: Optional[Limit] = None, guild: Optional[Limit] = None,
+                 global_limit: Optional[Limit] = None, wheel_slot_sec: float = 1.0, wheel_slots: int = 64,
+                 clock: Callable[[], float] = time.monotonic):
+        self.limits: Dict[str, Optional[Limit]] = {"user": user, "guild": guild, "global": global_limit}
+        self._clock = clock
+        self._buckets: Dict[Tuple[str, Hashable], _Bucket] = {}
+        self._wheel = TimingWheel(wheel_slot_sec, wheel_slots)
+        self.denied = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def check(self, guild_id: int, user_id: int, now: Optional[float] = None) -> Verdict:
+        # Takes one token from every level, or none if any level is empty
+        now = self._clock() if now is None else now
+        self._expire(now)
+        keys = (("user", (guild_id, user_id)), ("guild", guild_id), ("global", None))
+        buckets = []
+        for scope, ident in keys:
+            limit = self.limits[scope]
+            if limit is None:
+                continue
+            bucket = self._refill((scope, ident), limit, now)
+            if bucket.tokens < 1.0:
+                self.denied += 1
+                return Verdict((1.0 - bucket.tokens) / limit.rate_per_sec, scope)
+            buckets.append((scope, ident, bucket, limit))
+        for scope, ident, bucket, limit in buckets:
+            # New buckets are only stored once they hold less than a full burst
+            self._buckets[(scope, ident)] = bucket
+            bucket.tokens -= 1.0
+            # A bucket that has refilled to burst is indistinguishable from a missing one
+            bucket.full_at = now + (limit.burst - bucket.tokens) / limit.rate_per_sec
+            if not bucket.scheduled:
+                bucket.scheduled = True
+                self._wheel.schedule((scope, ident), bucket.full_at)
+        return Verdict(0.0, None)
+
+    def _refill(self, key: Tuple[str, Hashable], limit: Limit, now: float) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return _Bucket(limit.burst, now)
+        bucket.tokens = min(limit.burst, bucket.tokens + (now - bucket.updated) * limit.rate_per_sec)
+        bucket.updated = now
+        return bucket
+
+    def _expire(self, now: float) -> None:
+        for key in self._wheel.advance(now):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            if bucket.full_at <= now:
+                del self._buckets[key]
+                self.expired += 1
+            else:
+                self._wheel.schedule(key, bucket.full_at)
+
+
+# -------------------------
+# Fixed-window limit in a shared state backend (one ceiling across shard processes)
+# -------------------------
+class SharedWindowLimit:
+    # burst requests per burst/rate seconds: the token bucket's long-run rate with one counter per window
+    def __init__(self, backend: StateBackend, limit: Limit, *, scope: str = "global",
+                 clock: Callable[[], float] = time.time):
+        self.backend = backend
+        self.limit = limit
+        self.scope = scope
+        self.window_sec = limit.burst / limit.rate_per_sec
+        self._clock = clock
+        self.denied = 0
+
+    async def check(self, ident: Hashable = None) -> Verdict:
+        now = self._clock()
+        window = math.floor(now / self.window_sec)
+        count = await self.backend.incr(f"ratelimit:{self.scope}:{ident}:{window}", 1, 2 * self.window_sec)
+        if count > self.limit.burst:
+            self.denied += 1
+            return Verdict((window + 1) * self.window_sec - now, self.scope)
+        return Verdict(0.0, None)
@@ -0,0 +1,92 @@
+import dataclasses
+import math
+import re
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+from .pipeline import PipelineConfig
+
+
+class Route(NamedTuple):
+    name: str
+    models: Tuple[str, ...] = ()  # () runs the configured base models
+    summarize: bool = True  # False returns the best draft without a merge pass
+    max_tokens: Optional[int] = None  # None keeps the configured max_tokens
+
+
+FULL_ROUTE = Route("full")
+
+# Words that usually mean the answer needs reasoning, structure or code rather than a quick reply
+DEFAULT_COMPLEX_KEYWORDS: Tuple[str, ...] = (
+    "explain", "why", "how", "compare", "difference", "analyze", "analyse", "design", "implement", "write",
+    "code", "debug", "step", "steps", "plan", "pros", "cons", "summarize", "summarise", "essay", "story",
+    "translate", "calculate", "prove", "optimize", "optimise", "review", "list",
+)
+
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_END_RE = re.compile(r"[.!?]+(?=\s|$)")
+
+
+def apply_route(config: PipelineConfig, route: Route) -> PipelineConfig:
+    if not route.models and route.summarize and route.max_tokens is None:
+        return config
+    return dataclasses.replace(
+        config,
+        models=route.models or config.models,
+        max_tokens=route.max_tokens or config.max_tokens,
+        skip_merge_similarity=config.skip_merge_similarity if route.summarize else 0.0,
+    )
+
+
+class QuestionFeatures(NamedTuple):
+    words: int
+    sentences: int
+    keywords: int  # complex keywords present
+    code: bool  # code fence, inline code or several lines
+
+
+def question_features(question: str, keywords: Sequence[str] = DEFAULT_COMPLEX_KEYWORDS) -> QuestionFeatures:
+    words = _WORD_RE.findall(question.casefold())
+    wanted = set(keywords)
+    return QuestionFeatures(
+        words=len(words),
+        sentences=max(1, len(_SENTENCE_END_RE.findall(question.strip()))),
+        keywords=sum(1 for word in set(words) if word in wanted),
+        code="`" in question or question.strip().count("\n") >= 2,
+    )
+
+
+# -------------------------
+# Question router: cheap features pick the fast single-model path or the full fan-out -> merge
+# -------------------------
+class QuestionRouter:
+    # A question goes the fast route when it is short, has no code and a tiny logistic model over its
+    # length, sentence count and complex keywords scores it below `threshold` (the chance it needs the
+    # full pipeline). At max_words words and nothing else the score is exactly 0.5.
+    def __init__(self, fast: Route, full: Route = FULL_ROUTE, *, max_words: int = 12,
+                 keywords: Sequence[str] = DEFAULT_COMPLEX_KEYWORDS, threshold: float = 0.5,
+                 keyword_weight: float = 4.0, sentence_weight: float = 1.5):
+        self.fast = fast
+        self.full = full
+        self.max_words = max_words
+        self.keywords = tuple(k.casefold() for k in keywords)
+        self.threshold = threshold
+        self.keyword_weight = keyword_weight
+        self.sentence_weight = sentence_weight
+
+    @property
+    def routes(self) -> Tuple[Route, Route]:
+        return (self.fast, self.full)
+
+    def score(self, question: str) -> float:
+        features = question_features(question, self.keywords)
+        if features.code or features.words > self.max_words:
+            return 1.0
+        z = (
+            3.0 * (features.words / self.max_words - 1.0)
+            + self.keyword_weight * features.keywords
+            + self.sentence_weight * (features.sentences - 1)
+        )
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def route(self, question: str) -> Route:
+        return self.fast if self.score(question) < self.threshold else self.full
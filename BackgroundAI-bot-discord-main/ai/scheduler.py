@@ -0,0 +1,135 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+QueuedCallback = Callable[[int], Awaitable[None]]
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Ticket:
+    def __init__(self, guild_id: int, start_tag: float, finish_tag: float, seq: int):
+        self.guild_id = guild_id
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.seq = seq
+        self.granted: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self.cancelled = False
+        self.released = False
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return (self.finish_tag, self.seq) < (other.finish_tag, other.seq)
+
+
+# -------------------------
+# Weighted fair queuing across guilds with a global concurrency cap
+# -------------------------
+class FairScheduler:
+    def __init__(self, max_concurrency: int = 4, *, max_queue: int = 100, max_queue_per_guild: int = 10,
+                 weights: Optional[Dict[int, float]] = None, default_weight: float = 1.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_guild = max_queue_per_guild
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        self.in_flight = 0
+        self.rejected = 0
+        self._heap: List[Ticket] = []
+        self._queued_per_guild: Dict[int, int] = {}
+        self._last_finish: Dict[int, float] = {}  # guild -> finish tag of its newest request
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(self._queued_per_guild.values())
+
+    def submit(self, guild_id: int) -> Ticket:
+        queued_here = self._queued_per_guild.get(guild_id, 0)
+        if self.in_flight >= self.max_concurrency or self._heap:
+            if self.queue_depth >= self.max_queue or queued_here >= self.max_queue_per_guild:
+                self.rejected += 1
+                raise QueueFullError(f"Request queue is full (guild {guild_id})")
+        # Start-time fair queuing: a guild that went idle restarts at the current virtual time,
+        # so a backlog in one guild never pushes newcomers from other guilds to the back
+        start = max(self._virtual_time, self._last_finish.get(guild_id, 0.0))
+        weight = self.weights.get(guild_id, self.default_weight)
+        ticket = Ticket(guild_id, start, start + 1.0 / weight, next(self._seq))
+        self._last_finish[guild_id] = ticket.finish_tag
+        self._queued_per_guild[guild_id] = queued_here + 1
+        heapq.heappush(self._heap, ticket)
+        self._dispatch()
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        # 0 once running, otherwise 1-based place in dispatch order
+        if ticket.granted.done():
+            return 0
+        return 1 + sum(1 for other in self._heap if not other.cancelled and other < ticket)
+
+    async def wait(self, ticket: Ticket) -> None:
+        try:
+            await asyncio.shield(ticket.granted)
+        except asyncio.CancelledError:
+            self.cancel(ticket)
+            raise
+
+    def cancel(self, ticket: Ticket) -> None:
+        if ticket.granted.done() and not ticket.granted.cancelled():
+            self.release(ticket)
+            return
+        if not ticket.cancelled:
+            ticket.cancelled = True
+            ticket.granted.cancel()
+            self._dequeued(ticket.guild_id)
+            self._dispatch()
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        self.in_flight -= 1
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, guild_id: int, on_queued: Optional[QueuedCallback] = None) -> AsyncIterator[Ticket]:
+        ticket = self.submit(guild_id)
+        try:
+            if on_queued is not None and not ticket.granted.done():
+                await on_queued(self.position(ticket))
+            await self.wait(ticket)
+            yield ticket
+        finally:
+            self.cancel(ticket)
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.max_concurrency and self._heap:
+            ticket = heapq.heappop(self._heap)
+            if ticket.cancelled:
+                continue
+            self._dequeued(ticket.guild_id)
+            self._virtual_time = max(self._virtual_time, ticket.start_tag)
+            self.in_flight += 1
+            ticket.granted.set_result(None)
+        self._forget_idle_guilds()
+
+    def _dequeued(self, guild_id: int) -> None:
+        remaining = self._queued_per_guild.get(guild_id, 0) - 1
+        if remaining > 0:
+            self._queued_per_guild[guild_id] = remaining
+        else:
+            self._queued_per_guild.pop(guild_id, None)
+
+    def _forget_idle_guilds(self) -> None:
+        # Tags at or behind the virtual clock carry no information; drop them to keep memory bounded
+        if len(self._last_finish) > 2 * (len(self._queued_per_guild) + self.max_concurrency):
+            stale = [
+                g for g, f in self._last_finish.items()
+                if f <= self._virtual_time and g not in self._queued_per_guild
+            ]
+            for guild_id in stale:
+                del self._last_finish[guild_id]
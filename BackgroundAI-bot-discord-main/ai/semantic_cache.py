@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import math
+import operator
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .cache import normalize_question
+from .ollama_client import OllamaError
+
+try:
+    import numpy
+except ImportError:  # the pure-Python index is used instead (searched in a worker thread, and kept small)
+    numpy = None
+
+log = logging.getLogger("nightshade-bot")
+
+Vector = Tuple[float, ...]
+
+
+def cache_namespace(*, persona: str, models: Sequence[str], summarizer_model: str, temperature: float,
+                    max_tokens: int, embedding_model: str, route: str = "full") -> str:
+    # Answers are only interchangeable between questions asked of the same configuration (and router route), and
+    # vectors are only comparable when the same embedding model made them
+    material = json.dumps(
+        [persona, list(models), summarizer_model, temperature, max_tokens, embedding_model, route],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def unit_vector(vector: Sequence[float]) -> Optional[Vector]:
+    # Cosine similarity of unit vectors is a plain dot product; a zero vector matches nothing
+    norm = math.sqrt(sum(x * x for x in vector))
+    if not norm or not math.isfinite(norm):
+        return None
+    return tuple(x / norm for x in vector)
+
+
+# -------------------------
+# Vector index: exact (brute-force) cosine search over at most `capacity` unit vectors
+# -------------------------
+class VectorIndex:
+    # Rows live in one float32 matrix when NumPy is installed (a lookup is one matrix-vector product) and in a
+    # list of tuples otherwise; storage grows by doubling, so a small index stays small
+    INITIAL_ROWS = 16
+
+    def __init__(self, capacity: int, *, use_numpy: bool = numpy is not None):
+        if use_numpy and numpy is None:
+            raise ValueError("NumPy is not installed")
+        self.capacity = capacity
+        self.dim: Optional[int] = None  # fixed by the first vector added
+        self._use_numpy = use_numpy
+        self._rows: Dict[Hashable, int] = {}  # key -> row
+        self._keys: List[Optional[Hashable]] = []  # row -> key (None = free)
+        self._free: List[int] = []
+        self._matrix = None  # NumPy: (allocated rows, dim) float32 array + `_used` mask
+        self._used = None
+        self._vectors: List[Optional[Vector]] = []  # pure Python: row -> vector
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, key: Hashable, vector: Vector) -> None:
+        if self.dim is None:
+            self.dim = len(vector)
+        elif len(vector) != self.dim:
+            raise ValueError(f"Expected a {self.dim}-dimensional vector, got {len(vector)}")
+        row = self._rows.get(key)
+        if row is None:
+            row = self._take_row()
+            self._rows[key] = row
+            self._keys[row] = key
+        if self._use_numpy:
+            self._matrix[row] = vector
+            self._used[row] = True
+        else:
+            self._vectors[row] = vector
+
+    def remove(self, key: Hashable) -> None:
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        self._keys[row] = None
+        if self._use_numpy:
+            self._used[row] = False
+        else:
+            self._vectors[row] = None
+        self._free.append(row)
+
+    def search(self, vector: Vector) -> Optional[Tuple[Hashable, float]]:
+        # The stored key most similar to `vector`, with its cosine similarity
+        if not self._rows or len(vector) != self.dim:
+            return None
+        if self._use_numpy:
+            scores = self._matrix @ numpy.asarray(vector, dtype=numpy.float32)
+            scores[~self._used] = -numpy.inf
+            row = int(numpy.argmax(scores))
+            return self._keys[row], float(scores[row])
+        best_row, best = -1, -math.inf
+        for row, stored in enumerate(self._vectors):
+            if stored is not None:
+                score = sum(map(operator.mul, stored, vector))
+                if score > best:
+                    best_row, best = row, score
+        return self._keys[best_row], best
+
+    def _take_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        allocated = len(self._keys)
+        if allocated >= self.capacity:
+            raise ValueError(f"VectorIndex is full ({self.capacity} vectors)")
+        grown = min(self.capacity, max(self.INITIAL_ROWS, allocated * 2))
+        self._keys.extend([None] * (grown - allocated))
+        if self._use_numpy:
+            matrix = numpy.zeros((grown, self.dim), dtype=numpy.float32)
+            used = numpy.zeros(grown, dtype=bool)
+            if self._matrix is not None:
+                matrix[:allocated] = self._matrix
+                used[:allocated] = self._used
+            self._matrix, self._used = matrix, used
+        else:
+            self._vectors.extend([None] * (grown - allocated))
+        self._free.extend(range(grown - 1, allocated, -1))
+        return allocated
+
+
+class SemanticHit(NamedTuple):
+    answer: str
+    question: str  # the cached question that matched
+    similarity: float
+
+
+# -------------------------
+# Semantic answer cache: paraphrases of an answered question reuse its answer
+# -------------------------
+class SemanticCache:
+    # One index per namespace (persona + model configuration); max_entries bounds all of them together and the
+    # least recently used entry is evicted first. Lookups below `threshold` cosine similarity are misses.
+    # Without NumPy a lookup is a Python loop over every stored vector: it runs in a worker thread (lookups and
+    # stores are serialized so the index does not change under it) and the cache holds at most PURE_PYTHON_MAX_ENTRIES.
+    PURE_PYTHON_MAX_ENTRIES = 256
+
+    def __init__(self, embed: Callable[[str], Awaitable[Sequence[float]]], *, threshold: float = 0.9,
+                 max_entries: int = 1024, ttl_sec: float = 3600.0, embed_timeout_sec: float = 5.0,
+                 use_numpy: bool = numpy is not None, clock: Callable[[], float] = time.time):
+        self._embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries if use_numpy else min(max_entries, self.PURE_PYTHON_MAX_ENTRIES)
+        self.ttl_sec = ttl_sec
+        self.embed_timeout_sec = embed_timeout_sec
+        self.use_numpy = use_numpy
+        self._clock = clock
+        # (namespace, id) -> (expires_at, question, answer), least recently used first
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, str, str]]" = OrderedDict()
+        self._indexes: Dict[str, VectorIndex] = {}
+        self._ids = itertools.count()
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0  # questions that could not be embedded (counted as misses too)
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._indexes.clear()
+
+    async def embed(self, question: str) -> Optional[Vector]:
+        # None when the embedding model is unavailable: the question then simply goes to the models
+        try:
+            vector = await asyncio.wait_for(self._embed(normalize_question(question)), self.embed_timeout_sec)
+        except (OllamaError, OSError, asyncio.TimeoutError) as exc:
+            self.errors += 1
+            log.warning("Could not embed the question for the semantic cache: %s", exc or "timeout")
+            return None
+        return unit_vector(vector)
+
+    async def get(self, namespace: str, vector: Optional[Vector]) -> Optional[SemanticHit]:
+        async with self._lock:
+            return await self._get(namespace, vector)
+
+    async def put(self, namespace: str, question: str, vector: Optional[Vector], answer: str) -> None:
+        if vector is not None:
+            async with self._lock:
+                await self._put(namespace, question, vector, answer)
+
+    async def _get(self, namespace: str, vector: Optional[Vector]) -> Optional[SemanticHit]:
+        found = await self._nearest(namespace, vector) if vector is not None else None
+        if found is not None and found[1] >= self.threshold:
+            key, similarity = found
+            _, question, answer = self._entries[key]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return SemanticHit(answer, question, similarity)
+        self.misses += 1
+        return None
+
+    async def _put(self, namespace: str, question: str, vector: Vector, answer: str) -> None:
+        found = await self._nearest(namespace, vector)
+        if found is not None and found[1] >= self.threshold:
+            # A fresh answer replaces the one its paraphrase would have matched
+            self._drop(found[0])
+        while len(self._entries) >= self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+        index = self._indexes.get(namespace)
+        if index is None:
+            index = self._indexes[namespace] = VectorIndex(self.max_entries, use_numpy=self.use_numpy)
+        elif index.dim != len(vector):
+            # The embedding model changed under the same name; vectors of different sizes do not compare
+            for key in [k for k in self._entries if k[0] == namespace]:
+                self._drop(key)
+            index = self._indexes[namespace] = VectorIndex(self.max_entries, use_numpy=self.use_numpy)
+        key = (namespace, next(self._ids))
+        self._entries[key] = (self._clock() + self.ttl_sec, question, answer)
+        index.add(key, vector)
+
+    async def _nearest(self, namespace: str, vector: Vector) -> Optional[Tuple[Tuple[str, int], float]]:
+        # Expired entries are dropped as lookups find them
+        index = self._indexes.get(namespace)
+        now = self._clock()
+        while index is not None and len(index):
+            found = index.search(vector) if self.use_numpy else await asyncio.to_thread(index.search, vector)
+            if self._indexes.get(namespace) is not index:
+                return None  # cleared while the search ran
+            if found is None or self._entries[found[0]][0] > now:
+                return found
+            self._drop(found[0])
+        return None
+
+    def _drop(self, key: Tuple[str, int]) -> None:
+        del self._entries[key]
+        index = self._indexes[key[0]]
+        index.remove(key)
+        if not len(index):
+            del self._indexes[key[0]]
@@ -0,0 +1,90 @@
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+from typing import Dict, List, Mapping, Optional, Sequence
+
+log = logging.getLogger("nightshade-bot")
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    # Discord's routing formula: every event for a guild arrives on this shard
+    return (guild_id >> 22) % shard_count
+
+
+def split_shards(shard_count: int, processes: int) -> List[List[int]]:
+    # Round-robin, so each process holds a similar slice of guilds; never more processes than shards
+    processes = max(1, min(processes, shard_count))
+    return [list(range(first, shard_count, processes)) for first in range(processes)]
+
+
+class _ShardProcess:
+    def __init__(self, index: int, shard_ids: List[int]):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.restarts = 0
+
+
+# -------------------------
+# Supervisor: one child bot process per group of gateway shards
+# -------------------------
+class ShardSupervisor:
+    def __init__(self, command: Sequence[str], shard_count: int, processes: int, *,
+                 env: Optional[Mapping[str, str]] = None, restart_delay: float = 5.0,
+                 max_restart_delay: float = 300.0):
+        self.command = list(command)
+        self.shard_count = shard_count
+        self.env = dict(os.environ if env is None else env)
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.children = [_ShardProcess(i, ids) for i, ids in enumerate(split_shards(shard_count, processes))]
+        self._stopping = False
+
+    @property
+    def restarts(self) -> int:
+        return sum(child.restarts for child in self.children)
+
+    def child_env(self, child: _ShardProcess) -> Dict[str, str]:
+        env = dict(self.env)
+        env["BOT_SHARD_COUNT"] = str(self.shard_count)
+        env["BOT_SHARD_IDS"] = ",".join(str(i) for i in child.shard_ids)
+        return env
+
+    async def run(self) -> None:
+        # Returns once every child has exited cleanly or stop() was called
+        await asyncio.gather(*(self._keep_alive(child) for child in self.children))
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        self._stopping = True
+        running = [c.proc for c in self.children if c.proc is not None and c.proc.returncode is None]
+        for proc in running:
+            with contextlib.suppress(ProcessLookupError):
+                proc.send_signal(signal.SIGTERM)
+        for proc in running:
+            try:
+                await asyncio.wait_for(proc.wait(), timeout)
+            except asyncio.TimeoutError:
+                with contextlib.suppress(ProcessLookupError):
+                    proc.kill()
+                await proc.wait()
+
+    async def _keep_alive(self, child: _ShardProcess) -> None:
+        loop = asyncio.get_running_loop()
+        delay = self.restart_delay
+        while not self._stopping:
+            started = loop.time()
+            child.proc = await asyncio.create_subprocess_exec(*self.command, env=self.child_env(child))
+            log.info("Shard process %s started (pid %s, shards %s).", child.index, child.proc.pid, child.shard_ids)
+            code = await child.proc.wait()
+            if self._stopping or code == 0:
+                log.info("Shard process %s exited with code %s.", child.index, code)
+                return
+            if loop.time() - started > self.max_restart_delay:
+                delay = self.restart_delay  # it ran fine for a while: not a crash loop
+            log.warning("Shard process %s crashed with code %s; restarting in %.0fs.", child.index, code, delay)
+            await asyncio.sleep(delay)
+            child.restarts += 1
+            # Back off on crash loops (bad token, gateway outage) instead of hammering Discord
+            delay = min(delay * 2, self.max_restart_delay)
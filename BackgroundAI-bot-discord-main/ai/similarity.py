@@ -0,0 +1,39 @@
+import itertools
+import re
+from typing import FrozenSet, List, Sequence, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = 3) -> FrozenSet[Tuple[str, ...]]:
+    # Word n-grams; texts shorter than one shingle fall back to their words
+    words = _WORD_RE.findall(text.casefold())
+    if len(words) < size:
+        return frozenset((w,) for w in words)
+    return frozenset(tuple(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def jaccard(a: FrozenSet, b: FrozenSet) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def draft_similarity(drafts: Sequence[str], size: int = 3) -> float:
+    # Lowest pairwise overlap: drafts only count as redundant if every pair is
+    if len(drafts) < 2:
+        return 1.0
+    sets = [shingles(d, size) for d in drafts]
+    return min(jaccard(a, b) for a, b in itertools.combinations(sets, 2))
+
+
+def best_draft(drafts: Sequence[str], size: int = 3) -> str:
+    # The draft closest to all the others (medoid); ties go to the longer one
+    if len(drafts) == 1:
+        return drafts[0]
+    sets = [shingles(d, size) for d in drafts]
+    scores: List[Tuple[float, int, int]] = []
+    for i, own in enumerate(sets):
+        total = sum(jaccard(own, other) for j, other in enumerate(sets) if j != i)
+        scores.append((total, len(drafts[i]), -i))
+    return drafts[-max(scores)[2]]
@@ -0,0 +1,74 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+Progress = Callable[[str], None]
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.listeners: List[Progress] = []
+        self.last_progress: Optional[str] = None
+
+    def broadcast(self, text: str) -> None:
+        self.last_progress = text
+        for listener in list(self.listeners):
+            listener(text)
+
+
+# -------------------------
+# Single-flight: concurrent identical requests share one execution
+# -------------------------
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.abandoned = 0  # shared runs cancelled because every waiter left
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[Optional[Progress]], Awaitable[Any]],
+                 on_progress: Optional[Progress] = None) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call()
+            progress = call.broadcast if on_progress is not None else None
+            call.task = asyncio.create_task(fn(progress))
+            call.task.add_done_callback(lambda task, key=key, call=call: self._finished(key, call, task))
+            self._calls[key] = call
+            self.executions += 1
+        else:
+            self.coalesced += 1
+            if on_progress is not None and call.last_progress is not None:
+                # Late joiners catch up with what the leader has already streamed
+                on_progress(call.last_progress)
+        if on_progress is not None:
+            call.listeners.append(on_progress)
+        call.waiters += 1
+        try:
+            # shield: a waiter that gives up must not cancel the work the others are waiting on
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if on_progress is not None:
+                call.listeners.remove(on_progress)
+            if call.waiters == 0 and not call.task.done():
+                self._abandon(key, call)
+
+    def _abandon(self, key: Hashable, call: _Call) -> None:
+        # Nobody is waiting for the answer any more: stop the work and let the next caller start afresh
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        call.task.cancel()
+        self.abandoned += 1
+
+    def _finished(self, key: Hashable, call: _Call, task: asyncio.Task) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter was cancelled
+            task.exception()
@@ -0,0 +1,275 @@
+import abc
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+class StateError(Exception):
+    pass
+
+
+# -------------------------
+# Shared key/value state for sharded deployments
+# -------------------------
+class StateBackend(abc.ABC):
+    # Strings in, strings out; counters are strings holding integers (like Redis)
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        # Atomic across every process sharing the backend; ttl applies when the key is created
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    async def aclose(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    # Single process only: tests and unsharded runs
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}  # key -> (value, expires_at)
+
+    def _live(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= self._clock():
+            del self._data[key]
+            return None
+        return entry
+
+    def _expiry(self, ttl: Optional[float]) -> Optional[float]:
+        return None if ttl is None else self._clock() + ttl
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._live(key)
+        return None if entry is None else entry[0]
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._data[key] = (value, self._expiry(ttl))
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        entry = self._live(key)
+        value = amount if entry is None else int(entry[0]) + amount
+        self._data[key] = (str(value), self._expiry(ttl) if entry is None else entry[1])
+        return value
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class SQLiteStateBackend(StateBackend):
+    # One WAL database shared by every shard process on a host; calls run in a worker thread
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.path = path
+        self._clock = clock
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+            self._db = db
+        return self._db
+
+    def _run(self, fn: Callable[[sqlite3.Connection, float], Any]) -> Any:
+        with self._lock:
+            db = self._connect()
+            # IMMEDIATE takes the write lock up front, so read-modify-write is atomic across processes
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(db, self._clock())
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def _read(db: sqlite3.Connection, key: str, now: float) -> Optional[Tuple[str, Optional[float]]]:
+        row = db.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return row[0], row[1]
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = await asyncio.to_thread(self._run, lambda db, now: self._read(db, key, now))
+        return None if entry is None else entry[0]
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        def op(db: sqlite3.Connection, now: float) -> None:
+            db.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                       (key, value, None if ttl is None else now + ttl))
+        await asyncio.to_thread(self._run, op)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        def op(db: sqlite3.Connection, now: float) -> int:
+            entry = self._read(db, key, now)
+            if entry is None:
+                value, expires_at = amount, None if ttl is None else now + ttl
+            else:
+                value, expires_at = int(entry[0]) + amount, entry[1]
+            db.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                       (key, str(value), expires_at))
+            return value
+        return await asyncio.to_thread(self._run, op)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._run, lambda db, now: db.execute("DELETE FROM kv WHERE key = ?", (key,)))
+
+    def purge_expired(self) -> int:
+        return self._run(lambda db, now: db.execute(
+            "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class RedisStateBackend(StateBackend):
+    # Minimal RESP2 client: one connection, one command at a time (state calls are tiny)
+    # Increment and expiry in one atomic step: a key is never left without its TTL, and an existing TTL is kept
+    INCR_SCRIPT = (
+        "local value = redis.call('INCRBY', KEYS[1], ARGV[1]) "
+        "if redis.call('PTTL', KEYS[1]) == -1 then redis.call('PEXPIRE', KEYS[1], ARGV[2]) end "
+        "return value"
+    )
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0, *, connect_timeout: float = 5.0,
+                 read_timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout  # per command: a hung server must not hold the lock forever
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def command(self, *args: Any) -> Any:
+        async with self._lock:
+            for attempt in range(2):
+                fresh = self._writer is None
+                try:
+                    if fresh:
+                        await self._open()
+                    return await self._roundtrip(args)
+                except asyncio.TimeoutError as exc:
+                    self._drop()
+                    raise StateError(f"Redis at {self.host}:{self.port} timed out") from exc
+                except (ConnectionError, asyncio.IncompleteReadError) as exc:
+                    self._drop()
+                    # A pooled connection may have been closed by the server; retry once on a new one
+                    if fresh or attempt:
+                        raise StateError(f"Redis connection to {self.host}:{self.port} failed: {exc}") from exc
+                except BaseException:
+                    # Cancelled (or failed) between writing a command and reading its reply: the reply would be
+                    # read by the next command, so the connection cannot be reused
+                    self._drop()
+                    raise
+        raise StateError("unreachable")
+
+    async def _open(self) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout=self._connect_timeout
+        )
+        if self.db:
+            await self._roundtrip(("SELECT", self.db))
+
+    def _drop(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _roundtrip(self, args: Tuple[Any, ...]) -> Any:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._writer.write(b"".join(parts))
+        return await asyncio.wait_for(self._drain_and_read(), timeout=self._read_timeout)
+
+    async def _drain_and_read(self) -> Any:
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readuntil(b"\r\n")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            raise StateError(body.decode("utf-8", errors="replace"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            data = await self._reader.readexactly(size + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            count = int(body)
+            return None if count < 0 else [await self._read_reply() for _ in range(count)]
+        raise StateError(f"Unexpected Redis reply: {line!r}")
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.command("GET", key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            await self.command("SET", key, value)
+        else:
+            await self.command("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        if ttl is None:
+            return await self.command("INCRBY", key, amount)
+        return await self.command("EVAL", self.INCR_SCRIPT, 1, key, amount, max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str) -> None:
+        await self.command("DEL", key)
+
+    async def aclose(self) -> None:
+        async with self._lock:
+            self._drop()
+
+    def close(self) -> None:
+        self._drop()
+
+
+def create_state_backend(url: str) -> StateBackend:
+    # memory:// | sqlite:///path/to/state.sqlite3 | redis://host:port/db
+    parts = urlsplit(url)
+    if parts.scheme == "memory":
+        return MemoryStateBackend()
+    if parts.scheme == "sqlite":
+        path = (parts.netloc + parts.path) if parts.netloc else parts.path
+        if not path:
+            raise ValueError("sqlite state backend needs a path, e.g. sqlite:///var/lib/nightshade/state.sqlite3")
+        return SQLiteStateBackend(path)
+    if parts.scheme == "redis":
+        db = int(parts.path.strip("/") or 0)
+        return RedisStateBackend(parts.hostname or "localhost", parts.port or 6379, db)
+    raise ValueError(f"Unsupported state backend URL: {url!r} (use memory://, sqlite:///path or redis://host:port/db)")
@@ -0,0 +1,124 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+log = logging.getLogger("nightshade-bot")
+
+# Discord allows roughly 5 edits per 5s per channel; stay just under that
+DEFAULT_EDIT_INTERVAL_SEC = 1.2
+STREAM_CURSOR = " ▌"
+
+
+# -------------------------
+# Progressive reply: edits the placeholder as tokens arrive
+# -------------------------
+class ProgressiveReply:
+    def __init__(self, channel, placeholder, *, header: str, limit: int,
+                 render: Callable[[str], str], split: Callable[..., Iterable[str]],
+                 edit_interval: float = DEFAULT_EDIT_INTERVAL_SEC, cursor: str = STREAM_CURSOR,
+                 allowed_mentions: Any = None, on_api_call: Optional[Callable[[str, float], None]] = None,
+                 send: Optional[Callable[[str], Awaitable[Any]]] = None):
+        self.channel = channel
+        self.messages: List[Any] = [placeholder]
+        self._shown: List[Optional[str]] = [None]
+        self.header = header
+        self.cursor = cursor
+        # Reserve room for the cursor so a streaming chunk never needs re-splitting when it is removed
+        self.chunk_limit = max(1, limit - len(header) - len(cursor))
+        self.render = render
+        self.split = split
+        self.edit_interval = edit_interval
+        self.allowed_mentions = allowed_mentions
+        self.on_api_call = on_api_call  # (operation, seconds) for every Discord call
+        self.send = send  # routes rollover messages through a paced sender instead of channel.send
+        self.edits = 0
+        self._latest = ""
+        self._dirty = asyncio.Event()
+        self._render_lock = asyncio.Lock()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._last_flush = float("-inf")
+
+    def update(self, text: str) -> None:
+        # Called for every token; only the newest text is kept and flushed at most once per interval
+        self._latest = text
+        self._dirty.set()
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+
+    async def finish(self, text: str) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._pump_task
+        await self._flush(text, final=True)
+
+    async def abort(self) -> None:
+        # The question went away: stop editing and remove everything posted for it
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._pump_task
+        async with self._render_lock:
+            while self.messages:
+                stale = self.messages.pop()
+                self._shown.pop()
+                with contextlib.suppress(Exception):
+                    await self._timed("delete", stale.delete())
+
+    async def _pump(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._dirty.wait()
+            delay = self._last_flush + self.edit_interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._dirty.clear()
+            self._last_flush = loop.time()
+            try:
+                # Shielded so a cancel from finish() never leaves a half-recorded rollover
+                await asyncio.shield(self._flush(self._latest, final=False))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Streaming edit failed")
+
+    async def _flush(self, text: str, final: bool) -> None:
+        async with self._render_lock:
+            body = self.render(text)
+            if not body:
+                return
+            chunks = list(self.split(body, limit=self.chunk_limit))
+            for i, chunk in enumerate(chunks):
+                content = f"{self.header}{chunk}"
+                if not final and i == len(chunks) - 1:
+                    content += self.cursor
+                if i < len(self.messages):
+                    if self._shown[i] != content:
+                        await self._timed("edit", self.messages[i].edit(content=content))
+                        self._shown[i] = content
+                        self.edits += 1
+                else:
+                    # Rollover: the previous message is full, continue in a new one
+                    if self.send is not None:
+                        self.messages.append(await self.send(content))
+                    else:
+                        self.messages.append(await self._timed(
+                            "send", self.channel.send(content, allowed_mentions=self.allowed_mentions)
+                        ))
+                    self._shown.append(content)
+            if final:
+                while len(self.messages) > max(1, len(chunks)):
+                    stale = self.messages.pop()
+                    self._shown.pop()
+                    with contextlib.suppress(Exception):
+                        await self._timed("delete", stale.delete())
+
+    async def _timed(self, operation: str, call: Awaitable[Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return await call
+        finally:
+            if self.on_api_call is not None:
+                self.on_api_call(operation, time.perf_counter() - started)
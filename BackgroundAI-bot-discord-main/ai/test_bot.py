@@ -2,6 +2,7 @@ import asyncio
 import importlib
 import os
 import sys
+import tempfile
 import types
 import unittest
 from unittest.mock import AsyncMock, patch
@@ -30,6 +31,11 @@ def _install_discord_stub():
     discord_stub.Forbidden = type("Forbidden", (Exception,), {})
     discord_stub.Interaction = type("Interaction", (), {})
     discord_stub.Message = type("Message", (), {})
+    discord_stub.RawMessageDeleteEvent = type("RawMessageDeleteEvent", (), {})
+    discord_stub.RawBulkMessageDeleteEvent = type("RawBulkMessageDeleteEvent", (), {})
+    discord_stub.Guild = type("Guild", (), {})
+    discord_stub.TextChannel = type("TextChannel", (), {})
+    discord_stub.abc = types.SimpleNamespace(GuildChannel=type("GuildChannel", (), {}))
     discord_stub.utils = types.SimpleNamespace(get=lambda *args, **kwargs: None)
 
     app_commands_stub = types.ModuleType("discord.app_commands")
@@ -83,7 +89,14 @@ def _install_discord_stub():
         def run(self, *_args, **_kwargs):
             return None
 
+    class FakeAutoShardedBot(FakeBot):
+        def __init__(self, *args, shard_count=None, shard_ids=None, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.shard_count = shard_count
+            self.shard_ids = shard_ids
+
     commands_stub.Bot = FakeBot
+    commands_stub.AutoShardedBot = FakeAutoShardedBot
 
     discord_ext_stub = types.ModuleType("discord.ext")
     discord_ext_stub.commands = commands_stub
@@ -97,8 +110,12 @@ def _install_discord_stub():
 _install_discord_stub()
 
 os.environ.setdefault("DISCORD_TOKEN", "test-token")
+os.environ.setdefault("QUOTA_DB", "")  # keep quotas in memory; never write a state file from tests
 
 from ai import bot
+from ai.fake_orchestrator import read_pids, survivors, tree_command
+from ai.pipeline import PipelineResult
+from ai.state import StateError
 
 
 class CleanAiOutputTests(unittest.TestCase):
@@ -217,48 +234,337 @@ class StartCommandErrorHandlerTests(unittest.IsolatedAsyncioTestCase):
         )
 
 
-class IsCooldownOkTests(unittest.TestCase):
+def _text_channel(channel_id, name, guild_id=1):
+    channel = bot.discord.TextChannel()
+    channel.id, channel.name, channel.guild = channel_id, name, types.SimpleNamespace(id=guild_id)
+    return channel
+
+
+class AIChannelRegistryIntegrationTests(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self._original_last_user_ask_at = dict(bot.last_user_ask_at)
-        bot.last_user_ask_at.clear()
+        for target, value in (("ai.bot.ai_channels", bot.AIChannelRegistry()),
+                              ("ai.bot.quota_store", bot.QuotaStore(bot.MAX_QUESTIONS_PER_SERVER)),
+                              ("ai.bot.rate_limiter", bot.RateLimiter()),
+                              ("ai.bot.AI_STREAMING", False)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(bot.bot, "user", types.SimpleNamespace(mentioned_in=lambda _m: True), create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _message(self, channel_id):
+        thinking = types.SimpleNamespace(delete=AsyncMock(), edit=AsyncMock())
+        return types.SimpleNamespace(
+            author=types.SimpleNamespace(bot=False, id=2),
+            guild=types.SimpleNamespace(id=1),
+            channel=types.SimpleNamespace(id=channel_id, send=AsyncMock(return_value=thinking)),
+            content="<@99> hi there",
+            mentions=[types.SimpleNamespace(id=99)],
+            id=500 + channel_id,
+        )
 
-    def tearDown(self):
-        bot.last_user_ask_at.clear()
-        bot.last_user_ask_at.update(self._original_last_user_ask_at)
+    async def test_mentions_outside_ai_channels_are_ignored(self):
+        bot.ai_channels.add(_text_channel(11, "ai"))
+        message = self._message(10)
+
+        with patch("ai.bot.ask_ai_async", new=AsyncMock()) as ask:
+            await bot.on_message(message)
+
+        ask.assert_not_called()
+        message.channel.send.assert_not_called()
+
+    async def test_mentions_in_a_registered_channel_are_answered(self):
+        await bot.on_guild_channel_create(_text_channel(11, "ai"))
+        message = self._message(11)
+
+        with patch("ai.bot.ask_ai_async", new=AsyncMock(return_value=("answer", 0))) as ask:
+            await bot.on_message(message)
+
+        self.assertEqual("hi there", ask.await_args.args[0])
+        self.assertIn("answer", message.channel.send.await_args.args[0])
+
+    async def test_only_replies_to_the_bot_are_follow_ups_of_that_user(self):
+        await bot.on_guild_channel_create(_text_channel(11, "ai"))
+        plain = self._message(11)
+        reply = self._message(11)
+        reply.reference = types.SimpleNamespace(resolved=types.SimpleNamespace(author=types.SimpleNamespace(id=99)))
+
+        with patch.object(bot.bot, "user", types.SimpleNamespace(id=99, mentioned_in=lambda _m: True)), \
+            patch("ai.bot.ask_ai_async", new=AsyncMock(return_value=("answer", 0))) as ask:
+            await bot.on_message(plain)
+            await bot.on_message(reply)
+
+        first, second = ask.await_args_list
+        self.assertEqual(((11, 2), False), (first.kwargs["conversation_id"], first.kwargs["follow_up"]))
+        self.assertEqual(((11, 2), True), (second.kwargs["conversation_id"], second.kwargs["follow_up"]))
+
+    async def test_long_answers_are_sent_as_one_attachment(self):
+        await bot.on_guild_channel_create(_text_channel(11, "ai"))
+        message = self._message(11)
+        sender = bot.OutboundSender(global_limit=None, attach_after_chunks=2,
+                                    make_file=lambda data, name: (name, len(data)))
+
+        with patch("ai.bot.outbound", sender), \
+            patch("ai.bot.ask_ai_async", new=AsyncMock(return_value=("word " * 2000, 0))):
+            await bot.on_message(message)
+
+        self.assertEqual(2, message.channel.send.await_count)  # placeholder + one answer
+        self.assertEqual(("answer.md", 10000), message.channel.send.await_args.kwargs["file"])
+
+    async def test_traced_messages_show_up_in_aitraces_for_their_server(self):
+        await bot.on_guild_channel_create(_text_channel(11, "ai"))
+        tracer = bot.Tracer(sample_rate=1.0, slow_sec=0.0)
+
+        with patch("ai.bot.tracer", tracer), \
+            patch("ai.bot.ask_ai_async", new=AsyncMock(return_value=("answer", 0))):
+            await bot.on_message(self._message(11))
+            replies = []
+            for guild_id in (1, 2):
+                send_message = AsyncMock()
+                await bot.aitraces(types.SimpleNamespace(
+                    guild_id=guild_id, response=types.SimpleNamespace(send_message=send_message)
+                ))
+                replies.append(send_message.await_args.args[0])
+
+        (trace,) = tracer.recent
+        self.assertEqual({"guild": 1, "channel": 11, "message": 511}, trace.attrs)
+        self.assertEqual(["thinking_message", "ask_ai_async", "discord:delete", "deliver"],
+                         [s.name for s in sorted(trace.spans, key=lambda s: s.start_sec)])
+        self.assertIn(trace.trace_id, replies[0])
+        self.assertIn("None recorded.", replies[1])
+
+    async def test_channel_events_keep_the_registry_current(self):
+        general = _text_channel(12, "general")
+        renamed = _text_channel(12, "ai")
+
+        await bot.on_guild_channel_update(general, renamed)
+        self.assertTrue(bot.ai_channels.is_ai_channel(1, 12))
+        await bot.on_guild_channel_delete(renamed)
+        self.assertFalse(bot.ai_channels.is_ai_channel(1, 12))
+
+    async def test_start_registers_the_new_channel(self):
+        created = _text_channel(13, "ai")
+        created.mention = "#ai"
+        guild = types.SimpleNamespace(id=1, text_channels=[], create_text_channel=AsyncMock(return_value=created))
+        send_message = AsyncMock()
+        interaction = types.SimpleNamespace(guild=guild, response=types.SimpleNamespace(send_message=send_message))
+
+        await bot.start(interaction)
+
+        guild.create_text_channel.assert_awaited_once_with("ai")
+        self.assertTrue(bot.ai_channels.is_ai_channel(1, 13))
+
+    async def test_start_keeps_the_question_quota(self):
+        for _ in range(3):
+            await bot.quota_store.try_consume(1)
+        created = _text_channel(13, "ai")
+        created.mention = "#ai"
+        guild = types.SimpleNamespace(id=1, text_channels=[], create_text_channel=AsyncMock(return_value=created))
+        interaction = types.SimpleNamespace(guild=guild, response=types.SimpleNamespace(send_message=AsyncMock()))
+
+        await bot.start(interaction)
+
+        self.assertEqual(3, await bot.quota_store.used(1))
+
+    async def test_resetcounter_clears_the_quota(self):
+        await bot.quota_store.try_consume(1)
+        interaction = types.SimpleNamespace(guild_id=1, response=types.SimpleNamespace(send_message=AsyncMock()))
+
+        await bot.resetcounter(interaction)
+
+        self.assertEqual(0, await bot.quota_store.used(1))
+
+    async def test_exhausted_quota_stops_questions(self):
+        bot.ai_channels.add(_text_channel(11, "ai"))
+        message = self._message(11)
+
+        with patch.object(bot.quota_store, "limit", 1), patch("ai.bot.MAX_QUESTIONS_PER_SERVER", 1), \
+            patch("ai.bot.ask_ai_async", new=AsyncMock(return_value=("answer", 0))) as ask:
+            await bot.on_message(message)
+            await bot.on_message(message)
+
+        self.assertEqual(1, ask.await_count)
+        self.assertIn("question limit", message.channel.send.await_args.args[0])
+
+    async def test_a_quota_store_outage_gets_an_error_reply(self):
+        bot.ai_channels.add(_text_channel(11, "ai"))
+        message = self._message(11)
+
+        for method in ("used", "try_consume"):
+            with patch.object(bot.quota_store, method, AsyncMock(side_effect=StateError("down"))), \
+                patch("ai.bot.ask_ai_async", new=AsyncMock(return_value=("answer", 0))) as ask, \
+                self.assertLogs("nightshade-bot", "WARNING"):
+                await bot.on_message(message)
+
+            ask.assert_not_called()
+            self.assertIn("question limit right now", message.channel.send.await_args.args[0])
+
+    async def test_a_shared_global_limit_outage_fails_open(self):
+        bot.ai_channels.add(_text_channel(11, "ai"))
+        message = self._message(11)
+        down = types.SimpleNamespace(check=AsyncMock(side_effect=OSError("down")))
+
+        with patch("ai.bot.shared_global_limit", down), \
+            patch("ai.bot.ask_ai_async", new=AsyncMock(return_value=("answer", 0))) as ask, \
+            self.assertLogs("nightshade-bot", "WARNING"):
+            await bot.on_message(message)
+
+        ask.assert_awaited_once()
+        self.assertIn("answer", message.channel.send.await_args.args[0])
+
+    async def test_start_refuses_when_an_ai_channel_exists(self):
+        guild = types.SimpleNamespace(id=1, text_channels=[_text_channel(14, "ai")], create_text_channel=AsyncMock())
+        send_message = AsyncMock()
+        interaction = types.SimpleNamespace(guild=guild, response=types.SimpleNamespace(send_message=send_message))
 
-    def test_first_call_allows_and_records_timestamp(self):
-        guild_id = 123
-        user_id = 456
-        now = 100.0
+        await bot.start(interaction)
 
-        allowed = bot.is_cooldown_ok(guild_id, user_id, now)
+        guild.create_text_channel.assert_not_called()
+        send_message.assert_awaited_once_with("⚠️ #ai channel already exists.", ephemeral=True)
 
-        self.assertTrue(allowed)
-        self.assertEqual(now, bot.last_user_ask_at[(guild_id, user_id)])
+
+class CancellationIntegrationTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        for target, value in (("ai.bot.ai_channels", bot.AIChannelRegistry()),
+                              ("ai.bot.quota_store", bot.QuotaStore(bot.MAX_QUESTIONS_PER_SERVER)),
+                              ("ai.bot.rate_limiter", bot.RateLimiter()),
+                              ("ai.bot.active_requests", bot.ActiveRequests()),
+                              ("ai.bot.AI_STREAMING", False)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(bot.bot, "user", types.SimpleNamespace(mentioned_in=lambda _m: True), create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        bot.ai_channels.add(_text_channel(11, "ai"))
+        self.started = asyncio.Event()
+
+    def _message(self, message_id):
+        thinking = types.SimpleNamespace(delete=AsyncMock(), edit=AsyncMock())
+        return types.SimpleNamespace(
+            author=types.SimpleNamespace(bot=False, id=2),
+            guild=types.SimpleNamespace(id=1),
+            channel=types.SimpleNamespace(id=11, send=AsyncMock(return_value=thinking)),
+            content="<@99> hi there",
+            mentions=[types.SimpleNamespace(id=99)],
+            id=message_id,
+        )
+
+    async def _hang(self, *_args, **_kwargs):
+        self.started.set()
+        await asyncio.sleep(60)
+
+    async def _ask_in_background(self, message):
+        self.started.clear()
+        task = asyncio.create_task(bot.on_message(message))
+        await self.started.wait()
+        return task
+
+    async def test_deleting_the_question_cancels_its_answer(self):
+        message = self._message(501)
+
+        with patch("ai.bot.ask_ai_async", new=self._hang):
+            task = await self._ask_in_background(message)
+            with self.assertLogs("nightshade-bot", level="INFO") as logs:
+                await bot.on_raw_message_delete(types.SimpleNamespace(message_id=501))
+                await task
+
+        self.assertIn("question deleted", logs.output[0])
+        message.channel.send.return_value.delete.assert_awaited_once()
+        self.assertEqual(1, message.channel.send.await_count)  # only the placeholder
+        self.assertEqual(0, await bot.quota_store.used(1))
+        self.assertEqual(0, len(bot.active_requests))
+
+    async def test_a_newer_question_supersedes_the_older_one(self):
+        first, second = self._message(501), self._message(502)
+        answers = iter([self._hang(), asyncio.sleep(0, result=("second answer", 0))])
+
+        with patch("ai.bot.ask_ai_async", new=lambda *_args, **_kwargs: next(answers)):
+            task = await self._ask_in_background(first)
+            with self.assertLogs("nightshade-bot", level="INFO") as logs:
+                await bot.on_message(second)
+                await task
+
+        self.assertIn("superseded", logs.output[0])
+        self.assertEqual(1, first.channel.send.await_count)
+        self.assertIn("second answer", second.channel.send.await_args.args[0])
+        self.assertEqual(1, await bot.quota_store.used(1))
+
+    async def test_deleting_the_channel_cancels_its_answers(self):
+        message = self._message(501)
+
+        with patch("ai.bot.ask_ai_async", new=self._hang):
+            task = await self._ask_in_background(message)
+            with self.assertLogs("nightshade-bot", level="INFO"):
+                await bot.on_guild_channel_delete(_text_channel(11, "ai"))
+                await task
+
+        self.assertEqual(1, bot.active_requests.cancelled)
+        self.assertEqual(1, message.channel.send.await_count)
+
+
+class RateLimiterTests(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("ai.bot.rate_limiter", bot.RateLimiter(user=bot.Limit(1 / bot.PER_USER_COOLDOWN_SEC, 1)))
+        self.limiter = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_first_call_is_allowed(self):
+        self.assertTrue(bot.rate_limiter.check(123, 456, 100.0).allowed)
 
     def test_immediate_second_call_is_blocked(self):
-        guild_id = 123
-        user_id = 456
-        now = 100.0
+        bot.rate_limiter.check(123, 456, 100.0)
 
-        first_allowed = bot.is_cooldown_ok(guild_id, user_id, now)
-        second_allowed = bot.is_cooldown_ok(guild_id, user_id, now)
+        verdict = bot.rate_limiter.check(123, 456, 100.0)
 
-        self.assertTrue(first_allowed)
-        self.assertFalse(second_allowed)
-        self.assertEqual(now, bot.last_user_ask_at[(guild_id, user_id)])
+        self.assertEqual("user", verdict.scope)
+        self.assertAlmostEqual(bot.PER_USER_COOLDOWN_SEC, verdict.retry_after)
 
-    def test_call_after_cooldown_is_allowed_and_updates_timestamp(self):
-        guild_id = 123
-        user_id = 456
-        first_ts = 100.0
-        second_ts = first_ts + bot.PER_USER_COOLDOWN_SEC
+    def test_call_after_cooldown_is_allowed(self):
+        bot.rate_limiter.check(123, 456, 100.0)
 
-        bot.is_cooldown_ok(guild_id, user_id, first_ts)
-        allowed_after_cooldown = bot.is_cooldown_ok(guild_id, user_id, second_ts)
+        self.assertTrue(bot.rate_limiter.check(123, 456, 100.0 + bot.PER_USER_COOLDOWN_SEC).allowed)
 
-        self.assertTrue(allowed_after_cooldown)
-        self.assertEqual(second_ts, bot.last_user_ask_at[(guild_id, user_id)])
+    def test_default_limiter_has_user_guild_and_global_buckets(self):
+        limits = importlib.reload(bot).rate_limiter.limits
+
+        self.assertEqual((1 / bot.PER_USER_COOLDOWN_SEC, 1), tuple(limits["user"]))
+        self.assertEqual(bot.RATE_LIMIT_GUILD_BURST, limits["guild"].burst)
+        self.assertEqual(bot.RATE_LIMIT_GLOBAL_BURST, limits["global"].burst)
+
+    def test_zero_rate_disables_a_level(self):
+        with patch.dict(os.environ, {"RATE_LIMIT_GLOBAL_PER_MIN": "0"}, clear=False):
+            self.assertIsNone(importlib.reload(bot).rate_limiter.limits["global"])
+        importlib.reload(bot)
+
+
+class ShardedConfigTests(unittest.TestCase):
+    def tearDown(self):
+        importlib.reload(bot)
+
+    def test_child_process_runs_its_shards_with_a_slice_of_the_global_limit(self):
+        with patch.dict(os.environ, {"BOT_SHARD_COUNT": "4", "BOT_SHARD_IDS": "1"}, clear=False):
+            reloaded = importlib.reload(bot)
+
+        self.assertEqual((4, [1]), (reloaded.bot.shard_count, reloaded.bot.shard_ids))
+        self.assertEqual(round(bot.RATE_LIMIT_GLOBAL_BURST / 4), reloaded.rate_limiter.limits["global"].burst)
+        self.assertIsInstance(reloaded.quota_store, reloaded.QuotaStore)
+
+    def test_state_backend_shares_quotas_cache_and_the_global_limit(self):
+        with patch.dict(os.environ, {"BOT_SHARD_COUNT": "2", "BOT_SHARD_IDS": "0", "STATE_BACKEND": "memory://"},
+                        clear=False):
+            reloaded = importlib.reload(bot)
+
+        self.assertIsInstance(reloaded.quota_store, reloaded.SharedQuotaStore)
+        self.assertIs(reloaded.state_backend, reloaded.answer_cache.backend)
+        self.assertIsNone(reloaded.rate_limiter.limits["global"])
+        self.assertEqual(bot.RATE_LIMIT_GLOBAL_BURST, reloaded.shared_global_limit.limit.burst)
+
+    def test_shard_ids_must_fit_the_shard_count(self):
+        with patch.dict(os.environ, {"BOT_SHARD_COUNT": "2", "BOT_SHARD_IDS": "2"}, clear=False):
+            with self.assertRaises(ValueError):
+                importlib.reload(bot)
 
 
 class PowershellPrefixTests(unittest.TestCase):
@@ -294,13 +600,9 @@ class AskAiAsyncTimeoutTests(unittest.IsolatedAsyncioTestCase):
     async def test_timeout_kills_and_reaps_process(self):
         class DummyProc:
             def __init__(self):
-                self.killed = False
                 self.wait = AsyncMock(return_value=0)
                 self.communicate = AsyncMock(return_value=(b"", None))
 
-            def kill(self):
-                self.killed = True
-
         dummy_proc = DummyProc()
 
         async def fake_create_subprocess_exec(*_args, **_kwargs):
@@ -311,26 +613,88 @@ class AskAiAsyncTimeoutTests(unittest.IsolatedAsyncioTestCase):
                 awaitable.close()
             raise asyncio.TimeoutError
 
-        with patch("ai.bot.os.path.isfile", return_value=True), \
+        with patch("ai.bot.AI_BACKEND", "powershell"), \
+            patch("ai.bot.os.path.isfile", return_value=True), \
             patch("ai.bot.powershell_prefix", return_value=[]), \
             patch("ai.bot.asyncio.create_subprocess_exec", new=fake_create_subprocess_exec), \
-            patch("ai.bot.asyncio.wait_for", new=fake_wait_for):
+            patch("ai.bot.asyncio.wait_for", new=fake_wait_for), \
+            patch("ai.bot.kill_process_tree", new=AsyncMock()) as kill_tree:
             with self.assertLogs("nightshade-bot", level="WARNING") as cm:
                 message, code = await bot.ask_ai_async("hello")
 
         self.assertIn("timed out", message)
         self.assertEqual(code, 124)
-        self.assertTrue(dummy_proc.killed)
-        self.assertEqual(dummy_proc.wait.await_count, 1)
+        # The whole process group is reclaimed, not just the top-level pwsh
+        kill_tree.assert_awaited_once_with(dummy_proc)
         self.assertIn("timed out", " ".join(cm.output).lower())
 
 
+@unittest.skipIf(sys.platform == "win32", "the fake orchestrator tree is checked with POSIX signals")
+class AskAiAsyncPowershellCancellationTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.pid_file = os.path.join(self.tmp.name, "pids")
+        for target, value in (("ai.bot.AI_BACKEND", "powershell"),
+                              ("ai.bot.answer_cache", None),
+                              ("ai.bot.os.path.isfile", lambda _path: True),
+                              ("ai.bot.powershell_args", lambda *_args: tree_command(self.pid_file))):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_timeout_leaves_no_child_process_behind(self):
+        with patch("ai.bot.AI_TIMEOUT_SEC", 1), self.assertLogs("nightshade-bot", level="WARNING"):
+            message, code = await bot.ask_ai_async("hello")
+
+        self.assertEqual(124, code)
+        self.assertEqual([], await survivors(await read_pids(self.pid_file)))
+
+    async def test_cancelled_question_leaves_no_child_process_behind(self):
+        task = asyncio.create_task(bot.ask_ai_async("hello"))
+        pids = await read_pids(self.pid_file)
+
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        self.assertEqual([], await survivors(pids))
+
+
+class AskAiAsyncPowershellOutputTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch("ai.bot.answer_cache", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_stdout_is_cleaned_as_it_streams(self):
+        output = "NightshadeAI: caf\u00e9 \x1b[1mready\x1b[0m\n\n\n\ndone".encode("utf-8")
+        pieces = [output[i:i + 3] for i in range(0, len(output), 3)] + [b""]
+
+        class DummyProc:
+            def __init__(self):
+                self.stdout = types.SimpleNamespace(read=AsyncMock(side_effect=pieces))
+                self.wait = AsyncMock(return_value=0)
+
+        async def fake_create_subprocess_exec(*_args, **_kwargs):
+            return DummyProc()
+
+        with patch("ai.bot.AI_BACKEND", "powershell"), \
+            patch("ai.bot.os.path.isfile", return_value=True), \
+            patch("ai.bot.powershell_prefix", return_value=[]), \
+            patch("ai.bot.asyncio.create_subprocess_exec", new=fake_create_subprocess_exec):
+            message, code = await bot.ask_ai_async("hello")
+
+        self.assertEqual(("caf\u00e9 ready\n\ndone", 0), (message, code))
+
+
 class AskAiAsyncErrorTests(unittest.IsolatedAsyncioTestCase):
     async def test_unexpected_exception_logs_details_and_hides_message(self):
         async def fake_create_subprocess_exec(*_args, **_kwargs):
             raise RuntimeError("boom")
 
-        with patch("ai.bot.os.path.isfile", return_value=True), \
+        with patch("ai.bot.AI_BACKEND", "powershell"), \
+            patch("ai.bot.os.path.isfile", return_value=True), \
             patch("ai.bot.powershell_prefix", return_value=[]), \
             patch("ai.bot.asyncio.create_subprocess_exec", new=fake_create_subprocess_exec):
             with self.assertLogs("nightshade-bot", level="ERROR") as cm:
@@ -342,6 +706,576 @@ class AskAiAsyncErrorTests(unittest.IsolatedAsyncioTestCase):
         self.assertIn("boom", " ".join(cm.output))
 
 
+class AskAiAsyncHttpBackendTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Backend dispatch tests must not be answered from the cache
+        patcher = patch("ai.bot.answer_cache", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_http_backend_returns_cleaned_pipeline_answer(self):
+        result = PipelineResult("NightshadeAI: merged\x1b[0m answer", 0, ["a", "b"])
+
+        with patch("ai.bot.AI_BACKEND", "http"), \
+            patch.object(bot.ai_pipeline, "run", new=AsyncMock(return_value=result)) as run, \
+            patch("ai.bot.asyncio.create_subprocess_exec") as spawn:
+            message, code = await bot.ask_ai_async("hello")
+
+        self.assertEqual(("merged answer", 0), (message, code))
+        run.assert_awaited_once_with("hello", None, history=None)
+        spawn.assert_not_called()
+
+    async def test_http_backend_times_out_with_exit_124(self):
+        async def slow_run(_question, _on_progress=None, history=None):
+            await asyncio.sleep(10)
+
+        with patch("ai.bot.AI_BACKEND", "http"), \
+            patch("ai.bot.AI_TIMEOUT_SEC", 0.01), \
+            patch.object(bot.ai_pipeline, "run", new=slow_run):
+            with self.assertLogs("nightshade-bot", level="WARNING"):
+                message, code = await bot.ask_ai_async("hello")
+
+        self.assertEqual(124, code)
+        self.assertIn("timed out", message)
+
+    async def test_http_backend_forwards_progress_callback(self):
+        seen = []
+
+        async def fake_run(_question, on_progress, history=None):
+            on_progress("NightshadeAI: partial")
+            return PipelineResult("done", 0)
+
+        with patch("ai.bot.AI_BACKEND", "http"), \
+            patch.object(bot.ai_pipeline, "run", new=fake_run):
+            await bot.ask_ai_async("hello", on_progress=seen.append)
+
+        self.assertEqual(["NightshadeAI: partial"], seen)
+
+    async def test_http_backend_passes_exit_code_through(self):
+        result = PipelineResult("⚠️ No valid outputs generated from base models.", 2)
+
+        with patch("ai.bot.AI_BACKEND", "http"), \
+            patch.object(bot.ai_pipeline, "run", new=AsyncMock(return_value=result)):
+            message, code = await bot.ask_ai_async("hello")
+
+        self.assertEqual(2, code)
+        self.assertIn("No valid outputs", message)
+
+    async def test_http_backend_records_skipped_merges(self):
+        result = PipelineResult("only draft", 0, ["only draft"], merge_skipped=True, similarity=1.0)
+        send_message = AsyncMock()
+        interaction = types.SimpleNamespace(guild_id=1, response=types.SimpleNamespace(send_message=send_message))
+
+        with patch("ai.bot.AI_BACKEND", "http"), \
+            patch("ai.bot.merge_stats", bot.MergeStats()), \
+            patch.object(bot.ai_pipeline, "run", new=AsyncMock(return_value=result)):
+            await bot.ask_ai_async("hello")
+            await bot.aiinfo(interaction)
+            self.assertEqual(1, bot.merge_stats.skipped)
+
+        self.assertIn("Summarizer skipped: **1** / 1", send_message.await_args.args[0])
+
+
+class MetricsTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch("ai.bot.answer_cache", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_pipeline_stages_and_exit_code_are_recorded(self):
+        result = PipelineResult("answer", 0, ["d1", "d2"],
+                                {"draft:model-a": 1.5, "drafts": 1.6, "summarizer": 2.0, "total": 3.7})
+        before = {
+            "runs": bot.REQUESTS_TOTAL.value(exit_code=0),
+            "drafts": bot.DRAFT_SECONDS.count(model="model-a"),
+            "queue": bot.STAGE_SECONDS.count(stage="queue_wait"),
+            "summarizer": bot.STAGE_SECONDS.count(stage="summarizer"),
+            "cleaning": bot.STAGE_SECONDS.count(stage="cleaning"),
+        }
+
+        with patch.object(bot.ai_pipeline, "run", new=AsyncMock(return_value=result)):
+            await bot.ask_ai_async("metrics question")
+
+        self.assertEqual(before["runs"] + 1, bot.REQUESTS_TOTAL.value(exit_code=0))
+        self.assertEqual(before["drafts"] + 1, bot.DRAFT_SECONDS.count(model="model-a"))
+        self.assertEqual(before["queue"] + 1, bot.STAGE_SECONDS.count(stage="queue_wait"))
+        self.assertEqual(before["summarizer"] + 1, bot.STAGE_SECONDS.count(stage="summarizer"))
+        self.assertEqual(before["cleaning"] + 1, bot.STAGE_SECONDS.count(stage="cleaning"))
+
+    def test_every_script_exit_code_is_exported_from_the_start(self):
+        text = bot.metrics.render()
+
+        for code in (0, 1, 2, 3, 4, 5, 6, 124, 127):
+            self.assertIn(f'nightshade_requests_total{{exit_code="{code}"}}', text)
+        self.assertIn("nightshade_queue_depth ", text)
+        self.assertIn("nightshade_in_flight ", text)
+
+    def test_unknown_exit_codes_are_grouped(self):
+        before = bot.REQUESTS_TOTAL.value(exit_code="other")
+
+        bot.record_exit_code(42)
+
+        self.assertEqual(before + 1, bot.REQUESTS_TOTAL.value(exit_code="other"))
+
+    async def test_aiinfo_summarizes_latency_and_exit_codes(self):
+        send_message = AsyncMock()
+        interaction = types.SimpleNamespace(guild_id=1, response=types.SimpleNamespace(send_message=send_message))
+        bot.STAGE_SECONDS.observe(0.2, stage="drafts")
+        bot.record_exit_code(124)
+
+        await bot.aiinfo(interaction)
+
+        text = send_message.await_args.args[0]
+        self.assertRegex(text, r"Latency p50/p95: .*drafts \d+\.\d\d/\d+\.\d\ds")
+        self.assertRegex(text, r"Exit codes: .*124×\d+")
+
+
+class AskAiAsyncPoolBackendTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Backend dispatch tests must not be answered from the cache
+        patcher = patch("ai.bot.answer_cache", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_pool_backend_uses_warm_workers(self):
+        result = PipelineResult("pooled answer", 0, ["d1"], {"total": 1.0})
+
+        with patch("ai.bot.AI_BACKEND", "pool"), \
+            patch("ai.bot.os.path.isfile", return_value=True), \
+            patch.object(bot.orchestrator_pool, "run", new=AsyncMock(return_value=result)) as run, \
+            patch("ai.bot.asyncio.create_subprocess_exec") as spawn:
+            message, code = await bot.ask_ai_async("hello")
+
+        self.assertEqual(("pooled answer", 0), (message, code))
+        run.assert_awaited_once_with("hello")
+        spawn.assert_not_called()
+
+    async def test_pool_timeout_maps_to_exit_124(self):
+        with patch("ai.bot.AI_BACKEND", "pool"), \
+            patch("ai.bot.os.path.isfile", return_value=True), \
+            patch.object(bot.orchestrator_pool, "run", new=AsyncMock(side_effect=asyncio.TimeoutError)):
+            with self.assertLogs("nightshade-bot", level="WARNING"):
+                message, code = await bot.ask_ai_async("hello")
+
+        self.assertEqual(124, code)
+        self.assertIn("timed out", message)
+
+    async def test_pool_retry_hands_the_checkpointed_drafts_to_the_worker(self):
+        failed = PipelineResult("⚠️ Summarizer error: boom", 4, ["d1", "d2"], {"total": 1.0},
+                                drafts_by_model={"m1": "d1", "m2": "d2"})
+        merged = PipelineResult("merged", 0, ["d1", "d2"], {"total": 0.5})
+        checkpoints = bot.DraftCheckpoints()
+
+        with patch("ai.bot.AI_BACKEND", "pool"), \
+            patch("ai.bot.os.path.isfile", return_value=True), \
+            patch("ai.bot.draft_checkpoints", checkpoints), \
+            patch.object(bot.ai_pipeline.config, "models", ("m1", "m2")), \
+            patch.object(bot.orchestrator_pool, "run", new=AsyncMock(side_effect=[failed, merged])) as run:
+            self.assertEqual(4, (await bot.ask_ai_async("hello"))[1])
+            with self.assertLogs("nightshade-bot", level="INFO") as logs:
+                self.assertEqual(("merged", 0), await bot.ask_ai_async("hello"))
+
+        self.assertEqual({"drafts": {"m1": "d1", "m2": "d2"}}, run.await_args_list[1].kwargs)
+        self.assertIn("Resuming from 2 checkpointed draft(s)", logs.output[0])
+        self.assertEqual(0, len(checkpoints))
+
+
+class AnswerCacheIntegrationTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch("ai.bot.answer_cache", bot.AnswerCache(8, 60))
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_repeated_question_is_served_from_cache(self):
+        backend = AsyncMock(return_value=("cached answer", 0))
+
+        with patch("ai.bot.ask_backend", new=backend):
+            first = await bot.ask_ai_async("What can you do?")
+            second = await bot.ask_ai_async("  what can YOU do ")
+
+        self.assertEqual(("cached answer", 0), first)
+        self.assertEqual(("cached answer", 0), second)
+        self.assertEqual(1, backend.await_count)
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    async def test_concurrent_identical_questions_share_one_backend_call(self):
+        async def slow_backend(_question, _on_progress=None):
+            await asyncio.sleep(0.02)
+            return ("shared answer", 0)
+
+        backend = AsyncMock(side_effect=slow_backend)
+        coalesced_before = bot.inflight_questions.coalesced
+
+        with patch("ai.bot.ask_backend", new=backend):
+            results = await asyncio.gather(
+                bot.ask_ai_async("Is it up?"),
+                bot.ask_ai_async("is it up"),
+                bot.ask_ai_async("IS IT UP?!"),
+            )
+
+        self.assertEqual([("shared answer", 0)] * 3, results)
+        self.assertEqual(1, backend.await_count)
+        self.assertEqual(2, bot.inflight_questions.coalesced - coalesced_before)
+
+    async def test_failed_answers_are_not_cached(self):
+        backend = AsyncMock(return_value=("⚠️ AI timed out", 124))
+
+        with patch("ai.bot.ask_backend", new=backend):
+            await bot.ask_ai_async("hello")
+            await bot.ask_ai_async("hello")
+
+        self.assertEqual(2, backend.await_count)
+        self.assertEqual(0, len(self.cache))
+
+    async def test_key_depends_on_model_settings(self):
+        key = bot.question_cache_key("hello")
+
+        with patch("ai.bot.AI_MAX_TOKENS", bot.AI_MAX_TOKENS + 1):
+            self.assertNotEqual(key, bot.question_cache_key("hello"))
+        with patch("ai.bot.NIGHTSHADE_PERSONA", "Another persona"):
+            self.assertNotEqual(key, bot.question_cache_key("hello"))
+
+    async def test_aiinfo_reports_cache_counters(self):
+        send_message = AsyncMock()
+        interaction = types.SimpleNamespace(guild_id=1, response=types.SimpleNamespace(send_message=send_message))
+        self.cache.hits, self.cache.misses = 3, 1
+
+        await bot.aiinfo(interaction)
+
+        text = send_message.await_args.args[0]
+        self.assertIn("Answer cache: **3** hits / **1** misses (75%)", text)
+
+
+class SemanticCacheIntegrationTests(unittest.IsolatedAsyncioTestCase):
+    VECTORS = {
+        "how do i reset my password": (1.0, 0.1, 0.0),
+        "password reset how": (0.95, 0.2, 0.0),
+        "what is the weather": (0.0, 0.0, 1.0),
+    }
+
+    def setUp(self):
+        async def embed(text):
+            return self.VECTORS[text]
+
+        self.cache = bot.SemanticCache(embed, threshold=0.9, max_entries=8)
+        for name, value in (("ai.bot.semantic_cache", self.cache), ("ai.bot.answer_cache", bot.AnswerCache(8, 60))):
+            patcher = patch(name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_a_paraphrase_is_served_without_the_backend(self):
+        backend = AsyncMock(side_effect=[("Use the reset link.", 0), ("Sunny.", 0)])
+
+        with patch("ai.bot.ask_backend", new=backend):
+            first = await bot.ask_ai_async("How do I reset my password?")
+            with self.assertLogs("nightshade-bot", "INFO"):
+                second = await bot.ask_ai_async("Password reset how?")
+            third = await bot.ask_ai_async("What is the weather?")
+
+        self.assertEqual(("Use the reset link.", 0), first)
+        self.assertEqual(("Use the reset link.", 0), second)
+        self.assertEqual(("Sunny.", 0), third)
+        self.assertEqual(2, backend.await_count)
+        self.assertEqual((1, 2), (self.cache.hits, self.cache.misses))
+
+    async def test_failed_answers_and_other_personas_are_not_shared(self):
+        backend = AsyncMock(side_effect=[("⚠️ AI timed out", 124), ("fresh", 0), ("other persona", 0)])
+
+        with patch("ai.bot.ask_backend", new=backend):
+            await bot.ask_ai_async("How do I reset my password?")
+            await bot.ask_ai_async("Password reset how?")
+            with patch("ai.bot.NIGHTSHADE_PERSONA", "Another persona"):
+                answer = await bot.ask_ai_async("How do I reset my password?")
+
+        self.assertEqual(("other persona", 0), answer)
+        self.assertEqual(3, backend.await_count)
+
+    async def test_aiinfo_reports_semantic_cache_counters(self):
+        send_message = AsyncMock()
+        interaction = types.SimpleNamespace(guild_id=1, response=types.SimpleNamespace(send_message=send_message))
+        self.cache.hits, self.cache.misses = 1, 3
+
+        await bot.aiinfo(interaction)
+
+        self.assertIn("Semantic cache: **1** hits / **3** misses (25%)", send_message.await_args.args[0])
+
+
+class ConversationIntegrationTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.store = bot.ConversationStore(1024)
+        for target, value in (("ai.bot.conversations", self.store), ("ai.bot.answer_cache", bot.AnswerCache(8, 60)),
+                              ("ai.bot.AI_BACKEND", "http")):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_follow_up_sees_the_history_and_skips_the_cache(self):
+        histories = []
+
+        async def fake_run(question, _on_progress=None, history=None):
+            histories.append(history)
+            return PipelineResult(f"answer to {question}", 0, contexts={"m1": [1, 2]})
+
+        with patch.object(bot.ai_pipeline, "run", new=fake_run):
+            await bot.ask_ai_async("hello", conversation_id=7)
+            await bot.ask_ai_async("hello", conversation_id=7, follow_up=True)
+            await bot.ask_ai_async("hello", conversation_id=8, follow_up=True)
+
+        self.assertIsNone(histories[0])
+        self.assertEqual(2, len(histories))  # the other channel's first question is a cache hit
+        self.assertEqual(("hello",), tuple(t.question for t in histories[1].turns))
+        self.assertEqual({}, histories[1].contexts)  # shared first answers carry no context
+        self.assertEqual({"m1": [1, 2]}, self.store.history(7).contexts)
+        self.assertEqual(2, len(self.store.history(7).turns))
+        self.assertEqual(1, len(self.store.history(8).turns))
+
+    async def test_questions_that_are_not_follow_ups_stay_cached_but_are_remembered(self):
+        backend = AsyncMock(return_value=("answer", 0))
+
+        with patch("ai.bot.ask_backend", new=backend):
+            await bot.ask_ai_async("hello", conversation_id=7)
+            await bot.ask_ai_async("hello", conversation_id=7)
+
+        self.assertEqual(1, backend.await_count)
+        self.assertEqual(2, len(self.store.history(7).turns))
+
+    async def test_failed_answers_are_not_remembered(self):
+        with patch("ai.bot.ask_backend", new=AsyncMock(return_value=("⚠️ AI timed out", 124))):
+            await bot.ask_ai_async("hello", conversation_id=7)
+
+        self.assertFalse(self.store.history(7))
+
+
+class RequestSchedulerIntegrationTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        for target, value in (("ai.bot.answer_cache", None), ("ai.bot.degradation", None),
+                              ("ai.bot.request_scheduler", bot.FairScheduler(1, max_queue=1, max_queue_per_guild=1))):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_backend_runs_inside_a_scheduler_slot(self):
+        seen = []
+
+        async def backend(_question, _on_progress=None):
+            seen.append(bot.request_scheduler.in_flight)
+            return ("ok", 0)
+
+        with patch("ai.bot.ask_backend", new=AsyncMock(side_effect=backend)):
+            self.assertEqual(("ok", 0), await bot.ask_ai_async("hello", guild_id=5))
+
+        self.assertEqual([1], seen)
+        self.assertEqual(0, bot.request_scheduler.in_flight)
+
+    async def test_queued_request_is_told_its_position_and_overflow_is_rejected(self):
+        gate = asyncio.Event()
+        positions = []
+
+        async def backend(_question, _on_progress=None):
+            await gate.wait()
+            return ("ok", 0)
+
+        async def on_queued(position):
+            positions.append(position)
+
+        with patch("ai.bot.ask_backend", new=AsyncMock(side_effect=backend)):
+            running = asyncio.create_task(bot.ask_ai_async("first", guild_id=1))
+            queued = asyncio.create_task(bot.ask_ai_async("second", guild_id=2, on_queued=on_queued))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(bot.QueueFullError):
+                await bot.ask_ai_async("third", guild_id=3)
+            gate.set()
+            await asyncio.gather(running, queued)
+
+        self.assertEqual([1], positions)
+
+    async def test_aiinfo_reports_backend_load(self):
+        send_message = AsyncMock()
+        interaction = types.SimpleNamespace(guild_id=1, response=types.SimpleNamespace(send_message=send_message))
+
+        await bot.aiinfo(interaction)
+
+        self.assertIn("Backend load: **0 / 1** running, **0** queued", send_message.await_args.args[0])
+
+
+class DegradationIntegrationTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.degradation = bot.DegradationController(
+            bot.DEFAULT_TIERS, bot.DEFAULT_THRESHOLDS, latency_target_sec=60, hold_sec=3600
+        )
+        for target, value in (("ai.bot.answer_cache", None), ("ai.bot.degradation", self.degradation)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _degrade_to(self, name):
+        level = [t.name for t in bot.DEFAULT_TIERS].index(name)
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            self.degradation.update(int(self.degradation.thresholds[level - 1] * 10), 10)
+
+    async def test_rejecting_tier_turns_questions_away_before_queueing(self):
+        self._degrade_to("rejecting")
+
+        with patch("ai.bot.ask_backend", new=AsyncMock()) as backend:
+            with self.assertRaises(bot.QueueFullError):
+                await bot.ask_ai_async("hello")
+
+        backend.assert_not_awaited()
+
+    async def test_degraded_tier_runs_the_reduced_pipeline(self):
+        self._degrade_to("single-model")
+        result = PipelineResult("short answer", 0, ["a"])
+        reduced = bot.tier_pipelines["single-model"]
+
+        with patch("ai.bot.AI_BACKEND", "http"), \
+            patch.object(reduced, "run", new=AsyncMock(return_value=result)) as run, \
+            patch.object(bot.ai_pipeline, "run", new=AsyncMock()) as full_run:
+            self.assertEqual(("short answer", 0), await bot.ask_ai_async("hello"))
+
+        run.assert_awaited_once()
+        full_run.assert_not_awaited()
+        self.assertEqual((bot.AI_MODELS[0],), reduced.config.models)
+        self.assertGreater(self.degradation.recent_latency, 0)
+
+    async def test_reduced_tier_answers_are_not_cached(self):
+        self._degrade_to("single-model")
+        cache = bot.AnswerCache(8, 60)
+        backend = AsyncMock(return_value=("short answer", 0))
+
+        with patch("ai.bot.answer_cache", cache), patch("ai.bot.ask_backend", new=backend):
+            await bot.ask_ai_async("hello")
+            await bot.ask_ai_async("hello")
+
+        self.assertEqual(2, backend.await_count)
+        self.assertEqual(0, len(cache))
+
+    async def test_pool_workers_get_the_tier_settings_per_request(self):
+        self._degrade_to("short-answers")
+        result = PipelineResult("pooled", 0, ["d1"], {"total": 1.0})
+
+        with patch("ai.bot.AI_BACKEND", "pool"), \
+            patch("ai.bot.os.path.isfile", return_value=True), \
+            patch.object(bot.orchestrator_pool, "run", new=AsyncMock(return_value=result)) as run:
+            await bot.ask_ai_async("hello")
+
+        options = run.await_args.kwargs
+        self.assertEqual([bot.AI_MODELS[0]], options["models"])
+        self.assertEqual(bot.AI_MAX_TOKENS // 2, options["max_tokens"])
+        self.assertEqual(0.0, options["skip_merge_similarity"])
+
+    async def test_aiinfo_reports_the_service_tier(self):
+        self._degrade_to("fewer-models")
+        send_message = AsyncMock()
+        interaction = types.SimpleNamespace(guild_id=1, response=types.SimpleNamespace(send_message=send_message))
+
+        await bot.aiinfo(interaction)
+
+        self.assertIn("Service tier: **fewer-models**", send_message.await_args.args[0])
+
+
+class QuestionRouterIntegrationTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.router = bot.QuestionRouter(bot.Route("fast", ("fast-model",), summarize=False, max_tokens=128))
+        self.fast = bot.Pipeline(bot.ollama_client, bot.apply_route(bot.PIPELINE_CONFIG, self.router.fast))
+        for target, value in (("ai.bot.answer_cache", None),
+                              ("ai.bot.degradation", None),
+                              ("ai.bot.question_router", self.router),
+                              ("ai.bot.route_pipelines", {("fast", "full"): self.fast})):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_fast_route_answers_are_cached_apart_from_full_ones(self):
+        fast_key = bot.question_cache_key("hi")
+        fast_namespace = bot.semantic_cache_namespace(bot.route_for("hi"))
+
+        with patch("ai.bot.question_router", None):
+            self.assertNotEqual(fast_key, bot.question_cache_key("hi"))
+            self.assertNotEqual(fast_namespace, bot.semantic_cache_namespace(bot.route_for("hi")))
+
+    async def test_trivial_questions_take_the_fast_pipeline(self):
+        fast_before = bot.ROUTE_SECONDS.count(route="fast")
+        full_before = bot.ROUTE_SECONDS.count(route="full")
+
+        with patch("ai.bot.AI_BACKEND", "http"), \
+            patch.object(self.fast, "run", new=AsyncMock(return_value=PipelineResult("hey!", 0))) as fast_run, \
+            patch.object(bot.ai_pipeline, "run", new=AsyncMock(return_value=PipelineResult("long", 0))) as full_run:
+            self.assertEqual(("hey!", 0), await bot.ask_ai_async("hi"))
+            self.assertEqual(("long", 0), await bot.ask_ai_async("explain how tcp congestion control works"))
+
+        fast_run.assert_awaited_once()
+        full_run.assert_awaited_once()
+        self.assertEqual(fast_before + 1, bot.ROUTE_SECONDS.count(route="fast"))
+        self.assertEqual(full_before + 1, bot.ROUTE_SECONDS.count(route="full"))
+
+    async def test_pool_workers_get_the_fast_route_settings(self):
+        result = PipelineResult("pooled", 0, ["d1"], {"total": 1.0})
+
+        with patch("ai.bot.AI_BACKEND", "pool"), \
+            patch("ai.bot.os.path.isfile", return_value=True), \
+            patch.object(bot.orchestrator_pool, "run", new=AsyncMock(return_value=result)) as run:
+            await bot.ask_ai_async("who wrote hamlet")
+
+        options = run.await_args.kwargs
+        self.assertEqual(["fast-model"], options["models"])
+        self.assertEqual(128, options["max_tokens"])
+        self.assertEqual(0.0, options["skip_merge_similarity"])
+
+    async def test_aiinfo_reports_route_volume_and_savings(self):
+        send_message = AsyncMock()
+        interaction = types.SimpleNamespace(guild_id=1, response=types.SimpleNamespace(send_message=send_message))
+        bot.ROUTE_SECONDS.observe(1.0, route="fast")
+        bot.ROUTE_SECONDS.observe(20.0, route="full")
+
+        await bot.aiinfo(interaction)
+
+        line = next(l for l in send_message.await_args.args[0].splitlines() if l.startswith("Routes:"))
+        self.assertIn("fast **", line)
+        self.assertIn("full **", line)
+        self.assertIn("s saved", line)
+
+
+class PowershellArgsTests(unittest.TestCase):
+    @patch("ai.bot.powershell_prefix", return_value=["pwsh"])
+    def test_passes_backend_settings_to_script(self, _prefix):
+        args = bot.powershell_args("why?")
+
+        self.assertEqual(["pwsh", "-File", bot.POWERSHELL_SCRIPT, "-Prompt", "why?"], args[:5])
+        self.assertEqual(",".join(bot.AI_MODELS), args[args.index("-Models") + 1])
+        self.assertEqual(bot.AI_SUMMARIZER_MODEL, args[args.index("-SummarizerModel") + 1])
+        # The script plans its stages to finish before the bot's own timeout fires
+        self.assertLess(int(args[args.index("-DeadlineSec") + 1]), bot.AI_TIMEOUT_SEC)
+
+    @patch("ai.bot.powershell_prefix", return_value=["pwsh"])
+    def test_server_args_start_script_in_server_mode(self, _prefix):
+        args = bot.powershell_server_args()
+
+        self.assertEqual(["pwsh", "-File", bot.POWERSHELL_SCRIPT, "-Server"], args[:4])
+        self.assertNotIn("-Prompt", args)
+
+    @patch("ai.bot.powershell_prefix", return_value=["pwsh"])
+    def test_script_skips_its_model_check_when_the_bot_keeps_models_warm(self, _prefix):
+        args = bot.powershell_args("why?")
+
+        self.assertIn("-SkipModelCheck", args)
+        self.assertEqual(bot.OLLAMA_KEEP_ALIVE, args[args.index("-KeepAlive") + 1])
+        with patch("ai.bot.model_inventories", []):
+            self.assertNotIn("-SkipModelCheck", bot.powershell_args("why?"))
+
+
+class StreamingEnabledTests(unittest.TestCase):
+    def test_only_http_backend_streams(self):
+        with patch("ai.bot.AI_STREAMING", True):
+            with patch("ai.bot.AI_BACKEND", "http"):
+                self.assertTrue(bot.streaming_enabled())
+            with patch("ai.bot.AI_BACKEND", "pool"):
+                self.assertFalse(bot.streaming_enabled())
+
+    def test_can_be_disabled(self):
+        with patch("ai.bot.AI_STREAMING", False), patch("ai.bot.AI_BACKEND", "http"):
+            self.assertFalse(bot.streaming_enabled())
+
+
 class ConfigEnvironmentOverrideTests(unittest.TestCase):
     def tearDown(self):
         importlib.reload(bot)
@@ -372,6 +1306,83 @@ class ConfigEnvironmentOverrideTests(unittest.TestCase):
             importlib.reload(bot)
             self.assertEqual("processing", bot.THINKING_MESSAGE)
 
+    def test_ai_models_override(self):
+        with patch.dict(os.environ, {"AI_MODELS": "phi3:mini, qwen2:7b"}, clear=False):
+            importlib.reload(bot)
+            self.assertEqual(("phi3:mini", "qwen2:7b"), bot.AI_MODELS)
+            self.assertEqual(("phi3:mini", "qwen2:7b"), bot.ai_pipeline.config.models)
+
+    def test_fallback_summarizer_reaches_both_backends(self):
+        with patch.dict(os.environ, {"AI_FALLBACK_SUMMARIZER_MODEL": "phi3:mini"}, clear=False):
+            importlib.reload(bot)
+            with patch("ai.bot.powershell_prefix", return_value=["pwsh"]):
+                args = bot.powershell_server_args()
+            self.assertEqual("phi3:mini", bot.ai_pipeline.config.fallback_summarizer_model)
+            self.assertEqual("phi3:mini", args[args.index("-FallbackSummarizerModel") + 1])
+            self.assertIn("phi3:mini", bot.model_inventories[0].models)
+
+    def test_router_builds_a_fast_pipeline_per_tier(self):
+        with patch.dict(os.environ, {"AI_ROUTER": "true", "ROUTE_FAST_MODEL": "phi3:mini",
+                                     "ROUTE_FAST_MAX_WORDS": "5"}, clear=False):
+            importlib.reload(bot)
+            self.assertEqual(5, bot.question_router.max_words)
+            self.assertEqual({("fast", tier.name) for tier in bot.DEFAULT_TIERS}, set(bot.route_pipelines))
+            self.assertEqual(("phi3:mini",), bot.pipeline_for(bot.DEFAULT_TIERS[0], bot.route_for("hi")).config.models)
+            self.assertIs(bot.ai_pipeline, bot.pipeline_for(bot.DEFAULT_TIERS[0], bot.route_for("explain it")))
+            self.assertIn("phi3:mini", bot.model_inventories[0].models)
+
+    def test_semantic_cache_embeds_through_ollama(self):
+        env = {"SEMANTIC_CACHE": "on", "SEMANTIC_CACHE_MODEL": "embed", "SEMANTIC_CACHE_THRESHOLD": "0.8"}
+        with patch.dict(os.environ, env, clear=False):
+            importlib.reload(bot)
+            client = types.SimpleNamespace(embed=AsyncMock(return_value=[3.0, 4.0]))
+            with patch("ai.bot.ollama_client", client):
+                vector = asyncio.run(bot.semantic_cache.embed("Hello?"))
+            self.assertEqual((0.6, 0.8), vector)
+            client.embed.assert_awaited_once_with("embed", "hello", keep_alive=bot.OLLAMA_KEEP_ALIVE)
+            self.assertEqual(0.8, bot.semantic_cache.threshold)
+            self.assertEqual(frozenset({"embed"}), bot.model_inventories[0].embedding_models)
+
+    def test_ollama_hosts_build_a_pool_with_one_inventory_per_host(self):
+        env = {
+            "AI_MODELS": "m1,m2", "AI_SUMMARIZER_MODEL": "m2",
+            "OLLAMA_HOSTS": '[{"url": "gpu1:11434", "models": ["m1"]}, {"url": "gpu2:11434", "weight": 2}]',
+        }
+        with patch.dict(os.environ, env, clear=False):
+            importlib.reload(bot)
+            self.assertIs(bot.ollama_hosts, bot.ai_pipeline.client)
+            self.assertEqual(["http://gpu1:11434", "http://gpu2:11434"], [h.url for h in bot.ollama_hosts.hosts])
+            self.assertEqual([("m1",), ("m1", "m2")], [inv.models for inv in bot.model_inventories])
+
+    def test_deadline_settings_reach_the_pipeline(self):
+        env = {"AI_TIMEOUT_SEC": "100", "AI_MIN_DRAFTS": "1", "AI_HEDGE_AFTER_SEC": "5"}
+        with patch.dict(os.environ, env, clear=False):
+            importlib.reload(bot)
+            config = bot.ai_pipeline.config
+            self.assertEqual(90, config.deadline_sec)
+            self.assertEqual(1, config.min_drafts)
+            self.assertEqual(5, config.hedge_after_sec)
+
+    def test_draft_budget_share_must_leave_room_for_the_summarizer(self):
+        with patch.dict(os.environ, {"AI_DRAFT_BUDGET_SHARE": "1"}, clear=False):
+            with self.assertRaises(ValueError):
+                importlib.reload(bot)
+
+    def test_streaming_flag_parses_booleans(self):
+        with patch.dict(os.environ, {"AI_STREAMING": "off"}, clear=False):
+            importlib.reload(bot)
+            self.assertFalse(bot.AI_STREAMING)
+
+    def test_invalid_streaming_flag_is_rejected(self):
+        with patch.dict(os.environ, {"AI_STREAMING": "maybe"}, clear=False):
+            with self.assertRaises(ValueError):
+                importlib.reload(bot)
+
+    def test_invalid_backend_is_rejected(self):
+        with patch.dict(os.environ, {"AI_BACKEND": "carrier-pigeon"}, clear=False):
+            with self.assertRaises(ValueError):
+                importlib.reload(bot)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,166 @@
+import os
+import tempfile
+import unittest
+
+from ai.cache import AnswerCache, answer_cache_key, normalize_question
+from ai.state import MemoryStateBackend, StateBackend, StateError
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _key(question, **overrides):
+    settings = dict(persona="p", models=("a", "b"), summarizer_model="s", temperature=0.2, max_tokens=512)
+    settings.update(overrides)
+    return answer_cache_key(question, **settings)
+
+
+class CacheKeyTests(unittest.TestCase):
+    def test_normalizes_case_whitespace_and_trailing_punctuation(self):
+        self.assertEqual("what can you do", normalize_question("  What   can you\tdo?? "))
+
+    def test_equivalent_questions_share_a_key(self):
+        self.assertEqual(_key("What can you do?"), _key("what can you do"))
+
+    def test_settings_change_the_key(self):
+        base = _key("hi")
+        self.assertNotEqual(base, _key("hi", persona="other"))
+        self.assertNotEqual(base, _key("hi", models=("b", "a")))
+        self.assertNotEqual(base, _key("hi", summarizer_model="t"))
+        self.assertNotEqual(base, _key("hi", temperature=0.3))
+        self.assertNotEqual(base, _key("hi", max_tokens=256))
+        self.assertNotEqual(base, _key("hi", route="fast"))
+
+
+class AnswerCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_hit_and_miss_counters(self):
+        cache = AnswerCache(4, 60)
+
+        self.assertIsNone(await cache.get("k"))
+        await cache.put("k", "v")
+        self.assertEqual("v", await cache.get("k"))
+
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(0.5, cache.hit_rate)
+
+    async def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = AnswerCache(4, 10, clock=clock)
+        await cache.put("k", "v")
+
+        clock.now += 9.9
+        self.assertEqual("v", await cache.get("k"))
+        clock.now += 0.2
+        self.assertIsNone(await cache.get("k"))
+        self.assertEqual(0, len(cache))
+
+    async def test_least_recently_used_entry_is_evicted(self):
+        cache = AnswerCache(2, 60)
+        await cache.put("a", "1")
+        await cache.put("b", "2")
+        await cache.get("a")
+
+        await cache.put("c", "3")
+
+        self.assertEqual("1", await cache.get("a"))
+        self.assertIsNone(await cache.get("b"))
+        self.assertEqual(1, cache.evictions)
+
+
+class SqliteTierTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "answers.sqlite3")
+
+    async def test_answers_survive_a_restart(self):
+        first = AnswerCache(4, 60, sqlite_path=self.path)
+        await first.put("k", "persisted")
+        first.close()
+
+        second = AnswerCache(4, 60, sqlite_path=self.path)
+        self.addCleanup(second.close)
+
+        self.assertEqual("persisted", await second.get("k"))
+        self.assertEqual(1, second.disk_hits)
+        # Promoted to memory: the next lookup does not touch disk
+        await second.get("k")
+        self.assertEqual(1, second.disk_hits)
+
+    async def test_expired_rows_are_not_served(self):
+        clock = FakeClock()
+        first = AnswerCache(4, 10, sqlite_path=self.path, clock=clock)
+        await first.put("k", "stale")
+        first.close()
+
+        clock.now += 11
+        second = AnswerCache(4, 10, sqlite_path=self.path, clock=clock)
+        self.addCleanup(second.close)
+
+        self.assertIsNone(await second.get("k"))
+
+    async def test_disk_tier_is_bounded(self):
+        clock = FakeClock()
+        cache = AnswerCache(1, 60, sqlite_path=self.path, disk_max_entries=3, clock=clock)
+        self.addCleanup(cache.close)
+        for i in range(6):
+            clock.now += 1
+            await cache.put(f"k{i}", str(i))
+
+        rows = cache._connect().execute("SELECT key FROM answers ORDER BY key").fetchall()
+
+        self.assertEqual(["k3", "k4", "k5"], [r[0] for r in rows])
+
+    async def test_corrupt_file_is_a_miss(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a database" * 100)
+        cache = AnswerCache(4, 60, sqlite_path=self.path)
+        self.addCleanup(cache.close)
+
+        with self.assertLogs("nightshade-bot", "WARNING"):
+            await cache.put("k", "v")
+            cache.clear()
+            self.assertIsNone(await cache.get("k"))
+        self.assertEqual(1, cache.misses)
+
+
+class SharedTierTests(unittest.IsolatedAsyncioTestCase):
+    async def test_answers_are_shared_between_processes(self):
+        backend = MemoryStateBackend()
+        shard_a = AnswerCache(4, 60, backend=backend)
+        shard_b = AnswerCache(4, 60, backend=backend)
+        await shard_a.put("k", "shared")
+
+        self.assertEqual("shared", await shard_b.get("k"))
+        self.assertEqual(1, shard_b.shared_hits)
+        await shard_b.get("k")
+        self.assertEqual(1, shard_b.shared_hits)
+
+    async def test_backend_outage_is_a_miss(self):
+        class DownBackend(StateBackend):
+            async def get(self, key):
+                raise StateError("down")
+
+            async def set(self, key, value, ttl=None):
+                raise StateError("down")
+
+            async def incr(self, key, amount=1, ttl=None):
+                raise StateError("down")
+
+            async def delete(self, key):
+                raise StateError("down")
+
+        cache = AnswerCache(4, 60, backend=DownBackend())
+        with self.assertLogs("nightshade-bot", "WARNING"):
+            await cache.put("k", "v")
+            cache.clear()
+            self.assertIsNone(await cache.get("k"))
+
+
+if __name__ == "__main__":
+    unittest.main()
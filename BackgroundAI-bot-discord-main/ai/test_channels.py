@@ -0,0 +1,53 @@
+import types
+import unittest
+
+from ai.channels import AIChannelRegistry
+
+
+def _channel(channel_id, name, guild_id=1):
+    return types.SimpleNamespace(id=channel_id, name=name, guild=types.SimpleNamespace(id=guild_id))
+
+
+class AIChannelRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = AIChannelRegistry()
+
+    def test_index_guild_keeps_only_ai_channels(self):
+        self.registry.index_guild(1, [_channel(10, "general"), _channel(11, "ai"), _channel(12, "ai")])
+
+        self.assertEqual(frozenset({11, 12}), self.registry.channels(1))
+        self.assertTrue(self.registry.is_ai_channel(1, 11))
+        self.assertFalse(self.registry.is_ai_channel(1, 10))
+        self.assertFalse(self.registry.is_ai_channel(2, 11))
+
+    def test_reindex_replaces_previous_state(self):
+        self.registry.index_guild(1, [_channel(11, "ai")])
+        self.registry.index_guild(1, [_channel(11, "general")])
+
+        self.assertEqual(0, len(self.registry))
+
+    def test_create_and_delete_events(self):
+        self.registry.add(_channel(11, "ai"))
+        self.registry.add(_channel(12, "random"))
+        self.assertEqual(frozenset({11}), self.registry.channels(1))
+
+        self.registry.remove(_channel(11, "ai"))
+        self.registry.remove(_channel(99, "ai", guild_id=5))
+        self.assertEqual(frozenset(), self.registry.channels(1))
+
+    def test_renames_move_channels_in_and_out(self):
+        self.registry.update(_channel(11, "general"), _channel(11, "ai"))
+        self.assertTrue(self.registry.is_ai_channel(1, 11))
+
+        self.registry.update(_channel(11, "ai"), _channel(11, "ai-archive"))
+        self.assertFalse(self.registry.is_ai_channel(1, 11))
+
+    def test_forget_guild(self):
+        self.registry.add(_channel(11, "ai"))
+        self.registry.forget_guild(1)
+
+        self.assertEqual(0, len(self.registry))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from ai.checkpoints import Checkpoint, DraftCheckpoints, draft_key
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _key(model="m1", prompt="p", **overrides):
+    settings = dict(temperature=0.2, max_tokens=512)
+    settings.update(overrides)
+    return draft_key(model, prompt, **settings)
+
+
+class DraftKeyTests(unittest.TestCase):
+    def test_every_generation_setting_changes_the_key(self):
+        base = _key()
+        self.assertEqual(base, _key())
+        self.assertNotEqual(base, _key(model="m2"))
+        self.assertNotEqual(base, _key(prompt="q"))
+        self.assertNotEqual(base, _key(temperature=0.3))
+        self.assertNotEqual(base, _key(max_tokens=256))
+        self.assertNotEqual(base, _key(ascii_only=True))
+        self.assertNotEqual(base, _key(context=[1, 2]))
+
+
+class DraftCheckpointsTests(unittest.TestCase):
+    def test_restore_returns_the_checkpointed_models_and_counts_them(self):
+        checkpoints = DraftCheckpoints(4, 60)
+        checkpoints.put("k1", "draft one", [7])
+
+        found = checkpoints.restore({"m1": "k1", "m2": "k2"})
+
+        self.assertEqual({"m1": Checkpoint("draft one", [7])}, found)
+        self.assertEqual(1, checkpoints.resumed)
+
+    def test_checkpoints_expire_after_ttl(self):
+        clock = FakeClock()
+        checkpoints = DraftCheckpoints(4, 10, clock=clock)
+        checkpoints.put("k", "draft")
+
+        clock.now += 9.9
+        self.assertIsNotNone(checkpoints.get("k"))
+        clock.now += 0.2
+        self.assertIsNone(checkpoints.get("k"))
+        self.assertEqual(0, len(checkpoints))
+
+    def test_oldest_checkpoints_are_evicted_past_the_size_limit(self):
+        checkpoints = DraftCheckpoints(2, 60)
+        for key in ("a", "b", "c"):
+            checkpoints.put(key, key)
+
+        self.assertIsNone(checkpoints.get("a"))
+        self.assertEqual(2, len(checkpoints))
+        self.assertEqual(1, checkpoints.evictions)
+
+    def test_forget_drops_a_finished_requests_drafts(self):
+        checkpoints = DraftCheckpoints(4, 60)
+        checkpoints.put("k1", "one")
+        checkpoints.put("k2", "two")
+
+        checkpoints.forget({"m1": "k1"})
+
+        self.assertEqual({"m2": Checkpoint("two", None)}, checkpoints.restore({"m1": "k1", "m2": "k2"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
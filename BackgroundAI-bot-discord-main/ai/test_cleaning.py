@@ -0,0 +1,122 @@
+import random
+import unittest
+
+from ai.cleaning import (
+    StreamCleaner, clean_ai_output, clean_stream, iter_discord_chunks, split_discord_message,
+    stream_discord_chunks,
+)
+
+# Characters that exercise every rule: escapes, spinners, persona tags, CR/LF runs, Unicode spaces
+ALPHABET = [
+    "\n", "\r", " ", "\t", "\x85", "\x1c", "\x1b", "[", "3", "1", "m", ";", "a", "é", "😀", "⠋",
+    "NightshadeAI:", "nightshadeai:", "Night", "N", "ı", "?",
+]
+
+
+def reference_split(text, limit=2000):
+    chunks = []
+    while len(text) > limit:
+        split_pos = text.rfind('\n', 0, limit)
+        if split_pos == -1:
+            split_pos = text.rfind(' ', 0, limit)
+        if split_pos == -1:
+            split_pos = limit
+        chunks.append(text[:split_pos].strip())
+        text = text[split_pos:].strip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+def random_pieces(rng, data):
+    cuts = sorted(rng.sample(range(len(data) + 1), min(len(data) + 1, rng.randrange(8))))
+    pieces, prev = [], 0
+    for cut in cuts + [len(data)]:
+        pieces.append(data[prev:cut])
+        prev = cut
+    return pieces
+
+
+class StreamCleanerTests(unittest.TestCase):
+    def feed_all(self, pieces, **kwargs):
+        return "".join(clean_stream(pieces, **kwargs))
+
+    def test_matches_clean_ai_output_for_any_chunking(self):
+        rng = random.Random(7)
+        for _ in range(3000):
+            text = "".join(rng.choice(ALPHABET) for _ in range(rng.randrange(60)))
+            persona = rng.random() < 0.8
+            data = text.encode("utf-8") if rng.random() < 0.5 else text
+            streamed = self.feed_all(random_pieces(rng, data), remove_persona_tag=persona)
+
+            self.assertEqual(clean_ai_output(text, persona), streamed, repr(text))
+
+    def test_utf8_sequence_split_across_chunks(self):
+        data = "naïve 数据 🙂".encode("utf-8")
+        pieces = [data[i:i + 1] for i in range(len(data))]
+
+        self.assertEqual("naïve 数据 🙂", self.feed_all(pieces))
+
+    def test_escape_sequence_split_across_chunks(self):
+        self.assertEqual("red text", self.feed_all(["red\x1b", "[3", "1m text\x1b[", "0m"]))
+
+    def test_incomplete_escape_is_kept_like_the_buffered_cleaner(self):
+        self.assertEqual(clean_ai_output("end\x1b[3"), self.feed_all(["end\x1b", "[3"]))
+
+    def test_persona_tag_split_across_chunks(self):
+        self.assertEqual("hello\nworld", self.feed_all(["hello\nNights", "hadeAI:", "  \n", "world"]))
+
+    def test_tag_in_the_middle_of_a_line_is_kept(self):
+        self.assertEqual("say NightshadeAI: hi", self.feed_all(["say Nightsh", "adeAI: hi"]))
+
+    def test_output_is_released_before_the_stream_ends(self):
+        cleaner = StreamCleaner()
+
+        self.assertEqual("first line", cleaner.feed(b"\x1b[32mfirst line\n"))
+        self.assertEqual("\nsecond", cleaner.feed(b"second\n\n\n"))
+        self.assertEqual("", cleaner.finish())
+
+    def test_feed_after_finish_is_rejected(self):
+        cleaner = StreamCleaner()
+        cleaner.finish()
+
+        with self.assertRaises(ValueError):
+            cleaner.feed("late")
+
+
+class DiscordChunkTests(unittest.TestCase):
+    def test_matches_the_slicing_splitter(self):
+        rng = random.Random(11)
+        for _ in range(3000):
+            text = "".join(rng.choice(ALPHABET) for _ in range(rng.randrange(120)))
+            limit = rng.randrange(1, 30)
+            expected = reference_split(text, limit)
+
+            self.assertEqual(expected, split_discord_message(text, limit), repr(text))
+            self.assertEqual(expected, list(stream_discord_chunks(random_pieces(rng, text), limit)), repr(text))
+
+    def test_chunks_are_yielded_as_soon_as_they_are_complete(self):
+        seen = []
+
+        def pieces():
+            for piece in ["alpha beta ", "gamma delta ", "epsilon"]:
+                seen.append(piece)
+                yield piece
+
+        chunks = stream_discord_chunks(pieces(), limit=12)
+
+        self.assertEqual("alpha beta", next(chunks))
+        self.assertEqual(2, len(seen))
+        self.assertEqual(["gamma delta", "epsilon"], list(chunks))
+
+    def test_long_output_respects_the_limit(self):
+        text = ("word " * 50_000).strip()
+
+        chunks = list(iter_discord_chunks(text, 2000))
+
+        self.assertTrue(all(len(chunk) <= 2000 for chunk in chunks))
+        self.assertEqual(text.split(), " ".join(chunks).split())
+
+
+if __name__ == "__main__":
+    unittest.main()
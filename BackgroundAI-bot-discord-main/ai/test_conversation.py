@@ -0,0 +1,178 @@
+import asyncio
+import unittest
+
+from ai.conversation import ConversationStore, History, Turn, estimate_tokens
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _turn(n, size=60):
+    return f"q{n}", "a" * size
+
+
+class ConversationStoreTests(unittest.IsolatedAsyncioTestCase):
+    async def test_new_channel_has_empty_history(self):
+        history = ConversationStore().history(1)
+
+        self.assertFalse(history)
+        self.assertEqual(History(1, 0, "", (), {}), history)
+
+    async def test_turns_and_contexts_are_recorded(self):
+        store = ConversationStore()
+
+        store.record(store.history(1), "hi", "hello", {"m1": [1, 2, 3]})
+        history = store.history(1)
+
+        self.assertEqual((Turn("hi", "hello"),), history.turns)
+        self.assertEqual({"m1": [1, 2, 3]}, history.contexts)
+        self.assertFalse(store.history(2))
+
+    async def test_context_from_a_stale_snapshot_is_dropped(self):
+        store = ConversationStore()
+        store.record(store.history(1), "q1", "a1", {"m1": [1]})
+        first, second = store.history(1), store.history(1)
+
+        store.record(first, "q2", "a2", {"m1": [2]})
+        store.record(second, "q3", "a3", {"m1": [3]})
+
+        history = store.history(1)
+        self.assertEqual(["q1", "q2", "q3"], [t.question for t in history.turns])
+        self.assertEqual({}, history.contexts)
+        self.assertEqual(1, store.stale_contexts)
+
+    async def test_without_a_summarizer_old_turns_are_dropped(self):
+        store = ConversationStore(token_budget=60)
+        for n in range(4):
+            store.record(store.history(1), *_turn(n), {"m1": [n]})
+
+        history = store.history(1)
+
+        self.assertEqual(["q2", "q3"], [t.question for t in history.turns])
+        self.assertEqual({"m1": [3]}, history.contexts)
+        self.assertLessEqual(sum(t.tokens for t in history.turns), 60)
+        self.assertGreater(store.compactions, 0)
+
+    async def test_old_turns_are_folded_into_a_summary_in_the_background(self):
+        folded = []
+
+        async def summarize(summary, turns):
+            folded.append((summary, [t.question for t in turns]))
+            return "they talked about " + ", ".join(t.question for t in turns)
+
+        store = ConversationStore(token_budget=60, summarize=summarize)
+        for n in range(3):
+            store.record(store.history(1), *_turn(n))
+        self.assertEqual(3, len(store.history(1).turns))  # compaction has not run yet
+
+        await asyncio.sleep(0)
+        history = store.history(1)
+
+        self.assertEqual([("", ["q0", "q1"])], folded)
+        self.assertEqual("they talked about q0, q1", history.summary)
+        self.assertEqual(["q2"], [t.question for t in history.turns])
+        self.assertEqual(1, store.compactions)
+
+    async def test_turns_recorded_during_compaction_are_kept(self):
+        gate = asyncio.Event()
+
+        async def summarize(summary, turns):
+            await gate.wait()
+            return "summary"
+
+        store = ConversationStore(token_budget=60, summarize=summarize)
+        for n in range(3):
+            store.record(store.history(1), *_turn(n))
+        await asyncio.sleep(0)
+        store.record(store.history(1), *_turn(3))
+        gate.set()
+        await asyncio.sleep(0)
+
+        self.assertEqual(["q2", "q3"], [t.question for t in store.history(1).turns])
+
+    async def test_failed_summary_still_bounds_the_history(self):
+        async def summarize(summary, turns):
+            raise RuntimeError("model down")
+
+        store = ConversationStore(token_budget=60, summarize=summarize)
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            for n in range(3):
+                store.record(store.history(1), *_turn(n))
+            await asyncio.sleep(0)
+
+        self.assertEqual(["q2"], [t.question for t in store.history(1).turns])
+        self.assertEqual(1, store.compaction_failures)
+
+    async def test_summary_is_capped(self):
+        async def summarize(summary, turns):
+            return "s" * 1000
+
+        store = ConversationStore(token_budget=60, summarize=summarize)
+        for n in range(3):
+            store.record(store.history(1), *_turn(n))
+        await asyncio.sleep(0)
+
+        self.assertLessEqual(estimate_tokens(store.history(1).summary), 60 // 4)
+
+    async def test_least_recently_used_channel_is_evicted(self):
+        store = ConversationStore(max_sessions=2)
+        for channel in (1, 2):
+            store.record(store.history(channel), "q", "a")
+        store.history(1)
+
+        store.record(store.history(3), "q", "a")
+
+        self.assertEqual(2, len(store))
+        self.assertTrue(store.history(1))
+        self.assertFalse(store.history(2))
+        self.assertEqual(1, store.evictions)
+
+    async def test_idle_channels_expire(self):
+        clock = FakeClock()
+        store = ConversationStore(idle_sec=60, clock=clock)
+        store.record(store.history(1), "q", "a")
+        clock.now = 30
+        store.record(store.history(2), "q", "a")
+
+        clock.now = 61
+        self.assertFalse(store.history(1))
+        self.assertTrue(store.history(2))
+        self.assertEqual(1, len(store))
+
+    async def test_compaction_of_an_evicted_channel_is_discarded(self):
+        gate = asyncio.Event()
+
+        async def summarize(summary, turns):
+            await gate.wait()
+            return "summary"
+
+        store = ConversationStore(token_budget=60, max_sessions=1, summarize=summarize)
+        for n in range(3):
+            store.record(store.history(1), *_turn(n))
+        store.record(store.history(2), "q", "a")
+        gate.set()
+        await asyncio.sleep(0)
+
+        self.assertFalse(store.history(1))
+        self.assertEqual(0, store.compactions)
+
+    async def test_aclose_cancels_pending_compactions(self):
+        async def summarize(summary, turns):
+            await asyncio.sleep(10)
+
+        store = ConversationStore(token_budget=60, summarize=summarize)
+        for n in range(3):
+            store.record(store.history(1), *_turn(n))
+
+        await store.aclose()
+
+        self.assertEqual(3, len(store.history(1).turns))
+
+
+if __name__ == "__main__":
+    unittest.main()
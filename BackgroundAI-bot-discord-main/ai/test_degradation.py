@@ -0,0 +1,106 @@
+import unittest
+
+from ai.degradation import DEFAULT_TIERS, MIN_TOKENS, DegradationController, Tier, apply_tier
+from ai.pipeline import PipelineConfig
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _tier(name):
+    return next(t for t in DEFAULT_TIERS if t.name == name)
+
+
+class ApplyTierTests(unittest.TestCase):
+    def setUp(self):
+        self.config = PipelineConfig(models=("a", "b", "c"), max_tokens=512, retries=2, hedge_after_sec=5.0)
+
+    def test_full_tier_keeps_the_config(self):
+        self.assertIs(self.config, apply_tier(self.config, _tier("full")))
+
+    def test_fewer_models_keeps_the_first_half_and_stops_hedging(self):
+        config = apply_tier(self.config, _tier("fewer-models"))
+
+        self.assertEqual(("a", "b"), config.models)
+        self.assertEqual(0, config.retries)
+        self.assertIsNone(config.hedge_after_sec)
+        self.assertEqual(self.config.skip_merge_similarity, config.skip_merge_similarity)
+
+    def test_single_model_skips_the_summarizer(self):
+        config = apply_tier(self.config, _tier("single-model"))
+
+        self.assertEqual(("a",), config.models)
+        self.assertEqual(0.0, config.skip_merge_similarity)
+        self.assertEqual(512, config.max_tokens)
+
+    def test_short_answers_cut_the_token_budget_with_a_floor(self):
+        self.assertEqual(256, apply_tier(self.config, _tier("short-answers")).max_tokens)
+        tiny = PipelineConfig(models=("a",), max_tokens=80)
+        self.assertEqual(MIN_TOKENS, apply_tier(tiny, Tier("tiny", token_share=0.1)).max_tokens)
+
+
+class DegradationControllerTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.controller = DegradationController(latency_target_sec=10, latency_window_sec=60, hold_sec=30,
+                                                clock=self.clock)
+
+    def test_starts_at_full_service(self):
+        self.assertEqual("full", self.controller.update(0, 4).name)
+
+    def test_queue_depth_escalates_straight_to_the_matching_tier(self):
+        with self.assertLogs("nightshade-bot", level="WARNING") as logs:
+            tier = self.controller.update(12, 4)
+
+        self.assertEqual("short-answers", tier.name)
+        self.assertEqual(3.0, self.controller.pressure)
+        self.assertIn("service tier 'short-answers'", logs.output[0])
+
+    def test_heavy_backlog_rejects(self):
+        self.assertTrue(self.controller.update(20, 4).reject)
+
+    def test_recovery_waits_for_the_hold_and_steps_one_tier_at_a_time(self):
+        self.controller.update(12, 4)
+
+        self.assertEqual("short-answers", self.controller.update(0, 4).name)  # held
+        self.clock.now = 30
+        self.assertEqual("single-model", self.controller.update(0, 4).name)
+        self.assertEqual("single-model", self.controller.update(0, 4).name)  # held again
+        self.clock.now = 60
+        self.assertEqual("fewer-models", self.controller.update(0, 4).name)
+        self.clock.now = 90
+        self.assertEqual("full", self.controller.update(0, 4).name)
+        self.assertEqual(4, self.controller.transitions)
+
+    def test_pressure_just_below_a_threshold_does_not_recover(self):
+        self.controller.update(8, 4)  # pressure 2 -> single-model
+        self.clock.now = 100
+
+        # Below 2 but above 2 * recover_ratio: stays put instead of flapping
+        self.assertEqual("single-model", self.controller.update(7, 4).name)
+        self.assertEqual("fewer-models", self.controller.update(4, 4).name)
+
+    def test_recent_latency_adds_pressure_until_it_leaves_the_window(self):
+        self.controller.observe_latency(25)
+        self.controller.observe_latency(15)
+
+        self.assertEqual(20, self.controller.recent_latency)
+        self.assertEqual("single-model", self.controller.update(0, 4).name)
+        self.clock.now = 61
+        self.assertEqual(0.0, self.controller.recent_latency)
+        self.assertEqual("fewer-models", self.controller.update(0, 4).name)
+
+    def test_thresholds_are_validated(self):
+        with self.assertRaises(ValueError):
+            DegradationController(thresholds=(1.0, 2.0))
+        with self.assertRaises(ValueError):
+            DegradationController(thresholds=(1.0, 3.0, 2.0, 4.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
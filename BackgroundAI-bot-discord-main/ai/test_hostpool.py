@@ -0,0 +1,199 @@
+import asyncio
+import unittest
+
+from ai.fake_ollama import FakeOllamaServer
+from ai.hostpool import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, HostConfig, NoHealthyHost, OllamaHostPool, parse_hosts
+from ai.ollama_client import OllamaError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ParseHostsTests(unittest.TestCase):
+    def test_objects_and_bare_urls(self):
+        hosts = parse_hosts('[{"url": "gpu1:11434", "models": ["llama2"], "weight": 2}, "http://gpu2:11434/"]')
+
+        self.assertEqual([
+            HostConfig("http://gpu1:11434", frozenset({"llama2:latest"}), 2.0),
+            HostConfig("http://gpu2:11434", frozenset(), 1.0),
+        ], hosts)
+
+    def test_invalid_values_are_rejected(self):
+        for value in ("not json", "[]", '[{"models": []}]', '[{"url": "a", "weight": 0}]'):
+            with self.assertRaises(ValueError):
+                parse_hosts(value)
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def test_opens_after_consecutive_failures_and_probes_back_in(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failures=2, reset_sec=10, clock=clock)
+
+        breaker.failure()
+        self.assertTrue(breaker.allows())
+        breaker.failure()
+        self.assertEqual(OPEN, breaker.state)
+        self.assertFalse(breaker.allows())
+
+        clock.now = 10
+        self.assertTrue(breaker.allows())
+        self.assertEqual(HALF_OPEN, breaker.state)
+        breaker.begin()
+        self.assertFalse(breaker.allows())  # one probe at a time
+        breaker.success()
+        self.assertEqual(CLOSED, breaker.state)
+
+    def test_failed_probe_doubles_the_wait(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failures=1, reset_sec=10, clock=clock)
+        breaker.failure()
+
+        clock.now = 10
+        breaker.allows()
+        breaker.begin()
+        breaker.failure()
+
+        self.assertEqual(OPEN, breaker.state)
+        self.assertEqual(30, breaker.opened_until)
+
+
+class OllamaHostPoolTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.servers = []
+        for name in ("a", "b"):
+            server = await FakeOllamaServer(lambda model, prompt, name=name: f"{name} says hi", models=["m1"]).start()
+            self.servers.append(server)
+        self.clock = FakeClock()
+
+    async def asyncTearDown(self):
+        for server in self.servers:
+            await server.stop()
+
+    def _pool(self, *configs, **kwargs):
+        configs = configs or tuple(HostConfig(s.url) for s in self.servers)
+        kwargs.setdefault("health_interval_sec", 0)
+        pool = OllamaHostPool(configs, clock=self.clock, **kwargs)
+        self.addAsyncCleanup(pool.close)
+        return pool
+
+    def _generate_count(self, server):
+        return sum(1 for r in server.requests if r["path"] == "/api/generate")
+
+    async def test_concurrent_requests_spread_over_hosts(self):
+        for server in self.servers:
+            server.latency = 0.05
+        pool = self._pool()
+
+        await asyncio.gather(*(pool.generate("m1", "q") for _ in range(6)))
+
+        self.assertEqual([3, 3], [self._generate_count(s) for s in self.servers])
+        self.assertEqual([0, 0], [h.outstanding for h in pool.hosts])
+
+    async def test_slow_host_gets_less_traffic(self):
+        self.servers[0].latency = 0.1
+        pool = self._pool()
+
+        for _ in range(8):
+            await pool.generate("m1", "q")
+
+        fast, slow = self._generate_count(self.servers[1]), self._generate_count(self.servers[0])
+        self.assertGreater(fast, slow)
+
+    async def test_weight_biases_routing(self):
+        pool = self._pool(HostConfig(self.servers[0].url, weight=3.0), HostConfig(self.servers[1].url))
+        for host in pool.hosts:
+            host.latency_sec = 1.0
+            host.outstanding = 2  # as if each were already busy
+
+        self.assertIs(pool.hosts[0], pool.pick("m1"))
+
+    async def test_models_are_routed_only_to_hosts_that_serve_them(self):
+        pool = self._pool(HostConfig(self.servers[0].url, frozenset({"m2:latest"})), HostConfig(self.servers[1].url))
+
+        result = await pool.generate("m2", "q")
+
+        self.assertEqual("a says hi", result["response"])
+        self.assertIs(pool.hosts[1], pool.pick("m1", exclude={pool.hosts[0]}))
+
+    async def test_failing_host_fails_over_then_is_ejected(self):
+        self.servers[0].failing_models.add("m1")
+        pool = self._pool(breaker_failures=2, breaker_reset_sec=30)
+
+        with self.assertLogs("nightshade-bot", level="INFO") as logs:
+            results = [await pool.generate("m1", "q") for _ in range(4)]
+
+        self.assertTrue(all(r["response"] == "b says hi" for r in results))
+        self.assertEqual(OPEN, pool.hosts[0].breaker.state)
+        self.assertEqual(2, self._generate_count(self.servers[0]))  # no traffic once ejected
+        self.assertGreaterEqual(pool.failovers, 2)
+        self.assertTrue(any("Ejecting" in line for line in logs.output))
+
+    async def test_client_errors_do_not_eject_a_host(self):
+        class UnknownModelClient:
+            async def generate(self, model, prompt, **kwargs):
+                raise OllamaError("model not found", 404)
+
+            async def close(self):
+                pass
+
+        pool = self._pool(HostConfig("http://a"), HostConfig("http://b"), client_factory=lambda url: UnknownModelClient())
+
+        with self.assertRaises(OllamaError):
+            await pool.generate("m1", "q")
+
+        self.assertEqual(0, pool.failovers)
+        self.assertEqual([0, 0], [h.breaker.consecutive_failures for h in pool.hosts])
+
+    async def test_health_check_probes_an_ejected_host_back_in(self):
+        pool = self._pool(breaker_failures=1, breaker_reset_sec=10)
+        await self.servers[0].stop()
+
+        with self.assertLogs("nightshade-bot", level="INFO") as logs:
+            self.assertFalse(await pool.check(pool.hosts[0]))
+            self.assertEqual(OPEN, pool.hosts[0].breaker.state)
+            self.assertFalse(await pool.check(pool.hosts[0]))  # still waiting, not even tried
+
+            restarted = await FakeOllamaServer(models=["m1"]).start()
+            self.addAsyncCleanup(restarted.stop)
+            pool.hosts[0].client = type(pool.hosts[0].client)(restarted.url)
+            self.addAsyncCleanup(pool.hosts[0].client.close)
+            self.clock.now = 10
+            self.assertTrue(await pool.check(pool.hosts[0]))
+
+        self.assertEqual(CLOSED, pool.hosts[0].breaker.state)
+        self.assertTrue(any("is back" in line for line in logs.output))
+
+    async def test_streams_fail_over_before_the_first_token(self):
+        self.servers[0].failing_models.add("m1")
+        pool = self._pool(HostConfig(self.servers[0].url, weight=10.0), HostConfig(self.servers[1].url))
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            items = [item async for item in pool.stream_generate("m1", "q")]
+
+        self.assertEqual("b says hi", "".join(i.get("response", "") for i in items))
+        self.assertEqual([0, 0], [h.outstanding for h in pool.hosts])
+
+    async def test_no_healthy_host(self):
+        pool = self._pool(HostConfig(self.servers[0].url, frozenset({"m2:latest"})))
+
+        with self.assertRaises(NoHealthyHost):
+            await pool.generate("m1", "q")
+
+    async def test_inventory_calls_cover_every_host(self):
+        self.servers[1].models = []
+        pool = self._pool()
+
+        self.assertEqual(["m1"], await pool.list_models())
+        await pool.pull("m1")
+
+        pulls = [[r["body"]["model"] for r in s.requests if r["path"] == "/api/pull"] for s in self.servers]
+        self.assertEqual([[], ["m1"]], pulls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import asyncio
+import unittest
+
+from ai.fake_ollama import FakeOllamaServer
+from ai.inventory import ModelInventory, model_key
+from ai.ollama_client import OllamaClient
+
+
+class ModelInventoryTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await FakeOllamaServer(models=["m1:latest"]).start()
+        self.client = OllamaClient(self.server.url)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+
+    def _calls(self, path):
+        return [r["body"] for r in self.server.requests if r["path"] == path]
+
+    async def test_missing_models_are_pulled_then_every_model_is_warmed(self):
+        inventory = ModelInventory(self.client, ["m1", "m2:7b", "m1"], keep_alive="10m")
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            await inventory.ensure()
+            await inventory.warm_up()
+
+        self.assertEqual(["m2:7b"], [c["model"] for c in self._calls("/api/pull")])
+        self.assertEqual(["m2:7b"], inventory.pulled)
+        self.assertEqual([], inventory.missing)
+        warmups = self._calls("/api/generate")
+        self.assertEqual(["m1", "m2:7b"], [c["model"] for c in warmups])
+        self.assertTrue(all(c["keep_alive"] == "10m" and c["options"] == {"num_predict": 1} for c in warmups))
+        self.assertEqual({"m1", "m2:7b"}, set(inventory.warmup_sec))
+
+    async def test_embedding_models_are_pulled_and_warmed_with_an_embedding(self):
+        inventory = ModelInventory(self.client, ["m1"], embedding_models=["embed"], keep_alive="10m")
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            await inventory.ensure()
+            await inventory.warm_up()
+            await inventory.ping()
+
+        self.assertEqual(["embed"], [c["model"] for c in self._calls("/api/pull")])
+        self.assertEqual(["m1", "m1"], [c["model"] for c in self._calls("/api/generate")])
+        embeds = self._calls("/api/embed")
+        self.assertEqual(["embed", "embed"], [c["model"] for c in embeds])
+        self.assertTrue(all(c["keep_alive"] == "10m" for c in embeds))
+        self.assertEqual({"m1", "embed"}, set(inventory.warmup_sec))
+
+    async def test_without_auto_pull_missing_models_are_reported(self):
+        inventory = ModelInventory(self.client, ["m1", "m2"], auto_pull=False)
+
+        with self.assertLogs("nightshade-bot", level="ERROR"):
+            await inventory.ensure()
+
+        self.assertEqual([], self._calls("/api/pull"))
+        self.assertEqual(["m2"], inventory.missing)
+        self.assertIn("m2", inventory.errors)
+
+    async def test_failed_warm_up_is_recorded_and_others_continue(self):
+        self.server.models.append("m2:latest")
+        self.server.failing_models.add("m1")
+        inventory = ModelInventory(self.client, ["m1", "m2"])
+
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            await inventory.ensure()
+            await inventory.warm_up()
+
+        self.assertIn("warm-up failed", inventory.errors["m1"])
+        self.assertEqual({"m2"}, set(inventory.warmup_sec))
+
+    async def test_background_loop_pings_and_refreshes_without_blocking_startup(self):
+        inventory = ModelInventory(self.client, ["m1"], refresh_sec=0.05, ping_sec=0.02, keep_alive="5m")
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            inventory.start()
+            await inventory.wait_ready()
+            await asyncio.sleep(0.12)
+            await inventory.aclose()
+
+        self.assertFalse(inventory.running)
+        self.assertGreaterEqual(inventory.refreshes, 2)
+        self.assertGreaterEqual(inventory.pings, 2)
+        pings = [c for c in self._calls("/api/generate") if c["prompt"] == ""]
+        self.assertTrue(pings and all(c["keep_alive"] == "5m" for c in pings))
+
+    async def test_a_model_that_disappears_is_pulled_again(self):
+        inventory = ModelInventory(self.client, ["m1"], refresh_sec=0.02, ping_sec=0)
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            inventory.start()
+            await inventory.wait_ready()
+            self.server.models.clear()
+            await asyncio.sleep(0.08)
+            await inventory.aclose()
+
+        self.assertEqual(["m1"], [c["model"] for c in self._calls("/api/pull")])
+        self.assertTrue(inventory.has("m1"))
+
+    async def test_unreachable_ollama_still_finishes_startup(self):
+        await self.server.stop()
+        inventory = ModelInventory(self.client, ["m1"])
+
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            inventory.start()
+            await asyncio.wait_for(inventory.wait_ready(), 1)
+        await inventory.aclose()
+
+        self.assertTrue(inventory.ready)
+        self.assertEqual(["m1"], inventory.missing)
+
+    def test_untagged_names_match_latest(self):
+        self.assertEqual("llama2:latest", model_key("llama2"))
+        self.assertEqual("llama2:7b", model_key("llama2:7b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
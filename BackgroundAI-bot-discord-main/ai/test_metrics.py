@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+
+from ai.metrics import MetricsRegistry, MetricsServer
+
+
+class CounterAndGaugeTests(unittest.TestCase):
+    def test_counter_tracks_values_per_label_set(self):
+        registry = MetricsRegistry()
+        requests = registry.counter("requests_total", "Requests.", labels=("exit_code",))
+
+        requests.inc(exit_code=0)
+        requests.inc(2, exit_code=0)
+        requests.inc(exit_code=124)
+
+        self.assertEqual(3, requests.value(exit_code=0))
+        self.assertEqual(1, requests.value(exit_code="124"))
+        self.assertEqual(0, requests.value(exit_code=5))
+
+    def test_wrong_labels_are_rejected(self):
+        requests = MetricsRegistry().counter("requests_total", "Requests.", labels=("exit_code",))
+
+        with self.assertRaises(ValueError):
+            requests.inc(code=0)
+
+    def test_duplicate_names_are_rejected(self):
+        registry = MetricsRegistry()
+        registry.counter("x", "X.")
+
+        with self.assertRaises(ValueError):
+            registry.gauge("x", "X.")
+
+    def test_callback_gauge_is_read_at_scrape_time(self):
+        registry = MetricsRegistry()
+        depth = [3]
+        registry.gauge("queue_depth", "Queued.", lambda: depth[0])
+        depth[0] = 7
+
+        self.assertIn("queue_depth 7\n", registry.render())
+
+
+class HistogramTests(unittest.TestCase):
+    def test_observations_land_in_cumulative_buckets(self):
+        registry = MetricsRegistry()
+        stage = registry.histogram("stage_seconds", "Stage time.", labels=("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            stage.observe(value, stage="drafts")
+
+        text = registry.render()
+
+        self.assertIn("# TYPE stage_seconds histogram", text)
+        self.assertIn('stage_seconds_bucket{stage="drafts",le="0.1"} 2', text)
+        self.assertIn('stage_seconds_bucket{stage="drafts",le="1"} 3', text)
+        self.assertIn('stage_seconds_bucket{stage="drafts",le="+Inf"} 4', text)
+        self.assertIn('stage_seconds_sum{stage="drafts"} 3.65', text)
+        self.assertIn('stage_seconds_count{stage="drafts"} 4', text)
+
+    def test_quantiles_interpolate_within_buckets(self):
+        histogram = MetricsRegistry().histogram("t", "T.", buckets=(1.0, 2.0, 4.0))
+        for value in (0.5, 1.5, 1.5, 3.0):
+            histogram.observe(value)
+
+        self.assertAlmostEqual(1.5, histogram.quantile(0.5))
+        self.assertAlmostEqual(3.6, histogram.quantile(0.95))
+        self.assertIsNone(MetricsRegistry().histogram("u", "U.").quantile(0.5))
+
+    def test_values_above_the_last_bucket_report_its_bound(self):
+        histogram = MetricsRegistry().histogram("t", "T.", buckets=(1.0,))
+        histogram.observe(50)
+
+        self.assertEqual(1.0, histogram.quantile(0.99))
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        registry.counter("c", "C.", labels=("model",)).inc(model='a"b\\c')
+
+        self.assertIn('c{model="a\\"b\\\\c"} 1', registry.render())
+
+
+class MetricsServerTests(unittest.IsolatedAsyncioTestCase):
+    async def _get(self, port, path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode("ascii"))
+        await writer.drain()
+        data = await reader.read()
+        writer.close()
+        head, _, body = data.partition(b"\r\n\r\n")
+        return head.decode("ascii"), body.decode("utf-8")
+
+    async def test_serves_the_text_exposition(self):
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests.").inc()
+
+        async with MetricsServer(registry, port=0) as server:
+            head, body = await self._get(server.port, "/metrics")
+            missing, _ = await self._get(server.port, "/nope")
+
+        self.assertIn("200 OK", head)
+        self.assertIn("text/plain; version=0.0.4", head)
+        self.assertIn("requests_total 1\n", body)
+        self.assertIn("404", missing)
+        self.assertEqual(1, server.scrapes)
+
+
+if __name__ == "__main__":
+    unittest.main()
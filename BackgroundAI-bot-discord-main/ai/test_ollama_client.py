@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+
+from ai.fake_ollama import FakeOllamaServer, distribution
+from ai.ollama_client import OllamaClient, OllamaError, normalize_host
+
+
+class NormalizeHostTests(unittest.TestCase):
+    def test_adds_scheme_when_missing(self):
+        self.assertEqual("http://0.0.0.0:11434", normalize_host("0.0.0.0:11434"))
+
+    def test_defaults_to_localhost(self):
+        self.assertEqual("http://localhost:11434", normalize_host(None))
+
+    def test_strips_trailing_slash(self):
+        self.assertEqual("https://ollama.example", normalize_host("https://ollama.example/"))
+
+
+class DistributionTests(unittest.TestCase):
+    def test_fixed_value(self):
+        self.assertEqual(0.5, distribution("0.5")("any-model"))
+
+    def test_samples_are_seeded_and_in_range(self):
+        uniform = [distribution("uniform:1,2", seed=3)("m") for _ in range(3)]
+        again = [distribution("uniform:1,2", seed=3)("m") for _ in range(3)]
+
+        self.assertEqual(uniform, again)
+        self.assertTrue(all(1 <= v <= 2 for v in uniform))
+
+    def test_lognormal_median_is_the_first_parameter(self):
+        sample = distribution("lognormal:0.4,0.5", seed=1)
+        values = sorted(sample("m") for _ in range(2001))
+
+        self.assertAlmostEqual(0.4, values[1000], delta=0.04)
+
+    def test_unknown_kind_is_rejected(self):
+        with self.assertRaises(ValueError):
+            distribution("pareto:1,2")
+
+
+class OllamaClientTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await FakeOllamaServer(lambda model, prompt: f"{model}:{prompt}").start()
+        self.client = OllamaClient(self.server.url, max_connections=2)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+
+    async def test_generate_sends_options_and_returns_response(self):
+        data = await self.client.generate("m1", "hi", options={"temperature": 0.2, "num_predict": 5})
+
+        self.assertEqual("m1:hi", data["response"])
+        body = self.server.requests[-1]["body"]
+        self.assertEqual({"temperature": 0.2, "num_predict": 5}, body["options"])
+        self.assertFalse(body["stream"])
+
+    async def test_sequential_requests_reuse_one_keep_alive_connection(self):
+        for i in range(5):
+            await self.client.generate("m1", str(i))
+
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual(1, self.client.connections_opened)
+
+    async def test_concurrency_is_capped_by_pool_size(self):
+        self.server.latency = 0.02
+
+        await asyncio.gather(*(self.client.generate("m1", str(i)) for i in range(6)))
+
+        self.assertEqual(2, self.server.connections)
+
+    async def test_stream_generate_yields_incremental_fragments(self):
+        parts = [item async for item in self.client.stream_generate("m1", "a b c")]
+
+        self.assertEqual("m1:a b c", "".join(p["response"] for p in parts))
+        self.assertTrue(parts[-1]["done"])
+        self.assertGreater(len(parts), 2)
+
+    async def test_connection_is_reused_after_a_completed_stream(self):
+        [item async for item in self.client.stream_generate("m1", "x")]
+        await self.client.generate("m1", "y")
+
+        self.assertEqual(1, self.server.connections)
+
+    async def test_http_error_raises_ollama_error(self):
+        self.server.failing_models.add("broken")
+
+        with self.assertRaises(OllamaError) as ctx:
+            await self.client.generate("broken", "hi")
+
+        self.assertIn("broken", str(ctx.exception))
+
+    async def test_list_models_reads_tags(self):
+        self.server.models = ["a:1", "b:2"]
+
+        self.assertEqual(["a:1", "b:2"], await self.client.list_models())
+
+    async def test_reconnects_when_server_dropped_idle_connection(self):
+        await self.client.generate("m1", "first")
+        for task in list(self.server._handlers):
+            task.cancel()
+        await asyncio.sleep(0.01)
+
+        data = await self.client.generate("m1", "second")
+
+        self.assertEqual("m1:second", data["response"])
+        self.assertEqual(2, self.server.connections)
+
+    async def test_unreachable_host_raises_connection_error(self):
+        port = self.server.port
+        await self.server.stop()
+        client = OllamaClient(f"http://127.0.0.1:{port}")
+
+        with self.assertRaises(OSError):
+            await client.generate("m1", "hi")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import asyncio
+import time
+import unittest
+
+from ai.outbound import OutboundMessage, OutboundSender
+from ai.ratelimit import Limit
+
+
+class FakeChannel:
+    def __init__(self, channel_id=1, fail_on=None):
+        self.id = channel_id
+        self.sent = []  # (monotonic time, content, file)
+        self.fail_on = fail_on
+
+    async def send(self, content, allowed_mentions=None, file=None):
+        await asyncio.sleep(0)
+        if self.fail_on is not None and self.fail_on in content:
+            raise RuntimeError("send failed")
+        self.sent.append((time.monotonic(), content, file))
+        return content
+
+
+def _sender(**kwargs):
+    kwargs.setdefault("channel_limit", Limit(1000.0, 1000))
+    kwargs.setdefault("global_limit", None)
+    return OutboundSender(**kwargs)
+
+
+class PlanTests(unittest.IsolatedAsyncioTestCase):
+    async def test_short_answers_are_split_into_headed_chunks(self):
+        sender = _sender(attach_after_chunks=3, make_file=lambda data, name: (name, data))
+
+        plan = sender.plan("alpha beta gamma", header="H:", limit=9)
+
+        self.assertEqual([OutboundMessage("H:alpha"), OutboundMessage("H:beta"), OutboundMessage("H:gamma")], plan)
+
+    async def test_long_answers_become_one_attachment(self):
+        sender = _sender(attach_after_chunks=2, make_file=lambda data, name: (name, data))
+        text = "word " * 200
+
+        plan = sender.plan(text, header="H:", limit=100)
+
+        self.assertEqual(1, len(plan))
+        self.assertTrue(plan[0].content.startswith("H:word"))
+        self.assertIn("answer.md", plan[0].content)
+        self.assertLessEqual(len(plan[0].content), 100)
+        self.assertEqual(text.encode("utf-8"), plan[0].attachment)
+
+    async def test_zero_threshold_never_attaches(self):
+        sender = _sender(attach_after_chunks=0, make_file=lambda data, name: (name, data))
+
+        self.assertEqual(20, len(sender.plan("word " * 200, limit=50)))
+
+
+class OutboundSenderTests(unittest.IsolatedAsyncioTestCase):
+    async def test_sends_beyond_the_burst_are_paced(self):
+        sender = _sender(channel_limit=Limit(20.0, 2))
+        channel = FakeChannel()
+
+        await sender.deliver(channel, "a b c d", limit=1)
+
+        times = [t for t, _content, _file in channel.sent]
+        self.assertEqual(["a", "b", "c", "d"], [content for _t, content, _file in channel.sent])
+        self.assertGreaterEqual(times[-1] - times[0], 0.09)
+        self.assertGreater(sender.waited_sec, 0)
+
+    async def test_a_busy_channel_does_not_hold_up_another(self):
+        sender = _sender(channel_limit=Limit(5.0, 1))
+        slow, other = FakeChannel(1), FakeChannel(2)
+
+        busy = asyncio.create_task(sender.deliver(slow, "a b c", limit=1))
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        await sender.send(other, "hi")
+
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertFalse(busy.done())
+        await busy
+
+    async def test_answers_in_one_channel_are_not_interleaved(self):
+        sender = _sender(channel_limit=Limit(200.0, 1))
+        channel = FakeChannel()
+
+        await asyncio.gather(sender.deliver(channel, "a1 a2 a3", limit=2), sender.deliver(channel, "b1 b2", limit=2))
+
+        self.assertEqual(["a1", "a2", "a3", "b1", "b2"], [content for _t, content, _file in channel.sent])
+
+    async def test_attachment_is_built_at_send_time(self):
+        sender = _sender(attach_after_chunks=1, make_file=lambda data, name: (name, len(data)))
+        channel = FakeChannel()
+
+        await sender.deliver(channel, "one two three", limit=5)
+
+        self.assertEqual([("answer.md", 13)], [file for _t, _content, file in channel.sent])
+        self.assertEqual(1, sender.attachments)
+
+    async def test_a_failed_answer_does_not_block_the_next_one(self):
+        sender = _sender()
+        channel = FakeChannel(fail_on="bad")
+
+        first = sender.deliver(channel, "bad", limit=10)
+        second = sender.deliver(channel, "good", limit=10)
+        results = await asyncio.gather(first, second, return_exceptions=True)
+
+        self.assertIsInstance(results[0], RuntimeError)
+        self.assertEqual(["good"], results[1])
+        self.assertEqual(1, sender.failed)
+
+    async def test_abandoned_answers_are_skipped(self):
+        sender = _sender(channel_limit=Limit(10.0, 1))
+        channel = FakeChannel()
+        first = asyncio.create_task(sender.deliver(channel, "a b", limit=1))
+        second = asyncio.create_task(sender.deliver(channel, "skipped", limit=10))
+        await asyncio.sleep(0.01)
+
+        second.cancel()
+        await first
+
+        self.assertEqual(["a", "b"], [content for _t, content, _file in channel.sent])
+
+    async def test_idle_channels_release_their_worker(self):
+        sender = _sender()
+        await sender.send(FakeChannel(1), "hi")
+
+        self.assertEqual(0, sender.queue_depth)
+        self.assertEqual({}, sender._workers)
+        self.assertEqual({}, sender._queues)
+
+    async def test_api_calls_are_reported(self):
+        calls = []
+        sender = _sender(on_api_call=lambda operation, seconds: calls.append(operation))
+
+        await sender.send(FakeChannel(), "hi")
+
+        self.assertEqual(["send"], calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
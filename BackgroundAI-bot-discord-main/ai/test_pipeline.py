@@ -0,0 +1,434 @@
+import asyncio
+import time
+import unittest
+
+from ai import pipeline
+from ai.checkpoints import DraftCheckpoints
+from ai.fake_ollama import FakeOllamaServer
+from ai.ollama_client import OllamaClient
+from ai.conversation import History, Turn
+from ai.pipeline import Pipeline, PipelineConfig
+
+
+def _responder(model, prompt):
+    if "Final Answer:" in prompt:
+        return "NightshadeAI: merged answer"
+    return f"draft from {model}"
+
+
+class PromptBuildingTests(unittest.TestCase):
+    def test_final_prompt_matches_powershell_layout(self):
+        prompt = pipeline.build_prompt("Persona line", "What is 2+2?")
+
+        self.assertEqual("Persona line\n\nUser: What is 2+2?\nNightshadeAI:", prompt)
+
+    def test_history_extends_the_prompt_without_changing_its_prefix(self):
+        history = History(1, 3, "They met.", (Turn("Hi", "Hello!"),), {})
+
+        prompt = pipeline.build_prompt("Persona line", "And now?", history)
+
+        self.assertEqual(
+            "Persona line\n\nSummary of the earlier conversation:\nThey met.\n\n"
+            "User: Hi\nNightshadeAI: Hello!\n\nUser: And now?\nNightshadeAI:",
+            prompt,
+        )
+        self.assertTrue(prompt.endswith(pipeline.build_followup_prompt("And now?")))
+
+    def test_summarizer_prompt_wraps_and_caps_drafts(self):
+        prompt = pipeline.build_summarizer_prompt("P", ["one", "x" * 5000], max_tokens=100)
+
+        self.assertIn("<<<DRAFT>>>\none\n<<<END>>>", prompt)
+        self.assertIn("x" * 2000 + " …\n<<<END>>>", prompt)
+        self.assertNotIn("x" * 2001, prompt)
+        self.assertTrue(prompt.endswith("Final Answer:"))
+
+    def test_clean_draft_strips_spinners_and_persona_echo(self):
+        self.assertEqual("Hi\n\nthere", pipeline.clean_draft("⠁NightshadeAI: Hi\n\n\n\nthere  "))
+
+    def test_clean_draft_ascii_only(self):
+        self.assertEqual("caf", pipeline.clean_draft("café", ascii_only=True))
+
+
+class PipelineRunTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await FakeOllamaServer(_responder).start()
+        self.client = OllamaClient(self.server.url)
+        self.config = PipelineConfig(models=("m1", "m2", "m1"), summarizer_model="sum",
+                                     timeout_sec=1, retries=1, retry_delay_sec=0)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+
+    def _generate_calls(self):
+        return [r["body"] for r in self.server.requests if r["path"] == "/api/generate"]
+
+    async def test_fans_out_unique_models_then_merges(self):
+        result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertEqual(pipeline.EXIT_OK, result.exit_code)
+        self.assertEqual("merged answer", result.answer)
+        self.assertEqual(["draft from m1", "draft from m2"], result.drafts)
+        calls = self._generate_calls()
+        self.assertEqual(["m1", "m2", "sum"], sorted(c["model"] for c in calls))
+        summarizer_call = next(c for c in calls if c["model"] == "sum")
+        self.assertIn("<<<DRAFT>>>\ndraft from m2\n<<<END>>>", summarizer_call["prompt"])
+        self.assertEqual(512, summarizer_call["options"]["num_predict"])
+        self.assertIn("draft:m1", result.timings)
+        self.assertIn("summarizer", result.timings)
+
+    async def test_streams_summarizer_progress(self):
+        self.server.responder = lambda model, prompt: "merged streamed answer" if model == "sum" else f"draft from {model}"
+        seen = []
+
+        result = await Pipeline(self.client, self.config).run("hello", on_progress=seen.append)
+
+        self.assertEqual("merged streamed answer", result.answer)
+        self.assertEqual(["merged", "merged streamed", "merged streamed answer"], seen)
+        summarizer_call = next(c for c in self._generate_calls() if c["model"] == "sum")
+        self.assertTrue(summarizer_call["stream"])
+        self.assertFalse(any(c["stream"] for c in self._generate_calls() if c["model"] != "sum"))
+
+    async def test_failed_models_are_dropped_from_merge(self):
+        self.server.failing_models.add("m2")
+
+        result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertEqual(pipeline.EXIT_OK, result.exit_code)
+        self.assertEqual(["draft from m1"], result.drafts)
+
+    async def test_no_drafts_exits_2(self):
+        self.server.failing_models.update({"m1", "m2"})
+
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertEqual(pipeline.EXIT_NO_DRAFTS, result.exit_code)
+
+    async def test_summarizer_error_exits_4(self):
+        self.server.failing_models.add("sum")
+
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertEqual(pipeline.EXIT_SUMMARIZER_ERROR, result.exit_code)
+
+    async def test_summarizer_timeout_exits_5(self):
+        self.server.latency = lambda model: 0.5 if model == "sum" else 0.0
+        self.config.timeout_sec = 0.1
+        self.config.retries = 0
+
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertEqual(pipeline.EXIT_TIMEOUT, result.exit_code)
+
+    async def test_empty_summary_exits_3(self):
+        self.server.responder = lambda model, prompt: "" if model == "sum" else f"draft from {model}"
+
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertEqual(pipeline.EXIT_SUMMARIZER_EMPTY, result.exit_code)
+        self.assertEqual(2, sum(1 for c in self._generate_calls() if c["model"] == "sum"))
+
+
+
+class MergeSkipTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await FakeOllamaServer(_responder).start()
+        self.client = OllamaClient(self.server.url)
+        self.config = PipelineConfig(models=("m1", "m2"), summarizer_model="sum", timeout_sec=1, retries=0)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+
+    def _summarizer_calls(self):
+        return [r for r in self.server.requests if r["path"] == "/api/generate" and r["body"]["model"] == "sum"]
+
+    async def test_near_identical_drafts_skip_the_summarizer(self):
+        answers = {"m1": "Paris is the capital of France.", "m2": "Paris is the capital of France!"}
+        self.server.responder = lambda model, prompt: answers.get(model, "merged")
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            result = await Pipeline(self.client, self.config).run("capital?")
+
+        self.assertTrue(result.merge_skipped)
+        self.assertEqual(pipeline.EXIT_OK, result.exit_code)
+        self.assertEqual("Paris is the capital of France.", result.answer)
+        self.assertEqual(1.0, result.similarity)
+        self.assertNotIn("similarity", result.timings)
+        self.assertEqual([], self._summarizer_calls())
+
+    async def test_single_surviving_draft_is_returned_directly(self):
+        self.server.failing_models.add("m2")
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertTrue(result.merge_skipped)
+        self.assertEqual("draft from m1", result.answer)
+        self.assertEqual([], self._summarizer_calls())
+
+    async def test_different_drafts_are_merged(self):
+        result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertFalse(result.merge_skipped)
+        self.assertEqual("merged answer", result.answer)
+        self.assertLess(result.similarity, self.config.skip_merge_similarity)
+
+    async def test_threshold_above_one_always_merges(self):
+        self.config.skip_merge_similarity = 1.01
+        self.server.responder = lambda model, prompt: "merged" if model == "sum" else "same text"
+
+        result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertFalse(result.merge_skipped)
+        self.assertEqual(1, len(self._summarizer_calls()))
+
+    async def test_contexts_are_kept_only_for_models_that_gave_the_answer(self):
+        self.server.failing_models.add("m2")
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertEqual(["m1"], list(result.contexts))
+
+    async def test_merged_answers_have_no_reusable_context(self):
+        result = await Pipeline(self.client, self.config).run("hello")
+
+        self.assertEqual({}, result.contexts)
+
+
+class ConversationTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await FakeOllamaServer(lambda model, prompt: "same answer").start()
+        self.client = OllamaClient(self.server.url)
+        self.config = PipelineConfig(models=("m1", "m2"), summarizer_model="sum", persona="P",
+                                     timeout_sec=1, retries=0)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+
+    def _generate_calls(self):
+        return {r["body"]["model"]: r["body"] for r in self.server.requests if r["path"] == "/api/generate"}
+
+    async def test_model_with_a_context_only_gets_the_new_turn(self):
+        history = History(1, 1, "", (Turn("Hi", "Hello!"),), {"m1": [7, 8, 9]})
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            result = await Pipeline(self.client, self.config).run("And now?", history=history)
+
+        calls = self._generate_calls()
+        self.assertEqual("\n\nUser: And now?\nNightshadeAI:", calls["m1"]["prompt"])
+        self.assertEqual([7, 8, 9], calls["m1"]["context"])
+        self.assertEqual(pipeline.build_prompt("P", "And now?", history), calls["m2"]["prompt"])
+        self.assertNotIn("context", calls["m2"])
+        self.assertEqual({"m1", "m2"}, set(result.contexts))
+
+    async def test_compact_history_uses_the_summarizer_model(self):
+        summary = await Pipeline(self.client, self.config).compact_history("Old.", [Turn("Hi", "Hello!")], 100)
+
+        self.assertEqual("same answer", summary)
+        prompt = self._generate_calls()["sum"]["prompt"]
+        self.assertIn("Summary so far:\nOld.", prompt)
+        self.assertIn("User: Hi\nNightshadeAI: Hello!", prompt)
+
+
+class CheckpointResumeTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await FakeOllamaServer(_responder, failing_models={"sum"}).start()
+        self.client = OllamaClient(self.server.url)
+        self.config = PipelineConfig(models=("m1", "m2"), summarizer_model="sum",
+                                     timeout_sec=1, retries=0, retry_delay_sec=0)
+        self.checkpoints = DraftCheckpoints()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+
+    def _generated_models(self):
+        return [r["body"]["model"] for r in self.server.requests if r["path"] == "/api/generate"]
+
+    async def test_retry_after_a_failed_merge_only_reruns_the_summarizer(self):
+        pipe = Pipeline(self.client, self.config, self.checkpoints)
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            failed = await pipe.run("hello")
+        self.server.failing_models.clear()
+
+        with self.assertLogs("nightshade-bot", level="INFO") as logs:
+            result = await pipe.run("hello")
+
+        self.assertEqual(pipeline.EXIT_SUMMARIZER_ERROR, failed.exit_code)
+        self.assertEqual(pipeline.EXIT_OK, result.exit_code)
+        self.assertEqual("merged answer", result.answer)
+        self.assertEqual({"m1": "draft from m1", "m2": "draft from m2"}, result.drafts_by_model)
+        self.assertEqual(["m1", "m2", "sum", "sum"], sorted(self._generated_models()))
+        self.assertIn("Resuming from 2 checkpointed draft(s)", logs.output[0])
+        self.assertEqual(0, len(self.checkpoints))  # a finished answer needs no checkpoints
+
+    async def test_only_missing_drafts_are_generated_again(self):
+        self.config.models = ("m1", "m2", "m3")
+        self.server.failing_models.add("m3")
+        pipe = Pipeline(self.client, self.config, self.checkpoints)
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            await pipe.run("hello")
+        self.server.failing_models.clear()
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            result = await pipe.run("hello")
+
+        self.assertEqual(pipeline.EXIT_OK, result.exit_code)
+        self.assertEqual(["m1", "m2", "m3", "m3", "sum", "sum"], sorted(self._generated_models()))
+        self.assertEqual(3, len(result.drafts))
+
+    async def test_other_settings_do_not_resume(self):
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            await Pipeline(self.client, self.config, self.checkpoints).run("hello")
+        self.config.max_tokens = 128
+
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            await Pipeline(self.client, self.config, self.checkpoints).run("hello")
+
+        self.assertEqual(2, self._generated_models().count("m1"))
+        self.assertEqual(0, self.checkpoints.resumed)
+
+    async def test_fallback_summarizer_merges_the_same_drafts(self):
+        self.config.fallback_summarizer_model = "sum2"
+        pipe = Pipeline(self.client, self.config, self.checkpoints)
+
+        with self.assertLogs("nightshade-bot", level="WARNING") as logs:
+            result = await pipe.run("hello")
+
+        self.assertEqual(pipeline.EXIT_OK, result.exit_code)
+        self.assertEqual("merged answer", result.answer)
+        self.assertEqual(["m1", "m2", "sum", "sum2"], sorted(self._generated_models()))
+        self.assertEqual(1, pipe.fallbacks)
+        self.assertIn("fallback_summarizer", result.timings)
+        self.assertIn("fallback summarizer sum2", logs.output[-1])
+
+    async def test_no_fallback_for_an_empty_summary(self):
+        self.server.failing_models.clear()
+        self.server.responder = lambda model, prompt: "" if model == "sum" else f"draft from {model}"
+        self.config.fallback_summarizer_model = "sum2"
+        pipe = Pipeline(self.client, self.config)
+
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            result = await pipe.run("hello")
+
+        self.assertEqual(pipeline.EXIT_SUMMARIZER_EMPTY, result.exit_code)
+        self.assertEqual(0, pipe.fallbacks)
+
+
+class MergeStatsTests(unittest.TestCase):
+    def test_records_decisions_and_estimates_time_saved(self):
+        stats = pipeline.MergeStats(smoothing=0.5)
+        stats.record(pipeline.PipelineResult("a", 0, timings={"summarizer": 4.0}, similarity=0.2))
+        stats.record(pipeline.PipelineResult("b", 0, timings={"summarizer": 2.0}, similarity=0.4))
+        stats.record(pipeline.PipelineResult("c", 0, merge_skipped=True, similarity=1.0))
+
+        self.assertEqual((2, 1), (stats.merged, stats.skipped))
+        self.assertEqual(3.0, stats.summarizer_avg_sec)
+        self.assertEqual(3.0, stats.seconds_saved)
+        self.assertAlmostEqual(0.3, stats.mean_similarity(skipped=False))
+        self.assertEqual(1.0, stats.mean_similarity(skipped=True))
+
+    def test_no_savings_claimed_before_a_summarizer_run_was_seen(self):
+        stats = pipeline.MergeStats()
+        stats.record(pipeline.PipelineResult("c", 0, merge_skipped=True, similarity=1.0))
+
+        self.assertEqual(0.0, stats.seconds_saved)
+
+
+class DeadlineTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await FakeOllamaServer(_responder).start()
+        self.client = OllamaClient(self.server.url)
+        self.config = PipelineConfig(models=("m1", "m2"), summarizer_model="sum",
+                                     timeout_sec=5, retries=0, retry_delay_sec=0)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+
+    async def _timed_run(self, pipe):
+        started = time.monotonic()
+        result = await pipe.run("hello")
+        return result, time.monotonic() - started
+
+    async def test_merges_after_k_of_n_drafts_and_drops_stragglers(self):
+        self.server.latency = lambda model: 3.0 if model == "m2" else 0.0
+        self.config.min_drafts = 1
+        pipe = Pipeline(self.client, self.config)
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            result, elapsed = await self._timed_run(pipe)
+
+        self.assertEqual(pipeline.EXIT_OK, result.exit_code)
+        self.assertEqual(["draft from m1"], result.drafts)
+        self.assertEqual(1, pipe.stragglers_dropped)
+        self.assertLess(elapsed, 1.0)
+
+    async def test_draft_stage_stops_at_its_share_of_the_deadline(self):
+        self.server.latency = lambda model: 3.0 if model == "m2" else 0.0
+        self.config.deadline_sec = 0.6
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            result, elapsed = await self._timed_run(Pipeline(self.client, self.config))
+
+        self.assertEqual(pipeline.EXIT_OK, result.exit_code)
+        self.assertEqual(["draft from m1"], result.drafts)
+        self.assertLess(result.timings["drafts"], 0.5)
+        self.assertLess(elapsed, 0.6)
+
+    async def test_summarizer_is_cut_off_at_the_deadline(self):
+        self.server.latency = lambda model: 3.0 if model == "sum" else 0.0
+        self.config.deadline_sec = 0.4
+
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            result, elapsed = await self._timed_run(Pipeline(self.client, self.config))
+
+        self.assertEqual(pipeline.EXIT_TIMEOUT, result.exit_code)
+        self.assertLess(elapsed, 1.0)
+
+    async def test_slow_draft_is_hedged_with_a_duplicate_request(self):
+        calls = []
+
+        def latency(model):
+            calls.append(model)
+            # Only the first m2 request is slow; the hedge answers immediately
+            return 3.0 if calls.count("m2") == 1 and model == "m2" else 0.0
+
+        self.server.latency = latency
+        self.config.hedge_after_sec = 0.05
+        pipe = Pipeline(self.client, self.config)
+
+        with self.assertLogs("nightshade-bot", level="INFO"):
+            result, elapsed = await self._timed_run(pipe)
+
+        self.assertEqual(["draft from m1", "draft from m2"], result.drafts)
+        self.assertEqual(1, pipe.hedges)
+        self.assertEqual(2, calls.count("m2"))
+        self.assertLess(elapsed, 1.0)
+
+    async def test_cancelling_a_run_aborts_its_ollama_streams(self):
+        self.server.latency = 3.0
+        task = asyncio.create_task(Pipeline(self.client, self.config).run("hello"))
+        while self.server.generating < 2:
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        for _ in range(100):
+            if self.server.aborted == 2:
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(2, self.server.aborted)
+        self.assertEqual(0, self.server.generating)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import unittest
+
+from ai.fake_orchestrator import read_pids, survivors, tree_command
+from ai.processes import NEW_PROCESS_GROUP, kill_process_tree
+
+
+@unittest.skipIf(sys.platform == "win32", "the fake process tree uses POSIX signals for cleanup")
+class KillProcessTreeTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.pid_file = os.path.join(self.tmp.name, "pids")
+
+    async def _spawn_tree(self):
+        proc = await asyncio.create_subprocess_exec(
+            *tree_command(self.pid_file),
+            stdout=asyncio.subprocess.DEVNULL,
+            **NEW_PROCESS_GROUP,
+        )
+        return proc, await read_pids(self.pid_file)
+
+    def _reap(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    async def test_the_whole_tree_is_killed(self):
+        proc, pids = await self._spawn_tree()
+
+        await kill_process_tree(proc)
+
+        self.assertIsNotNone(proc.returncode)
+        self.assertEqual([], await survivors(pids))
+
+    async def test_killing_only_the_leader_orphans_its_children(self):
+        proc, pids = await self._spawn_tree()
+        self.addCleanup(self._reap, pids)
+
+        proc.kill()
+        await proc.wait()
+
+        self.assertEqual(pids, await survivors(pids, timeout=0.3))
+
+    async def test_children_outliving_their_leader_are_still_reclaimed(self):
+        proc, pids = await self._spawn_tree()
+        self.addCleanup(self._reap, pids)
+        proc.kill()
+        await proc.wait()
+
+        await kill_process_tree(proc)
+
+        self.assertEqual([], await survivors(pids))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from ai.profiling import LoopWatchdog, Stall, Tracer, add_span, current_trace, format_trace, span
+
+
+class TracerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_unsampled_requests_are_not_traced(self):
+        tracer = Tracer(sample_rate=0.5, slow_sec=0.0, rng=lambda: 0.7)
+
+        with tracer.trace("message") as trace:
+            with span("ask"):
+                pass
+
+        self.assertIsNone(trace)
+        self.assertEqual(0, tracer.traced)
+
+    async def test_spans_follow_the_request_into_other_tasks(self):
+        tracer = Tracer(sample_rate=1.0, slow_sec=0.0)
+
+        async def backend():
+            with span("backend", tier="full"):
+                await asyncio.sleep(0.01)
+            add_span("drafts", 0.005)
+
+        with tracer.trace("message", guild=1) as trace:
+            await asyncio.create_task(backend())
+        with span("outside"):
+            pass
+
+        self.assertIsNone(current_trace())
+        self.assertEqual(["backend", "drafts"], [s.name for s in trace.spans])
+        self.assertEqual({"tier": "full"}, trace.spans[0].attrs)
+        self.assertGreaterEqual(trace.spans[0].seconds, 0.01)
+        self.assertGreaterEqual(trace.seconds, trace.spans[0].seconds)
+
+    async def test_only_slow_traces_are_kept(self):
+        tracer = Tracer(sample_rate=1.0, slow_sec=0.02)
+
+        with tracer.trace("fast"):
+            pass
+        with tracer.trace("slow", guild=2):
+            await asyncio.sleep(0.03)
+
+        self.assertEqual(2, tracer.traced)
+        self.assertEqual(["slow"], [t.name for t in tracer.recent])
+        self.assertEqual([], tracer.find(guild=1))
+        self.assertEqual(["slow"], [t.name for t in tracer.find(guild=2)])
+
+    async def test_slow_traces_are_written_as_rotated_json_lines(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces.jsonl")
+            tracer = Tracer(sample_rate=1.0, slow_sec=0.0, path=path, max_bytes=400, backups=2)
+            for i in range(10):
+                with tracer.trace("message", guild=i):
+                    add_span("drafts", 0.5, model="m1")
+            tracer.close()
+
+            with open(path, encoding="utf-8") as f:
+                last = [json.loads(line) for line in f][-1]
+            rotated = sorted(os.listdir(tmp))
+
+        self.assertEqual(9, last["attrs"]["guild"])
+        self.assertEqual([{"name": "drafts", "start": 0.0, "seconds": 0.5, "model": "m1"}], last["spans"])
+        self.assertEqual(["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"], rotated)
+
+    async def test_format_trace_lists_the_slowest_spans(self):
+        tracer = Tracer(sample_rate=1.0, slow_sec=0.0)
+        with tracer.trace("message") as trace:
+            add_span("cleaning", 0.01)
+            add_span("backend", 2.0)
+
+        line = format_trace(trace)
+
+        self.assertIn(trace.trace_id, line)
+        self.assertLess(line.index("backend 2.00s"), line.index("cleaning 0.01s"))
+
+
+class LoopWatchdogTests(unittest.IsolatedAsyncioTestCase):
+    async def test_blocking_callback_is_reported_with_its_stack(self):
+        watchdog = LoopWatchdog(threshold_sec=0.05, interval_sec=0.01)
+        watchdog.start()
+        await asyncio.sleep(0.03)
+
+        with self.assertLogs("nightshade-bot", level="WARNING") as logs:
+            time.sleep(0.2)  # blocks the loop
+            await asyncio.sleep(0.05)
+        await watchdog.aclose()
+
+        self.assertEqual(1, watchdog.stalls)
+        self.assertGreaterEqual(watchdog.max_lag_sec, 0.05)
+        self.assertIn("test_blocking_callback_is_reported_with_its_stack", watchdog.recent[-1].stack)
+        self.assertIn("test_profiling.py", watchdog.recent[-1].location)
+        self.assertIn("Event loop blocked", logs.output[0])
+
+    async def test_an_idle_loop_is_not_a_stall(self):
+        watchdog = LoopWatchdog(threshold_sec=0.05, interval_sec=0.01)
+        watchdog.start()
+
+        await asyncio.sleep(0.15)
+        await watchdog.aclose()
+
+        self.assertEqual(0, watchdog.stalls)
+        self.assertFalse(watchdog.running)
+
+    def test_location_is_the_innermost_frame(self):
+        stack = '  File "a.py", line 1, in outer\n    inner()\n  File "b.py", line 7, in inner\n    spin()'
+
+        self.assertEqual('File "b.py", line 7, in inner', Stall(0.0, 1.0, stack).location)
+
+
+if __name__ == "__main__":
+    unittest.main()
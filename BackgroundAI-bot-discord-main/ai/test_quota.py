@@ -0,0 +1,138 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from ai.quota import QuotaStore, SharedQuotaStore
+from ai.state import MemoryStateBackend
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class QuotaStoreTests(unittest.IsolatedAsyncioTestCase):
+    async def test_consumes_up_to_the_limit(self):
+        store = QuotaStore(2)
+
+        self.assertEqual([True, True, False], [await store.try_consume(1) for _ in range(3)])
+        self.assertTrue(await store.try_consume(2))
+        self.assertEqual(2, await store.used(1))
+
+    async def test_refund_and_reset(self):
+        store = QuotaStore(5)
+        await store.try_consume(1)
+        await store.try_consume(1)
+
+        await store.refund(1)
+        self.assertEqual(1, await store.used(1))
+        await store.reset(1)
+        self.assertEqual(0, await store.used(1))
+
+    async def test_window_rolls_over_lazily(self):
+        clock = FakeClock(86400 * 10 + 100)
+        store = QuotaStore(1, window_sec=86400, clock=clock)
+        await store.try_consume(1)
+        self.assertFalse(await store.try_consume(1))
+
+        clock.now = 86400 * 11 + 1  # just past midnight UTC
+
+        self.assertTrue(await store.try_consume(1))
+
+
+class QuotaPersistenceTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "state.sqlite3")
+
+    async def test_counts_survive_a_restart(self):
+        first = QuotaStore(10, sqlite_path=self.path, flush_interval=0.01)
+        for _ in range(3):
+            await first.try_consume(7)
+        await first.aclose()
+
+        second = QuotaStore(10, sqlite_path=self.path)
+        self.addCleanup(second.close)
+
+        self.assertEqual(3, await second.used(7))
+        self.assertEqual(0, await second.used(8))
+
+    async def test_increments_are_batched_off_the_event_loop(self):
+        store = QuotaStore(1000, sqlite_path=self.path, flush_interval=0.05)
+        self.addCleanup(store.close)
+        threads = []
+        original = store._disk_put
+
+        def record_thread(rows):
+            threads.append(threading.current_thread())
+            original(rows)
+
+        await store.used(1)  # first access reads the (empty) row
+        with patch.object(store, "_disk_put", side_effect=record_thread):
+            for guild_id in range(20):
+                await store.try_consume(guild_id % 4)
+            self.assertEqual([], threads)  # nothing written on the hot path
+            await asyncio.sleep(0.15)
+
+        self.assertEqual(1, len(threads))  # one batch for all four guilds
+        self.assertIsNot(threading.main_thread(), threads[0])
+
+    async def test_database_uses_wal(self):
+        store = QuotaStore(10, sqlite_path=self.path)
+        await store.try_consume(1)
+        await store.aclose()
+
+        with sqlite3.connect(self.path) as db:
+            self.assertEqual("wal", db.execute("PRAGMA journal_mode").fetchone()[0])
+
+    async def test_close_without_a_loop_flushes_synchronously(self):
+        store = QuotaStore(10, sqlite_path=self.path, flush_interval=60)
+        await store.try_consume(1)
+        store.close()
+
+        reopened = QuotaStore(10, sqlite_path=self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(1, await reopened.used(1))
+
+
+class SharedQuotaStoreTests(unittest.IsolatedAsyncioTestCase):
+    async def test_processes_sharing_a_backend_share_the_limit(self):
+        backend = MemoryStateBackend()
+        shard_a, shard_b = SharedQuotaStore(3, backend), SharedQuotaStore(3, backend)
+
+        results = [await store.try_consume(1) for store in (shard_a, shard_b, shard_a, shard_b)]
+
+        self.assertEqual([True, True, True, False], results)
+        self.assertEqual(3, await shard_b.used(1))
+
+    async def test_refund_never_goes_below_zero_and_reset_clears(self):
+        store = SharedQuotaStore(5, MemoryStateBackend())
+        await store.refund(1)
+        self.assertEqual(0, await store.used(1))
+
+        await store.try_consume(1)
+        await store.try_consume(1)
+        await store.reset(1)
+        self.assertEqual(0, await store.used(1))
+
+    async def test_window_rolls_over(self):
+        clock = FakeClock(86400 * 10 + 100)
+        store = SharedQuotaStore(1, MemoryStateBackend(), window_sec=86400, clock=clock)
+        await store.try_consume(1)
+        self.assertFalse(await store.try_consume(1))
+
+        clock.now = 86400 * 11 + 1
+
+        self.assertTrue(await store.try_consume(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+
+from ai.ratelimit import Limit, RateLimiter, SharedWindowLimit, TimingWheel
+from ai.state import MemoryStateBackend
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TimingWheelTests(unittest.TestCase):
+    def test_keys_come_due_after_their_slot(self):
+        wheel = TimingWheel(slot_sec=1.0, slots=8)
+        wheel.schedule("a", 2.5)
+        wheel.schedule("b", 5.0)
+
+        self.assertEqual([], list(wheel.advance(2.9)))
+        self.assertEqual(["a"], list(wheel.advance(3.0)))
+        self.assertEqual(["b"], list(wheel.advance(100.0)))
+
+    def test_far_future_keys_wait_in_the_last_slot(self):
+        wheel = TimingWheel(slot_sec=1.0, slots=4)
+        wheel.schedule("now", 0.0)
+        wheel.schedule("later", 50.0)
+
+        due = list(wheel.advance(3.0))
+
+        self.assertEqual(["now", "later"], due)  # caller re-checks "later" and reschedules it
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_burst_then_refill(self):
+        limiter = RateLimiter(user=Limit(0.5, 2))
+
+        self.assertTrue(limiter.check(1, 1, now=0.0).allowed)
+        self.assertTrue(limiter.check(1, 1, now=0.0).allowed)
+        verdict = limiter.check(1, 1, now=0.0)
+        self.assertEqual(("user", 2.0), (verdict.scope, verdict.retry_after))
+
+        self.assertTrue(limiter.check(1, 1, now=2.0).allowed)
+
+    def test_one_token_per_interval_matches_a_fixed_cooldown(self):
+        limiter = RateLimiter(user=Limit(1 / 4, 1))
+
+        self.assertTrue(limiter.check(1, 1, now=100.0).allowed)
+        self.assertFalse(limiter.check(1, 1, now=103.9).allowed)
+        self.assertTrue(limiter.check(1, 1, now=104.0).allowed)
+
+    def test_users_are_independent_but_share_the_guild_bucket(self):
+        limiter = RateLimiter(user=Limit(1, 1), guild=Limit(1, 2))
+
+        self.assertTrue(limiter.check(1, 1, now=0.0).allowed)
+        self.assertTrue(limiter.check(1, 2, now=0.0).allowed)
+        self.assertEqual("guild", limiter.check(1, 3, now=0.0).scope)
+        self.assertTrue(limiter.check(2, 3, now=0.0).allowed)
+
+    def test_global_limit_spans_guilds(self):
+        limiter = RateLimiter(global_limit=Limit(1, 1))
+
+        self.assertTrue(limiter.check(1, 1, now=0.0).allowed)
+        self.assertEqual("global", limiter.check(2, 2, now=0.0).scope)
+
+    def test_denied_checks_consume_nothing(self):
+        limiter = RateLimiter(user=Limit(1, 1), guild=Limit(1, 1))
+        limiter.check(1, 1, now=0.0)
+
+        self.assertEqual("guild", limiter.check(1, 2, now=0.0).scope)
+        # User 2's bucket was not charged by the denied attempt
+        self.assertTrue(limiter.check(1, 2, now=1.0).allowed)
+        self.assertEqual(1, limiter.denied)
+
+    def test_idle_buckets_expire(self):
+        limiter = RateLimiter(user=Limit(1, 1))
+        for user_id in range(5000):
+            limiter.check(user_id % 7, user_id, now=0.0)
+        self.assertEqual(5000, len(limiter))
+
+        limiter.check(99, 99, now=5.0)
+
+        self.assertEqual(1, len(limiter))  # only the fresh user's bucket remains
+
+    def test_memory_tracks_active_users_under_churn(self):
+        limiter = RateLimiter(user=Limit(0.5, 1))
+        for step in range(20000):
+            now = step * 0.01
+            limiter.check(1, step, now=now)  # a new user every 10ms, each refills within 2s
+
+        self.assertLess(len(limiter), 400)
+        self.assertGreater(limiter.expired, 19000)
+
+    def test_active_buckets_survive_the_wheel(self):
+        limiter = RateLimiter(user=Limit(0.1, 3), wheel_slots=4)
+        limiter.check(1, 1, now=0.0)
+        limiter.check(1, 1, now=0.0)
+
+        limiter.check(2, 2, now=6.0)  # advances the wheel past the slot horizon
+
+        self.assertTrue(limiter.check(1, 1, now=6.0).allowed)
+        self.assertFalse(limiter.check(1, 1, now=6.0).allowed)
+
+
+class SharedWindowLimitTests(unittest.IsolatedAsyncioTestCase):
+    async def test_ceiling_is_shared_between_processes(self):
+        clock = FakeClock(1000.0)
+        backend = MemoryStateBackend(clock=clock)
+        limit = Limit.per_minute(6, 3)  # 3 requests per 30s window
+        shard_a = SharedWindowLimit(backend, limit, clock=clock)
+        shard_b = SharedWindowLimit(backend, limit, clock=clock)
+
+        verdicts = [await limiter.check() for limiter in (shard_a, shard_b, shard_a, shard_b)]
+
+        self.assertEqual([True, True, True, False], [v.allowed for v in verdicts])
+        self.assertEqual("global", verdicts[-1].scope)
+        self.assertAlmostEqual(20.0, verdicts[-1].retry_after)
+        clock.now += 20
+        self.assertTrue((await shard_a.check()).allowed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from ai.pipeline import PipelineConfig
+from ai.router import FULL_ROUTE, QuestionRouter, Route, apply_route, question_features
+
+FAST = Route("fast", ("m1",), summarize=False, max_tokens=256)
+
+
+class QuestionFeaturesTests(unittest.TestCase):
+    def test_counts_words_sentences_and_keywords(self):
+        features = question_features("Explain the sun. Why is it hot?")
+
+        self.assertEqual((7, 2, 2, False), features)
+
+    def test_code_and_multi_line_questions_are_flagged(self):
+        self.assertTrue(question_features("what does `x += 1` do").code)
+        self.assertTrue(question_features("fix this\nline one\nline two").code)
+
+
+class QuestionRouterTests(unittest.TestCase):
+    def setUp(self):
+        self.router = QuestionRouter(FAST, max_words=12)
+
+    def test_greetings_and_short_lookups_take_the_fast_route(self):
+        for question in ("hi", "hello there!", "what is the capital of france?", "who wrote hamlet"):
+            self.assertIs(FAST, self.router.route(question), question)
+
+    def test_complex_questions_take_the_full_route(self):
+        for question in (
+            "explain recursion",
+            "compare rust and go",
+            "what is the best way to structure a large python project with many services and shared code",
+            "what does `yield from` do",
+            "Is it raining. Should I bring an umbrella. Or a coat?",
+        ):
+            self.assertIs(FULL_ROUTE, self.router.route(question), question)
+
+    def test_score_is_even_at_the_word_limit(self):
+        self.assertAlmostEqual(0.5, self.router.score(" ".join(["word"] * 12)))
+        self.assertEqual(1.0, self.router.score(" ".join(["word"] * 13)))
+
+    def test_threshold_and_keywords_are_configurable(self):
+        strict = QuestionRouter(FAST, threshold=0.05)
+        custom = QuestionRouter(FAST, keywords=("recipe",))
+
+        self.assertIs(FULL_ROUTE, strict.route("what is the capital of france?"))
+        self.assertIs(FAST, custom.route("explain recursion"))
+        self.assertIs(FULL_ROUTE, custom.route("pancake recipe"))
+
+
+class ApplyRouteTests(unittest.TestCase):
+    def test_fast_route_runs_one_model_without_a_merge(self):
+        config = PipelineConfig(models=("m1", "m2"), max_tokens=512)
+
+        fast = apply_route(config, FAST)
+
+        self.assertEqual(("m1",), fast.models)
+        self.assertEqual(256, fast.max_tokens)
+        self.assertEqual(0.0, fast.skip_merge_similarity)
+        self.assertIs(config, apply_route(config, FULL_ROUTE))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+
+from ai.scheduler import FairScheduler, QueueFullError
+
+
+async def _hold(scheduler, guild_id, started, gate, label):
+    async with scheduler.slot(guild_id):
+        started.append(label)
+        await gate.wait()
+
+
+class FairSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_global_concurrency_cap_is_enforced(self):
+        scheduler = FairScheduler(2)
+        started, gate = [], asyncio.Event()
+        tasks = [asyncio.create_task(_hold(scheduler, g, started, gate, g)) for g in range(5)]
+        await asyncio.sleep(0)
+
+        self.assertEqual(2, len(started))
+        self.assertEqual(2, scheduler.in_flight)
+        self.assertEqual(3, scheduler.queue_depth)
+
+        gate.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(5, len(started))
+        self.assertEqual(0, scheduler.in_flight)
+
+    async def test_busy_guild_does_not_starve_a_newcomer(self):
+        scheduler = FairScheduler(1)
+        blocker = scheduler.submit(0)
+        busy = [scheduler.submit(1) for _ in range(5)]
+        newcomer = scheduler.submit(2)
+
+        self.assertEqual(2, scheduler.position(newcomer))
+        scheduler.release(blocker)
+        scheduler.release(busy[0])
+
+        self.assertTrue(newcomer.granted.done())
+        self.assertFalse(busy[1].granted.done())
+
+    async def test_weights_give_proportional_share(self):
+        scheduler = FairScheduler(1, weights={1: 2.0})
+        blocker = scheduler.submit(0)
+        heavy = [scheduler.submit(1) for _ in range(4)]
+        light = [scheduler.submit(2) for _ in range(2)]
+        order, running = [], blocker
+        tickets = {id(t): name for name, group in (("heavy", heavy), ("light", light)) for t in group}
+
+        for _ in range(6):
+            scheduler.release(running)
+            running = next(t for t in heavy + light if t.granted.done() and not t.released)
+            order.append(tickets[id(running)])
+
+        self.assertEqual(["heavy", "heavy", "light", "heavy", "heavy", "light"], order)
+
+    async def test_full_queue_rejects_cleanly(self):
+        scheduler = FairScheduler(1, max_queue=2, max_queue_per_guild=1)
+        scheduler.submit(0)
+        scheduler.submit(1)
+
+        with self.assertRaises(QueueFullError):
+            scheduler.submit(1)  # per-guild limit
+        scheduler.submit(2)
+        with self.assertRaises(QueueFullError):
+            scheduler.submit(3)  # global limit
+
+        self.assertEqual(2, scheduler.rejected)
+        self.assertEqual(2, scheduler.queue_depth)
+
+    async def test_requests_that_run_immediately_are_never_rejected(self):
+        scheduler = FairScheduler(2, max_queue=1, max_queue_per_guild=1)
+
+        scheduler.submit(1)
+        scheduler.submit(1)
+
+        self.assertEqual(2, scheduler.in_flight)
+
+    async def test_on_queued_reports_position(self):
+        scheduler = FairScheduler(1)
+        blocker = scheduler.submit(0)
+        positions = []
+
+        async def report(position):
+            positions.append(position)
+
+        async def ask(guild_id):
+            async with scheduler.slot(guild_id, report):
+                pass
+
+        tasks = [asyncio.create_task(ask(g)) for g in (1, 2)]
+        await asyncio.sleep(0)
+        scheduler.release(blocker)
+        await asyncio.gather(*tasks)
+
+        self.assertEqual([1, 2], positions)
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        scheduler = FairScheduler(1)
+        blocker = scheduler.submit(0)
+        started, gate = [], asyncio.Event()
+        waiter = asyncio.create_task(_hold(scheduler, 1, started, gate, "cancelled"))
+        other = asyncio.create_task(_hold(scheduler, 2, started, gate, "other"))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(1, scheduler.queue_depth)
+
+        scheduler.release(blocker)
+        gate.set()
+        await other
+        self.assertEqual(["other"], started)
+        self.assertEqual(0, scheduler.in_flight)
+
+    async def test_errors_inside_the_slot_release_it(self):
+        scheduler = FairScheduler(1)
+
+        with self.assertRaises(RuntimeError):
+            async with scheduler.slot(1):
+                raise RuntimeError("backend down")
+
+        self.assertEqual(0, scheduler.in_flight)
+
+
+if __name__ == "__main__":
+    unittest.main()
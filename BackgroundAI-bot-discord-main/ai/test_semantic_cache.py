@@ -0,0 +1,211 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from ai.fake_ollama import FakeOllamaServer
+from ai.ollama_client import OllamaClient, OllamaError
+from ai.semantic_cache import SemanticCache, VectorIndex, cache_namespace, numpy, unit_vector
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+VECTORS = {
+    "how do i reset my password": (1.0, 0.1, 0.0),
+    "password reset how": (0.95, 0.2, 0.0),
+    "what is the weather": (0.0, 0.0, 1.0),
+    "tell me a joke": (0.0, 1.0, 0.0),
+}
+
+
+async def fake_embed(text):
+    if text not in VECTORS:
+        raise OllamaError("model 'embed' failed", 500)
+    return VECTORS[text]
+
+
+def _namespace(**overrides):
+    settings = dict(persona="p", models=("a", "b"), summarizer_model="s", temperature=0.2, max_tokens=512,
+                    embedding_model="e")
+    settings.update(overrides)
+    return cache_namespace(**settings)
+
+
+class VectorIndexTests(unittest.TestCase):
+    use_numpy = False
+
+    def _index(self, capacity=64):
+        return VectorIndex(capacity, use_numpy=self.use_numpy)
+
+    def test_search_returns_the_most_similar_key(self):
+        index = self._index()
+        for key, vector in (("x", (1.0, 0.0)), ("y", (0.0, 1.0)), ("xy", unit_vector((1.0, 1.0)))):
+            index.add(key, vector)
+
+        key, similarity = index.search(unit_vector((0.9, 0.1)))
+
+        self.assertEqual("x", key)
+        self.assertAlmostEqual(0.9939, similarity, places=3)
+
+    def test_removed_keys_are_not_found_and_their_rows_are_reused(self):
+        index = self._index()
+        index.add("x", (1.0, 0.0))
+        index.add("y", (0.0, 1.0))
+        index.remove("x")
+        index.add("z", (0.6, 0.8))
+
+        self.assertEqual("z", index.search((1.0, 0.0))[0])
+        self.assertEqual(2, len(index))
+
+    def test_grows_up_to_its_capacity(self):
+        index = self._index(capacity=40)
+        for i in range(40):
+            index.add(i, unit_vector((1.0, i)))
+
+        self.assertEqual(39, index.search(unit_vector((1.0, 39)))[0])
+        with self.assertRaises(ValueError):
+            index.add("one too many", (1.0, 0.0))
+
+    def test_vectors_of_another_size_never_match(self):
+        index = self._index()
+        index.add("x", (1.0, 0.0))
+
+        self.assertIsNone(index.search((1.0, 0.0, 0.0)))
+        with self.assertRaises(ValueError):
+            index.add("y", (1.0, 0.0, 0.0))
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class NumpyVectorIndexTests(VectorIndexTests):
+    use_numpy = True
+
+
+class SemanticCacheTests(unittest.IsolatedAsyncioTestCase):
+    def _cache(self, **kwargs):
+        kwargs.setdefault("threshold", 0.9)
+        return SemanticCache(fake_embed, **kwargs)
+
+    async def _put(self, cache, question, answer, namespace="ns"):
+        await cache.put(namespace, question, await cache.embed(question), answer)
+
+    async def _get(self, cache, question, namespace="ns"):
+        return await cache.get(namespace, await cache.embed(question))
+
+    def test_namespace_depends_on_the_configuration(self):
+        base = _namespace()
+        self.assertEqual(base, _namespace())
+        self.assertNotEqual(base, _namespace(persona="other"))
+        self.assertNotEqual(base, _namespace(models=("b", "a")))
+        self.assertNotEqual(base, _namespace(max_tokens=256))
+        self.assertNotEqual(base, _namespace(embedding_model="f"))
+        self.assertNotEqual(base, _namespace(route="fast"))
+
+    async def test_a_paraphrase_gets_the_stored_answer(self):
+        cache = self._cache()
+        await self._put(cache, "How do I reset my password?", "Use the reset link.")
+
+        hit = await self._get(cache, "Password reset how?")
+
+        self.assertEqual("Use the reset link.", hit.answer)
+        self.assertEqual("How do I reset my password?", hit.question)
+        self.assertGreater(hit.similarity, 0.9)
+        self.assertEqual((1, 0), (cache.hits, cache.misses))
+
+    async def test_unrelated_questions_and_other_namespaces_miss(self):
+        cache = self._cache()
+        await self._put(cache, "How do I reset my password?", "Use the reset link.")
+
+        self.assertIsNone(await self._get(cache, "What is the weather?"))
+        self.assertIsNone(await self._get(cache, "Password reset how?", namespace="other"))
+        self.assertEqual((0, 2), (cache.hits, cache.misses))
+        self.assertEqual(0.0, cache.hit_rate)
+
+    async def test_the_threshold_is_tunable(self):
+        cache = self._cache(threshold=0.999)
+        await self._put(cache, "How do I reset my password?", "Use the reset link.")
+
+        self.assertIsNone(await self._get(cache, "Password reset how?"))
+
+    async def test_least_recently_used_entries_are_evicted(self):
+        cache = self._cache(max_entries=2)
+        await self._put(cache, "How do I reset my password?", "reset")
+        await self._put(cache, "What is the weather?", "sunny")
+        await self._get(cache, "How do I reset my password?")
+        await self._put(cache, "Tell me a joke", "no")
+
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.evictions)
+        self.assertIsNone(await self._get(cache, "What is the weather?"))
+        self.assertEqual("reset", (await self._get(cache, "Password reset how?")).answer)
+
+    async def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = self._cache(ttl_sec=10, clock=clock)
+        await self._put(cache, "How do I reset my password?", "reset")
+
+        clock.now += 10.1
+
+        self.assertIsNone(await self._get(cache, "Password reset how?"))
+        self.assertEqual(0, len(cache))
+
+    async def test_a_new_answer_replaces_its_paraphrase(self):
+        cache = self._cache()
+        await self._put(cache, "How do I reset my password?", "old")
+        await self._put(cache, "Password reset how?", "new")
+
+        self.assertEqual(1, len(cache))
+        self.assertEqual("new", (await self._get(cache, "How do I reset my password?")).answer)
+
+    async def test_without_numpy_lookups_run_in_a_thread_over_a_capped_cache(self):
+        cache = self._cache(max_entries=4096, use_numpy=False)
+        await self._put(cache, "How do I reset my password?", "reset")
+
+        with patch("ai.semantic_cache.asyncio.to_thread", wraps=asyncio.to_thread) as to_thread:
+            self.assertEqual("reset", (await self._get(cache, "Password reset how?")).answer)
+
+        to_thread.assert_called_once()
+        self.assertEqual(SemanticCache.PURE_PYTHON_MAX_ENTRIES, cache.max_entries)
+
+    async def test_embedding_failures_count_as_misses(self):
+        cache = self._cache()
+
+        with self.assertLogs("nightshade-bot", "WARNING"):
+            vector = await cache.embed("Something the model cannot embed")
+        await cache.put("ns", "Something the model cannot embed", vector, "answer")
+
+        self.assertIsNone(await cache.get("ns", vector))
+        self.assertEqual((1, 1, 0), (cache.errors, cache.misses, len(cache)))
+
+    async def test_slow_embeddings_time_out(self):
+        async def slow_embed(text):
+            await asyncio.sleep(1)
+
+        cache = SemanticCache(slow_embed, embed_timeout_sec=0.01)
+
+        with self.assertLogs("nightshade-bot", "WARNING"):
+            self.assertIsNone(await cache.embed("hi"))
+        self.assertEqual(1, cache.errors)
+
+
+class OllamaEmbeddingTests(unittest.IsolatedAsyncioTestCase):
+    async def test_embeds_through_the_ollama_api(self):
+        async with FakeOllamaServer(embedder=lambda text: [float(len(text)), 1.0]) as server:
+            client = OllamaClient(server.url)
+            try:
+                vector = await client.embed("nomic-embed-text", "hello", keep_alive="5m")
+            finally:
+                await client.close()
+
+        self.assertEqual([5.0, 1.0], vector)
+        self.assertEqual(
+            {"model": "nomic-embed-text", "input": "hello", "keep_alive": "5m"}, server.requests[-1]["body"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
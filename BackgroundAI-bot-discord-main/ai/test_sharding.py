@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+from ai.sharding import ShardSupervisor, shard_for_guild, split_shards
+
+
+class ShardMathTests(unittest.TestCase):
+    def test_guild_routing_matches_discord_formula(self):
+        guild_id = 81384788765712384  # Discord API server
+        self.assertEqual((guild_id >> 22) % 4, shard_for_guild(guild_id, 4))
+        self.assertEqual(0, shard_for_guild(guild_id, 1))
+
+    def test_shards_are_split_round_robin(self):
+        self.assertEqual([[0, 3], [1, 4], [2]], split_shards(5, 3))
+        self.assertEqual([[0], [1]], split_shards(2, 8))
+        self.assertEqual([[0, 1, 2]], split_shards(3, 1))
+
+
+class ShardSupervisorTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def _child(self, body):
+        script = os.path.join(self.dir, "child.py")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write("import os, sys\nids = os.environ['BOT_SHARD_IDS']\n" + body)
+        return [sys.executable, script]
+
+    async def test_children_get_their_shard_ids(self):
+        command = self._child(
+            "open(os.path.join(sys.argv[1], 'shards-' + ids), 'w').write(os.environ['BOT_SHARD_COUNT'])\n"
+        )
+        supervisor = ShardSupervisor(command + [self.dir], 4, 2)
+
+        await asyncio.wait_for(supervisor.run(), timeout=30)
+
+        self.assertEqual(["shards-0,2", "shards-1,3"], sorted(f for f in os.listdir(self.dir) if f.startswith("shards")))
+        self.assertEqual(0, supervisor.restarts)
+
+    async def test_crashed_child_is_restarted(self):
+        # Crashes on the first run, exits cleanly on the second
+        command = self._child(
+            "marker = os.path.join(sys.argv[1], 'ran-' + ids)\n"
+            "if not os.path.exists(marker):\n"
+            "    open(marker, 'w').close()\n"
+            "    sys.exit(3)\n"
+        )
+        supervisor = ShardSupervisor(command + [self.dir], 1, 1, restart_delay=0.01)
+
+        await asyncio.wait_for(supervisor.run(), timeout=30)
+
+        self.assertEqual(1, supervisor.restarts)
+
+    async def test_stop_terminates_running_children(self):
+        supervisor = ShardSupervisor(self._child("import time\ntime.sleep(60)\n"), 2, 2)
+        runner = asyncio.create_task(supervisor.run())
+        while not all(c.proc for c in supervisor.children):
+            await asyncio.sleep(0.01)
+
+        await supervisor.stop(timeout=5)
+        await asyncio.wait_for(runner, timeout=5)
+
+        self.assertTrue(all(c.proc.returncode is not None for c in supervisor.children))
+
+
+if __name__ == "__main__":
+    unittest.main()
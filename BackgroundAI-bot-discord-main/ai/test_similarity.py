@@ -0,0 +1,35 @@
+import unittest
+
+from ai.similarity import best_draft, draft_similarity, jaccard, shingles
+
+
+class SimilarityTests(unittest.TestCase):
+    def test_shingles_ignore_case_and_punctuation(self):
+        self.assertEqual(shingles("The sky, is BLUE."), shingles("the sky is blue"))
+
+    def test_short_texts_fall_back_to_words(self):
+        self.assertEqual(frozenset({("hi",), ("there",)}), shingles("Hi there"))
+
+    def test_jaccard_of_two_empty_sets_is_one(self):
+        self.assertEqual(1.0, jaccard(frozenset(), frozenset()))
+
+    def test_similarity_is_the_lowest_pair(self):
+        same = "the quick brown fox jumps over the lazy dog"
+        other = "an entirely different answer about something else"
+
+        self.assertEqual(1.0, draft_similarity([same, same]))
+        self.assertEqual(0.0, draft_similarity([same, same, other]))
+        self.assertEqual(1.0, draft_similarity([same]))
+
+    def test_best_draft_is_the_one_closest_to_the_rest(self):
+        drafts = [
+            "water boils at 100 degrees celsius at sea level",
+            "water boils at 100 degrees celsius at sea level pressure",
+            "it depends",
+        ]
+
+        self.assertEqual(drafts[1], best_draft(drafts))
+
+
+if __name__ == "__main__":
+    unittest.main()
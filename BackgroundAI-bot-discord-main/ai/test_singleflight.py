@@ -0,0 +1,139 @@
+import asyncio
+import unittest
+
+from ai.singleflight import SingleFlight
+
+
+class SingleFlightTests(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_identical_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def work(_progress):
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return ("answer", 0)
+
+        results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+
+        self.assertEqual([("answer", 0)] * 5, results)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1, flight.executions)
+        self.assertEqual(4, flight.coalesced)
+        self.assertEqual(0, flight.in_flight)
+
+    async def test_different_keys_run_separately(self):
+        flight = SingleFlight()
+
+        async def work(_progress):
+            await asyncio.sleep(0.01)
+            return "x"
+
+        await asyncio.gather(flight.do("a", work), flight.do("b", work))
+
+        self.assertEqual(2, flight.executions)
+        self.assertEqual(0, flight.coalesced)
+
+    async def test_finished_key_executes_again(self):
+        flight = SingleFlight()
+        counter = iter(range(10))
+
+        async def work(_progress):
+            return next(counter)
+
+        self.assertEqual(0, await flight.do("k", work))
+        self.assertEqual(1, await flight.do("k", work))
+
+    async def test_cancelling_one_waiter_keeps_shared_work_running(self):
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work(_progress):
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flight.do("k", work))
+        second = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual("done", await second)
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+    async def test_shared_work_is_cancelled_once_every_waiter_left(self):
+        flight = SingleFlight()
+        started, stopped = asyncio.Event(), asyncio.Event()
+
+        async def work(_progress):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            finally:
+                stopped.set()
+
+        waiters = [asyncio.create_task(flight.do("k", work)) for _ in range(2)]
+        await started.wait()
+        waiters[0].cancel()
+        await asyncio.sleep(0)
+        self.assertFalse(stopped.is_set())
+        waiters[1].cancel()
+        await asyncio.wait_for(stopped.wait(), timeout=1)
+
+        self.assertEqual(1, flight.abandoned)
+        self.assertEqual(0, flight.in_flight)
+
+        async def fresh(_progress):
+            return "again"
+
+        self.assertEqual("again", await flight.do("k", fresh))
+
+    async def test_errors_reach_every_waiter(self):
+        flight = SingleFlight()
+
+        async def work(_progress):
+            await asyncio.sleep(0.01)
+            raise RuntimeError("backend down")
+
+        results = await asyncio.gather(flight.do("k", work), flight.do("k", work), return_exceptions=True)
+
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+    async def test_progress_is_fanned_out_and_replayed_to_late_joiners(self):
+        flight = SingleFlight()
+        step = asyncio.Event()
+        leader_seen, joiner_seen = [], []
+
+        async def work(progress):
+            progress("one")
+            await step.wait()
+            progress("one two")
+            return "one two"
+
+        leader = asyncio.create_task(flight.do("k", work, leader_seen.append))
+        await asyncio.sleep(0)
+        joiner = asyncio.create_task(flight.do("k", work, joiner_seen.append))
+        await asyncio.sleep(0)
+        step.set()
+        await asyncio.gather(leader, joiner)
+
+        self.assertEqual(["one", "one two"], leader_seen)
+        self.assertEqual(["one", "one two"], joiner_seen)
+
+    async def test_no_progress_callback_when_leader_does_not_stream(self):
+        flight = SingleFlight()
+        received = []
+
+        async def work(progress):
+            received.append(progress)
+            return "x"
+
+        await flight.do("k", work)
+
+        self.assertEqual([None], received)
+
+
+if __name__ == "__main__":
+    unittest.main()
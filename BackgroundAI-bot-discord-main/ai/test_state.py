@@ -0,0 +1,183 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from ai.fake_redis import FakeRedisServer
+from ai.state import (
+    MemoryStateBackend, RedisStateBackend, SQLiteStateBackend, StateBackend, StateError, create_state_backend,
+)
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class BackendContract:
+    # Every backend must behave the same; subclasses provide make_backend()
+    async def test_get_set_delete(self):
+        self.assertIsNone(await self.backend.get("k"))
+        await self.backend.set("k", "v")
+        self.assertEqual("v", await self.backend.get("k"))
+        await self.backend.delete("k")
+        self.assertIsNone(await self.backend.get("k"))
+
+    async def test_incr_creates_and_counts(self):
+        self.assertEqual(1, await self.backend.incr("n"))
+        self.assertEqual(4, await self.backend.incr("n", 3))
+        self.assertEqual(3, await self.backend.incr("n", -1))
+        self.assertEqual("3", await self.backend.get("n"))
+
+    async def test_concurrent_increments_are_not_lost(self):
+        await asyncio.gather(*(self.backend.incr("n") for _ in range(50)))
+
+        self.assertEqual("50", await self.backend.get("n"))
+
+    async def test_unicode_values_round_trip(self):
+        await self.backend.set("k", "héllo 🤖\r\nline two")
+
+        self.assertEqual("héllo 🤖\r\nline two", await self.backend.get("k"))
+
+
+class MemoryBackendTests(BackendContract, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.clock = FakeClock()
+        self.backend = MemoryStateBackend(clock=self.clock)
+
+    async def test_ttl_expires_keys(self):
+        await self.backend.set("k", "v", ttl=10)
+        await self.backend.incr("n", ttl=10)
+        self.clock.now += 5
+        # An increment keeps the expiry set when the key was created
+        await self.backend.incr("n", ttl=10)
+        self.clock.now += 5.1
+
+        self.assertIsNone(await self.backend.get("k"))
+        self.assertIsNone(await self.backend.get("n"))
+
+
+class SQLiteBackendTests(BackendContract, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "state.sqlite3")
+        self.clock = FakeClock()
+        self.backend = SQLiteStateBackend(self.path, clock=self.clock)
+        self.addCleanup(self.backend.close)
+
+    async def test_two_processes_share_counters(self):
+        other = SQLiteStateBackend(self.path, clock=self.clock)
+        self.addCleanup(other.close)
+
+        await asyncio.gather(*(b.incr("n") for _ in range(20) for b in (self.backend, other)))
+
+        self.assertEqual("40", await other.get("n"))
+
+    async def test_expired_rows_are_ignored_and_purged(self):
+        await self.backend.set("k", "v", ttl=10)
+        self.clock.now += 11
+
+        self.assertIsNone(await self.backend.get("k"))
+        self.assertEqual(1, await self.backend.incr("k"))
+        await self.backend.set("old", "v", ttl=1)
+        self.clock.now += 2
+        self.assertEqual(1, self.backend.purge_expired())
+
+
+class RedisBackendTests(BackendContract, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await FakeRedisServer().start()
+        self.addAsyncCleanup(self.server.stop)
+        self.backend = create_state_backend(self.server.url)
+        self.addAsyncCleanup(self.backend.aclose)
+
+    async def test_ttl_is_sent_in_milliseconds(self):
+        await self.backend.set("k", "v", ttl=1.5)
+        await self.backend.incr("n", ttl=2)
+
+        self.assertIn(["SET", "k", "v", "PX", "1500"], self.server.commands)
+        self.assertIn(["EVAL", RedisStateBackend.INCR_SCRIPT, "1", "n", "1", "2000"], self.server.commands)
+
+    async def test_incr_sets_the_expiry_in_the_same_command_and_keeps_it(self):
+        await self.backend.incr("n", ttl=2)
+        await asyncio.sleep(0.05)
+        await self.backend.incr("n", ttl=2)
+
+        self.assertEqual(["EVAL", "EVAL"], [args[0] for args in self.server.commands])
+        self.assertLess(await self.backend.command("PTTL", "n"), 1960)
+
+    async def test_reconnects_after_the_server_drops_the_connection(self):
+        await self.backend.set("k", "v")
+        self.server.drop_connections()
+        await asyncio.sleep(0.01)
+
+        self.assertEqual("v", await self.backend.get("k"))
+        self.assertEqual(2, self.server.connections)
+
+    async def test_a_cancelled_command_does_not_leave_its_reply_for_the_next_one(self):
+        await self.backend.set("a", "A")
+        await self.backend.set("b", "B")
+        self.server.reply_delay = 0.05
+        pending = asyncio.create_task(self.backend.get("a"))
+        await asyncio.sleep(0.01)  # written, reply not yet read
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+
+        self.assertEqual("B", await self.backend.get("b"))
+        self.assertEqual(1, await self.backend.incr("n"))
+
+    async def test_a_hung_server_times_out(self):
+        backend = RedisStateBackend("127.0.0.1", self.server.port, read_timeout=0.05)
+        self.addAsyncCleanup(backend.aclose)
+        self.server.reply_delay = 1
+
+        with self.assertRaises(StateError):
+            await backend.get("k")
+        self.server.reply_delay = 0
+        self.assertIsNone(await backend.get("k"))
+
+    async def test_server_errors_raise_state_error(self):
+        await self.backend.set("k", "not a number")
+
+        with self.assertRaises(StateError):
+            await self.backend.incr("k")
+
+    async def test_unreachable_server_raises_state_error(self):
+        await self.server.stop()
+        backend = RedisStateBackend("127.0.0.1", self.server.port)
+
+        with self.assertRaises(StateError):
+            await backend.get("k")
+
+
+class StateBackendTests(unittest.TestCase):
+    def test_an_incomplete_backend_cannot_be_created(self):
+        class GetOnly(StateBackend):
+            async def get(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            GetOnly()
+
+
+class CreateStateBackendTests(unittest.TestCase):
+    def test_parses_urls(self):
+        self.assertIsInstance(create_state_backend("memory://"), MemoryStateBackend)
+        sqlite = create_state_backend("sqlite:///tmp/state.sqlite3")
+        self.assertEqual("/tmp/state.sqlite3", sqlite.path)
+        self.assertEqual("state.sqlite3", create_state_backend("sqlite://state.sqlite3").path)
+        redis = create_state_backend("redis://cache.local:6380/2")
+        self.assertEqual(("cache.local", 6380, 2), (redis.host, redis.port, redis.db))
+
+    def test_rejects_unknown_schemes(self):
+        with self.assertRaises(ValueError):
+            create_state_backend("postgres://db")
+
+
+if __name__ == "__main__":
+    unittest.main()
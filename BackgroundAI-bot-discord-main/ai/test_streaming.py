@@ -0,0 +1,192 @@
+import asyncio
+import types
+import unittest
+
+from ai.streaming import ProgressiveReply
+
+
+def _split(text, limit):
+    return [text[i:i + limit] for i in range(0, len(text), limit)]
+
+
+class FakeMessage:
+    def __init__(self, channel, content):
+        self.channel = channel
+        self.content = content
+        self.deleted = False
+
+    async def edit(self, content):
+        self.channel.edit_log.append(content)
+        self.content = content
+
+    async def delete(self):
+        self.deleted = True
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+        self.edit_log = []
+
+    async def send(self, content, allowed_mentions=None):
+        msg = FakeMessage(self, content)
+        self.sent.append(msg)
+        return msg
+
+
+class ProgressiveReplyTests(unittest.IsolatedAsyncioTestCase):
+    def _reply(self, channel, placeholder, limit=40, interval=0.05):
+        return ProgressiveReply(channel, placeholder, header="H:", limit=limit, render=str.strip,
+                                split=_split, edit_interval=interval, cursor="_")
+
+    async def test_first_token_replaces_placeholder(self):
+        channel = FakeChannel()
+        placeholder = await channel.send("thinking")
+        reply = self._reply(channel, placeholder)
+
+        reply.update("Hel")
+        await asyncio.sleep(0.01)
+
+        self.assertEqual("H:Hel_", placeholder.content)
+
+    async def test_bursts_of_tokens_are_coalesced_into_few_edits(self):
+        channel = FakeChannel()
+        placeholder = await channel.send("thinking")
+        reply = self._reply(channel, placeholder, limit=2000, interval=0.05)
+
+        text = ""
+        for i in range(200):
+            text += "x"
+            reply.update(text)
+            if i % 20 == 0:
+                await asyncio.sleep(0.01)
+        await reply.finish(text)
+
+        self.assertLess(reply.edits, 10)
+        self.assertEqual("H:" + "x" * 200, placeholder.content)
+
+    async def test_edits_respect_minimum_interval(self):
+        channel = FakeChannel()
+        placeholder = await channel.send("thinking")
+        reply = self._reply(channel, placeholder, limit=2000, interval=0.1)
+        loop = asyncio.get_running_loop()
+        stamps = []
+        original_edit = placeholder.edit
+
+        async def timed_edit(content):
+            stamps.append(loop.time())
+            await original_edit(content)
+
+        placeholder.edit = timed_edit
+        text = ""
+        deadline = loop.time() + 0.45
+        while loop.time() < deadline:
+            text += "y"
+            reply.update(text)
+            await asyncio.sleep(0.005)
+        await reply.finish(text)
+
+        gaps = [b - a for a, b in zip(stamps, stamps[1:-1])]
+        self.assertTrue(all(gap >= 0.09 for gap in gaps), gaps)
+
+    async def test_rolls_over_to_new_message_near_limit(self):
+        channel = FakeChannel()
+        placeholder = await channel.send("thinking")
+        reply = self._reply(channel, placeholder, limit=20)
+
+        reply.update("a" * 30)
+        await asyncio.sleep(0.01)
+        await reply.finish("a" * 30)
+
+        self.assertEqual(2, len(reply.messages))
+        self.assertTrue(all(len(m.content) <= 20 for m in reply.messages))
+        self.assertEqual("a" * 30, "".join(m.content[2:] for m in reply.messages))
+        self.assertFalse(any(m.content.endswith("_") for m in reply.messages))
+
+    async def test_finish_trims_messages_when_final_text_is_shorter(self):
+        channel = FakeChannel()
+        placeholder = await channel.send("thinking")
+        reply = self._reply(channel, placeholder, limit=20)
+
+        reply.update("b" * 50)
+        await asyncio.sleep(0.01)
+        extra = reply.messages[1:]
+        await reply.finish("[exit 5] failed")
+
+        self.assertEqual([placeholder], reply.messages)
+        self.assertEqual("H:[exit 5] failed", placeholder.content)
+        self.assertTrue(all(m.deleted for m in extra))
+
+    async def test_abort_stops_streaming_and_deletes_every_message(self):
+        channel = FakeChannel()
+        placeholder = await channel.send("thinking")
+        reply = self._reply(channel, placeholder, limit=20)
+
+        reply.update("c" * 30)
+        await asyncio.sleep(0.01)
+        posted = list(reply.messages)
+        await reply.abort()
+        edits = len(channel.edit_log)
+        reply.update("c" * 40)  # a late token must not bring the reply back
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(2, len(posted))
+        self.assertTrue(all(m.deleted for m in posted))
+        self.assertEqual([], reply.messages)
+        self.assertEqual(edits, len(channel.edit_log))
+
+    async def test_failed_edit_is_logged_and_streaming_continues(self):
+        channel = FakeChannel()
+        placeholder = await channel.send("thinking")
+        calls = types.SimpleNamespace(n=0)
+        original_edit = placeholder.edit
+
+        async def flaky_edit(content):
+            calls.n += 1
+            if calls.n == 1:
+                raise RuntimeError("429")
+            await original_edit(content)
+
+        placeholder.edit = flaky_edit
+        reply = self._reply(channel, placeholder, interval=0.01)
+
+        with self.assertLogs("nightshade-bot", level="ERROR"):
+            reply.update("one")
+            await asyncio.sleep(0.02)
+        await reply.finish("one two")
+
+        self.assertEqual("H:one two", placeholder.content)
+
+    async def test_every_discord_call_is_reported(self):
+        channel = FakeChannel()
+        placeholder = await channel.send("thinking")
+        calls = []
+        reply = ProgressiveReply(channel, placeholder, header="H:", limit=20, render=str.strip, split=_split,
+                                 edit_interval=0.01, cursor="_",
+                                 on_api_call=lambda op, seconds: calls.append((op, seconds >= 0)))
+
+        reply.update("b" * 50)
+        await asyncio.sleep(0.02)
+        await reply.finish("short")
+
+        self.assertEqual({("edit", True), ("send", True), ("delete", True)}, set(calls))
+
+    async def test_rollover_messages_can_go_through_a_custom_sender(self):
+        channel = FakeChannel()
+        placeholder = await channel.send("thinking")
+        routed = []
+
+        async def send(content):
+            routed.append(content)
+            return await channel.send(content)
+
+        reply = ProgressiveReply(channel, placeholder, header="H:", limit=20, render=str.strip, split=_split,
+                                 cursor="_", send=send)
+        await reply.finish("c" * 30)
+
+        self.assertEqual(["H:" + "c" * 13], routed)
+        self.assertEqual(2, len(reply.messages))
+
+
+if __name__ == "__main__":
+    unittest.main()
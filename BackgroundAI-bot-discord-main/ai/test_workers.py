@@ -0,0 +1,190 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+from ai.fake_orchestrator import read_pids, survivors
+from ai.workers import OrchestratorPool, WorkerError
+
+# Speaks the same JSON-lines protocol as `BackgroundAI_Bot.ps1 -Server`
+FAKE_WORKER = r'''
+import json, os, subprocess, sys, time
+print("[pull] some-model", flush=True)
+print(json.dumps({"event": "ready", "pid": os.getpid()}), flush=True)
+for line in sys.stdin:
+    req = json.loads(line)
+    prompt = req["prompt"]
+    if prompt == "hang":
+        time.sleep(60)
+    if prompt.startswith("spawn:"):
+        # Like the draft jobs: children that only die with the whole tree
+        children = [subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"]) for _ in range(2)]
+        with open(prompt[6:] + ".tmp", "w") as f:
+            f.write(" ".join(str(c.pid) for c in children))
+        os.replace(prompt[6:] + ".tmp", prompt[6:])
+        time.sleep(60)
+    if prompt == "crash":
+        sys.exit(3)
+    code = 2 if prompt == "fail" else 0
+    print(json.dumps({
+        "id": req["id"],
+        "exit_code": code,
+        "answer": f"{prompt}|{os.getpid()}|{req.get('max_tokens')}" if code == 0 else "",
+        "message": "No valid outputs generated from base models." if code else "",
+        "drafts": ["draft one", "draft two"],
+        "drafts_by_model": {"m1": "draft one", "m2": "draft two"},
+        "timings": {"draft:m1": 0.25, "summarizer": 0.5, "total": 1},
+        "similarity": 0.4,
+    }), flush=True)
+'''
+
+
+def _command():
+    return [sys.executable, "-c", FAKE_WORKER]
+
+
+class OrchestratorPoolTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.pool = OrchestratorPool(_command, size=2, request_timeout=2, startup_timeout=10,
+                                     supervise_interval=0.05)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    async def test_returns_structured_result(self):
+        result = await self.pool.run("hello", max_tokens=64)
+
+        self.assertEqual(0, result.exit_code)
+        self.assertTrue(result.answer.startswith("hello|"))
+        self.assertTrue(result.answer.endswith("|64"))
+        self.assertEqual(["draft one", "draft two"], result.drafts)
+        self.assertEqual({"m1": "draft one", "m2": "draft two"}, result.drafts_by_model)
+        self.assertEqual({"draft:m1": 0.25, "summarizer": 0.5, "total": 1.0}, result.timings)
+        self.assertEqual(0.4, result.similarity)
+
+    async def test_workers_stay_warm_between_requests(self):
+        await self.pool.start()
+        pids = {w.proc.pid for w in self.pool.workers}
+
+        for i in range(4):
+            await self.pool.run(f"q{i}")
+
+        self.assertEqual(2, len(pids))
+        self.assertEqual(pids, {w.proc.pid for w in self.pool.workers})
+        self.assertEqual(4, sum(w.served for w in self.pool.workers))
+
+    async def test_concurrent_requests_use_separate_workers(self):
+        results = await asyncio.gather(self.pool.run("a"), self.pool.run("b"))
+
+        pids = {r.answer.split("|")[1] for r in results}
+        self.assertEqual(2, len(pids))
+
+    async def test_failure_carries_message_and_exit_code(self):
+        result = await self.pool.run("fail")
+
+        self.assertEqual(2, result.exit_code)
+        self.assertIn("No valid outputs", result.answer)
+
+    async def test_hung_worker_is_killed_and_replaced(self):
+        self.pool.request_timeout = 0.3
+
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.pool.run("hang")
+            for _ in range(2):
+                result = await self.pool.run("after")
+                self.assertEqual(0, result.exit_code)
+
+        self.assertEqual(1, self.pool.restarts)
+        self.assertTrue(all(w.alive for w in self.pool.workers))
+
+    async def test_waiting_for_a_free_worker_is_bounded_by_the_deadline(self):
+        await self.pool.start()
+        self.pool.request_timeout = 0.1
+        held = [self.pool._idle.get_nowait() for _ in range(2)]
+        try:
+            with self.assertLogs("nightshade-bot", level="WARNING") as logs:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await self.pool.run("queued")
+        finally:
+            for worker in held:
+                self.pool._idle.put_nowait(worker)
+
+        self.assertIn("No orchestrator worker became free", logs.output[0])
+
+    async def test_supervisor_survives_a_failing_respawn(self):
+        await self.pool.start()
+        worker = self.pool.workers[0]
+        worker._command_factory = lambda: ["/nonexistent/pwsh"]
+
+        with self.assertLogs("nightshade-bot", level="ERROR") as logs:
+            await worker.kill()
+            await worker.proc.wait()
+            for _ in range(100):
+                if len(logs.output) >= 2:
+                    break
+                await asyncio.sleep(0.05)
+
+        self.assertGreaterEqual(len(logs.output), 2)
+        self.assertFalse(self.pool._supervisor.done())
+
+    @unittest.skipIf(sys.platform == "win32", "the fake worker's children are checked with POSIX signals")
+    async def test_abandoned_request_kills_the_worker_and_its_children(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pid_file = os.path.join(tmp, "pids")
+            task = asyncio.create_task(self.pool.run(f"spawn:{pid_file}"))
+            pids = await read_pids(pid_file)
+
+            with self.assertLogs("nightshade-bot", level="INFO") as logs:
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+            self.assertEqual([], await survivors(pids))
+        self.assertIn("request abandoned", logs.output[0])
+        result = await self.pool.run("after")
+        self.assertEqual(0, result.exit_code)
+
+    async def test_supervisor_respawns_crashed_worker(self):
+        with self.assertLogs("nightshade-bot", level="WARNING"):
+            with self.assertRaises(WorkerError):
+                await self.pool.run("crash")
+            for _ in range(100):
+                if self.pool.restarts and all(w.alive for w in self.pool.workers):
+                    break
+                await asyncio.sleep(0.05)
+
+        self.assertEqual(1, self.pool.restarts)
+        self.assertTrue(all(w.alive for w in self.pool.workers))
+
+    async def test_pool_size_is_configurable(self):
+        pool = OrchestratorPool(_command, size=3, startup_timeout=10)
+        try:
+            await pool.start()
+            self.assertEqual(3, len({w.proc.pid for w in pool.workers}))
+        finally:
+            await pool.close()
+
+    async def test_spawn_time_is_reported_per_worker(self):
+        spawns = []
+        pool = OrchestratorPool(_command, size=2, startup_timeout=10, on_spawn=spawns.append)
+        try:
+            await pool.start()
+        finally:
+            await pool.close()
+
+        self.assertEqual(2, len(spawns))
+        self.assertTrue(all(seconds > 0 for seconds in spawns))
+
+    async def test_start_fails_when_no_worker_comes_up(self):
+        pool = OrchestratorPool(lambda: [sys.executable, "-c", "import sys; sys.exit(1)"], size=1,
+                                startup_timeout=10)
+
+        with self.assertRaises(WorkerError):
+            await pool.start()
+        await pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
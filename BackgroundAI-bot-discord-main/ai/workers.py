@@ -0,0 +1,224 @@
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .pipeline import PipelineResult
+from .processes import NEW_PROCESS_GROUP, kill_process_tree
+
+log = logging.getLogger("nightshade-bot")
+
+# Answers and drafts travel as single JSON lines; the default 64 KiB StreamReader limit is too small
+LINE_LIMIT = 8 * 1024 * 1024
+
+
+class WorkerError(Exception):
+    pass
+
+
+# -------------------------
+# One long-lived orchestrator process (BackgroundAI_Bot.ps1 -Server)
+# -------------------------
+class OrchestratorWorker:
+    def __init__(self, index: int, command_factory: Callable[[], Sequence[str]], *, startup_timeout: float = 60.0,
+                 on_spawn: Optional[Callable[[float], None]] = None):
+        self.index = index
+        self._command_factory = command_factory
+        self._startup_timeout = startup_timeout
+        self._on_spawn = on_spawn  # seconds from exec to the ready line
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.busy_since: Optional[float] = None
+        self.served = 0
+        self.lock = asyncio.Lock()
+        self._stderr_task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self) -> None:
+        started = time.monotonic()
+        self.proc = await asyncio.create_subprocess_exec(
+            *self._command_factory(),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=LINE_LIMIT,
+            **NEW_PROCESS_GROUP,
+        )
+        self._stderr_task = asyncio.create_task(self._drain_stderr(self.proc))
+        try:
+            await asyncio.wait_for(self._read_message(lambda msg: msg.get("event") == "ready"),
+                                   timeout=self._startup_timeout)
+        except (asyncio.TimeoutError, WorkerError) as exc:
+            await self.kill()
+            raise WorkerError(f"Orchestrator worker {self.index} failed to start: {exc!r}") from exc
+        self.busy_since = None
+        if self._on_spawn is not None:
+            self._on_spawn(time.monotonic() - started)
+        log.info("Orchestrator worker %s ready (pid %s).", self.index, self.proc.pid)
+
+    async def request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.alive:
+            raise WorkerError(f"Orchestrator worker {self.index} is not running")
+        self.busy_since = time.monotonic()
+        try:
+            self.proc.stdin.write(json.dumps(payload).encode("utf-8") + b"\n")
+            await self.proc.stdin.drain()
+            response = await self._read_message(lambda msg: msg.get("id") == payload["id"])
+        except (ConnectionError, BrokenPipeError) as exc:
+            raise WorkerError(f"Orchestrator worker {self.index} pipe closed") from exc
+        finally:
+            self.busy_since = None
+        self.served += 1
+        return response
+
+    async def kill(self) -> None:
+        if self.proc is None:
+            return
+        # The whole process group: draft jobs and `ollama run` children must not outlive the worker
+        await kill_process_tree(self.proc)
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+
+    async def _read_message(self, match: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                raise WorkerError(f"Orchestrator worker {self.index} exited (code {self.proc.returncode})")
+            try:
+                message = json.loads(line)
+            except ValueError:
+                # e.g. "[pull] model" progress printed while the worker boots
+                log.debug("Worker %s: %s", self.index, line.decode("utf-8", errors="ignore").rstrip())
+                continue
+            if isinstance(message, dict) and match(message):
+                return message
+
+    async def _drain_stderr(self, proc: asyncio.subprocess.Process) -> None:
+        while True:
+            line = await proc.stderr.readline()
+            if not line:
+                return
+            log.warning("Worker %s stderr: %s", self.index, line.decode("utf-8", errors="ignore").rstrip())
+
+
+# -------------------------
+# Pool + supervisor
+# -------------------------
+class OrchestratorPool:
+    def __init__(self, command_factory: Callable[[], Sequence[str]], *, size: int = 2,
+                 request_timeout: float = 240.0, startup_timeout: float = 60.0,
+                 supervise_interval: float = 5.0, on_spawn: Optional[Callable[[float], None]] = None):
+        self.size = size
+        self.request_timeout = request_timeout
+        self.supervise_interval = supervise_interval
+        self.workers: List[OrchestratorWorker] = [
+            OrchestratorWorker(i, command_factory, startup_timeout=startup_timeout, on_spawn=on_spawn)
+            for i in range(size)
+        ]
+        self.restarts = 0
+        self._idle: "asyncio.Queue[OrchestratorWorker]" = asyncio.Queue()
+        self._ids = itertools.count(1)
+        self._started = False
+        self._start_lock = asyncio.Lock()
+        self._supervisor: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self._started:
+                return
+            outcomes = await asyncio.gather(*(w.start() for w in self.workers), return_exceptions=True)
+            failures = [exc for exc in outcomes if isinstance(exc, BaseException)]
+            if len(failures) == len(self.workers):
+                raise failures[0]
+            for exc in failures:
+                # Dead workers are respawned on first use or by the supervisor
+                log.warning("Orchestrator worker failed to start: %s", exc)
+            for worker in self.workers:
+                self._idle.put_nowait(worker)
+            self._supervisor = asyncio.create_task(self._supervise())
+            self._started = True
+
+    async def close(self) -> None:
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._supervisor
+        await asyncio.gather(*(w.kill() for w in self.workers))
+        self._started = False
+
+    async def run(self, question: str, **options: Any) -> PipelineResult:
+        await self.start()
+        # Waiting for a free worker counts against the same deadline as the request itself
+        deadline = time.monotonic() + self.request_timeout
+        try:
+            worker = await asyncio.wait_for(self._idle.get(), timeout=self.request_timeout)
+        except asyncio.TimeoutError:
+            log.warning("No orchestrator worker became free within %ss.", self.request_timeout)
+            raise
+        try:
+            if not worker.alive or worker.lock.locked():
+                # A supervisor restart may still be waiting for the new process's ready line
+                await self._restart(worker)
+            payload = {"id": str(next(self._ids)), "prompt": question, **options}
+            try:
+                response = await asyncio.wait_for(worker.request(payload),
+                                                  timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                log.warning("Orchestrator worker %s missed the %ss deadline; killing it.", worker.index,
+                            self.request_timeout)
+                await worker.kill()
+                raise
+            except asyncio.CancelledError:
+                # The question was abandoned; a worker cannot be told to drop a request, so it is
+                # killed (with its children) and respawned by the supervisor or the next request
+                log.info("Orchestrator worker %s request abandoned; killing it.", worker.index)
+                await worker.kill()
+                raise
+        finally:
+            self._idle.put_nowait(worker)
+
+        exit_code = int(response.get("exit_code", 1))
+        if exit_code == 0:
+            answer = response.get("answer") or ""
+        else:
+            answer = f"⚠️ {response.get('message') or 'AI backend failed.'}"
+        return PipelineResult(
+            answer=answer,
+            exit_code=exit_code,
+            drafts=list(response.get("drafts") or []),
+            drafts_by_model=dict(response.get("drafts_by_model") or {}),
+            timings={k: float(v) for k, v in (response.get("timings") or {}).items()},
+            merge_skipped=bool(response.get("merge_skipped")),
+            similarity=float(response["similarity"]) if response.get("similarity") is not None else None,
+        )
+
+    async def _restart(self, worker: OrchestratorWorker) -> None:
+        async with worker.lock:
+            if worker.alive:
+                return
+            await worker.kill()
+            self.restarts += 1
+            log.warning("Restarting orchestrator worker %s.", worker.index)
+            await worker.start()
+
+    async def _supervise(self) -> None:
+        # Kill workers stuck on one request well past the deadline and respawn dead idle ones
+        while True:
+            await asyncio.sleep(self.supervise_interval)
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.busy_since is not None and now - worker.busy_since > self.request_timeout:
+                    log.warning("Supervisor: worker %s busy for %.0fs; killing it.", worker.index,
+                                now - worker.busy_since)
+                    await worker.kill()
+                elif worker.busy_since is None and not worker.alive and not worker.lock.locked():
+                    try:
+                        await self._restart(worker)
+                    except Exception:
+                        # e.g. pwsh missing or out of file descriptors: keep supervising, retry next round
+                        log.exception("Supervisor could not restart worker %s", worker.index)